@@ -0,0 +1,311 @@
+"""
+Admission control for the generation endpoints
+
+Every upload that reaches /upload, /upload-stream or /summarize-pdf used to
+start work at once, so a burst of uploads made all of them share the model
+limits and time out together. Requests now have to be admitted first: a
+bounded number run concurrently, the next ones wait in a bounded FIFO queue,
+and the rest are turned away straight away with an expected wait:
+
+    429  the wait queue is full
+    503  a queued request was not admitted within its maximum wait
+
+Free-tier models (':free' in the model name) share a small per-minute call
+quota, so they are admitted through a separate, narrower lane.
+
+The expected wait is derived from the observed (moving average) time a
+request holds its slot. stats() reports the gauges: running and queued
+requests, current and average queue wait, and rejection counters.
+
+Configuration:
+    ADMISSION_MAX_CONCURRENT        Generation requests running at once (default: 4)
+    ADMISSION_FREE_TIER_CONCURRENT  Free-tier model requests running at once (default: 2)
+    ADMISSION_MAX_QUEUE             Requests allowed to wait per lane (default: 16)
+    ADMISSION_MAX_WAIT_SECONDS      Longest a request waits for a slot (default: 30)
+"""
+
+import os
+import math
+import time
+import asyncio
+import threading
+from collections import deque
+
+ADMISSION_MAX_CONCURRENT = int(os.environ.get('ADMISSION_MAX_CONCURRENT', 4))
+ADMISSION_FREE_TIER_CONCURRENT = int(os.environ.get('ADMISSION_FREE_TIER_CONCURRENT', 2))
+ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', 16))
+ADMISSION_MAX_WAIT_SECONDS = float(os.environ.get('ADMISSION_MAX_WAIT_SECONDS', 30))
+
+# Assumed time a request holds its slot until one has been observed
+DEFAULT_SERVICE_SECONDS = 30.0
+
+# Weight of the newest observation in the moving averages
+_EWMA_ALPHA = 0.2
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; carries the HTTP status and expected wait."""
+
+    def __init__(self, status, message, expected_wait):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.expected_wait = expected_wait
+
+    @property
+    def retry_after(self):
+        """Expected wait rounded up to whole seconds, for the Retry-After header."""
+        return max(1, math.ceil(self.expected_wait))
+
+    def response_body(self):
+        return {
+            'error': 'Server busy' if self.status == 503 else 'Too many requests',
+            'details': self.message,
+            'expected_wait_seconds': round(self.expected_wait, 1),
+            'retry_after': self.retry_after
+        }
+
+
+class _Waiter:
+    """A queued request; grant() hands it a slot."""
+
+    def __init__(self):
+        self.granted = False
+        self.enqueued_at = time.monotonic()
+        self._event = threading.Event()
+
+    def grant(self):
+        self.granted = True
+        self._event.set()
+
+    def wait(self, timeout):
+        self._event.wait(timeout)
+
+
+class _AsyncWaiter(_Waiter):
+    """A queued request of an asyncio task; grant() may be called from any thread."""
+
+    def __init__(self):
+        super().__init__()
+        self._loop = asyncio.get_running_loop()
+        self._future = self._loop.create_future()
+
+    def grant(self):
+        self.granted = True
+        self._loop.call_soon_threadsafe(self._resolve)
+
+    def _resolve(self):
+        if not self._future.done():
+            self._future.set_result(True)
+
+    async def wait(self, timeout):
+        try:
+            await asyncio.wait_for(asyncio.shield(self._future), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+
+class Admission:
+    """Slot held by an admitted request; release() is idempotent."""
+
+    def __init__(self, controller, waited_seconds):
+        self.controller = controller
+        self.waited_seconds = waited_seconds
+        self.admitted_at = time.monotonic()
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self.controller._release(time.monotonic() - self.admitted_at)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class AdmissionController:
+    """
+    Concurrency limit with a bounded FIFO wait queue.
+
+    A released slot is handed directly to the oldest waiter, so queued
+    requests are admitted in arrival order and new arrivals cannot overtake.
+    """
+
+    def __init__(self, name, max_concurrent, max_queue=ADMISSION_MAX_QUEUE,
+                 max_wait_seconds=ADMISSION_MAX_WAIT_SECONDS):
+        self.name = name
+        self.max_concurrent = max(1, max_concurrent)
+        self.max_queue = max(0, max_queue)
+        self.max_wait_seconds = max_wait_seconds
+        self._lock = threading.Lock()
+        self._waiters = deque()
+        self.active = 0
+        self.admitted_total = 0
+        self.rejected_queue_full = 0
+        self.rejected_timeout = 0
+        self.service_seconds = None
+        self.wait_seconds = None
+        self.last_wait_seconds = 0.0
+        self.max_observed_wait_seconds = 0.0
+
+    def expected_wait(self, position):
+        """
+        Expected seconds until the request at queue position (1-based) is admitted.
+
+        Every max_concurrent releases move the queue forward by one "wave",
+        and a wave takes about one average service time.
+        """
+        service = self.service_seconds or DEFAULT_SERVICE_SECONDS
+        return math.ceil(position / self.max_concurrent) * service
+
+    def _try_admit(self):
+        """Claim a free slot if nobody is queued; caller holds the lock."""
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            return True
+        return False
+
+    def _enqueue(self, waiter):
+        """Queue a waiter or raise 429 when the queue is full; caller holds the lock."""
+        if len(self._waiters) >= self.max_queue:
+            self.rejected_queue_full += 1
+            raise AdmissionRejected(
+                429,
+                f"{len(self._waiters)} requests are already waiting for the {self.name} lane",
+                self.expected_wait(len(self._waiters) + 1)
+            )
+        self._waiters.append(waiter)
+
+    def _wait_timeout(self, timeout):
+        if timeout is None:
+            return self.max_wait_seconds
+        return max(0.0, min(timeout, self.max_wait_seconds))
+
+    def _finish_wait(self, waiter):
+        """Admit a granted waiter or raise 503 for one that timed out."""
+        with self._lock:
+            if not waiter.granted:
+                position = self._waiters.index(waiter) + 1
+                self._waiters.remove(waiter)
+                self.rejected_timeout += 1
+                raise AdmissionRejected(
+                    503,
+                    f"No {self.name} slot became free within "
+                    f"{time.monotonic() - waiter.enqueued_at:.1f}s",
+                    self.expected_wait(position)
+                )
+        return self._admitted(time.monotonic() - waiter.enqueued_at)
+
+    def _admitted(self, waited):
+        with self._lock:
+            self.admitted_total += 1
+            self.last_wait_seconds = waited
+            self.max_observed_wait_seconds = max(self.max_observed_wait_seconds, waited)
+            self.wait_seconds = _moving_average(self.wait_seconds, waited)
+        return Admission(self, waited)
+
+    def acquire(self, timeout=None):
+        """
+        Wait for a slot.
+
+        Args:
+            timeout (float): Longest wait in seconds (capped at max_wait_seconds),
+                e.g. the time left before the request's deadline
+
+        Returns:
+            Admission: The slot; release() it when the request is done
+
+        Raises:
+            AdmissionRejected: 429 when the queue is full, 503 when the wait timed out
+        """
+        waiter = _Waiter()
+        with self._lock:
+            if self._try_admit():
+                waiter = None
+            else:
+                self._enqueue(waiter)
+        if waiter is None:
+            return self._admitted(0.0)
+
+        waiter.wait(self._wait_timeout(timeout))
+        return self._finish_wait(waiter)
+
+    async def acquire_async(self, timeout=None):
+        """acquire() for asyncio handlers: waits without holding a thread."""
+        waiter = _AsyncWaiter()
+        with self._lock:
+            if self._try_admit():
+                waiter = None
+            else:
+                self._enqueue(waiter)
+        if waiter is None:
+            return self._admitted(0.0)
+
+        try:
+            await waiter.wait(self._wait_timeout(timeout))
+        except asyncio.CancelledError:
+            # The client went away while queued: leave the queue, or pass on
+            # a slot that was granted in the meantime
+            with self._lock:
+                if not waiter.granted:
+                    self._waiters.remove(waiter)
+                    raise
+            self._release(None)
+            raise
+        return self._finish_wait(waiter)
+
+    def _release(self, service_seconds):
+        with self._lock:
+            if service_seconds is not None:
+                self.service_seconds = _moving_average(self.service_seconds, service_seconds)
+            if self._waiters:
+                # The slot passes straight to the oldest waiter
+                self._waiters.popleft().grant()
+            else:
+                self.active -= 1
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            oldest_wait = now - self._waiters[0].enqueued_at if self._waiters else 0.0
+            return {
+                'active': self.active,
+                'max_concurrent': self.max_concurrent,
+                'queue_depth': len(self._waiters),
+                'max_queue': self.max_queue,
+                'max_wait_seconds': self.max_wait_seconds,
+                'oldest_wait_seconds': round(oldest_wait, 3),
+                'last_wait_seconds': round(self.last_wait_seconds, 3),
+                'avg_wait_seconds': round(self.wait_seconds or 0.0, 3),
+                'max_observed_wait_seconds': round(self.max_observed_wait_seconds, 3),
+                'avg_service_seconds': round(self.service_seconds, 3) if self.service_seconds else None,
+                'expected_wait_seconds': round(self.expected_wait(len(self._waiters) + 1), 1)
+                if self.active >= self.max_concurrent else 0.0,
+                'admitted_total': self.admitted_total,
+                'rejected_queue_full': self.rejected_queue_full,
+                'rejected_timeout': self.rejected_timeout
+            }
+
+
+def _moving_average(current, observation):
+    if current is None:
+        return observation
+    return (1 - _EWMA_ALPHA) * current + _EWMA_ALPHA * observation
+
+
+generation_admission = AdmissionController('generation', ADMISSION_MAX_CONCURRENT)
+free_tier_admission = AdmissionController('free-tier', ADMISSION_FREE_TIER_CONCURRENT)
+
+
+def admission_for_model(model_name):
+    """Return the admission lane of a request for the given model."""
+    if model_name and ':free' in model_name:
+        return free_tier_admission
+    return generation_admission
+
+
+def admission_stats():
+    return {controller.name: controller.stats() for controller in (generation_admission, free_tier_admission)}
@@ -0,0 +1,229 @@
+"""
+Process-wide cache of document analyses shared by the local generators
+
+generate_fast_mcq_questions(), generate_professional_mcq_questions() and
+generate_enhanced_professional_mcq_questions() create a new generator per
+call, and the fallback chain of mcq_generator may run all three on the same
+text; each one split the text into sentences, ran spaCy over it and mined it
+again. The fast generator's own cache was keyed by hash(text) and died with
+the generator object.
+
+Analyses are now kept here, per document, keyed by the SHA-256 of the text
+(generation_cache.document_hash), and built part by part on first use:
+
+    sentences            sent_tokenize() of the text
+    spaCy analysis       DocumentAnalysis, per spaCy pipeline
+    pattern matches      pattern_engine records, per generator
+    sentence embeddings  normalized matrix, per sentence model
+    generator analyses   the dict each generator's questions are built from
+
+so a generator that follows another on the same text reuses the parts they
+have in common, and a document seen again (re-generation, another number of
+questions) is not analysed again. Parts are read-only once built.
+
+The cache keeps the most recently used documents; it is bounded by a document
+count and by the estimated size of their parts (NumPy arrays, spaCy docs,
+strings and containers; the models they reference are not counted).
+
+Configuration:
+    ANALYSIS_CACHE_SIZE     Documents kept (default: 16)
+    ANALYSIS_CACHE_MAX_MB   Budget for the estimated size of cached analyses (default: 256)
+"""
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+from generation_cache import document_hash
+
+ANALYSIS_CACHE_SIZE = int(os.environ.get('ANALYSIS_CACHE_SIZE', 16))
+ANALYSIS_CACHE_MAX_MB = float(os.environ.get('ANALYSIS_CACHE_MAX_MB', 256))
+
+# Approximate memory of one spaCy token besides the doc tensor (token struct, lexeme refs, annotations)
+SPACY_TOKEN_BYTES = 256
+
+# Attributes holding shared models, which are not part of an analysis' size
+_MODEL_ATTRIBUTES = frozenset({'nlp', 'model', 'sentence_model'})
+
+
+def estimate_size(value, seen=None):
+    """
+    Approximate memory in bytes of an analysis part; objects in seen are not counted again.
+
+    Args:
+        value: Part to measure (containers, arrays, spaCy docs, plain objects)
+        seen (set): ids of objects already counted; updated
+    """
+    seen = set() if seen is None else seen
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    if isinstance(value, (str, bytes, int, float, bool)) or value is None:
+        return sys.getsizeof(value)
+    nbytes = getattr(value, 'nbytes', None)
+    if isinstance(nbytes, int):  # NumPy arrays
+        return nbytes
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(estimate_size(key, seen) + estimate_size(item, seen)
+                                          for key, item in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return sys.getsizeof(value) + sum(estimate_size(item, seen) for item in value)
+    if hasattr(value, 'vocab') and hasattr(value, 'tensor'):  # spaCy Doc
+        return getattr(value.tensor, 'nbytes', 0) + len(value) * SPACY_TOKEN_BYTES
+    if hasattr(value, 'doc') and hasattr(value, 'start'):  # spaCy Span; its doc is counted on its own
+        return sys.getsizeof(value)
+
+    attributes = getattr(value, '__dict__', None)
+    if attributes is None:
+        slots = getattr(type(value), '__slots__', ())
+        attributes = {name: getattr(value, name, None) for name in slots}
+    return sys.getsizeof(value) + sum(estimate_size(item, seen) for name, item in attributes.items()
+                                      if name not in _MODEL_ATTRIBUTES)
+
+
+class _Document:
+    """Cached parts of one document."""
+
+    def __init__(self):
+        self.parts = {}
+        self.size = 0
+        self.counted = set()  # ids of objects included in size; the parts keep them alive
+
+
+class AnalysisCache:
+    """Thread-safe LRU of per-document analysis parts, bounded by documents and estimated bytes."""
+
+    def __init__(self, max_documents=ANALYSIS_CACHE_SIZE, max_mb=ANALYSIS_CACHE_MAX_MB):
+        self.max_documents = max(0, max_documents)
+        self.max_bytes = max(0, max_mb) * 1024 * 1024
+        self._documents = OrderedDict()  # document hash -> _Document
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        self.hits = 0
+        self.misses = 0
+        self.evicted_total = 0
+
+    def _build_lock(self, key):
+        with self._lock:
+            return self._build_locks.setdefault(key, threading.Lock())
+
+    def part(self, text, name, builder):
+        """
+        A part of the text's analysis, built with builder() on first use.
+
+        Concurrent requests for the same part wait for one build. Builders may
+        request other parts of the same document.
+
+        Args:
+            text (str): Document text
+            name (Hashable): Part name, e.g. ('spacy', 'en_core_web_sm')
+            builder (Callable[[], Any]): Builds the part
+
+        Returns:
+            The cached or newly built part
+        """
+        if not self.max_documents:
+            return builder()
+        doc_key = document_hash(text)
+
+        with self._lock:
+            document = self._documents.get(doc_key)
+            if document is not None and name in document.parts:
+                self.hits += 1
+                self._documents.move_to_end(doc_key)
+                return document.parts[name]
+
+        build_lock = self._build_lock((doc_key, name))
+        with build_lock:
+            with self._lock:
+                document = self._documents.get(doc_key)
+                if document is not None and name in document.parts:
+                    self.hits += 1
+                    self._documents.move_to_end(doc_key)
+                    return document.parts[name]
+                self.misses += 1
+
+            try:
+                value = builder()
+            except Exception:
+                with self._lock:
+                    self._build_locks.pop((doc_key, name), None)
+                raise
+
+            with self._lock:
+                document = self._documents.get(doc_key)
+                if document is None:
+                    document = self._documents[doc_key] = _Document()
+                document.parts[name] = value
+                document.size += estimate_size(value, document.counted)
+                self._documents.move_to_end(doc_key)
+                self._evict(keep=doc_key)
+                self._build_locks.pop((doc_key, name), None)
+            return value
+
+    def _evict(self, keep):
+        """Drop least recently used documents over the limits; the document in use stays. Caller holds the lock."""
+        for doc_key in list(self._documents):
+            if len(self._documents) <= self.max_documents and self._total_bytes() <= self.max_bytes:
+                break
+            if doc_key != keep:
+                del self._documents[doc_key]
+                self.evicted_total += 1
+
+    def _total_bytes(self):
+        return sum(document.size for document in self._documents.values())
+
+    def clear(self):
+        with self._lock:
+            self._documents.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'documents': len(self._documents), 'max_documents': self.max_documents,
+                    'bytes': self._total_bytes(), 'max_bytes': int(self.max_bytes),
+                    'hits': self.hits, 'misses': self.misses, 'evicted_total': self.evicted_total}
+
+
+analysis_cache = AnalysisCache()
+
+
+def pipeline_name(nlp):
+    """Name of a spaCy pipeline, e.g. 'en_core_web_sm-3.7.1', part of the analysis keys."""
+    meta = getattr(nlp, 'meta', None) or {}
+    if meta.get('name'):
+        return f"{meta.get('lang', 'xx')}_{meta['name']}-{meta.get('version', '')}"
+    return f"pipeline-{id(nlp)}"
+
+
+def document_sentences(text):
+    """The text's sentences (nltk sent_tokenize), cached."""
+    def split():
+        from nltk.tokenize import sent_tokenize
+        return sent_tokenize(text)
+    return analysis_cache.part(text, 'sentences', split)
+
+
+def document_analysis(text, nlp):
+    """The text's DocumentAnalysis with a spaCy pipeline, cached per pipeline."""
+    def analyse():
+        from document_analysis import DocumentAnalysis
+        return DocumentAnalysis(nlp, document_sentences(text))
+    return analysis_cache.part(text, ('spacy', pipeline_name(nlp)), analyse)
+
+
+def document_patterns(text, source):
+    """pattern_engine matches of the text's sentences for one generator ('fast', 'professional', 'enhanced'), cached."""
+    def mine():
+        from pattern_engine import mine_sentences
+        return mine_sentences(document_sentences(text), (source,))
+    return analysis_cache.part(text, ('patterns', source), mine)
+
+
+def document_embeddings(text, model, model_key):
+    """Normalized embeddings of the text's sentences with a sentence model, cached per model."""
+    def encode():
+        from embedding_index import encode_normalized
+        return encode_normalized(model, document_sentences(text), model_key)
+    return analysis_cache.part(text, ('embeddings', model_key), encode)
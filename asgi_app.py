@@ -0,0 +1,271 @@
+"""
+ASGI entry point with async generation endpoints
+
+Run with:
+    pip install -r requirements-async.txt
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5002
+
+POST /upload and POST /upload-stream are served by async handlers that await
+the model through AsyncOpenAI (see generate_mcq_questions_with_metadata_async),
+so a request waiting on the model holds no thread and one process can keep
+hundreds of generations in flight. PDF extraction and offline generation are
+CPU-bound and still run in worker threads.
+
+Every other route (login, exports, notes, jobs, batch, ...) is served by the
+unchanged Flask app through asgiref's WSGI adapter. The async handlers use the
+Flask login session, result store and response builders of flask_app.py, so
+clients see the same routes, cookies and response bodies as under the WSGI
+server. A client that disconnects from /upload-stream cancels its run.
+Both endpoints pass the same admission control as the Flask routes; requests
+queued for a slot wait on the event loop.
+"""
+
+import json
+import shutil
+import asyncio
+import uuid
+
+from starlette.applications import Starlette
+from starlette.background import BackgroundTask
+from starlette.datastructures import UploadFile
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Mount, Route
+from asgiref.wsgi import WsgiToAsgi
+from flask_login import current_user
+
+from admission_control import AdmissionRejected, admission_for_model
+from flask_app import (
+    app as flask_app, IS_VERCEL, STREAM_HEARTBEAT_SECONDS, SSE_HEADERS, progress_queues,
+    prepare_mcq_upload, mcq_upload_response, parse_stream_upload,
+    stream_preparation_events, stream_result_events, sse_event, cleanup_temp_files
+)
+from mcq_generator import generate_mcq_questions_with_metadata_async
+from request_deadline import RequestDeadline
+
+
+class UploadedFile:
+    """Starlette upload with the filename/save() interface of Werkzeug's FileStorage."""
+
+    def __init__(self, upload):
+        self.filename = upload.filename or ''
+        self._file = upload.file
+
+    def save(self, path):
+        self._file.seek(0)
+        with open(path, 'wb') as destination:
+            shutil.copyfileobj(self._file, destination)
+
+
+def to_starlette_response(flask_response):
+    """Convert a Flask response object into an equivalent Starlette one."""
+    headers = {key: value for key, value in flask_response.headers.items() if key.lower() != 'content-length'}
+    return Response(flask_response.get_data(), status_code=flask_response.status_code, headers=headers)
+
+
+def json_response(body, status=200):
+    """JSON response serialized exactly like Flask's jsonify()."""
+    with flask_app.app_context():
+        response = to_starlette_response(flask_app.json.response(body))
+    response.status_code = status
+    return response
+
+
+def authenticate(request):
+    """
+    Resolve the logged-in user from the Flask session cookie.
+
+    Returns:
+        tuple: (user_id, None) when logged in, otherwise (None, response) with
+        the same 401 JSON / login redirect Flask-Login would send
+    """
+    with flask_app.test_request_context(
+        request.url.path,
+        base_url=f"{request.url.scheme}://{request.url.netloc}",
+        query_string=request.url.query,
+        method=request.method,
+        headers=list(request.headers.items())
+    ):
+        if current_user.is_authenticated:
+            return current_user.id, None
+        return None, to_starlette_response(flask_app.make_response(flask_app.login_manager.unauthorized()))
+
+
+async def read_upload_form(request):
+    """
+    Parse a multipart upload into (form, files) like request.form/request.files.
+
+    Returns:
+        tuple: (form, files), or (None, response) if the body is too large
+    """
+    max_length = flask_app.config.get('MAX_CONTENT_LENGTH')
+    content_length = request.headers.get('content-length')
+    if max_length and content_length and content_length.isdigit() and int(content_length) > max_length:
+        return None, Response('Request Entity Too Large', status_code=413)
+
+    form = await request.form()
+    files = {key: UploadedFile(value) for key, value in form.multi_items() if isinstance(value, UploadFile)}
+    return form, files
+
+
+async def admit_generation_request(model_name, deadline=None):
+    """
+    Async twin of flask_app.admit_generation_request(): queued requests hold no thread.
+
+    Returns:
+        tuple: (admission, None), or (None, response) when the request is turned away
+    """
+    try:
+        admission = await admission_for_model(model_name).acquire_async(
+            timeout=deadline.remaining() if deadline else None)
+    except AdmissionRejected as rejection:
+        print(f"🚦 Request turned away ({rejection.status}): {rejection.message}")
+        response = json_response(rejection.response_body(), rejection.status)
+        response.headers['Retry-After'] = str(rejection.retry_after)
+        return None, response
+    return admission, None
+
+
+async def upload_file(request):
+    """Async twin of flask_app.upload_file()."""
+    # Budget starts when the request arrives, not when generation starts
+    deadline = RequestDeadline.for_request(IS_VERCEL)
+
+    owner, denied = authenticate(request)
+    if denied:
+        return denied
+
+    try:
+        form, files = await read_upload_form(request)
+        if form is None:
+            return files
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+
+    admission, busy = await admit_generation_request(form.get('modelName', 'deepseek/deepseek-chat'), deadline)
+    if busy:
+        return busy
+
+    try:
+        upload, error = await asyncio.to_thread(prepare_mcq_upload, form, files)
+        if error:
+            return json_response(*error)
+
+        try:
+            result = await generate_mcq_questions_with_metadata_async(**upload['generation_args'], deadline=deadline)
+        finally:
+            cleanup_temp_files(upload['temp_path'])
+            cleanup_temp_files(upload['amendment_temp_path'])
+
+        body, status = await asyncio.to_thread(mcq_upload_response, upload, result, owner)
+        return json_response(body, status)
+
+    except Exception as e:
+        return json_response({'error': str(e)}, 500)
+    finally:
+        admission.release()
+
+
+async def upload_stream(request):
+    """Async twin of flask_app.upload_stream(): same events, progress via an asyncio queue."""
+    # Budget starts when the request arrives, not when generation starts
+    deadline = RequestDeadline.for_request(IS_VERCEL)
+
+    owner, denied = authenticate(request)
+    if denied:
+        return denied
+
+    form, files = await read_upload_form(request)
+    if form is None:
+        return files
+
+    admission, busy = await admit_generation_request(form.get('modelName', 'deepseek/deepseek-chat'), deadline)
+    if busy:
+        return busy
+
+    try:
+        upload = await asyncio.to_thread(parse_stream_upload, form, files)
+    except BaseException:
+        admission.release()
+        raise
+    if upload is None:
+        admission.release()
+        return Response(sse_event({'status': 'error', 'message': 'No PDF file provided'}),
+                        media_type='text/event-stream')
+
+    session_id = str(uuid.uuid4())
+    loop = asyncio.get_running_loop()
+    progress_queue = asyncio.Queue()
+    progress_queues.register(session_id, progress_queue)
+
+    def send_progress(message, status='progress', data=None):
+        """Send progress update to the queue (safe from worker threads)."""
+        event_data = {'message': message, 'status': status}
+        if data:
+            event_data.update(data)
+        loop.call_soon_threadsafe(progress_queue.put_nowait, json.dumps(event_data))
+
+    async def generate():
+        """Async generator for the SSE stream."""
+        task = None
+        try:
+            # Extraction and estimation block, so each stage runs in a thread
+            stages = stream_preparation_events(upload)
+            while True:
+                event = await asyncio.to_thread(next, stages, None)
+                if event is None:
+                    break
+                yield sse_event(event)
+            if 'generation_args' not in upload:
+                return
+
+            task = asyncio.ensure_future(generate_mcq_questions_with_metadata_async(
+                **upload['generation_args'],
+                deadline=deadline,
+                progress=lambda message, **details: send_progress(message, data=details)
+            ))
+            task.add_done_callback(lambda _: progress_queue.put_nowait(None))
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(progress_queue.get(), timeout=STREAM_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    # SSE comment: keeps proxies from closing an idle stream
+                    yield ": heartbeat\n\n"
+                    continue
+                if event is None:
+                    break
+                yield f"data: {event}\n\n"
+
+            try:
+                result = task.result()
+            except Exception as e:
+                result = {'error': str(e)}
+
+            for event in await asyncio.to_thread(list, stream_result_events(upload, result, owner)):
+                yield sse_event(event)
+
+        except Exception as e:
+            yield sse_event({'status': 'error', 'message': str(e)})
+        finally:
+            # The client went away while chunks were still being generated:
+            # stop the run instead of paying for it
+            if task is not None and not task.done():
+                print(f"🛑 Stream {session_id[:8]} closed by the client - cancelling generation")
+                task.cancel()
+
+    def close_stream():
+        """Release the slot and the upload however the stream ended, even if it never started."""
+        cleanup_temp_files(upload['temp_path'])
+        cleanup_temp_files(upload['amendment_temp_path'])
+        progress_queues.remove(session_id)
+        admission.release()
+
+    return StreamingResponse(generate(), media_type='text/event-stream', headers=SSE_HEADERS,
+                             background=BackgroundTask(close_stream))
+
+
+app = Starlette(routes=[
+    Route('/upload', upload_file, methods=['POST']),
+    Route('/upload-stream', upload_stream, methods=['POST']),
+    Mount('/', app=WsgiToAsgi(flask_app))
+])
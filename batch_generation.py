@@ -0,0 +1,493 @@
+"""
+Batch-API MCQ generation for bulk, non-interactive runs
+
+Plans every chunk call of every PDF up front, submits them together as one
+JSONL batch job to a provider that offers an OpenAI-compatible /v1/batches
+endpoint, polls until the job finishes and feeds the results through the same
+parsing and metadata path as generate_mcq_questions_with_metadata().
+
+Batch jobs trade latency (results within the 24h completion window) for batch
+pricing and no rate-limit sleeps between chunks.
+
+Usage:
+    python batch_generation.py --provider openai --model gpt-4o-mini \\
+        --questions 20 --output-dir batch_output circulars/*.pdf
+
+    # Offline, against the local mock batch server
+    python mock_batch_server.py --port 8765
+    python batch_generation.py --provider custom --base-url http://127.0.0.1:8765/v1 \\
+        --api-key mock --model mock-model --poll-interval 1 sample.pdf
+
+    # Collect a job submitted earlier (after --timeout or an interrupted run)
+    python batch_generation.py --batch-id batch_abc123 --output-dir batch_output
+
+After submission the planned documents are written to
+<output-dir>/<batch id>.manifest.json (without the API key), so the results of
+a job can still be collected with --batch-id when the run that submitted it
+stopped waiting.
+"""
+
+import os
+import json
+import time
+import argparse
+from types import SimpleNamespace
+
+from mcq_generator import (
+    get_ai_client, extract_generation_input, plan_mcq_chunks, add_question_metadata,
+    build_reference_string, repair_json_response, new_token_usage, record_token_usage,
+    format_token_usage
+)
+from generation_cache import document_hash, get_cached_summary, store_summary
+from prompt_templates import (
+    SUMMARY_SYSTEM_PROMPT, build_mcq_system_prompt, build_mcq_user_prompt,
+    build_summary_prompt, build_prompt_messages
+)
+
+# Providers whose API exposes the OpenAI-compatible Files + Batches endpoints.
+# 'custom' covers self-hosted gateways and mock_batch_server.py.
+BATCH_CAPABLE_PROVIDERS = ('openai', 'custom')
+
+BATCH_ENDPOINT = '/v1/chat/completions'
+BATCH_COMPLETION_WINDOW = '24h'
+BATCH_TERMINAL_STATUSES = ('completed', 'failed', 'expired', 'cancelled')
+DEFAULT_POLL_INTERVAL = 30  # seconds
+
+SUMMARY_REQUEST = 'summary'
+
+# model_config keys stored in a batch manifest; the API key is never written
+MANIFEST_MODEL_CONFIG_KEYS = ('provider', 'model_name', 'custom_base_url', 'book_name', 'chapter_name')
+
+
+def is_batch_available(provider):
+    """Check if a provider offers a batch endpoint."""
+    return provider in BATCH_CAPABLE_PROVIDERS
+
+
+def prepare_batch_documents(pdf_paths, num_questions, model_config):
+    """
+    Extract text from each PDF and plan its chunk calls.
+
+    Args:
+        pdf_paths (list): Paths of the PDFs to process
+        num_questions (int): Questions to generate per PDF
+        model_config (dict): Model configuration
+
+    Returns:
+        list: One dict per PDF with 'doc_id', 'pdf_path' and either
+              'error' or the extraction result plus 'plan' and 'system_prompt'
+    """
+    provider = model_config.get('provider', 'openai')
+    model_name = model_config.get('model_name')
+    source_reference = build_reference_string(
+        {}, model_config.get('book_name', ''), model_config.get('chapter_name', '')
+    )
+
+    documents = []
+    for doc_index, pdf_path in enumerate(pdf_paths):
+        document = {'doc_id': f"doc{doc_index}", 'pdf_path': pdf_path}
+
+        generation_input = extract_generation_input(pdf_path, model_config)
+        if isinstance(generation_input, str):
+            print(f"⚠️  Skipping {pdf_path}: {generation_input}")
+            document['error'] = generation_input
+            documents.append(document)
+            continue
+
+        document.update(generation_input)
+        document['doc_hash'] = document_hash(generation_input['text'])
+        document['cached_summary'] = get_cached_summary(document['doc_hash'])
+        document['plan'] = plan_mcq_chunks(generation_input['text'], num_questions, provider, model_name)
+        document['system_prompt'] = build_mcq_system_prompt(generation_input['use_amendment'], source_reference)
+        documents.append(document)
+
+        print(f"📋 {os.path.basename(pdf_path)}: {len(document['plan'])} chunk call(s) planned")
+
+    return documents
+
+
+def build_batch_requests(documents, model_name, include_summary=True):
+    """
+    Turn the planned chunk calls into batch-job JSONL.
+
+    Each line's custom_id is "<doc_id>:<chunk index>" (or "<doc_id>:summary"),
+    so results can be matched back to their document and chunk.
+
+    Args:
+        documents (list): Documents from prepare_batch_documents()
+        model_name (str): Model to call
+        include_summary (bool): Whether to add a 2-line summary request per PDF
+                                (skipped for PDFs whose summary is already cached)
+
+    Returns:
+        str: JSONL content for the batch input file
+    """
+    def request_line(custom_id, system_prompt, user_prompt, max_tokens, temperature):
+        return json.dumps({
+            'custom_id': custom_id,
+            'method': 'POST',
+            'url': BATCH_ENDPOINT,
+            'body': {
+                'model': model_name,
+                'messages': build_prompt_messages(system_prompt, user_prompt, model_name),
+                'max_tokens': max_tokens,
+                'temperature': temperature
+            }
+        })
+
+    lines = []
+    for document in documents:
+        if 'error' in document:
+            continue
+
+        for call in document['plan']:
+            user_prompt = build_mcq_user_prompt(call['num_questions'], call['text'])
+            lines.append(request_line(f"{document['doc_id']}:{call['index']}",
+                                      document['system_prompt'], user_prompt, 8000, 0.7))
+
+        if include_summary and not document.get('cached_summary'):
+            lines.append(request_line(f"{document['doc_id']}:{SUMMARY_REQUEST}",
+                                      SUMMARY_SYSTEM_PROMPT, build_summary_prompt(document['text']), 200, 0.5))
+
+    return '\n'.join(lines) + '\n'
+
+
+def submit_batch_job(client, jsonl):
+    """Upload the JSONL input file and create the batch job."""
+    batch_file = client.files.create(file=('mcq_batch.jsonl', jsonl.encode('utf-8')), purpose='batch')
+    batch = client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=BATCH_COMPLETION_WINDOW
+    )
+    print(f"📤 Submitted batch job {batch.id} ({jsonl.count(chr(10))} requests)")
+    return batch
+
+
+def wait_for_batch_job(client, batch_id, poll_interval=DEFAULT_POLL_INTERVAL, timeout=None):
+    """
+    Poll a batch job until it reaches a terminal status.
+
+    Args:
+        client: OpenAI-compatible client
+        batch_id (str): Batch job id
+        poll_interval (float): Seconds between status checks
+        timeout (float): Optional maximum seconds to wait
+
+    Returns:
+        Batch: Final batch object
+
+    Raises:
+        TimeoutError: If the job is still running after timeout seconds
+    """
+    start_time = time.time()
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        if counts:
+            print(f"⏳ Batch {batch_id}: {batch.status} ({counts.completed}/{counts.total} done, {counts.failed} failed)")
+        else:
+            print(f"⏳ Batch {batch_id}: {batch.status}")
+
+        if batch.status in BATCH_TERMINAL_STATUSES:
+            return batch
+
+        if timeout is not None and time.time() - start_time > timeout:
+            raise TimeoutError(f"Batch {batch_id} still '{batch.status}' after {timeout} seconds")
+
+        time.sleep(poll_interval)
+
+
+def download_batch_results(client, batch):
+    """
+    Download the output of a finished batch job.
+
+    Expired and cancelled jobs can still have partial output, so the output
+    file is read whenever one exists.
+
+    Returns:
+        dict: custom_id -> chat completion body (dict) for successful requests
+    """
+    results = {}
+    if not batch.output_file_id:
+        return results
+
+    content = client.files.content(batch.output_file_id).text
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        response = item.get('response') or {}
+        if item.get('error') or response.get('status_code') != 200:
+            print(f"⚠️  Batch request {item.get('custom_id')} failed: {item.get('error') or response.get('status_code')}")
+            continue
+        results[item['custom_id']] = response['body']
+
+    return results
+
+
+def record_batch_usage(usage_stats, body):
+    """Record the usage block of a batch result body like a live completion."""
+    usage = body.get('usage')
+    if usage:
+        record_token_usage(usage_stats, SimpleNamespace(usage=SimpleNamespace(**usage)))
+    else:
+        record_token_usage(usage_stats, None)
+
+
+def collect_document_result(document, results, num_questions):
+    """
+    Parse one document's batch results into the generate_mcq_questions_with_metadata() result format.
+
+    Args:
+        document (dict): Document from prepare_batch_documents()
+        results (dict): Output of download_batch_results()
+        num_questions (int): Questions requested per PDF
+
+    Returns:
+        dict: Result with questions, summary and metadata, or {'error': ...}
+    """
+    if 'error' in document:
+        return {'pdf_path': document['pdf_path'], 'error': document['error']}
+
+    usage_stats = new_token_usage()
+    questions = []
+
+    # Stitch chunk results together in document order
+    for call in document['plan']:
+        body = results.get(f"{document['doc_id']}:{call['index']}")
+        if body is None:
+            print(f"⚠️  No result for chunk {call['index'] + 1} of {document['pdf_path']}")
+            continue
+
+        record_batch_usage(usage_stats, body)
+        try:
+            response = body['choices'][0]['message']['content'].strip()
+            chunk_questions = json.loads(repair_json_response(response))
+        except (KeyError, IndexError, json.JSONDecodeError) as parse_error:
+            print(f"⚠️  Could not parse chunk {call['index'] + 1} of {document['pdf_path']}: {parse_error}")
+            continue
+
+        if isinstance(chunk_questions, list):
+            questions.extend(chunk_questions)
+        else:
+            questions.append(chunk_questions)
+
+    questions = questions[:num_questions]
+    if not questions:
+        return {'pdf_path': document['pdf_path'], 'error': 'Batch job returned no questions for this document'}
+
+    pdf_summary = document.get('cached_summary') or "Summary not available"
+    summary_body = results.get(f"{document['doc_id']}:{SUMMARY_REQUEST}")
+    if summary_body:
+        record_batch_usage(usage_stats, summary_body)
+        try:
+            batch_summary = summary_body['choices'][0]['message']['content'].strip()
+        except (KeyError, IndexError, AttributeError) as parse_error:
+            print(f"⚠️  Could not parse the summary of {document['pdf_path']}: {parse_error}")
+            batch_summary = ''
+        if batch_summary:
+            pdf_summary = batch_summary
+            store_summary(document['doc_hash'], pdf_summary, summary_body.get('model'))
+
+    questions, summary, truncation_warnings = add_question_metadata(
+        questions, document['page_map'], document['sections'], document['total_pages']
+    )
+
+    return {
+        'pdf_path': document['pdf_path'],
+        'questions': questions,
+        'summary': summary,
+        'page_map': document['page_map'],
+        'sections': document['sections'],
+        'total_pages': document['total_pages'],
+        'pdf_summary': pdf_summary,
+        'truncation_warnings': truncation_warnings,
+        'token_usage': usage_stats
+    }
+
+
+def manifest_path(manifest_dir, batch_id):
+    """Path of the manifest of a batch job."""
+    return os.path.join(manifest_dir, f"{batch_id}.manifest.json")
+
+
+def save_batch_manifest(manifest_dir, batch_id, documents, num_questions, model_config):
+    """
+    Write what is needed to collect a batch job's results later: its id, the
+    planned documents and the model configuration without the API key.
+
+    Returns:
+        str: Path of the manifest
+    """
+    os.makedirs(manifest_dir, exist_ok=True)
+    path = manifest_path(manifest_dir, batch_id)
+    manifest = {
+        'batch_id': batch_id,
+        'num_questions': num_questions,
+        'model_config': {key: model_config.get(key) for key in MANIFEST_MODEL_CONFIG_KEYS},
+        'documents': documents,
+        'created_at': time.time()
+    }
+    with open(path, 'w', encoding='utf-8') as manifest_file:
+        json.dump(manifest, manifest_file, ensure_ascii=False)
+    return path
+
+
+def load_batch_manifest(manifest_dir, batch_id):
+    """Read the manifest written by save_batch_manifest()."""
+    with open(manifest_path(manifest_dir, batch_id), encoding='utf-8') as manifest_file:
+        return json.load(manifest_file)
+
+
+def collect_batch_results(client, batch_id, documents, num_questions, poll_interval=DEFAULT_POLL_INTERVAL,
+                          timeout=None):
+    """Wait for a submitted batch job, download its output and parse it per document."""
+    results = {}
+    if batch_id:
+        batch = wait_for_batch_job(client, batch_id, poll_interval, timeout)
+        print(f"📥 Batch {batch.id} finished with status '{batch.status}'")
+        results = download_batch_results(client, batch)
+
+    document_results = []
+    for document in documents:
+        result = collect_document_result(document, results, num_questions)
+        if 'token_usage' in result:
+            print(f"{os.path.basename(document['pdf_path'])}: {format_token_usage(result['token_usage'])}")
+        document_results.append(result)
+
+    return document_results
+
+
+def generate_mcq_questions_batch(pdf_paths, num_questions=5, model_config=None,
+                                 poll_interval=DEFAULT_POLL_INTERVAL, timeout=None, include_summary=True,
+                                 manifest_dir=None):
+    """
+    Generate MCQ questions for many PDFs with a single provider batch job.
+
+    Args:
+        pdf_paths (list): Paths of the PDFs to process
+        num_questions (int): Questions to generate per PDF
+        model_config (dict): Model configuration (provider, model_name, custom_api_key,
+                             custom_base_url, book_name, chapter_name)
+        poll_interval (float): Seconds between batch status checks
+        timeout (float): Optional maximum seconds to wait for the batch job
+        include_summary (bool): Whether to generate the 2-line PDF summary in the same job
+        manifest_dir (str): Directory for the job's manifest, so its results can be collected
+                            with resume_mcq_questions_batch() if this call stops waiting
+
+    Returns:
+        list: One result dict per PDF, in input order, shaped like the
+              result of generate_mcq_questions_with_metadata() plus 'pdf_path'
+    """
+    model_config = model_config or {}
+    provider = model_config.get('provider', 'openai')
+    if not is_batch_available(provider):
+        raise ValueError(f"Provider '{provider}' does not offer a batch endpoint. "
+                         f"Supported providers: {', '.join(BATCH_CAPABLE_PROVIDERS)}")
+    if not model_config.get('model_name'):
+        raise ValueError("model_name is required for batch generation")
+
+    client = get_ai_client(provider, model_config.get('custom_api_key'), model_config.get('custom_base_url'))
+
+    documents = prepare_batch_documents(pdf_paths, num_questions, model_config)
+    jsonl = build_batch_requests(documents, model_config['model_name'], include_summary)
+
+    batch_id = None
+    if jsonl.strip():
+        batch_id = submit_batch_job(client, jsonl).id
+        if manifest_dir:
+            path = save_batch_manifest(manifest_dir, batch_id, documents, num_questions, model_config)
+            print(f"🗂️  Manifest saved to {path} - collect later with --batch-id {batch_id}")
+
+    return collect_batch_results(client, batch_id, documents, num_questions, poll_interval, timeout)
+
+
+def resume_mcq_questions_batch(batch_id, manifest_dir, custom_api_key=None, poll_interval=DEFAULT_POLL_INTERVAL,
+                               timeout=None):
+    """
+    Collect the results of a batch job submitted earlier, without submitting again.
+
+    Args:
+        batch_id (str): Id of the submitted job
+        manifest_dir (str): Directory holding its manifest (see save_batch_manifest())
+        custom_api_key (str): API key (custom provider), which manifests do not store
+        poll_interval (float): Seconds between batch status checks
+        timeout (float): Optional maximum seconds to wait for the batch job
+
+    Returns:
+        list: As generate_mcq_questions_batch()
+    """
+    manifest = load_batch_manifest(manifest_dir, batch_id)
+    model_config = manifest['model_config']
+    client = get_ai_client(model_config['provider'], custom_api_key, model_config.get('custom_base_url'))
+    print(f"🔁 Resuming batch {batch_id} ({len(manifest['documents'])} document(s))")
+    return collect_batch_results(client, batch_id, manifest['documents'], manifest['num_questions'],
+                                 poll_interval, timeout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate MCQs for many PDFs with a provider batch job")
+    parser.add_argument('pdfs', nargs='*', help="PDF files to process")
+    parser.add_argument('--provider', default='openai', choices=BATCH_CAPABLE_PROVIDERS)
+    parser.add_argument('--model', help="Model name, e.g. gpt-4o-mini")
+    parser.add_argument('--questions', type=int, default=20, help="Questions per PDF")
+    parser.add_argument('--api-key', default=None, help="API key (custom provider)")
+    parser.add_argument('--base-url', default=None, help="Base URL (custom provider)")
+    parser.add_argument('--book-name', default='')
+    parser.add_argument('--chapter-name', default='')
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL)
+    parser.add_argument('--timeout', type=float, default=None, help="Maximum seconds to wait for the job")
+    parser.add_argument('--no-summary', action='store_true', help="Skip the 2-line PDF summaries")
+    parser.add_argument('--output-dir', default='batch_output')
+    parser.add_argument('--batch-id', default=None,
+                        help="Collect the results of a job submitted earlier (its manifest is read from --output-dir)")
+    args = parser.parse_args()
+    if args.batch_id and args.pdfs:
+        parser.error("--batch-id collects an existing job; do not pass PDFs")
+    if not args.batch_id and not (args.pdfs and args.model):
+        parser.error("PDF files and --model are required unless --batch-id is given")
+
+    model_config = {
+        'provider': args.provider,
+        'model_name': args.model,
+        'custom_api_key': args.api_key,
+        'custom_base_url': args.base_url,
+        'book_name': args.book_name,
+        'chapter_name': args.chapter_name
+    }
+
+    try:
+        if args.batch_id:
+            results = resume_mcq_questions_batch(args.batch_id, args.output_dir, args.api_key,
+                                                 poll_interval=args.poll_interval, timeout=args.timeout)
+        else:
+            results = generate_mcq_questions_batch(
+                args.pdfs, args.questions, model_config,
+                poll_interval=args.poll_interval, timeout=args.timeout, include_summary=not args.no_summary,
+                manifest_dir=args.output_dir
+            )
+    except TimeoutError as e:
+        # The job keeps running at the provider; its manifest allows collecting it later
+        raise SystemExit(f"⏱️  {e} - run again with --batch-id to collect the results")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    used_names = set()
+    for result in results:
+        base_name = os.path.splitext(os.path.basename(result['pdf_path']))[0]
+        name = base_name
+        # PDFs from different folders may share a name
+        suffix = 2
+        while name in used_names:
+            name = f"{base_name}_{suffix}"
+            suffix += 1
+        used_names.add(name)
+        output_path = os.path.join(args.output_dir, f"{name}.json")
+        with open(output_path, 'w', encoding='utf-8') as output_file:
+            json.dump(result, output_file, indent=2, ensure_ascii=False)
+        status = f"error: {result['error']}" if 'error' in result else f"{len(result['questions'])} questions"
+        print(f"💾 {output_path} ({status})")
+
+
+if __name__ == '__main__':
+    main()
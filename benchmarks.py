@@ -0,0 +1,461 @@
+"""
+Performance benchmarks for the local generation pipeline
+
+Usage:
+    python benchmarks.py t5 [--model t5-base] [--sentences 64] [--batch-sizes 1,8,16]
+    python benchmarks.py centrality [--sizes 1000,5000,10000,20000,50000] [--dimension 768]
+    python benchmarks.py backends {t5,sentence-transformer,qa} [--model NAME]
+                                  [--backends pytorch,int8,onnx,onnx-int8] [--sentences 64]
+    python benchmarks.py patterns [--words 1000000]
+    python benchmarks.py startup [--modules flask_app,mcq_generator] [--runs 5] [--max-seconds S]
+
+Every benchmark runs on a fixed sample generated from templates, so results
+are comparable between runs and machines. Local models are loaded through the
+model registry (see model_registry.py) and need the offline dependencies
+(torch, transformers, ...); the centrality benchmark only needs NumPy (and
+scikit-learn for the former N x N baseline). The startup benchmark imports the
+app modules in fresh interpreters and fails when one of them loads a heavy
+package at import time or, with --max-seconds, takes longer than that.
+"""
+
+import os
+import sys
+import json
+import time
+import statistics
+import subprocess
+import tracemalloc
+import argparse
+import itertools
+
+SAMPLE_OFFICES = ["postmaster", "sub-divisional inspector", "head record officer", "treasurer",
+                  "branch postmaster", "divisional superintendent", "system administrator", "mail overseer"]
+SAMPLE_ACTIONS = ["verify the register of insured articles", "submit the daily account",
+                  "inspect the cash balance", "report discrepancies to the divisional office",
+                  "record the receipt of registered letters", "countersign the savings bank journal",
+                  "forward unclaimed articles to the return letter office", "check the stamp stock"]
+SAMPLE_DEADLINES = ["every working day", "within three days", "before the close of business",
+                    "once a month", "at the end of each quarter", "within twenty-four hours"]
+
+
+def sample_sentences(count):
+    """Deterministic sample of rule-like sentences similar to the documents the app processes."""
+    combinations = itertools.cycle(itertools.product(SAMPLE_OFFICES, SAMPLE_ACTIONS, SAMPLE_DEADLINES))
+    return [f"The {office} shall {action} {deadline}." for office, action, deadline in
+            itertools.islice(combinations, count)]
+
+
+def benchmark_t5(model_name, sentence_count, batch_sizes):
+    """
+    Sentences/sec of T5 question generation for each batch size.
+
+    Batch size 1 is the former one-sentence-per-generate() behaviour. The
+    generation options are those of FastMCQGenerator._generate_fast_t5_questions().
+    """
+    from model_registry import shared_t5_model, generate_in_batches
+
+    print(f"📚 Loading {model_name}...")
+    tokenizer, model = shared_t5_model(model_name)
+    prompts = [f"question: {sentence}" for sentence in sample_sentences(sentence_count)]
+    options = dict(max_input_length=256, max_length=32, num_beams=2, early_stopping=True, do_sample=False)
+
+    # Warm-up so one-time initialisation is not timed
+    list(generate_in_batches(tokenizer, model, prompts[:2], batch_size=2, **options))
+
+    results = {}
+    for batch_size in batch_sizes:
+        started = time.perf_counter()
+        outputs = list(generate_in_batches(tokenizer, model, prompts, batch_size=batch_size, **options))
+        elapsed = time.perf_counter() - started
+        results[batch_size] = len(outputs) / elapsed
+        print(f"  batch size {batch_size:>3}: {results[batch_size]:7.2f} sentences/sec ({elapsed:.1f}s)")
+
+    baseline = results.get(1)
+    if baseline:
+        for batch_size, rate in results.items():
+            if batch_size != 1:
+                print(f"⚡ batch size {batch_size}: {rate / baseline:.1f}x the one-at-a-time throughput")
+    return results
+
+
+def _measure(function, *args):
+    """(result, seconds, peak MB of Python/NumPy allocations) of one call."""
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = function(*args)
+        elapsed = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return result, elapsed, peak / (1024 * 1024)
+
+
+def _matrix_centrality(embeddings):
+    """Former centrality: row means of the full N x N cosine similarity matrix."""
+    import numpy as np
+    from sklearn.metrics.pairwise import cosine_similarity
+    return np.mean(cosine_similarity(embeddings), axis=1)
+
+
+def benchmark_centrality(sizes, dimension, max_matrix_size):
+    """
+    Time and peak memory of sentence centrality per document size.
+
+    Random embeddings stand in for MPNet ones (768 dimensions); the N x N
+    baseline is only run up to max_matrix_size sentences, where its ranking
+    of the top 10 sentences is compared with sentence_centrality().
+    """
+    import numpy as np
+    from embedding_index import sentence_centrality
+
+    try:
+        import sklearn.metrics.pairwise  # noqa: F401 - imported up front so the import is not timed
+    except ImportError:
+        pass
+
+    rng = np.random.default_rng(0)
+    for size in sizes:
+        embeddings = rng.standard_normal((size, dimension), dtype=np.float32)
+        scores, elapsed, peak = _measure(sentence_centrality, embeddings)
+        line = f"  {size:>6} sentences: O(N*d) {elapsed * 1000:8.1f} ms, {peak:8.1f} MB peak"
+
+        if size <= max_matrix_size:
+            try:
+                matrix_scores, matrix_elapsed, matrix_peak = _measure(_matrix_centrality, embeddings)
+            except ImportError:
+                matrix_scores = None
+                line += " | N x N baseline needs scikit-learn"
+            except MemoryError:
+                matrix_scores = None
+                line += " | N x N baseline: out of memory"
+            if matrix_scores is not None:
+                same = list(np.argsort(scores)[-10:]) == list(np.argsort(matrix_scores)[-10:])
+                line += (f" | N x N {matrix_elapsed * 1000:8.1f} ms, {matrix_peak:8.1f} MB peak"
+                         f" | top-10 ranking {'identical' if same else 'DIFFERENT'}")
+        else:
+            line += f" | N x N would need {size * size * 4 / (1024 * 1024):,.0f} MB for the matrix alone"
+        print(line)
+
+
+def _token_overlap(first, second):
+    first, second = set(first.lower().split()), set(second.lower().split())
+    return len(first & second) / len(first | second) if first | second else 1.0
+
+
+def _backend_run_t5(model_name, backend, sentences):
+    """(latency s, sentences/sec, outputs) of T5 question generation with one backend."""
+    from model_registry import shared_t5_model, generate_in_batches
+
+    tokenizer, model = shared_t5_model(model_name, backend=backend)
+    prompts = [f"question: {sentence}" for sentence in sentences]
+    options = dict(max_input_length=256, max_length=32, num_beams=2, early_stopping=True, do_sample=False)
+    list(generate_in_batches(tokenizer, model, prompts[:2], batch_size=2, **options))
+
+    started = time.perf_counter()
+    for prompt in prompts[:8]:
+        list(generate_in_batches(tokenizer, model, [prompt], batch_size=1, **options))
+    latency = (time.perf_counter() - started) / min(8, len(prompts))
+
+    started = time.perf_counter()
+    outputs = [text for _, text in generate_in_batches(tokenizer, model, prompts, **options)]
+    return latency, len(prompts) / (time.perf_counter() - started), outputs
+
+
+def _backend_run_sentence_transformer(model_name, backend, sentences):
+    """(latency s, sentences/sec, embeddings) of sentence encoding with one backend."""
+    from model_registry import shared_sentence_transformer
+
+    model = shared_sentence_transformer(model_name, backend=backend)
+    model.encode(sentences[:2])
+
+    started = time.perf_counter()
+    for sentence in sentences[:8]:
+        model.encode([sentence])
+    latency = (time.perf_counter() - started) / min(8, len(sentences))
+
+    started = time.perf_counter()
+    embeddings = model.encode(sentences, batch_size=32)
+    return latency, len(sentences) / (time.perf_counter() - started), embeddings
+
+
+def _backend_run_qa(model_name, backend, sentences):
+    """(latency s, questions/sec, answers) of extractive QA with one backend."""
+    from model_registry import shared_qa_pipeline
+
+    qa_pipeline = shared_qa_pipeline(model_name, backend=backend)
+    questions = [("Who is responsible for this duty?", sentence) for sentence in sentences]
+    qa_pipeline(question=questions[0][0], context=questions[0][1])
+
+    started = time.perf_counter()
+    answers = [qa_pipeline(question=question, context=context)["answer"] for question, context in questions]
+    elapsed = time.perf_counter() - started
+    return elapsed / len(questions), len(questions) / elapsed, answers
+
+
+def benchmark_backends(kind, model_name, backends, sentence_count):
+    """
+    Latency, throughput and quality of the inference backends for one model.
+
+    Quality is measured against the pytorch backend (run first): identical
+    outputs and token overlap for T5, cosine similarity of the embeddings for
+    sentence transformers; QA answers are also checked against the office
+    named in each sample sentence.
+    """
+    import numpy as np
+    from inference_backend import effective_backend
+
+    runners = {'t5': _backend_run_t5, 'sentence-transformer': _backend_run_sentence_transformer,
+               'qa': _backend_run_qa}
+    sentences = sample_sentences(sentence_count)
+    offices = [next(office for office in SAMPLE_OFFICES if f"The {office} " in sentence) for sentence in sentences]
+    backends = ['pytorch'] + [backend for backend in backends if backend != 'pytorch']
+
+    reference = None
+    for backend in backends:
+        if effective_backend(backend) != backend:
+            print(f"  {backend:>10}: not available here, skipped")
+            continue
+        print(f"📚 Loading {model_name} ({backend})...")
+        latency, throughput, outputs = runners[kind](model_name, backend, sentences)
+        line = f"  {backend:>10}: {latency * 1000:8.1f} ms latency, {throughput:7.2f} items/sec"
+
+        if reference is None:
+            reference = outputs
+        elif kind == 't5':
+            identical = sum(a == b for a, b in zip(outputs, reference)) / len(outputs)
+            overlap = sum(_token_overlap(a, b) for a, b in zip(outputs, reference)) / len(outputs)
+            line += f" | {identical:.0%} identical to pytorch, token overlap {overlap:.2f}"
+        elif kind == 'sentence-transformer':
+            outputs, reference_matrix = np.asarray(outputs, dtype=np.float64), np.asarray(reference, dtype=np.float64)
+            cosine = np.sum(outputs * reference_matrix, axis=1) / (
+                np.linalg.norm(outputs, axis=1) * np.linalg.norm(reference_matrix, axis=1))
+            line += f" | cosine to pytorch: mean {cosine.mean():.4f}, min {cosine.min():.4f}"
+        else:
+            agreement = sum(a.strip() == b.strip() for a, b in zip(outputs, reference)) / len(outputs)
+            line += f" | {agreement:.0%} same answers as pytorch"
+
+        if kind == 'qa':
+            accuracy = sum(office in answer.lower() for office, answer in zip(offices, outputs)) / len(outputs)
+            line += f" | accuracy {accuracy:.0%}"
+        print(line)
+
+
+# Packages the web app must not import at start-up; they load on first use
+STARTUP_DEFERRED_MODULES = ('torch', 'transformers', 'sentence_transformers', 'spacy', 'nltk', 'sklearn',
+                            'pandas', 'fpdf', 'openai')
+
+_STARTUP_PROBE = """
+import sys, json, time
+started = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - started
+print(json.dumps({{'seconds': elapsed, 'loaded': [name for name in {deferred!r} if name in sys.modules]}}))
+"""
+
+
+def _import_profile(module):
+    """(name, seconds) of the modules module imports directly, by cumulative -X importtime, largest first."""
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', f"import {module}"],
+                               capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    imports = []
+    for line in completed.stderr.splitlines():
+        fields = line.split('|')
+        if not line.startswith('import time:') or len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        # Nesting is shown as two spaces per level; level 1 = imported by module itself
+        name = fields[2].rstrip()
+        if (len(name) - len(name.lstrip()) - 1) // 2 == 1:
+            imports.append((name.strip(), int(fields[1]) / 1e6))
+    return sorted(imports, key=lambda item: -item[1])
+
+
+def benchmark_startup(modules, runs, max_seconds=None):
+    """
+    Cold import time of the app modules, each in fresh interpreters.
+
+    Returns:
+        bool: True when no module loaded a STARTUP_DEFERRED_MODULES package and
+        every median import time is within max_seconds
+    """
+    passed = True
+    for module in modules:
+        timings, loaded = [], set()
+        for _ in range(runs):
+            probe = _STARTUP_PROBE.format(module=module, deferred=STARTUP_DEFERRED_MODULES)
+            completed = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__)))
+            if completed.returncode != 0:
+                print(f"  {module:>16}: import failed\n{completed.stderr.strip()}")
+                passed = False
+                break
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            timings.append(result['seconds'])
+            loaded.update(result['loaded'])
+        if not timings:
+            continue
+
+        median = statistics.median(timings)
+        line = f"  {module:>16}: median {median * 1000:7.1f} ms, min {min(timings) * 1000:7.1f} ms over {runs} runs"
+        if loaded:
+            line += f" | ❌ imported at start-up: {', '.join(sorted(loaded))}"
+            passed = False
+        if max_seconds is not None and median > max_seconds:
+            line += f" | ❌ over {max_seconds:.2f} s"
+            passed = False
+        print(line)
+        heaviest = ', '.join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in _import_profile(module)[:5])
+        print(f"  {'':>16}  heaviest imports: {heaviest}")
+    return passed
+
+
+# Sentence shapes the mining patterns look for, mixed with plain rule sentences
+SAMPLE_PATTERN_TEMPLATES = [
+    "The {Office} is the officer responsible to {action} {deadline}.",
+    "The Savings Bank Scheme was founded by the {office} in {year} to {action}.",
+    "A Registered Article refers to an article which the {office} must {action} {deadline}.",
+    "The Return Letter Office includes a section where the {office} can {action}.",
+    "The process of Account Closing requires the {office} to {action} {deadline}.",
+    "The {Office} represents the division when asked to {action} {deadline}.",
+]
+
+
+def sample_pattern_sentences(word_count):
+    """Deterministic corpus of about word_count words for the pattern engine benchmark."""
+    rules = itertools.cycle(sample_sentences(len(SAMPLE_OFFICES) * len(SAMPLE_ACTIONS) * len(SAMPLE_DEADLINES)))
+    shapes = itertools.cycle(itertools.product(SAMPLE_PATTERN_TEMPLATES, SAMPLE_OFFICES, SAMPLE_ACTIONS))
+    sentences, words = [], 0
+    for number in itertools.count():
+        if number % 2:
+            template, office, action = next(shapes)
+            sentence = template.format(Office=office.title(), office=office, action=action,
+                                       deadline=SAMPLE_DEADLINES[number % len(SAMPLE_DEADLINES)],
+                                       year=1850 + number % 150)
+        else:
+            sentence = next(rules)
+        sentences.append(sentence)
+        words += len(sentence.split())
+        if words >= word_count:
+            return sentences
+
+
+def _per_pattern_mining(sentences):
+    """The former mining: every pattern of every generator re.search()ed on its own."""
+    import re
+    from pattern_engine import MINING_PATTERNS
+
+    results = []
+    for sentence in sentences:
+        found = []
+        for source, patterns in MINING_PATTERNS.items():
+            for position, (tag, pattern, _) in enumerate(patterns):
+                match = re.search(pattern, sentence, re.IGNORECASE)
+                if match:
+                    found.append((source, position, match.span(), match.groups()))
+        results.append(found)
+    return results
+
+
+def benchmark_patterns(word_count):
+    """
+    Sentence mining with the pattern engine against per-pattern re.search(), on one corpus.
+
+    Both run every generator's patterns; the match records must be identical.
+    """
+    from pattern_engine import MINING_PATTERNS, mine_sentences
+
+    sentences = sample_pattern_sentences(word_count)
+    words = sum(len(sentence.split()) for sentence in sentences)
+    print(f"📄 Corpus: {len(sentences)} sentences, {words} words")
+
+    started = time.perf_counter()
+    baseline = _per_pattern_mining(sentences)
+    baseline_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    mined = mine_sentences(sentences)
+    engine_seconds = time.perf_counter() - started
+
+    # The engine numbers patterns per tag; the baseline by position in the source
+    positions = {}
+    for source, source_patterns in MINING_PATTERNS.items():
+        tag_counts = {}
+        for position, (tag, _, _) in enumerate(source_patterns):
+            tag_counts[tag] = tag_counts.get(tag, -1) + 1
+            positions[source, tag, tag_counts[tag]] = position
+    engine_results = [[(match.source, positions[match.source, match.tag, match.index], match.match.span(),
+                        match.match.groups()) for match in patterns.matches] for patterns in mined]
+    identical = engine_results == baseline
+    records = sum(len(patterns.matches) for patterns in mined)
+
+    for label, seconds in (('per-pattern re.search', baseline_seconds), ('pattern engine', engine_seconds)):
+        print(f"  {label:>22}: {seconds:7.2f} s, {words / seconds:>11,.0f} words/sec")
+    print(f"  {'speed-up':>22}: {baseline_seconds / engine_seconds:.1f}x | {records} match records, "
+          f"{'identical' if identical else 'DIFFERENT'} to per-pattern matching")
+    return identical
+
+
+def _int_list(value):
+    return [int(item) for item in value.split(',') if item.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    t5 = commands.add_parser('t5', help='T5 question generation throughput per batch size')
+    t5.add_argument('--model', default='t5-base', help='T5 checkpoint (default: t5-base, as in fast mode)')
+    t5.add_argument('--sentences', type=int, default=64, help='Sample size (default: 64)')
+    t5.add_argument('--batch-sizes', type=_int_list, default=[1, 8, 16],
+                    help='Comma-separated batch sizes; 1 is the unbatched baseline (default: 1,8,16)')
+
+    centrality = commands.add_parser('centrality', help='Sentence centrality time and memory per document size')
+    centrality.add_argument('--sizes', type=_int_list, default=[1000, 5000, 10000, 20000, 50000],
+                            help='Comma-separated sentence counts (default: 1000,5000,10000,20000,50000)')
+    centrality.add_argument('--dimension', type=int, default=768,
+                            help='Embedding dimension (default: 768, as all-mpnet-base-v2)')
+    centrality.add_argument('--max-matrix-size', type=int, default=10000,
+                            help='Largest size the N x N baseline is run for (default: 10000)')
+
+    backends = commands.add_parser('backends', help='Inference backends compared on one model')
+    backends.add_argument('kind', choices=['t5', 'sentence-transformer', 'qa'], help='Model kind')
+    backends.add_argument('--model', help='Model name (default: t5-base, all-mpnet-base-v2, '
+                                          'deepset/roberta-base-squad2 per kind)')
+    backends.add_argument('--backends', type=lambda value: [item.strip() for item in value.split(',') if item.strip()],
+                          default=['pytorch', 'int8', 'onnx', 'onnx-int8'],
+                          help='Comma-separated backends; pytorch is always run as the reference')
+    backends.add_argument('--sentences', type=int, default=64, help='Sample size (default: 64)')
+
+    patterns = commands.add_parser('patterns', help='Single-pass pattern engine against per-pattern matching')
+    patterns.add_argument('--words', type=int, default=1000000, help='Corpus size in words (default: 1000000)')
+
+    startup = commands.add_parser('startup', help='Cold-start import time of the app modules')
+    startup.add_argument('--modules', type=lambda value: [item.strip() for item in value.split(',') if item.strip()],
+                         default=['mcq_generator', 'flask_app'],
+                         help='Comma-separated modules to import (default: mcq_generator,flask_app)')
+    startup.add_argument('--runs', type=int, default=5, help='Fresh interpreters per module (default: 5)')
+    startup.add_argument('--max-seconds', type=float,
+                         help='Fail when a median import time is above this (default: no limit)')
+
+    args = parser.parse_args(argv)
+    if args.command == 'startup':
+        return 0 if benchmark_startup(args.modules, args.runs, args.max_seconds) else 1
+    if args.command == 'patterns':
+        return 0 if benchmark_patterns(args.words) else 1
+    try:
+        if args.command == 't5':
+            benchmark_t5(args.model, args.sentences, args.batch_sizes)
+        elif args.command == 'centrality':
+            benchmark_centrality(args.sizes, args.dimension, args.max_matrix_size)
+        elif args.command == 'backends':
+            default_models = {'t5': 't5-base', 'sentence-transformer': 'all-mpnet-base-v2',
+                              'qa': 'deepset/roberta-base-squad2'}
+            benchmark_backends(args.kind, args.model or default_models[args.kind], args.backends, args.sentences)
+    except ImportError as e:
+        print(f"❌ Benchmark needs the offline dependencies: {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,407 @@
+"""
+Library-wide distractor index across all processed documents
+
+Distractors used to come only from the current document's entities, or from
+hard-coded fallbacks ("Java / C++ / JavaScript" on postal-rules questions).
+The local generators now add the terms and phrases of every document they
+process (entities, short noun chunks) to a persistent embedding index, and
+ask it for the library terms closest to an answer before falling back.
+
+Storage, one directory per sentence-transformer model:
+
+    meta.json        model, dimension, number of rows, IVF training size
+    vectors.f32      row-normalized float32 embeddings, memory-mapped for queries
+    terms.txt        one term per row
+    assignments.i32  IVF list of every row
+    centroids.npy    IVF centroids
+
+The files are append-only, so new PDFs are added incrementally; meta.json is
+replaced last and atomically and is the source of truth for the row count, so
+readers (other workers included) never see a half-written row.
+
+Nearest neighbours are found with an inverted file (IVF) index in pure NumPy:
+rows are grouped by their nearest k-means centroid, and a query scores only
+the rows of its DISTRACTOR_LIBRARY_NPROBE closest lists. Until the library
+reaches LIBRARY_TRAIN_MIN rows it is searched exhaustively; it is re-trained
+whenever it has grown four-fold since the last training.
+
+Training runs on a background thread, outside the file lock: adding a
+document's terms only appends its rows and assigns them to the current
+centroids. The new centroids and assignments are swapped in under the lock
+once trained; rows appended meanwhile are assigned to them then.
+
+Configuration:
+    DISTRACTOR_LIBRARY_DIR     Index directory (default: cache/distractor_library,
+                               or the system temp directory on Vercel)
+    DISTRACTOR_LIBRARY_NPROBE  IVF lists scanned per query (default: 8)
+"""
+
+import os
+import re
+import json
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from embedding_index import encode_normalized, top_k_indices
+
+try:
+    import fcntl
+except ImportError:  # Windows: only threads of one process are serialized
+    fcntl = None
+
+if os.environ.get('VERCEL'):
+    _DEFAULT_LIBRARY_DIR = os.path.join(tempfile.gettempdir(), 'distractor_library')
+else:
+    _DEFAULT_LIBRARY_DIR = os.path.join('cache', 'distractor_library')
+
+LIBRARY_DIR = os.environ.get('DISTRACTOR_LIBRARY_DIR', _DEFAULT_LIBRARY_DIR)
+LIBRARY_NPROBE = int(os.environ.get('DISTRACTOR_LIBRARY_NPROBE', 8))
+
+# Rows before the IVF index is trained; smaller libraries are searched exhaustively
+LIBRARY_TRAIN_MIN = 1024
+
+# Rows sampled for k-means training, and k-means iterations
+_TRAIN_SAMPLE = 20000
+_TRAIN_ITERATIONS = 10
+
+# Rows scored at once when (re)assigning rows to lists
+_ASSIGN_CHUNK = 65536
+
+# Library terms this similar to the answer are paraphrases of it, not distractors
+MAX_DISTRACTOR_SIMILARITY = 0.92
+
+_LEADING_ARTICLE = re.compile(r'^(?:the|a|an)\s+', re.IGNORECASE)
+
+
+def clean_term(term):
+    """Normalize a term for the library, or return None if it makes a poor option."""
+    term = _LEADING_ARTICLE.sub('', ' '.join(term.split())).strip(' .,;:()[]"\'')
+    if not (2 < len(term) < 50) or len(term.split()) > 6 or not re.search(r'[A-Za-z]', term):
+        return None
+    return term
+
+
+def _normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def _train_centroids(vectors, list_count):
+    """Spherical k-means over (a sample of) normalized vectors."""
+    rng = np.random.default_rng(0)
+    if len(vectors) > _TRAIN_SAMPLE:
+        vectors = vectors[np.sort(rng.choice(len(vectors), _TRAIN_SAMPLE, replace=False))]
+    vectors = np.asarray(vectors, dtype=np.float32)
+    centroids = vectors[rng.choice(len(vectors), list_count, replace=False)].copy()
+    for _ in range(_TRAIN_ITERATIONS):
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        empty = ~sums.any(axis=1)
+        sums[empty] = centroids[empty]  # keep centroids that lost all their rows
+        centroids = _normalize_rows(sums).astype(np.float32)
+    return centroids
+
+
+def _assign(vectors, centroids):
+    """Nearest centroid of every row, in chunks to bound memory."""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), _ASSIGN_CHUNK):
+        chunk = np.asarray(vectors[start:start + _ASSIGN_CHUNK], dtype=np.float32)
+        assignments[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+class DistractorLibrary:
+    """Persistent, incrementally updated nearest-neighbour index of library terms for one model."""
+
+    def __init__(self, model_key, directory):
+        self.model_key = model_key
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._meta_version = None
+        self._training = None  # background training thread, while it runs
+        self._reset()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _reset(self):
+        self.count = 0
+        self.dimension = None
+        self.trained_count = 0
+        self._vectors = None
+        self._terms = []
+        self._known = set()
+        self._centroids = None
+        self._list_rows = None
+        self._list_bounds = None
+
+    def _read_meta(self):
+        try:
+            with open(self._path('meta.json')) as meta_file:
+                return json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+
+    def _refresh(self):
+        """(Re)load the index when meta.json changed, e.g. after another worker added rows."""
+        try:
+            stat = os.stat(self._path('meta.json'))
+            version = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            version = None
+        if version == self._meta_version:
+            return
+        self._meta_version = version
+        self._reset()
+
+        meta = self._read_meta()
+        if not meta or not meta.get('count'):
+            return
+        self.count = meta['count']
+        self.dimension = meta['dimension']
+        self.trained_count = meta.get('trained_count', 0)
+        self._vectors = np.memmap(self._path('vectors.f32'), dtype=np.float32, mode='r',
+                                  shape=(self.count, self.dimension))
+        with open(self._path('terms.txt'), encoding='utf-8') as terms_file:
+            self._terms = [line.rstrip('\n') for _, line in zip(range(self.count), terms_file)]
+        self._known = {term.lower() for term in self._terms}
+
+        if self.trained_count:
+            self._centroids = np.load(self._path('centroids.npy'))
+            assignments = np.fromfile(self._path('assignments.i32'), dtype=np.int32, count=self.count)
+            self._list_rows = np.argsort(assignments, kind='stable')
+            self._list_bounds = np.searchsorted(assignments[self._list_rows],
+                                                np.arange(len(self._centroids) + 1))
+
+    def add(self, terms, vectors):
+        """
+        Append terms that are not in the library yet.
+
+        Args:
+            terms (List[str]): Cleaned terms (see clean_term())
+            vectors (np.ndarray): Their normalized embeddings, one row per term
+
+        Returns:
+            int: Number of terms added
+        """
+        with self._lock:
+            with self._file_lock():
+                self._refresh()
+                added = self._append(terms, np.asarray(vectors, dtype=np.float32))
+            if self.needs_training():
+                self._start_training()
+            return added
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock on the index files across processes; caller holds self._lock."""
+        os.makedirs(self.directory, exist_ok=True)
+        with open(self._path('lock'), 'a') as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def needs_training(self):
+        """Whether the library reached LIBRARY_TRAIN_MIN rows or grew four-fold since the last training."""
+        return self.count >= LIBRARY_TRAIN_MIN and (not self.trained_count or self.count >= 4 * self.trained_count)
+
+    def _start_training(self):
+        """Train the IVF index on a background thread, unless a training is running; caller holds self._lock."""
+        if self._training is not None and self._training.is_alive():
+            return
+        self._training = threading.Thread(target=self._train, args=(self.count, self.dimension),
+                                          name=f"distractor-library-train-{self.model_key}", daemon=True)
+        self._training.start()
+
+    def _train(self, count, dimension):
+        """Train centroids on the first count rows without holding a lock, then swap them in."""
+        try:
+            vectors = np.memmap(self._path('vectors.f32'), dtype=np.float32, mode='r', shape=(count, dimension))
+            list_count = min(1024, max(8, int(np.sqrt(count))))
+            centroids = _train_centroids(vectors, list_count)
+            assignments = _assign(vectors, centroids)
+            with self._lock:
+                with self._file_lock():
+                    self._refresh()
+                    if self.dimension != dimension or self.trained_count >= count:
+                        return  # another worker trained a newer index meanwhile
+                    # Rows appended while training get their list now
+                    appended = np.memmap(self._path('vectors.f32'), dtype=np.float32, mode='r',
+                                         shape=(self.count, dimension))[count:]
+                    assignments = np.concatenate([assignments, _assign(appended, centroids)])
+                    self._swap_index(centroids, assignments, count)
+            print(f"📚 Distractor library ({self.model_key}) indexed: {count} terms in {list_count} lists")
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not train the distractor library index: {e}")
+
+    def _swap_index(self, centroids, assignments, trained_count):
+        """Replace centroids, assignments and meta.json; caller holds the file lock."""
+        with open(self._path('centroids.npy.tmp'), 'wb') as centroids_file:
+            np.save(centroids_file, centroids)
+        os.replace(self._path('centroids.npy.tmp'), self._path('centroids.npy'))
+        assignments.astype(np.int32).tofile(self._path('assignments.i32.tmp'))
+        os.replace(self._path('assignments.i32.tmp'), self._path('assignments.i32'))
+        self._write_meta(self.dimension, self.count, trained_count)
+
+    def _write_meta(self, dimension, count, trained_count):
+        meta = {'model': self.model_key, 'dimension': dimension, 'count': count, 'trained_count': trained_count}
+        with open(self._path('meta.json.tmp'), 'w') as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(self._path('meta.json.tmp'), self._path('meta.json'))
+        self._refresh()
+
+    def _append(self, terms, vectors):
+        """Append rows and assign them to the current IVF lists; caller holds the file lock."""
+        if self.dimension is not None and vectors.shape[1] != self.dimension:
+            raise ValueError(f"Expected {self.dimension}-dimensional embeddings, got {vectors.shape[1]}")
+
+        new_rows = []
+        for term, vector in zip(terms, vectors):
+            if term.lower() not in self._known:
+                self._known.add(term.lower())
+                new_rows.append((term, vector))
+        if not new_rows:
+            return 0
+
+        new_terms = [term for term, _ in new_rows]
+        new_vectors = np.vstack([vector for _, vector in new_rows])
+        dimension = new_vectors.shape[1]
+        count = self.count + len(new_rows)
+
+        # Drop the tail of an append that crashed before meta.json was written
+        row_bytes = dimension * 4
+        for name, size in (('vectors.f32', self.count * row_bytes), ('assignments.i32', self.count * 4)):
+            if os.path.exists(self._path(name)) and os.path.getsize(self._path(name)) > size:
+                os.truncate(self._path(name), size)
+        if os.path.exists(self._path('terms.txt')) and self.count != self._count_lines('terms.txt'):
+            with open(self._path('terms.txt'), 'w', encoding='utf-8') as terms_file:
+                terms_file.writelines(f"{term}\n" for term in self._terms)
+
+        with open(self._path('vectors.f32'), 'ab') as vectors_file:
+            vectors_file.write(new_vectors.tobytes())
+        with open(self._path('terms.txt'), 'a', encoding='utf-8') as terms_file:
+            terms_file.writelines(f"{term}\n" for term in new_terms)
+
+        # (Re)training is left to _start_training(); until then new rows join the current lists
+        if self.trained_count:
+            with open(self._path('assignments.i32'), 'ab') as assignments_file:
+                assignments_file.write(_assign(new_vectors, self._centroids).tobytes())
+
+        self._write_meta(dimension, count, self.trained_count)
+        return len(new_rows)
+
+    def _count_lines(self, name):
+        with open(self._path(name), 'rb') as text_file:
+            return sum(1 for _ in text_file)
+
+    def _candidate_rows(self, query):
+        """Rows of the query's closest IVF lists in file order, or None to scan every row."""
+        if self._centroids is None:
+            return None
+        nprobe = min(LIBRARY_NPROBE, len(self._centroids))
+        lists = top_k_indices((query @ self._centroids.T)[None, :], nprobe)[0]
+        return np.sort(np.concatenate([self._list_rows[self._list_bounds[i]:self._list_bounds[i + 1]]
+                                       for i in lists]))
+
+    def nearest(self, queries, k, exclude=(), max_similarity=MAX_DISTRACTOR_SIMILARITY):
+        """
+        The k library terms closest to each query vector.
+
+        Args:
+            queries (np.ndarray): Normalized query embeddings, one row per query
+            k (int): Terms per query
+            exclude (List[str]): Per query, a term to leave out (case-insensitive)
+            max_similarity (float): Terms more similar than this are left out as paraphrases
+
+        Returns:
+            List[List[str]]: Per query, up to k terms, closest first
+        """
+        with self._lock:
+            self._refresh()
+            if not self.count or self.dimension != queries.shape[1]:
+                return [[] for _ in queries]
+
+            results = []
+            for row, query in enumerate(queries):
+                rows = self._candidate_rows(query)
+                candidates = self._vectors if rows is None else self._vectors[rows]
+                scores = np.asarray(candidates @ query)
+                scores[scores > max_similarity] = -np.inf
+                excluded = exclude[row].lower() if row < len(exclude) else None
+
+                terms = []
+                for index in top_k_indices(scores[None, :], k + 4)[0]:
+                    term = self._terms[index if rows is None else rows[index]]
+                    if scores[index] != -np.inf and term.lower() != excluded:
+                        terms.append(term)
+                    if len(terms) == k:
+                        break
+                results.append(terms)
+            return results
+
+    def stats(self):
+        with self._lock:
+            self._refresh()
+            return {'model': self.model_key, 'terms': self.count, 'dimension': self.dimension,
+                    'lists': len(self._centroids) if self._centroids is not None else 0,
+                    'trained_count': self.trained_count}
+
+
+_libraries = {}
+_libraries_lock = threading.Lock()
+
+
+def distractor_library(model_key):
+    """The process-wide library of a sentence-transformer model."""
+    with _libraries_lock:
+        if model_key not in _libraries:
+            directory = os.path.join(LIBRARY_DIR, re.sub(r'[^A-Za-z0-9._-]+', '_', model_key))
+            _libraries[model_key] = DistractorLibrary(model_key, directory)
+        return _libraries[model_key]
+
+
+def index_document_terms(model, model_key, terms):
+    """
+    Add a processed document's terms and phrases to the library.
+
+    Args:
+        model: SentenceTransformer that embeds the terms
+        model_key (str): Name of the model
+        terms (List[str]): Entities, noun chunks, ... of the document
+    """
+    cleaned = list(dict.fromkeys(term for term in map(clean_term, terms) if term))
+    if not cleaned:
+        return 0
+    try:
+        added = distractor_library(model_key).add(cleaned, encode_normalized(model, cleaned, model_key))
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Could not update the distractor library: {e}")
+        return 0
+    if added:
+        print(f"📚 Added {added} terms to the distractor library")
+    return added
+
+
+def library_distractors(model, model_key, answers, k=3):
+    """
+    Library terms closest to each answer, for all answers in one encode() call.
+
+    Returns:
+        List[List[str]]: Per answer, up to k terms, closest first
+    """
+    if not answers:
+        return []
+    try:
+        return distractor_library(model_key).nearest(encode_normalized(model, answers, model_key), k, answers)
+    except (OSError, ValueError) as e:
+        print(f"⚠️ Distractor library unavailable: {e}")
+        return [[] for _ in answers]
@@ -0,0 +1,143 @@
+"""
+Per-document NLP analysis shared by answer and distractor generation
+
+The local generators used to run spaCy again for every candidate question: a
+full parse of the document for each question's distractors and another parse
+of every answer sentence, i.e. 50 full parses for 50 questions over a 100-page
+text. DocumentAnalysis parses a document once, sentence by sentence through
+nlp.pipe() with the pipeline components nobody reads (lemmatizer, text
+categorizers, ...) disabled, and keeps what answer and distractor code asks for:
+
+    entities          (text, label) pairs in document order
+    unique_entities   entity texts without repeats, in document order
+    entities_by_label label -> unique entity texts, for O(1) candidate lookup
+    noun_chunks       noun chunk spans (text, root POS, ...)
+    tokens_by_pos     POS tag -> unique token texts
+
+A DocumentAnalysis is shared through analysis_cache and is read-only once
+built. Text that is not one of the document's sentences (an extracted answer,
+a longer QA context) is parsed on first use and memoized by a DocumentView,
+which a generator creates for its run, so the shared analysis and its cached
+size do not change.
+"""
+
+# Pipeline components whose output the analysis reads; the others are disabled
+ANALYSIS_COMPONENTS = {
+    "tok2vec", "transformer", "tagger", "morphologizer", "attribute_ruler", "parser", "senter", "ner"
+}
+
+# Sentences handed to the pipeline per batch
+PIPE_BATCH_SIZE = 64
+
+
+class DocumentAnalysis:
+    """spaCy analysis of one document, computed once and queried by every question."""
+
+    def __init__(self, nlp, sentences, batch_size=PIPE_BATCH_SIZE):
+        """
+        Parse the document.
+
+        Args:
+            nlp: Loaded spaCy pipeline
+            sentences (List[str]): The document's sentences
+            batch_size (int): Sentences per nlp.pipe() batch
+        """
+        self.nlp = nlp
+        self.disabled = [name for name in nlp.pipe_names if name not in ANALYSIS_COMPONENTS]
+        self.sentences = [sentence for sentence in sentences if sentence.strip()]
+        with nlp.select_pipes(disable=self.disabled):
+            self.docs = list(nlp.pipe(self.sentences, batch_size=batch_size))
+        self._docs_by_text = dict(zip(self.sentences, self.docs))
+
+        self.entities = []
+        self.unique_entities = []
+        self.entities_by_label = {}
+        self._entity_labels = {}
+        self.noun_chunks = []
+        self.tokens_by_pos = {}
+        seen_tokens = set()
+
+        for doc in self.docs:
+            for ent in doc.ents:
+                self.entities.append((ent.text, ent.label_))
+                key = ent.text.lower()
+                if key not in self._entity_labels:
+                    self._entity_labels[key] = ent.label_
+                    self.unique_entities.append(ent.text)
+                    self.entities_by_label.setdefault(ent.label_, []).append(ent.text)
+            self.noun_chunks.extend(doc.noun_chunks)
+            for token in doc:
+                if (token.pos_, token.text) not in seen_tokens:
+                    seen_tokens.add((token.pos_, token.text))
+                    self.tokens_by_pos.setdefault(token.pos_, []).append(token.text)
+
+    def doc(self, text):
+        """
+        Parsed doc of a text: one of the document's sentences, else a new parse
+        (not kept; use a DocumentView to memoize).
+        """
+        doc = self._docs_by_text.get(text)
+        if doc is None:
+            doc = self.parse(text)
+        return doc
+
+    def parse(self, text):
+        """Parse a text with the analysis pipeline."""
+        with self.nlp.select_pipes(disable=self.disabled):
+            return self.nlp(text)
+
+    def label_of(self, text):
+        """
+        Entity label of a text: its label in the document, else the label
+        of the first entity found in it, else None.
+        """
+        label = self._entity_labels.get(text.lower())
+        if label is None:
+            ents = self.doc(text).ents
+            label = ents[0].label_ if ents else None
+        return label
+
+    def entity_candidates(self, answer):
+        """
+        Entities that could stand in for the answer: entities with the
+        answer's label first, then those of the other labels.
+
+        Args:
+            answer (str): The correct answer, which is left out
+
+        Returns:
+            List[str]: Unique entity texts, in document order within each group
+        """
+        label = self.label_of(answer)
+        same_label = self.entities_by_label.get(label, []) if label else []
+        others = [text for text in self.unique_entities if self._entity_labels[text.lower()] != label]
+        answer_lower = answer.lower()
+        return [text for text in same_label + others if text.lower() != answer_lower]
+
+
+class DocumentView:
+    """
+    One run's access to a shared DocumentAnalysis. Texts that are not
+    document sentences are parsed once and memoized here, so the shared
+    analysis stays read-only; other attributes are read from it.
+    """
+
+    def __init__(self, analysis):
+        self.analysis = analysis
+        self._parsed = {}
+
+    def __getattr__(self, name):
+        if name == 'analysis':  # not set yet, e.g. while unpickling
+            raise AttributeError(name)
+        return getattr(self.analysis, name)
+
+    def doc(self, text):
+        """Parsed doc of a text: one of the document's sentences, or parsed once per run."""
+        doc = self.analysis._docs_by_text.get(text) or self._parsed.get(text)
+        if doc is None:
+            doc = self._parsed[text] = self.analysis.parse(text)
+        return doc
+
+    # Same lookups as the analysis, but parsing through this view's memo
+    label_of = DocumentAnalysis.label_of
+    entity_candidates = DocumentAnalysis.entity_candidates
@@ -0,0 +1,216 @@
+"""
+Normalized embedding matrices with vectorized top-k similarity search
+
+Distractor generation used to call sentence_model.encode() on the full entity
+list of the document for every question and run a full np.argsort over the
+similarities. An EmbeddingIndex encodes a document's unique texts once into a
+row-normalized float32 matrix; a batch of queries is then answered with one
+matrix product (cosine similarity) and np.argpartition, which selects the k
+best rows without sorting all of them.
+
+sentence_centrality() ranks sentences by their mean similarity to the rest of
+the document in O(N*d), without building the N x N similarity matrix.
+
+Embeddings are cached process-wide by model and SHA-1 of the text, so texts
+that come back in later requests (the same PDF, recurring names and terms)
+are not encoded again. The cache keeps the most recently used vectors.
+
+Configuration:
+    EMBEDDING_CACHE_SIZE   Embeddings kept in the process-wide cache (default: 10000)
+"""
+
+import os
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+EMBEDDING_CACHE_SIZE = int(os.environ.get('EMBEDDING_CACHE_SIZE', 10000))
+
+# Added to the scores of preferred texts; larger than any gap between two cosine similarities
+PREFERRED_SCORE_OFFSET = 4.0
+
+
+class EmbeddingCache:
+    """Thread-safe LRU of normalized embedding vectors keyed by (model, text hash)."""
+
+    def __init__(self, max_entries=EMBEDDING_CACHE_SIZE):
+        self.max_entries = max(0, max_entries)
+        self._vectors = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(model_key, text):
+        return model_key, hashlib.sha1(text.encode('utf-8')).digest()
+
+    def get(self, key):
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._vectors.move_to_end(key)
+            return vector
+
+    def put(self, key, vector):
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._vectors[key] = vector
+            self._vectors.move_to_end(key)
+            while len(self._vectors) > self.max_entries:
+                self._vectors.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._vectors), 'max_entries': self.max_entries,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+embedding_cache = EmbeddingCache()
+
+
+def encode_normalized(model, texts, model_key):
+    """
+    Embeddings of texts as a row-normalized float32 matrix, through the cache.
+
+    Only the texts missing from the cache are encoded, in one encode() call.
+
+    Args:
+        model: SentenceTransformer (anything with encode(list) -> array)
+        texts (List[str]): Texts to embed
+        model_key (str): Name of the model, part of the cache key
+
+    Returns:
+        np.ndarray: Matrix of shape (len(texts), dimension)
+    """
+    keys = [EmbeddingCache.key(model_key, text) for text in texts]
+    vectors = [embedding_cache.get(key) for key in keys]
+
+    missing = [index for index, vector in enumerate(vectors) if vector is None]
+    if missing:
+        encoded = np.asarray(model.encode([texts[index] for index in missing]), dtype=np.float32)
+        norms = np.linalg.norm(encoded, axis=1, keepdims=True)
+        encoded /= np.where(norms == 0, 1, norms)
+        for index, vector in zip(missing, encoded):
+            vectors[index] = vector
+            embedding_cache.put(keys[index], vector)
+
+    if not vectors:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.vstack(vectors)
+
+
+def top_k_indices(scores, k):
+    """
+    Column indices of the k highest scores of every row, best first.
+
+    np.argpartition selects the k best in linear time; only those k are sorted.
+    """
+    rows, columns = scores.shape
+    k = min(k, columns)
+    if k <= 0:
+        return np.zeros((rows, 0), dtype=int)
+    if k < columns:
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        candidates = np.tile(np.arange(columns), (rows, 1))
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1, kind='stable')
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def _unit_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float64)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def sentence_centrality(embeddings, block_size=4096):
+    """
+    Mean cosine similarity of every row to all rows, in O(N*d) time.
+
+    For unit vectors mean_j(e_i . e_j) = e_i . mean_j(e_j), so one product with
+    the mean embedding replaces the N x N similarity matrix. Rows are
+    normalized block by block, so memory stays at O(block_size*d + N); zero
+    rows score 0, as with cosine_similarity().
+
+    Args:
+        embeddings (np.ndarray): Sentence embeddings, one row per sentence
+        block_size (int): Rows normalized at a time
+
+    Returns:
+        np.ndarray: Centrality score per sentence (float64)
+    """
+    count = len(embeddings)
+    if not count:
+        return np.zeros(0)
+    blocks = range(0, count, block_size)
+    mean = sum(_unit_rows(embeddings[start:start + block_size]).sum(axis=0) for start in blocks) / count
+    scores = np.empty(count)
+    for start in blocks:
+        scores[start:start + block_size] = _unit_rows(embeddings[start:start + block_size]) @ mean
+    return scores
+
+
+class EmbeddingIndex:
+    """Unique texts of a document and their normalized embedding matrix."""
+
+    def __init__(self, model, texts, model_key):
+        """
+        Encode the texts (duplicates dropped, first occurrence kept).
+
+        Args:
+            model: SentenceTransformer used for the texts and later queries
+            texts (List[str]): Candidate texts, e.g. the document's entities
+            model_key (str): Name of the model, part of the cache key
+        """
+        self.model = model
+        self.model_key = model_key
+        self.texts = list(dict.fromkeys(texts))
+        self._positions = {}
+        for index, text in enumerate(self.texts):
+            self._positions.setdefault(text.lower(), []).append(index)
+        self.matrix = encode_normalized(model, self.texts, model_key)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def most_similar(self, queries, k, eligible=None, preferred=None):
+        """
+        The k texts most similar to each query, for all queries at once.
+
+        Args:
+            queries (List[str]): Query texts, e.g. the correct answers of all questions
+            k (int): Results per query
+            eligible (Callable[[str], bool]): Filter on candidate texts
+            preferred (List[Iterable[str]]): Per query, texts ranked before all
+                others, e.g. the entities with the answer's label
+
+        Returns:
+            List[List[str]]: Per query, up to k texts, preferred texts first and
+            most similar first within each group; the query text itself
+            (case-insensitive) is never returned
+        """
+        if not queries or not self.texts:
+            return [[] for _ in queries]
+
+        scores = encode_normalized(self.model, queries, self.model_key) @ self.matrix.T
+        if eligible is not None:
+            mask = np.array([not eligible(text) for text in self.texts])
+            scores[:, mask] = -np.inf
+        if preferred is not None:
+            # Cosine scores are at most 1, so the offset ranks preferred texts above the rest
+            for row, texts in enumerate(preferred):
+                positions = sorted({index for text in texts for index in self._positions.get(text.lower(), [])})
+                scores[row, positions] += PREFERRED_SCORE_OFFSET
+        for row, query in enumerate(queries):
+            scores[row, self._positions.get(query.lower(), [])] = -np.inf
+
+        results = []
+        for row, indices in enumerate(top_k_indices(scores, k)):
+            results.append([self.texts[index] for index in indices if scores[row, index] != -np.inf])
+        return results
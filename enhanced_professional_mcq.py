@@ -5,28 +5,38 @@ Generates truly professional-quality questions suitable for academic and certifi
 
 import os
 import re
+import importlib.util
 import json
 import random
 from typing import List, Dict, Tuple, Optional
 import warnings
 warnings.filterwarnings("ignore")
 
-try:
-    import torch
-    from transformers import (
-        AutoTokenizer, AutoModelForSeq2SeqLM, 
-        T5ForConditionalGeneration, T5Tokenizer,
-        pipeline
-    )
-    from sentence_transformers import SentenceTransformer
-    import spacy
+from model_registry import (
+    shared_t5_model, shared_sentence_transformer, shared_spacy_model, generate_in_batches, T5_BATCH_SIZE
+)
+from document_analysis import DocumentAnalysis, DocumentView
+from pattern_engine import SentencePatterns
+from analysis_cache import analysis_cache, pipeline_name, document_sentences, document_analysis, document_patterns
+
+# Packages the generator needs, located with importlib.util.find_spec() as in
+# mcq_generator; the models themselves are loaded through model_registry
+ENHANCED_DEPENDENCIES = ('torch', 'transformers', 'sentence_transformers', 'spacy', 'nltk', 'numpy')
+ENHANCED_DEPENDENCIES_AVAILABLE = all(importlib.util.find_spec(name) is not None
+                                     for name in ENHANCED_DEPENDENCIES)
+
+if ENHANCED_DEPENDENCIES_AVAILABLE:
     import nltk
-    from nltk.tokenize import sent_tokenize
-    import numpy as np
-    ENHANCED_DEPENDENCIES_AVAILABLE = True
-except ImportError as e:
-    print(f"Warning: Enhanced dependencies not available: {e}")
-    ENHANCED_DEPENDENCIES_AVAILABLE = False
+else:
+    print("Warning: Enhanced dependencies not available: "
+          + ', '.join(name for name in ENHANCED_DEPENDENCIES if importlib.util.find_spec(name) is None))
+
+# Sampled candidate questions per concept, decoded in the same generate() call
+CONCEPT_QUESTION_CANDIDATES = 3
+
+# Sentences about a concept given to T5 as the context of its question
+CONCEPT_CONTEXT_SENTENCES = 2
+
 
 class EnhancedProfessionalMCQGenerator:
     """Enhanced Professional MCQ Generator for truly professional questions"""
@@ -41,6 +51,9 @@ class EnhancedProfessionalMCQGenerator:
         self.sentence_model = None
         self.nlp = None
         
+        # spaCy analysis of the document being processed
+        self.document = None
+        
         os.makedirs(self.model_cache_dir, exist_ok=True)
         self._download_nltk_data()
     
@@ -62,42 +75,26 @@ class EnhancedProfessionalMCQGenerator:
         print("🎯 Loading enhanced professional models...")
         
         try:
+            # Models come from the process-wide registry: loaded from disk
+            # once, then shared by every request and generator
             # Use T5-Large for better quality (compromise between speed and quality)
             print("📚 Loading T5-Large for professional question generation...")
             model_name = "t5-large"  # Better than base, faster than FLAN-T5-Large
-            self.question_tokenizer = T5Tokenizer.from_pretrained(
-                model_name, 
-                cache_dir=os.path.join(self.model_cache_dir, "question_generation")
-            )
-            self.question_generator = T5ForConditionalGeneration.from_pretrained(
+            self.question_tokenizer, self.question_generator = shared_t5_model(
                 model_name,
-                cache_dir=os.path.join(self.model_cache_dir, "question_generation"),
-                torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32
+                cache_dir=os.path.join(self.model_cache_dir, "question_generation")
             )
             
-            # Optimize for inference
-            self.question_generator.eval()
-            if torch.cuda.is_available():
-                self.question_generator = self.question_generator.cuda()
-            
             # Load good sentence transformer
             print("🔍 Loading sentence transformer...")
-            self.sentence_model = SentenceTransformer(
+            self.sentence_model = shared_sentence_transformer(
                 'all-mpnet-base-v2',  # Better quality than MiniLM
                 cache_folder=os.path.join(self.model_cache_dir, "sentence_transformer")
             )
             
             # Load spaCy medium model (good balance)
             print("🧠 Loading spaCy medium model...")
-            try:
-                self.nlp = spacy.load("en_core_web_md")
-            except OSError:
-                try:
-                    self.nlp = spacy.load("en_core_web_sm")
-                except OSError:
-                    print("⚠️ Downloading spaCy model...")
-                    os.system("python -m spacy download en_core_web_sm")
-                    self.nlp = spacy.load("en_core_web_sm")
+            self.nlp = shared_spacy_model("en_core_web_md", "en_core_web_sm", download="en_core_web_sm")
             
             self.models_loaded = True
             print("✅ Enhanced models loaded successfully!")
@@ -120,6 +117,8 @@ class EnhancedProfessionalMCQGenerator:
         
         # Step 1: Advanced text analysis
         analysis = self._professional_text_analysis(text)
+        # Per-run view: answer and context parses are memoized outside the cached analysis
+        self.document = DocumentView(analysis["document"])
         
         # Step 2: Generate questions using professional strategies
         all_questions = []
@@ -154,32 +153,38 @@ class EnhancedProfessionalMCQGenerator:
         return final_questions
     
     def _professional_text_analysis(self, text: str) -> Dict:
-        """Professional-grade text analysis"""
+        """Professional-grade text analysis, cached process-wide (see analysis_cache.py)"""
+        return analysis_cache.part(text, ('enhanced', pipeline_name(self.nlp)),
+                                   lambda: self._build_professional_analysis(text))
+    
+    def _build_professional_analysis(self, text: str) -> Dict:
+        """Entities, definitions, key concepts, relationships and processes of a text"""
         print("🔍 Performing professional text analysis...")
         
-        # Basic analysis
-        sentences = sent_tokenize(text)
-        
-        # Advanced NLP analysis
-        doc = self.nlp(text)
+        # Sentences and the spaCy pass are shared with the other generators
+        sentences = document_sentences(text)
+        document = document_analysis(text, self.nlp)
         
         # Extract high-quality entities
         entities = []
-        for ent in doc.ents:
-            if ent.label_ in ["PERSON", "ORG", "PRODUCT", "EVENT", "LAW", "LANGUAGE", "WORK_OF_ART"]:
-                entities.append((ent.text, ent.label_))
+        for entity, label in document.entities:
+            if label in ["PERSON", "ORG", "PRODUCT", "EVENT", "LAW", "LANGUAGE", "WORK_OF_ART"]:
+                entities.append((entity, label))
+        
+        # Definition, relationship and process patterns, one scan per sentence
+        mined = document_patterns(text, 'enhanced')
         
         # Extract professional definitions
-        definitions = self._extract_professional_definitions(sentences)
+        definitions = self._extract_professional_definitions(mined)
         
         # Extract key concepts
-        key_concepts = self._extract_key_concepts(text, doc)
+        key_concepts = self._extract_key_concepts(text, document)
         
         # Extract relationships
-        relationships = self._extract_relationships(sentences)
+        relationships = self._extract_relationships(mined)
         
         # Extract processes and procedures
-        processes = self._extract_processes(sentences)
+        processes = self._extract_processes(mined)
         
         return {
             "sentences": sentences,
@@ -187,53 +192,43 @@ class EnhancedProfessionalMCQGenerator:
             "definitions": definitions,
             "key_concepts": key_concepts,
             "relationships": relationships,
-            "processes": processes
+            "processes": processes,
+            "document": document
         }
     
-    def _extract_professional_definitions(self, sentences: List[str]) -> List[Dict]:
+    def _extract_professional_definitions(self, mined: List[SentencePatterns]) -> List[Dict]:
         """Extract professional-quality definitions"""
         definitions = []
         
-        # Enhanced definition patterns
-        definition_patterns = [
-            r'([A-Z][a-zA-Z\s]+?)\s+is\s+(?:a|an|the)?\s*([^.]{20,150})',
-            r'([A-Z][a-zA-Z\s]+?)\s+refers to\s+([^.]{20,150})',
-            r'([A-Z][a-zA-Z\s]+?)\s+can be defined as\s+([^.]{20,150})',
-            r'([A-Z][a-zA-Z\s]+?)\s+means\s+([^.]{20,150})',
-            r'The term\s+([A-Z][a-zA-Z\s]+?)\s+describes\s+([^.]{20,150})',
-            r'([A-Z][a-zA-Z\s]+?)\s+represents\s+([^.]{20,150})'
-        ]
-        
-        for sentence in sentences:
+        for patterns in mined:
+            sentence = patterns.sentence
             if len(sentence.split()) >= 10:  # Ensure substantial content
-                for pattern in definition_patterns:
-                    match = re.search(pattern, sentence, re.IGNORECASE)
-                    if match:
-                        term = match.group(1).strip()
-                        definition = match.group(2).strip()
+                for match in patterns.of('definition'):
+                    term = match.group(1).strip()
+                    definition = match.group(2).strip()
+                    
+                    # Quality filters
+                    if (len(term.split()) <= 5 and 
+                        len(definition.split()) >= 5 and
+                        not any(word in definition.lower() for word in ['this', 'that', 'it', 'they'])):
                         
-                        # Quality filters
-                        if (len(term.split()) <= 5 and 
-                            len(definition.split()) >= 5 and
-                            not any(word in definition.lower() for word in ['this', 'that', 'it', 'they'])):
-                            
-                            definitions.append({
-                                "term": term,
-                                "definition": definition,
-                                "sentence": sentence,
-                                "quality_score": self._calculate_definition_quality(term, definition)
-                            })
+                        definitions.append({
+                            "term": term,
+                            "definition": definition,
+                            "sentence": sentence,
+                            "quality_score": self._calculate_definition_quality(term, definition)
+                        })
         
         # Sort by quality and return best
         definitions.sort(key=lambda x: x["quality_score"], reverse=True)
         return definitions[:10]
     
-    def _extract_key_concepts(self, text: str, doc) -> List[str]:
+    def _extract_key_concepts(self, text: str, document: DocumentAnalysis) -> List[str]:
         """Extract key concepts from text"""
         concepts = []
         
         # Extract noun phrases that are likely concepts
-        for chunk in doc.noun_chunks:
+        for chunk in document.noun_chunks:
             if (len(chunk.text.split()) <= 4 and 
                 len(chunk.text) > 3 and
                 chunk.root.pos_ == "NOUN"):
@@ -247,52 +242,35 @@ class EnhancedProfessionalMCQGenerator:
         unique_concepts = list(set(concepts))
         return [c for c in unique_concepts if len(c) > 3 and len(c) < 50][:15]
     
-    def _extract_relationships(self, sentences: List[str]) -> List[Dict]:
+    def _extract_relationships(self, mined: List[SentencePatterns]) -> List[Dict]:
         """Extract relationships between concepts"""
         relationships = []
         
-        relationship_patterns = [
-            r'([A-Z][a-zA-Z\s]+?)\s+(?:is a type of|is a kind of|is a subset of)\s+([^.]{5,50})',
-            r'([A-Z][a-zA-Z\s]+?)\s+(?:includes|contains|comprises)\s+([^.]{5,50})',
-            r'([A-Z][a-zA-Z\s]+?)\s+(?:leads to|results in|causes)\s+([^.]{5,50})',
-            r'([A-Z][a-zA-Z\s]+?)\s+(?:is used for|is designed for)\s+([^.]{5,50})'
-        ]
-        
-        for sentence in sentences:
-            for pattern in relationship_patterns:
-                match = re.search(pattern, sentence, re.IGNORECASE)
-                if match:
-                    subject = match.group(1).strip()
-                    object_rel = match.group(2).strip()
-                    relationships.append({
-                        "subject": subject,
-                        "object": object_rel,
-                        "sentence": sentence
-                    })
+        for patterns in mined:
+            for match in patterns.of('relationship'):
+                subject = match.group(1).strip()
+                object_rel = match.group(2).strip()
+                relationships.append({
+                    "subject": subject,
+                    "object": object_rel,
+                    "sentence": patterns.sentence
+                })
         
         return relationships[:8]
     
-    def _extract_processes(self, sentences: List[str]) -> List[Dict]:
+    def _extract_processes(self, mined: List[SentencePatterns]) -> List[Dict]:
         """Extract processes and procedures"""
         processes = []
         
-        process_patterns = [
-            r'([A-Z][a-zA-Z\s]+?)\s+(?:involves|requires|consists of)\s+([^.]{10,100})',
-            r'(?:The process of|The method of)\s+([A-Z][a-zA-Z\s]+?)\s+([^.]{10,100})',
-            r'([A-Z][a-zA-Z\s]+?)\s+(?:works by|operates by)\s+([^.]{10,100})'
-        ]
-        
-        for sentence in sentences:
-            for pattern in process_patterns:
-                match = re.search(pattern, sentence, re.IGNORECASE)
-                if match:
-                    process_name = match.group(1).strip()
-                    process_description = match.group(2).strip()
-                    processes.append({
-                        "name": process_name,
-                        "description": process_description,
-                        "sentence": sentence
-                    })
+        for patterns in mined:
+            for match in patterns.of('process'):
+                process_name = match.group(1).strip()
+                process_description = match.group(2).strip()
+                processes.append({
+                    "name": process_name,
+                    "description": process_description,
+                    "sentence": patterns.sentence
+                })
         
         return processes[:5]
     
@@ -363,77 +341,91 @@ class EnhancedProfessionalMCQGenerator:
         
         return questions
     
+    def _concept_context(self, concept: str, max_sentences: int = CONCEPT_CONTEXT_SENTENCES) -> Optional[str]:
+        """The sentences that best match a concept, in document order (None if none mention it)"""
+        concept_lower = concept.lower()
+        concept_words = set(concept_lower.split())
+        if not concept_words:
+            return None
+        scored = []
+        for position, sentence in enumerate(self.document.sentences):
+            sentence_lower = sentence.lower()
+            # Whole concept first, then sentences sharing most of its words
+            score = 2 * sentence_lower.count(concept_lower) + \
+                len(concept_words & set(sentence_lower.split())) / len(concept_words)
+            if score > 0:
+                scored.append((score, position, sentence))
+        
+        if not scored:
+            return None
+        best = sorted(scored, key=lambda item: (-item[0], item[1]))[:max_sentences]
+        return " ".join(sentence for _, _, sentence in sorted(best, key=lambda item: item[1]))
+    
     def _generate_concept_questions(self, text: str, analysis: Dict, num_questions: int) -> List[Dict]:
         """Generate professional concept-based questions"""
         questions = []
         
-        # Use T5 for concept questions
+        # One prompt per concept, with the concept's own sentences as context;
+        # every generate() call samples several candidate questions per prompt
+        concept_prompts = []
         for concept in analysis["key_concepts"][:num_questions * 2]:
+            context = self._concept_context(concept) or text[:200]
+            concept_prompts.append((concept, f"Generate a professional question about {concept}: {context}"))
+        if not concept_prompts:
+            return questions
+        
+        # Batched across concepts (in-process or through the inference service);
+        # later batches only run while questions are still missing
+        generated = generate_in_batches(
+            self.question_tokenizer,
+            self.question_generator,
+            [prompt for _, prompt in concept_prompts],
+            batch_size=min(num_questions, T5_BATCH_SIZE),
+            max_input_length=400,
+            max_length=64,
+            num_beams=4,
+            num_return_sequences=CONCEPT_QUESTION_CANDIDATES,
+            early_stopping=True,
+            temperature=0.8,
+            do_sample=True,
+            top_p=0.9
+        )
+        
+        answered = set()
+        for index, question_text in generated:
             if len(questions) >= num_questions:
                 break
+            # The first acceptable candidate of a concept wins; its other candidates are skipped
+            if index in answered or not self._is_professional_question(question_text):
+                continue
+            concept = concept_prompts[index][0]
             
             try:
-                # Professional prompts for T5
-                prompts = [
-                    f"Generate a professional question about {concept}: {text[:200]}",
-                    f"Create an academic question regarding {concept}: {text[:200]}",
-                    f"What professional question can be asked about {concept}?"
-                ]
+                # Extract answer from text
+                answer = self._extract_professional_answer(question_text, text, concept)
                 
-                for prompt in prompts:
-                    if len(questions) >= num_questions:
-                        break
-                    
-                    # Generate with T5
-                    inputs = self.question_tokenizer.encode(
-                        prompt, 
-                        return_tensors="pt", 
-                        max_length=400, 
-                        truncation=True
+                if answer:
+                    # Generate professional distractors
+                    options = self._generate_professional_distractors_for_concept(
+                        answer, concept, text, analysis
                     )
                     
-                    if torch.cuda.is_available():
-                        inputs = inputs.cuda()
-                    
-                    with torch.no_grad():
-                        outputs = self.question_generator.generate(
-                            inputs,
-                            max_length=64,
-                            num_beams=4,
-                            early_stopping=True,
-                            temperature=0.8,
-                            do_sample=True,
-                            top_p=0.9
-                        )
-                    
-                    question_text = self.question_tokenizer.decode(outputs[0], skip_special_tokens=True)
-                    
-                    if self._is_professional_question(question_text):
-                        # Extract answer from text
-                        answer = self._extract_professional_answer(question_text, text, concept)
-                        
-                        if answer:
-                            # Generate professional distractors
-                            options = self._generate_professional_distractors_for_concept(
-                                answer, concept, text, analysis
-                            )
-                            
-                            if len(options) >= 4:
-                                questions.append({
-                                    "question": question_text,
-                                    "options": {
-                                        "A": options[0],
-                                        "B": options[1],
-                                        "C": options[2],
-                                        "D": options[3]
-                                    },
-                                    "correct": "A",
-                                    "explanation": f"Based on the concept of {concept} in the given text.",
-                                    "source": "professional_concept",
-                                    "confidence": 0.8,
-                                    "type": "concept"
-                                })
-                                break
+                    if len(options) >= 4:
+                        answered.add(index)
+                        questions.append({
+                            "question": question_text,
+                            "options": {
+                                "A": options[0],
+                                "B": options[1],
+                                "C": options[2],
+                                "D": options[3]
+                            },
+                            "correct": "A",
+                            "explanation": f"Based on the concept of {concept} in the given text.",
+                            "source": "professional_concept",
+                            "confidence": 0.8,
+                            "type": "concept"
+                        })
                 
             except Exception as e:
                 print(f"Error generating concept question: {e}")
@@ -544,14 +536,11 @@ class EnhancedProfessionalMCQGenerator:
 
     def _extract_professional_answer(self, question: str, text: str, concept: str) -> Optional[str]:
         """Extract professional-quality answer"""
-        # Use spaCy to find relevant information
-        doc = self.nlp(text)
-
         # Look for sentences containing the concept
         relevant_sentences = []
-        for sent in doc.sents:
-            if concept.lower() in sent.text.lower():
-                relevant_sentences.append(sent.text)
+        for sentence in self.document.sentences:
+            if concept.lower() in sentence.lower():
+                relevant_sentences.append(sentence)
 
         if not relevant_sentences:
             return None
@@ -661,11 +650,10 @@ class EnhancedProfessionalMCQGenerator:
 
     def _generate_contextual_alternatives(self, answer: str, text: str) -> List[str]:
         """Generate contextual alternatives"""
-        doc = self.nlp(text)
         alternatives = []
 
-        # Extract similar noun phrases
-        for chunk in doc.noun_chunks:
+        # Extract similar noun phrases of the document
+        for chunk in self.document.noun_chunks:
             if (chunk.text != answer and
                 len(chunk.text) > 3 and
                 len(chunk.text) < 80):
@@ -952,6 +940,11 @@ def generate_enhanced_professional_mcq_questions(text: str, num_questions: int =
         return []
 
 
+def warm_enhanced_models():
+    """Load the enhanced generator's models into the process-wide registry."""
+    EnhancedProfessionalMCQGenerator().load_enhanced_models()
+
+
 def is_enhanced_professional_mode_available() -> bool:
     """Check if enhanced professional mode dependencies are available"""
     return ENHANCED_DEPENDENCIES_AVAILABLE
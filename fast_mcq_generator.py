@@ -5,6 +5,7 @@ Uses smaller, faster models with intelligent caching and optimization
 
 import os
 import re
+import importlib.util
 import json
 import random
 import time
@@ -12,23 +13,28 @@ from typing import List, Dict, Tuple, Optional
 import warnings
 warnings.filterwarnings("ignore")
 
-try:
-    import torch
-    from transformers import (
-        AutoTokenizer, AutoModelForSeq2SeqLM, 
-        T5ForConditionalGeneration, T5Tokenizer,
-        pipeline
-    )
-    from sentence_transformers import SentenceTransformer
-    import spacy
+from model_registry import (
+    shared_t5_model, shared_sentence_transformer, shared_spacy_model, generate_in_batches
+)
+from document_analysis import DocumentView
+from analysis_cache import analysis_cache, pipeline_name, document_sentences, document_analysis, document_patterns
+
+# Sentence transformer of fast mode; also names its distractor library
+FAST_SENTENCE_MODEL_NAME = 'all-MiniLM-L6-v2'
+
+# Packages the generator needs, located with importlib.util.find_spec() as in
+# mcq_generator; the models themselves are loaded through model_registry
+FAST_DEPENDENCIES = ('torch', 'transformers', 'sentence_transformers', 'spacy', 'nltk', 'sklearn', 'numpy')
+FAST_DEPENDENCIES_AVAILABLE = all(importlib.util.find_spec(name) is not None
+                                 for name in FAST_DEPENDENCIES)
+
+if FAST_DEPENDENCIES_AVAILABLE:
     import nltk
-    from nltk.tokenize import sent_tokenize
-    from sklearn.feature_extraction.text import TfidfVectorizer
-    import numpy as np
-    FAST_DEPENDENCIES_AVAILABLE = True
-except ImportError as e:
-    print(f"Warning: Fast dependencies not available: {e}")
-    FAST_DEPENDENCIES_AVAILABLE = False
+    # NumPy-based helpers, imported only when the dependencies are installed
+    from distractor_library import index_document_terms, library_distractors
+else:
+    print("Warning: Fast dependencies not available: "
+          + ', '.join(name for name in FAST_DEPENDENCIES if importlib.util.find_spec(name) is None))
 
 class FastMCQGenerator:
     """Fast MCQ Generator optimized for speed and efficiency"""
@@ -43,8 +49,10 @@ class FastMCQGenerator:
         self.sentence_model = None
         self.nlp = None
         
+        # spaCy analysis of the document being processed
+        self.document = None
+        
         # Cache for repeated operations
-        self._sentence_cache = {}
         self._embedding_cache = {}
         
         os.makedirs(self.model_cache_dir, exist_ok=True)
@@ -69,39 +77,26 @@ class FastMCQGenerator:
         start_time = time.time()
         
         try:
+            # Models come from the process-wide registry: loaded from disk
+            # once, then shared by every request and generator
             # 1. Load T5-Base (much faster than Large)
             print("📚 Loading T5-Base for question generation...")
             model_name = "t5-base"  # 850MB vs 3GB for large
-            self.question_tokenizer = T5Tokenizer.from_pretrained(
-                model_name, 
-                cache_dir=os.path.join(self.model_cache_dir, "question_generation")
-            )
-            self.question_generator = T5ForConditionalGeneration.from_pretrained(
+            self.question_tokenizer, self.question_generator = shared_t5_model(
                 model_name,
-                cache_dir=os.path.join(self.model_cache_dir, "question_generation"),
-                torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32
+                cache_dir=os.path.join(self.model_cache_dir, "question_generation")
             )
             
-            # Optimize for inference
-            self.question_generator.eval()
-            if torch.cuda.is_available():
-                self.question_generator = self.question_generator.cuda()
-            
             # 2. Load fast sentence transformer
             print("🔍 Loading fast sentence transformer...")
-            self.sentence_model = SentenceTransformer(
-                'all-MiniLM-L6-v2',  # 90MB vs 420MB for mpnet
+            self.sentence_model = shared_sentence_transformer(
+                FAST_SENTENCE_MODEL_NAME,  # 90MB vs 420MB for mpnet
                 cache_folder=os.path.join(self.model_cache_dir, "sentence_transformer")
             )
             
             # 3. Load spaCy small model (fastest)
             print("🧠 Loading spaCy small model...")
-            try:
-                self.nlp = spacy.load("en_core_web_sm")
-            except OSError:
-                print("⚠️ spaCy model not found, downloading...")
-                os.system("python -m spacy download en_core_web_sm")
-                self.nlp = spacy.load("en_core_web_sm")
+            self.nlp = shared_spacy_model("en_core_web_sm", download="en_core_web_sm")
             
             self.models_loaded = True
             load_time = time.time() - start_time
@@ -126,6 +121,8 @@ class FastMCQGenerator:
         
         # Step 1: Quick text analysis
         analysis = self._fast_text_analysis(text)
+        # Per-run view: answer and context parses are memoized outside the cached analysis
+        self.document = DocumentView(analysis["document"])
         
         # Step 2: Generate questions using optimized strategies
         all_questions = []
@@ -155,51 +152,38 @@ class FastMCQGenerator:
         return final_questions
     
     def _fast_text_analysis(self, text: str) -> Dict:
-        """Fast text analysis with caching"""
-        # Check cache first
-        text_hash = hash(text)
-        if text_hash in self._sentence_cache:
-            return self._sentence_cache[text_hash]
-        
-        # Quick analysis
-        sentences = sent_tokenize(text)
-        
-        # Fast NLP processing
-        doc = self.nlp(text[:1000])  # Limit to first 1000 chars for speed
-        entities = [(ent.text, ent.label_) for ent in doc.ents]
+        """Fast text analysis, cached process-wide (see analysis_cache.py)"""
+        return analysis_cache.part(text, ('fast', pipeline_name(self.nlp)),
+                                   lambda: self._build_fast_analysis(text))
+    
+    def _build_fast_analysis(self, text: str) -> Dict:
+        """Sentences, entities, factual statements and key phrases of a text"""
+        # Sentences and the spaCy pass are shared with the other generators
+        sentences = document_sentences(text)
+        document = document_analysis(text, self.nlp)
         
-        # Quick factual statement extraction
-        factual_statements = []
-        for sentence in sentences:
-            if self._is_factual_sentence(sentence):
-                factual_statements.append(sentence)
+        # One pattern scan per sentence, read by the factual check and the pattern questions
+        mined = [patterns for patterns in document_patterns(text, 'fast') if patterns.has('fact')]
+        factual_statements = [patterns.sentence for patterns in mined]
         
         # Quick key phrase extraction
         key_phrases = self._extract_key_phrases_fast(text)
         
+        # Terms and phrases join the library-wide distractor index
+        noun_phrases = [chunk.text for chunk in document.noun_chunks if len(chunk.text.split()) <= 4]
+        index_document_terms(self.sentence_model, FAST_SENTENCE_MODEL_NAME,
+                             document.unique_entities + noun_phrases + key_phrases)
+        
         analysis = {
             "sentences": sentences,
-            "entities": entities,
+            "entities": document.entities,
             "factual_statements": factual_statements,
-            "key_phrases": key_phrases
+            "factual_patterns": mined,
+            "key_phrases": key_phrases,
+            "document": document
         }
-        
-        # Cache result
-        self._sentence_cache[text_hash] = analysis
         return analysis
     
-    def _is_factual_sentence(self, sentence: str) -> bool:
-        """Quick check if sentence contains factual information"""
-        factual_indicators = [
-            r'\b(?:is|are|was|were)\s+(?:a|an|the)?\s*\w+',
-            r'\b(?:created|developed|invented|founded)\b',
-            r'\b\d{4}\b',  # Years
-            r'\b(?:first|second|primary|main)\b',
-            r'\b(?:features?|includes?|supports?)\b'
-        ]
-        
-        return any(re.search(pattern, sentence, re.IGNORECASE) for pattern in factual_indicators)
-    
     def _extract_key_phrases_fast(self, text: str) -> List[str]:
         """Fast key phrase extraction using simple patterns"""
         # Extract capitalized phrases (likely important terms)
@@ -217,44 +201,38 @@ class FastMCQGenerator:
         """Generate questions using fast pattern matching"""
         questions = []
         
-        # Enhanced patterns for fast generation
-        patterns = [
-            # Definition patterns
-            {
-                'pattern': r'([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)\s+is\s+(?:a\s+|an\s+|the\s+)?([^.]{10,80})',
+        # Question templates of the pattern engine's fast question tags
+        # (definition, creation, year, feature; see pattern_engine.py)
+        patterns = {
+            'definition': {
                 'question_template': 'What is {term}?',
                 'answer_group': 2,
                 'term_group': 1
             },
-            # Creation patterns
-            {
-                'pattern': r'([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)\s+(?:was\s+)?(?:created|developed|invented|founded)\s+by\s+([^.]{5,50})',
+            'creation': {
                 'question_template': 'What was created by {creator}?',
                 'answer_group': 1,
                 'creator_group': 2
             },
-            # Year patterns
-            {
-                'pattern': r'(?:in\s+|during\s+)?(\d{4})',
+            'year': {
                 'question_template': 'In which year did this occur?',
                 'answer_group': 1
             },
-            # Feature patterns
-            {
-                'pattern': r'([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)\s+(?:features?|supports?|includes?)\s+([^.]{10,60})',
+            'feature': {
                 'question_template': 'What does {subject} feature?',
                 'answer_group': 2,
                 'subject_group': 1
             }
-        ]
+        }
         
-        for sentence in analysis["factual_statements"][:num_questions * 2]:
+        for sentence_patterns in analysis["factual_patterns"][:num_questions * 2]:
             if len(questions) >= num_questions:
                 break
+            sentence = sentence_patterns.sentence
             
-            for pattern_info in patterns:
-                match = re.search(pattern_info['pattern'], sentence, re.IGNORECASE)
-                if match:
+            for match in sentence_patterns.matches:
+                pattern_info = patterns.get(match.tag)
+                if pattern_info:
                     answer = match.group(pattern_info['answer_group']).strip()
                     answer = re.sub(r'^(?:a\s+|an\s+|the\s+)', '', answer, flags=re.IGNORECASE)
                     answer = answer.strip(' .,;:')
@@ -304,37 +282,26 @@ class FastMCQGenerator:
         # Select best sentences for T5 generation
         best_sentences = analysis["factual_statements"][:num_questions]
         
-        for sentence in best_sentences:
+        # Simple, fast prompts, generated in padded batches; the validity
+        # filters run on the decoded batch
+        prompts = [f"question: {sentence}" for sentence in best_sentences]
+        generated = generate_in_batches(
+            self.question_tokenizer,
+            self.question_generator,
+            prompts,
+            max_input_length=256,  # Reduced from 512
+            max_length=32,  # Reduced from 128
+            num_beams=2,    # Reduced from 5
+            early_stopping=True,
+            do_sample=False  # Faster than sampling
+        )
+        
+        for index, question_text in generated:
             if len(questions) >= num_questions:
                 break
             
+            sentence = best_sentences[index]
             try:
-                # Simple, fast prompt
-                prompt = f"question: {sentence}"
-                
-                # Fast tokenization
-                inputs = self.question_tokenizer.encode(
-                    prompt, 
-                    return_tensors="pt", 
-                    max_length=256,  # Reduced from 512
-                    truncation=True
-                )
-                
-                if torch.cuda.is_available():
-                    inputs = inputs.cuda()
-                
-                # Fast generation with reduced parameters
-                with torch.no_grad():
-                    outputs = self.question_generator.generate(
-                        inputs,
-                        max_length=32,  # Reduced from 128
-                        num_beams=2,    # Reduced from 5
-                        early_stopping=True,
-                        do_sample=False  # Faster than sampling
-                    )
-                
-                question_text = self.question_tokenizer.decode(outputs[0], skip_special_tokens=True)
-                
                 if self._is_valid_question_fast(question_text):
                     # Fast answer extraction
                     answer = self._extract_answer_fast(sentence, question_text)
@@ -384,9 +351,8 @@ class FastMCQGenerator:
     
     def _extract_answer_fast(self, sentence: str, question: str) -> Optional[str]:
         """Fast answer extraction"""
-        # Simple entity extraction from sentence
-        doc = self.nlp(sentence)
-        entities = [ent.text for ent in doc.ents if len(ent.text) > 2]
+        # Simple entity extraction from sentence (parsed with the document)
+        entities = [ent.text for ent in self.document.doc(sentence).ents if len(ent.text) > 2]
         
         # Return first reasonable entity
         for entity in entities:
@@ -404,21 +370,22 @@ class FastMCQGenerator:
         """Generate distractors quickly"""
         distractors = [correct_answer]
         
-        # Strategy 1: Extract similar entities from text
-        doc = self.nlp(full_text[:500])  # Limit for speed
-        entities = [ent.text for ent in doc.ents if ent.text != correct_answer and len(ent.text) > 2]
+        # Strategy 1: Entities of the document, those with the answer's label first
+        entities = [entity for entity in self.document.entity_candidates(correct_answer) if len(entity) > 2]
         
         # Add similar entities
-        for entity in entities[:3]:
-            if entity.lower() != correct_answer.lower():
-                distractors.append(entity)
+        distractors.extend(entities[:3])
+        
+        # Strategy 2: Closest terms of all processed documents
+        if len(distractors) < 4:
+            distractors.extend(library_distractors(self.sentence_model, FAST_SENTENCE_MODEL_NAME, [correct_answer])[0])
         
-        # Strategy 2: Generate variations
+        # Strategy 3: Generate variations
         if len(distractors) < 4:
             variations = self._generate_answer_variations(correct_answer)
             distractors.extend(variations)
         
-        # Strategy 3: Use fallbacks
+        # Strategy 4: Use fallbacks
         if len(distractors) < 4:
             fallbacks = self._get_fast_fallbacks(correct_answer)
             distractors.extend(fallbacks)
@@ -538,6 +505,11 @@ def generate_fast_mcq_questions(text: str, num_questions: int = 10,
         return []
 
 
+def warm_fast_models():
+    """Load the fast generator's models into the process-wide registry."""
+    FastMCQGenerator().load_fast_models()
+
+
 def is_fast_mode_available() -> bool:
     """Check if fast mode dependencies are available"""
     return FAST_DEPENDENCIES_AVAILABLE
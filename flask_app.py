@@ -4,21 +4,38 @@ import json
 import sys
 import queue
 import threading
+import time
 
 from mcq_generator import (
     extract_text_from_pdf, generate_mcq_questions, generate_mcq_questions_advanced,
     estimate_max_questions, estimate_max_questions_detailed,
     generate_mcq_questions_with_offline_fallback, get_generation_capabilities,
-    generate_mcq_questions_with_metadata, generate_pdf_summary, generate_comprehensive_notes
+    generate_mcq_questions_with_metadata, generate_pdf_summary, generate_comprehensive_notes,
+    new_token_usage
 )
+from request_deadline import RequestDeadline, CancellationToken
+from result_store import create_result_store, new_result_id
+from session_registry import (
+    SessionRegistry, SessionJanitor, SESSION_TTL_SECONDS, SPLIT_SESSION_TTL_SECONDS,
+    directory_size, remove_temp_dir
+)
+from admission_control import AdmissionRejected, admission_for_model, admission_stats
+from model_registry import model_registry
+from analysis_cache import analysis_cache
+from job_queue import (
+    JOB_HANDLERS, JOB_STATUS_QUEUED, JOB_TERMINAL_STATUSES, new_job_id, job_directory,
+    enqueue_job, get_job, get_job_events, queued_position, get_worker_pool, FinishedJobRetention
+)
+
+# Seconds between SSE heartbeats while a streaming upload waits for progress
+STREAM_HEARTBEAT_SECONDS = float(os.environ.get('STREAM_HEARTBEAT_SECONDS', 15))
 
-# Global progress queue for SSE (used for real-time progress updates)
-progress_queues = {}
+# Progress queues of streaming uploads (used for real-time progress updates);
+# sessions expire after SESSION_TTL_SECONDS of inactivity
+progress_queues = SessionRegistry('progress', SESSION_TTL_SECONDS)
 
 from mcq_parser import parse_mcq_pdf, debug_pdf_content
 
-import pandas as pd
-from fpdf import FPDF
 from io import BytesIO
 import tempfile
 import shutil
@@ -54,6 +71,18 @@ app = Flask(__name__, template_folder=os.path.join(os.path.dirname(__file__), 't
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 524288000  # 500MB max file size (increased from 50MB)
 
+# Split PDF files are kept until downloaded; the janitor deletes expired
+# sessions together with their temp directories
+app.config['split_sessions'] = SessionRegistry('split', SPLIT_SESSION_TTL_SECONDS)
+# The janitor also evicts idle local models when memory runs low and deletes
+# finished jobs after JOB_RETENTION_SECONDS
+session_janitor = SessionJanitor([progress_queues, app.config['split_sessions'], model_registry,
+                                  FinishedJobRetention()])
+session_janitor.start()
+
+# Warm the local generator models named in MODEL_PRELOAD (see /models/ready)
+model_registry.start_preload()
+
 # Secret key for session management (loaded from .env)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'fallback-dev-key-change-in-production')
 
@@ -113,9 +142,70 @@ class LoginForm(FlaskForm):
     submit = SubmitField('Login')
 
 
-# Global variables to store current questions and PDF summary
-current_questions = None
-current_pdf_summary = None
+# Generated results are kept server-side under a result id, so exports only
+# send the id back (per user, bounded; see result_store.py)
+result_store = create_result_store()
+
+
+def save_mcq_result(owner, questions, pdf_summary=None, result_id=None):
+    """
+    Store generated questions for export and return their result id.
+
+    A continued run (result_id of its earlier part given) appends its
+    questions to that result.
+    """
+    if result_id:
+        existing = result_store.get(result_id, owner)
+        if existing is not None:
+            existing['questions'] = existing['questions'] + questions
+            result_store.put(result_id, owner, existing)
+            return result_id
+
+    result_id = new_result_id()
+    result_store.put(result_id, owner, {'type': 'mcq', 'questions': questions, 'pdf_summary': pdf_summary})
+    return result_id
+
+
+def get_export_result(data):
+    """
+    Resolve the body of an export request to a stored result.
+
+    Accepts {'result_id': ...}; the full result JSON posted by older clients
+    is returned unchanged.
+
+    Returns:
+        dict or list or None: The stored (or posted) result, None if the id is unknown
+    """
+    if isinstance(data, dict) and data.get('result_id'):
+        return result_store.get(data['result_id'], current_user.id)
+    return data
+
+def admission_rejected_response(rejection):
+    """429/503 JSON response with a Retry-After header for a rejected request."""
+    response = jsonify(rejection.response_body())
+    response.status_code = rejection.status
+    response.headers['Retry-After'] = str(rejection.retry_after)
+    return response
+
+
+def admit_generation_request(model_name, deadline=None):
+    """
+    Wait for a generation slot in the model's admission lane (see admission_control.py).
+
+    The wait counts against the request deadline.
+
+    Returns:
+        tuple: (admission, None), or (None, response) when the request is turned away
+    """
+    try:
+        admission = admission_for_model(model_name).acquire(timeout=deadline.remaining() if deadline else None)
+    except AdmissionRejected as rejection:
+        print(f"🚦 Request turned away ({rejection.status}): {rejection.message}")
+        return None, admission_rejected_response(rejection)
+    if admission.waited_seconds >= 1:
+        print(f"🚦 Admitted after waiting {admission.waited_seconds:.1f}s")
+    return admission, None
+
 
 def cleanup_temp_files(file_path):
     """Safely cleanup temporary files"""
@@ -141,6 +231,7 @@ def split_pdf_by_pages_per_file(pdf_path, pages_per_file):
     Returns:
         List of tuples (filename, file_path) for split PDFs
     """
+    temp_dir = None
     try:
         reader = PdfReader(pdf_path)
         total_pages = len(reader.pages)
@@ -180,6 +271,7 @@ def split_pdf_by_pages_per_file(pdf_path, pages_per_file):
         return split_files, temp_dir
 
     except Exception as e:
+        remove_temp_dir(temp_dir)
         raise Exception(f"Error splitting PDF by pages: {str(e)}")
 
 
@@ -194,6 +286,7 @@ def split_pdf_by_page_ranges(pdf_path, page_ranges):
     Returns:
         List of tuples (filename, file_path) for split PDFs
     """
+    temp_dir = None
     try:
         reader = PdfReader(pdf_path)
         total_pages = len(reader.pages)
@@ -230,6 +323,7 @@ def split_pdf_by_page_ranges(pdf_path, page_ranges):
         return split_files, temp_dir
 
     except Exception as e:
+        remove_temp_dir(temp_dir)
         raise Exception(f"Error splitting PDF by ranges: {str(e)}")
 
 
@@ -243,6 +337,7 @@ def split_pdf_into_individual_pages(pdf_path):
     Returns:
         List of tuples (filename, file_path) for split PDFs
     """
+    temp_dir = None
     try:
         reader = PdfReader(pdf_path)
         total_pages = len(reader.pages)
@@ -268,6 +363,7 @@ def split_pdf_into_individual_pages(pdf_path):
         return split_files, temp_dir
 
     except Exception as e:
+        remove_temp_dir(temp_dir)
         raise Exception(f"Error splitting PDF into individual pages: {str(e)}")
 
 @app.route('/login', methods=['GET', 'POST'])
@@ -321,212 +417,436 @@ def get_capabilities():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/upload', methods=['POST'])
-@csrf.exempt
-@login_required
-def upload_file():
-    global current_questions
+def prepare_mcq_upload(form, files):
+    """
+    Validate an MCQ upload, save and extract its PDFs and work out how many
+    questions to generate.
 
-    try:
-        if 'pdfFile' not in request.files:
-            return jsonify({'error': 'No file uploaded'}), 400
+    Shared by the Flask /upload route and the async one in asgi_app.py;
+    files only need a filename and save(path), like Werkzeug's FileStorage.
 
-        file = request.files['pdfFile']
-        if file.filename == '':
-            return jsonify({'error': 'No file selected'}), 400
+    Returns:
+        tuple: (upload, None) with the parsed upload, or (None, (error_body, status))
+    """
+    if 'pdfFile' not in files:
+        return None, ({'error': 'No file uploaded'}, 400)
 
-        # Get form parameters
-        question_count = int(request.form.get('questionCount', 5))
-        use_max_questions = request.form.get('useMaxQuestions') == 'on'
-        difficulty = request.form.get('difficulty', 'medium')
-        model_provider = request.form.get('modelProvider', 'openrouter')
-        model_name = request.form.get('modelName', 'deepseek/deepseek-chat')
-        custom_api_key = request.form.get('customApiKey', '')
-        custom_base_url = request.form.get('customBaseUrl', '')
-        book_name = request.form.get('bookName', '').strip()
-        chapter_name = request.form.get('chapterName', '').strip()
-        prefer_offline = request.form.get('preferOffline') == 'on'
-        use_offline_estimation = request.form.get('useOfflineEstimation') == 'on'
-
-        # Amendment PDF support
-        use_amendment = request.form.get('useAmendment') == 'on'
-        amendment_file = None
-        amendment_text = ""
-
-        amendment_temp_path = None
-        if use_amendment and 'amendmentPdfFile' in request.files:
-            amendment_file = request.files['amendmentPdfFile']
-            if amendment_file and amendment_file.filename != '':
-                amendment_temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f"amendment_{amendment_file.filename}")
-                amendment_file.save(amendment_temp_path)
-                amendment_text = extract_text_from_pdf(amendment_temp_path)
-
-                # Check if amendment extraction was successful
-                is_amendment_error = (isinstance(amendment_text, str) and
-                                     amendment_text.startswith('Error extracting text from PDF:'))
-                if is_amendment_error:
-                    cleanup_temp_files(amendment_temp_path)
-                    return jsonify({'error': 'Failed to extract amendment PDF', 'details': amendment_text}), 400
+    file = files['pdfFile']
+    if file.filename == '':
+        return None, ({'error': 'No file selected'}, 400)
+
+    # Get form parameters
+    question_count = int(form.get('questionCount', 5))
+    use_max_questions = form.get('useMaxQuestions') == 'on'
+    difficulty = form.get('difficulty', 'medium')
+    model_provider = form.get('modelProvider', 'openrouter')
+    model_name = form.get('modelName', 'deepseek/deepseek-chat')
+    custom_api_key = form.get('customApiKey', '')
+    custom_base_url = form.get('customBaseUrl', '')
+    book_name = form.get('bookName', '').strip()
+    chapter_name = form.get('chapterName', '').strip()
+    prefer_offline = form.get('preferOffline') == 'on'
+    use_offline_estimation = form.get('useOfflineEstimation') == 'on'
+    continuation_token = form.get('continuationToken') or None
+    previous_result_id = form.get('resultId') or None
+
+    # Amendment PDF support
+    use_amendment = form.get('useAmendment') == 'on'
+    amendment_file = None
+    amendment_text = ""
 
-        # Save file temporarily
-        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-        file.save(temp_path)
+    amendment_temp_path = None
+    if use_amendment and 'amendmentPdfFile' in files:
+        amendment_file = files['amendmentPdfFile']
+        if amendment_file and amendment_file.filename != '':
+            amendment_temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f"amendment_{amendment_file.filename}")
+            amendment_file.save(amendment_temp_path)
+            amendment_text = extract_text_from_pdf(amendment_temp_path)
 
-        # Extract text and generate questions
-        extracted_text = extract_text_from_pdf(temp_path)
+            # Check if amendment extraction was successful
+            is_amendment_error = (isinstance(amendment_text, str) and
+                                 amendment_text.startswith('Error extracting text from PDF:'))
+            if is_amendment_error:
+                cleanup_temp_files(amendment_temp_path)
+                return None, ({'error': 'Failed to extract amendment PDF', 'details': amendment_text}, 400)
 
-        # Check if text extraction was successful (check for specific error patterns at the start)
-        is_error = (isinstance(extracted_text, str) and
-                   (extracted_text.startswith('Error extracting text from PDF:') or
-                    extracted_text.startswith('PDF Validation Error:') or
-                    extracted_text.startswith('Failed to load PDF document:') or
-                    extracted_text.startswith('No text could be extracted from the PDF') or
-                    extracted_text.startswith('Unexpected error extracting text from PDF:')))
+    # Save file temporarily
+    temp_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
+    file.save(temp_path)
 
-        if is_error:
-            # Clean up before returning error
-            cleanup_temp_files(temp_path)
-            cleanup_temp_files(amendment_temp_path)
+    # Extract text and generate questions
+    extracted_text = extract_text_from_pdf(temp_path)
 
-            # Return detailed error message
-            error_response = {
-                'error': 'PDF Processing Failed',
-                'details': extracted_text,
-                'suggestions': []
-            }
+    # Check if text extraction was successful (check for specific error patterns at the start)
+    is_error = (isinstance(extracted_text, str) and
+               (extracted_text.startswith('Error extracting text from PDF:') or
+                extracted_text.startswith('PDF Validation Error:') or
+                extracted_text.startswith('Failed to load PDF document:') or
+                extracted_text.startswith('No text could be extracted from the PDF') or
+                extracted_text.startswith('Unexpected error extracting text from PDF:')))
 
-            # Add specific suggestions based on error type
-            if "scanned document" in extracted_text or "image-based PDF" in extracted_text:
-                error_response['suggestions'] = [
-                    "🚀 Enable OCR support: Run 'python setup_ocr.py' to handle image PDFs",
-                    "📄 Use a PDF with selectable text instead",
-                    "🌐 Convert using online OCR: https://www.onlineocr.net/",
-                    "📝 Use a different PDF document"
-                ]
-            elif "corrupted" in extracted_text or "password-protected" in extracted_text:
-                error_response['suggestions'] = [
-                    "Check if the PDF file is corrupted",
-                    "If password-protected, remove the password first",
-                    "Try uploading a different PDF file"
-                ]
-            else:
-                error_response['suggestions'] = [
-                    "Ensure the file is a valid PDF document",
-                    "Try uploading a different PDF file",
-                    "Check if the PDF contains readable text"
-                ]
+    if is_error:
+        # Clean up before returning error
+        cleanup_temp_files(temp_path)
+        cleanup_temp_files(amendment_temp_path)
 
-            return jsonify(error_response), 400
+        # Return detailed error message
+        error_response = {
+            'error': 'PDF Processing Failed',
+            'details': extracted_text,
+            'suggestions': []
+        }
 
-        # Check if extracted text is empty
-        if not extracted_text.strip():
-            cleanup_temp_files(temp_path)
-            cleanup_temp_files(amendment_temp_path)
-            return jsonify({
-                'error': 'Empty PDF Content',
-                'details': 'The PDF appears to be empty or contains no readable text.',
-                'suggestions': ['Please upload a PDF with text content.']
-            }), 400
-
-        # Estimate maximum questions and determine how many to generate
-        if use_offline_estimation:
-            estimation_result = estimate_max_questions_detailed(extracted_text)
-            max_questions = estimation_result["max_questions"]
-            estimation_info = estimation_result
+        # Add specific suggestions based on error type
+        if "scanned document" in extracted_text or "image-based PDF" in extracted_text:
+            error_response['suggestions'] = [
+                "🚀 Enable OCR support: Run 'python setup_ocr.py' to handle image PDFs",
+                "📄 Use a PDF with selectable text instead",
+                "🌐 Convert using online OCR: https://www.onlineocr.net/",
+                "📝 Use a different PDF document"
+            ]
+        elif "corrupted" in extracted_text or "password-protected" in extracted_text:
+            error_response['suggestions'] = [
+                "Check if the PDF file is corrupted",
+                "If password-protected, remove the password first",
+                "Try uploading a different PDF file"
+            ]
         else:
-            max_questions = estimate_max_questions(extracted_text, use_offline=False)
-            estimation_info = {"max_questions": max_questions, "confidence": "basic"}
+            error_response['suggestions'] = [
+                "Ensure the file is a valid PDF document",
+                "Try uploading a different PDF file",
+                "Check if the PDF contains readable text"
+            ]
 
-        if use_max_questions:
-            questions_to_generate = max_questions
-        else:
-            questions_to_generate = question_count
-
-        # Prepare model configuration
-        model_config = {
-            'provider': model_provider,
-            'model_name': model_name,
-            'custom_api_key': custom_api_key,
-            'custom_base_url': custom_base_url,
+        return None, (error_response, 400)
+
+    # Check if extracted text is empty
+    if not extracted_text.strip():
+        cleanup_temp_files(temp_path)
+        cleanup_temp_files(amendment_temp_path)
+        return None, ({
+            'error': 'Empty PDF Content',
+            'details': 'The PDF appears to be empty or contains no readable text.',
+            'suggestions': ['Please upload a PDF with text content.']
+        }, 400)
+
+    # Estimate maximum questions and determine how many to generate
+    if use_offline_estimation:
+        estimation_result = estimate_max_questions_detailed(extracted_text)
+        max_questions = estimation_result["max_questions"]
+        estimation_info = estimation_result
+    else:
+        max_questions = estimate_max_questions(extracted_text, use_offline=False)
+        estimation_info = {"max_questions": max_questions, "confidence": "basic"}
+
+    if use_max_questions:
+        questions_to_generate = max_questions
+    else:
+        questions_to_generate = question_count
+
+    # Prepare model configuration
+    model_config = {
+        'provider': model_provider,
+        'model_name': model_name,
+        'custom_api_key': custom_api_key,
+        'custom_base_url': custom_base_url,
+        'book_name': book_name,
+        'chapter_name': chapter_name,
+        'use_amendment': use_amendment,
+        'amendment_text': amendment_text if use_amendment else None
+    }
+
+    print("🏷️  Generating questions with page and section metadata...")
+    if use_amendment and amendment_text:
+        print("📝 Amendment analysis enabled - generating questions covering amendments and changes...")
+
+    return {
+        'temp_path': temp_path,
+        'amendment_temp_path': amendment_temp_path,
+        'extracted_text': extracted_text,
+        'max_questions': max_questions,
+        'estimation_info': estimation_info,
+        'use_max_questions': use_max_questions,
+        'prefer_offline': prefer_offline,
+        'previous_result_id': previous_result_id,
+        'generation_args': {
+            'pdf_path': temp_path,
+            'num_questions': questions_to_generate,
+            'difficulty': difficulty,
             'book_name': book_name,
             'chapter_name': chapter_name,
-            'use_amendment': use_amendment,
-            'amendment_text': amendment_text if use_amendment else None
+            'prefer_offline': prefer_offline,
+            'model_config': model_config,
+            'continuation_token': continuation_token
         }
+    }, None
 
-        # Generate MCQ questions with metadata tracking
-        print("🏷️  Generating questions with page and section metadata...")
-        if use_amendment and amendment_text:
-            print("📝 Amendment analysis enabled - generating questions covering amendments and changes...")
-
-        result = generate_mcq_questions_with_metadata(
-            pdf_path=temp_path,
-            num_questions=questions_to_generate,
-            difficulty=difficulty,
-            book_name=book_name,
-            chapter_name=chapter_name,
-            prefer_offline=prefer_offline,
-            model_config=model_config
-        )
 
-        # Clean up temporary files
-        cleanup_temp_files(temp_path)
-        cleanup_temp_files(amendment_temp_path)
+def mcq_upload_response(upload, result, owner):
+    """
+    Clean up the upload's temp files and build the /upload response body for
+    a generation result.
 
-        # Check if generation failed
-        if 'error' in result:
-            error_response = {
-                'error': 'MCQ Generation Failed',
-                'details': result['error'],
-                'suggestions': []
-            }
+    Returns:
+        tuple: (response_body, status)
+    """
+    cleanup_temp_files(upload['temp_path'])
+    cleanup_temp_files(upload['amendment_temp_path'])
+
+    # Check if generation failed
+    if 'error' in result:
+        error_response = {
+            'error': 'MCQ Generation Failed',
+            'details': result['error'],
+            'suggestions': []
+        }
 
-            # Add specific suggestions based on error type
-            if "context length" in result['error'].lower():
-                error_response['suggestions'] = [
-                    "The document might be too large",
-                    "Try with a smaller document or fewer questions"
-                ]
-            elif "api" in result['error'].lower():
-                error_response['suggestions'] = [
-                    "Check your API key configuration",
-                    "Verify your internet connection",
-                    "Try again in a few moments"
-                ]
-            else:
-                error_response['suggestions'] = [
-                    "Please try again",
-                    "Contact support if the issue persists"
-                ]
+        # Add specific suggestions based on error type
+        if "context length" in result['error'].lower():
+            error_response['suggestions'] = [
+                "The document might be too large",
+                "Try with a smaller document or fewer questions"
+            ]
+        elif "api" in result['error'].lower():
+            error_response['suggestions'] = [
+                "Check your API key configuration",
+                "Verify your internet connection",
+                "Try again in a few moments"
+            ]
+        else:
+            error_response['suggestions'] = [
+                "Please try again",
+                "Contact support if the issue persists"
+            ]
+
+        return error_response, 500
+
+    questions = result['questions']
+    summary = result['summary']
+    pdf_summary = result.get('pdf_summary', 'Summary not available')
+    continuation_token = upload['generation_args']['continuation_token']
+
+    # Keep the result server-side for CSV/PDF export
+    result_id = save_mcq_result(owner, questions, pdf_summary,
+                                upload['previous_result_id'] if continuation_token else None)
+
+    if result.get('partial'):
+        message = (f'Generated {len(questions)} MCQ questions before the time limit '
+                   f'({result["chunks_processed"]}/{result["total_chunks"]} sections) - '
+                   'resend with continuationToken to continue')
+    else:
+        message = f'Successfully generated {len(questions)} MCQ questions'
+
+    return {
+        'result_id': result_id,
+        'questions': questions,
+        'summary': summary,
+        'pdf_summary': pdf_summary,
+        'message': message,
+        'text_length': len(upload['extracted_text']),
+        'max_questions_estimate': upload['max_questions'],
+        'used_max_questions': upload['use_max_questions'],
+        'questions_generated': len(questions),
+        'estimation_info': upload['estimation_info'],
+        'generation_method': 'offline' if upload['prefer_offline'] else 'online_with_fallback',
+        'total_pages': result.get('total_pages', 0),
+        'sections_detected': len(result.get('sections', [])),
+        'token_usage': result.get('token_usage'),
+        'partial': result.get('partial', False),
+        'continuation_token': result.get('continuation_token')
+    }, 200
 
-            return jsonify(error_response), 500
 
-        questions = result['questions']
-        summary = result['summary']
-        pdf_summary = result.get('pdf_summary', 'Summary not available')
+@app.route('/upload', methods=['POST'])
+@csrf.exempt
+@login_required
+def upload_file():
+    # Budget starts when the request arrives, not when generation starts
+    deadline = RequestDeadline.for_request(IS_VERCEL)
 
-        # Store questions globally for download
-        current_questions = questions
-        # Store PDF summary globally for CSV download
-        current_pdf_summary = pdf_summary
+    admission, busy = admit_generation_request(request.form.get('modelName', 'deepseek/deepseek-chat'), deadline)
+    if busy:
+        return busy
+
+    try:
+        upload, error = prepare_mcq_upload(request.form, request.files)
+        if error:
+            return jsonify(error[0]), error[1]
+
+        # Generate MCQ questions with metadata tracking
+        result = generate_mcq_questions_with_metadata(**upload['generation_args'], deadline=deadline)
+
+        body, status = mcq_upload_response(upload, result, current_user.id)
+        return jsonify(body), status
 
-        return jsonify({
-            'questions': questions,
-            'summary': summary,
-            'pdf_summary': pdf_summary,
-            'message': f'Successfully generated {len(questions)} MCQ questions',
-            'text_length': len(extracted_text),
-            'max_questions_estimate': max_questions,
-            'used_max_questions': use_max_questions,
-            'questions_generated': len(questions),
-            'estimation_info': estimation_info,
-            'generation_method': 'offline' if prefer_offline else 'online_with_fallback',
-            'total_pages': result.get('total_pages', 0),
-            'sections_detected': len(result.get('sections', []))
-        })
-        
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+    finally:
+        admission.release()
+
+
+def questions_csv_rows(questions, pdf_summary=None):
+    """
+    Build the CSV rows of the MCQ export.
+
+    Args:
+        questions (list): MCQ questions
+        pdf_summary (str): Optional PDF summary, written to the l2 column of the first row
+
+    Returns:
+        list: One dict per question
+    """
+    # Create DataFrame with l2 column (topic/summary)
+    # Topic is limited to 200 characters and only filled in the FIRST row
+    rows = []
+    for idx, q in enumerate(questions):
+        row = {
+            'question': q.get('text') if q.get('text') else (q.get('question') if q.get('question') else ''),  # Support both 'text' and 'question' keys
+            'option1': q['options'].get('A', ''),
+            'option2': q['options'].get('B', ''),
+            'option3': q['options'].get('C', ''),
+            'option4': q['options'].get('D', ''),
+            'correct': {'A':'1', 'B':'2', 'C':'3', 'D':'4'}.get(q.get('correct', ''), ''),
+            'difficulty': q.get('difficulty', 'medium').capitalize(),
+            'explanation': q.get('explanation', ''),
+            'l2': ''  # Initialize l2 column as empty for all rows
+        }
+        # Add topic (PDF summary) to l2 column ONLY for the first row, limited to 200 characters
+        if pdf_summary and idx == 0:
+            row['l2'] = pdf_summary[:200] if len(pdf_summary) > 200 else pdf_summary
+        rows.append(row)
+    return rows
+
+
+def build_questions_csv(questions, pdf_summary=None):
+    """
+    Build the MCQ CSV export.
+
+    Returns:
+        bytes: UTF-8 CSV with BOM (opens correctly in Excel)
+    """
+    return rows_to_csv(questions_csv_rows(questions, pdf_summary))
+
+
+def rows_to_csv(rows):
+    """CSV bytes (UTF-8 with BOM) of a list of row dicts."""
+    import pandas as pd
+
+    return pd.DataFrame(rows).to_csv(index=False).encode('utf-8-sig')
+
+
+def build_questions_pdf(questions):
+    """
+    Build the MCQ PDF export.
+
+    Args:
+        questions (list): MCQ questions (with optional page/section metadata)
+
+    Returns:
+        bytes: PDF document
+
+    Raises:
+        ValueError: If FPDF produced no content
+    """
+    from fpdf import FPDF
+
+    # Create PDF with proper error handling
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+
+    # Add title
+    pdf.set_font("Arial", 'B', 16)
+    pdf.cell(0, 10, "PDF MCQ Generator-sathish", 0, 1, 'C')
+    pdf.ln(5)
+    pdf.set_font("Arial", 'B', 14)
+    pdf.cell(0, 10, "Multiple Choice Questions", 0, 1, 'C')
+    pdf.ln(10)
+
+    # Add questions
+    for i, q in enumerate(questions, 1):
+        try:
+            # Question - use multi_cell for proper text wrapping
+            pdf.set_font("Arial", 'B', 12)
+            # Support both 'text' and 'question' keys - check if text exists and is not empty
+            question_content = q.get('text', '')
+            if not question_content:
+                question_content = q.get('question', '')
+            if not question_content:
+                question_content = 'No question text'
+            # Encode to latin-1 to handle special characters
+            question_text = f"{i}. {question_content}".encode('latin-1', errors='replace').decode('latin-1')
+
+            # Use multi_cell for automatic text wrapping (supports long questions)
+            pdf.multi_cell(0, 8, question_text)
+            pdf.ln(2)
+
+            # Options - use multi_cell for complete sentences without truncation
+            pdf.set_font("Arial", '', 11)
+            options = q.get('options', {})
+
+            for opt_key in ['A', 'B', 'C', 'D']:
+                opt_text = options.get(opt_key, f'No option {opt_key}')
+                # Encode to latin-1 to handle special characters
+                opt_text = opt_text.encode('latin-1', errors='replace').decode('latin-1')
+                # Use multi_cell to properly wrap long option text
+                pdf.multi_cell(0, 6, f"{opt_key}) {opt_text}")
+
+            pdf.ln(2)
+
+            # Answer and explanation
+            pdf.set_font("Arial", 'B', 11)
+            pdf.cell(0, 6, f"Correct Answer: {q.get('correct', 'N/A')}", 0, 1)
+            pdf.cell(0, 6, f"Difficulty: {q.get('difficulty', 'medium').capitalize()}", 0, 1)
+
+            # Add metadata if available (batch exports also name the source file)
+            metadata = q.get('metadata', {})
+            if metadata or q.get('source_file'):
+                pages = metadata.get('pages', [])
+                sections = metadata.get('sections', [])
+                if q.get('source_file'):
+                    pdf.set_font("Arial", 'I', 10)
+                    source_file = q['source_file'].encode('latin-1', errors='replace').decode('latin-1')
+                    pdf.cell(0, 6, f"File: {source_file}", 0, 1)
+                if pages or sections:
+                    pdf.set_font("Arial", 'I', 10)
+                    metadata_text = "Source: "
+                    if pages:
+                        metadata_text += f"Page(s) {', '.join(map(str, pages))}"
+                    if sections:
+                        if pages:
+                            metadata_text += " | "
+                        metadata_text += f"{', '.join(sections)}"
+                    pdf.cell(0, 6, metadata_text, 0, 1)
+
+            # Explanation - use multi_cell for proper text wrapping
+            pdf.set_font("Arial", '', 10)
+            explanation = q.get('explanation', 'No explanation provided')
+            # Encode to latin-1 to handle special characters
+            explanation = f"Explanation: {explanation}".encode('latin-1', errors='replace').decode('latin-1')
+            # Use multi_cell for automatic text wrapping
+            pdf.multi_cell(0, 6, explanation)
+
+            pdf.ln(8)
+
+        except Exception as question_error:
+            print(f"Error processing question {i}: {question_error}")
+            # Add a simple error message and continue
+            pdf.set_font("Arial", '', 10)
+            pdf.cell(0, 6, f"Error processing question {i}", 0, 1)
+            pdf.ln(4)
+            continue
+
+    # Use output(dest='S') which works reliably
+    pdf_string = pdf.output(dest='S')
+    if not pdf_string:
+        raise ValueError('PDF generation failed - empty content')
+
+    pdf_content = pdf_string.encode('latin-1') if isinstance(pdf_string, str) else bytes(pdf_string)
+    if len(pdf_content) == 0:
+        raise ValueError('PDF generation failed - 0 bytes generated')
+    return pdf_content
+
 
 @app.route('/download-csv', methods=['POST'])
 @csrf.exempt
@@ -537,6 +857,10 @@ def download_csv():
         if not data:
             return jsonify({'error': 'No data provided'}), 400
 
+        data = get_export_result(data)
+        if data is None:
+            return jsonify({'error': 'Result not found - it may have expired, please generate again'}), 404
+
         # Handle both old format (direct questions array) and new format (with pdf_summary)
         if isinstance(data, list):
             questions = data
@@ -548,33 +872,7 @@ def download_csv():
         if not questions:
             return jsonify({'error': 'No questions data provided'}), 400
 
-        # Create DataFrame with l2 column (topic/summary)
-        # Topic is limited to 200 characters and only filled in the FIRST row
-        rows = []
-        for idx, q in enumerate(questions):
-            row = {
-                'question': q.get('text') if q.get('text') else (q.get('question') if q.get('question') else ''),  # Support both 'text' and 'question' keys
-                'option1': q['options'].get('A', ''),
-                'option2': q['options'].get('B', ''),
-                'option3': q['options'].get('C', ''),
-                'option4': q['options'].get('D', ''),
-                'correct': {'A':'1', 'B':'2', 'C':'3', 'D':'4'}.get(q.get('correct', ''), ''),
-                'difficulty': q.get('difficulty', 'medium').capitalize(),
-                'explanation': q.get('explanation', ''),
-                'l2': ''  # Initialize l2 column as empty for all rows
-            }
-            # Add topic (PDF summary) to l2 column ONLY for the first row, limited to 200 characters
-            if pdf_summary and idx == 0:
-                row['l2'] = pdf_summary[:200] if len(pdf_summary) > 200 else pdf_summary
-            rows.append(row)
-
-        df = pd.DataFrame(rows)
-
-        # Create CSV in memory
-        csv_buffer = BytesIO()
-        csv_data = df.to_csv(index=False).encode('utf-8-sig')
-        csv_buffer.write(csv_data)
-        csv_buffer.seek(0)
+        csv_buffer = BytesIO(build_questions_csv(questions, pdf_summary))
 
         return send_file(
             csv_buffer,
@@ -586,6 +884,179 @@ def download_csv():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def sse_event(event):
+    """Format an event dict as a Server-Sent Events data line."""
+    return f"data: {json.dumps(event)}\n\n"
+
+
+def parse_stream_upload(form, files):
+    """
+    Parse an /upload-stream request and save its PDFs.
+
+    Shared by the Flask /upload-stream route and the async one in asgi_app.py.
+
+    Returns:
+        dict or None: The parsed upload, None if no PDF file was sent
+    """
+    file = files.get('pdfFile')
+    if not file or file.filename == '':
+        return None
+
+    upload = {
+        'question_count': int(form.get('questionCount', 5)),
+        'difficulty': form.get('difficulty', 'medium'),
+        'model_provider': form.get('modelProvider', 'openrouter'),
+        'model_name': form.get('modelName', 'deepseek/deepseek-chat'),
+        'custom_api_key': form.get('customApiKey', ''),
+        'custom_base_url': form.get('customBaseUrl', ''),
+        'use_max_questions': form.get('useMaxQuestions', 'false').lower() == 'true',
+        'book_name': form.get('bookName', ''),
+        'chapter_name': form.get('chapterName', ''),
+        'prefer_offline': form.get('preferOffline', 'false').lower() == 'true',
+        'use_offline_estimation': form.get('useOfflineEstimation', 'false').lower() == 'true',
+        'use_amendment': form.get('useAmendment', 'false').lower() == 'true',
+        'continuation_token': form.get('continuationToken') or None,
+        'previous_result_id': form.get('resultId') or None,
+        'amendment_text': None,
+        'amendment_temp_path': None
+    }
+
+    # Handle amendment PDF if provided
+    if upload['use_amendment'] and 'amendmentPdfFile' in files:
+        amendment_file = files['amendmentPdfFile']
+        if amendment_file and amendment_file.filename != '':
+            amendment_temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f"amendment_{amendment_file.filename}")
+            amendment_file.save(amendment_temp_path)
+            upload['amendment_temp_path'] = amendment_temp_path
+            upload['amendment_text'] = extract_text_from_pdf(amendment_temp_path)
+
+    # Save main PDF
+    upload['temp_path'] = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
+    file.save(upload['temp_path'])
+    return upload
+
+
+def stream_preparation_events(upload):
+    """
+    Extract the uploaded PDF and estimate the question count, yielding
+    progress events along the way.
+
+    Sets upload['generation_args'] when generation can start; on an
+    extraction error the last event is the error and the temp files are gone.
+    """
+    yield {'status': 'progress', 'message': '� File received, starting processing...'}
+
+    if upload['amendment_text']:
+        yield {'status': 'progress', 'message': '📝 Amendment PDF processed'}
+
+    # Extract text
+    yield {'status': 'progress', 'message': '📄 Extracting text from PDF with page tracking...'}
+    extracted_text = extract_text_from_pdf(upload['temp_path'])
+
+    # Check for extraction errors
+    is_error = (isinstance(extracted_text, str) and
+               (extracted_text.startswith('Error') or extracted_text.startswith('PDF') or
+                extracted_text.startswith('Failed') or extracted_text.startswith('No text')))
+
+    if is_error:
+        cleanup_temp_files(upload['temp_path'])
+        cleanup_temp_files(upload['amendment_temp_path'])
+        yield {'status': 'error', 'message': extracted_text}
+        return
+
+    upload['extracted_text'] = extracted_text
+    yield {'status': 'progress', 'message': f'📊 Extracted {len(extracted_text)} characters from PDF'}
+
+    # Estimate questions
+    if upload['use_offline_estimation']:
+        yield {'status': 'progress', 'message': '🔢 Estimating optimal question count...'}
+        estimation_result = estimate_max_questions_detailed(extracted_text)
+        max_questions = estimation_result["max_questions"]
+    else:
+        max_questions = estimate_max_questions(extracted_text, use_offline=False)
+
+    upload['max_questions'] = max_questions
+    questions_to_generate = max_questions if upload['use_max_questions'] else upload['question_count']
+
+    yield {'status': 'progress',
+           'message': f"🎯 Will generate {questions_to_generate} questions ({upload['difficulty']} difficulty)"}
+
+    # Prepare model configuration
+    model_config = {
+        'provider': upload['model_provider'],
+        'model_name': upload['model_name'],
+        'custom_api_key': upload['custom_api_key'],
+        'custom_base_url': upload['custom_base_url'],
+        'book_name': upload['book_name'],
+        'chapter_name': upload['chapter_name'],
+        'use_amendment': upload['use_amendment'],
+        'amendment_text': upload['amendment_text'] if upload['use_amendment'] else None
+    }
+
+    yield {'status': 'progress', 'message': f"🤖 Using model: {upload['model_name']}"}
+    yield {'status': 'progress', 'message': '⚙️ Generating MCQ questions with AI...'}
+
+    upload['generation_args'] = {
+        'pdf_path': upload['temp_path'],
+        'num_questions': questions_to_generate,
+        'difficulty': upload['difficulty'],
+        'book_name': upload['book_name'],
+        'chapter_name': upload['chapter_name'],
+        'prefer_offline': upload['prefer_offline'],
+        'model_config': model_config,
+        'continuation_token': upload['continuation_token']
+    }
+
+
+def stream_result_events(upload, result, owner):
+    """Yield the closing events of a streamed upload for a generation result."""
+    # Check for errors
+    if 'error' in result:
+        yield {'status': 'error', 'message': result['error']}
+        return
+
+    questions = result['questions']
+    summary = result['summary']
+    pdf_summary = result.get('pdf_summary', 'Summary not available')
+
+    yield {'status': 'progress', 'message': f'✅ Generated {len(questions)} questions successfully!'}
+    yield {'status': 'progress', 'message': '📋 Adding page and section metadata...'}
+
+    if result.get('partial'):
+        message = (f'Generated {len(questions)} MCQ questions before the time limit '
+                   f'({result["chunks_processed"]}/{result["total_chunks"]} sections)')
+    else:
+        message = f'Successfully generated {len(questions)} MCQ questions'
+
+    result_id = save_mcq_result(owner, questions, pdf_summary,
+                                upload['previous_result_id'] if upload['continuation_token'] else None)
+
+    # Send final result
+    yield {
+        'status': 'complete',
+        'result_id': result_id,
+        'message': message,
+        'questions': questions,
+        'summary': summary,
+        'pdf_summary': pdf_summary,
+        'text_length': len(upload['extracted_text']),
+        'max_questions_estimate': upload['max_questions'],
+        'questions_generated': len(questions),
+        'total_pages': result.get('total_pages', 0),
+        'sections_detected': len(result.get('sections', [])),
+        'token_usage': result.get('token_usage'),
+        'partial': result.get('partial', False),
+        'continuation_token': result.get('continuation_token')
+    }
+
+
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'Connection': 'keep-alive',
+    'X-Accel-Buffering': 'no'
+}
+
+
 @app.route('/upload-stream', methods=['POST'])
 @csrf.exempt
 @login_required
@@ -594,49 +1065,32 @@ def upload_stream():
     Streaming upload endpoint that returns real-time progress updates via Server-Sent Events.
     This endpoint provides detailed progress messages during question generation.
     """
+    # Budget starts when the request arrives, not when generation starts
+    deadline = RequestDeadline.for_request(IS_VERCEL)
+
+    admission, busy = admit_generation_request(request.form.get('modelName', 'deepseek/deepseek-chat'), deadline)
+    if busy:
+        return busy
+
     # Generate unique session ID for this upload
     session_id = str(uuid.uuid4())
 
     # Create a progress queue for this session
     progress_queue = queue.Queue()
-    progress_queues[session_id] = progress_queue
+    progress_queues.register(session_id, progress_queue)
 
     # IMPORTANT: Extract ALL request data BEFORE the generator function
     # This is because the request context is not available inside the generator
-    file = request.files.get('pdfFile')
-    if not file or file.filename == '':
-        return Response(
-            f"data: {json.dumps({'status': 'error', 'message': 'No PDF file provided'})}\n\n",
-            mimetype='text/event-stream'
-        )
-
-    # Parse form parameters (must be done before generator)
-    question_count = int(request.form.get('questionCount', 5))
-    difficulty = request.form.get('difficulty', 'medium')
-    model_provider = request.form.get('modelProvider', 'openrouter')
-    model_name = request.form.get('modelName', 'deepseek/deepseek-chat')
-    custom_api_key = request.form.get('customApiKey', '')
-    custom_base_url = request.form.get('customBaseUrl', '')
-    use_max_questions = request.form.get('useMaxQuestions', 'false').lower() == 'true'
-    book_name = request.form.get('bookName', '')
-    chapter_name = request.form.get('chapterName', '')
-    prefer_offline = request.form.get('preferOffline', 'false').lower() == 'true'
-    use_offline_estimation = request.form.get('useOfflineEstimation', 'false').lower() == 'true'
-    use_amendment = request.form.get('useAmendment', 'false').lower() == 'true'
-
-    # Handle amendment PDF if provided (must be done before generator)
-    amendment_text = None
-    amendment_temp_path = None
-    if use_amendment and 'amendmentPdfFile' in request.files:
-        amendment_file = request.files['amendmentPdfFile']
-        if amendment_file and amendment_file.filename != '':
-            amendment_temp_path = os.path.join(app.config['UPLOAD_FOLDER'], f"amendment_{amendment_file.filename}")
-            amendment_file.save(amendment_temp_path)
-            amendment_text = extract_text_from_pdf(amendment_temp_path)
-
-    # Save main PDF (must be done before generator)
-    temp_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-    file.save(temp_path)
+    try:
+        upload = parse_stream_upload(request.form, request.files)
+    except Exception:
+        admission.release()
+        raise
+    if upload is None:
+        admission.release()
+        return Response(sse_event({'status': 'error', 'message': 'No PDF file provided'}),
+                        mimetype='text/event-stream')
+    owner = current_user.id
 
     def send_progress(message, status='progress', data=None):
         """Send progress update to the queue."""
@@ -645,228 +1099,93 @@ def upload_stream():
             event_data.update(data)
         progress_queue.put(json.dumps(event_data))
 
+    cancellation = CancellationToken()
+    outcome = {}
+
     def generate():
         """Generator function for SSE stream."""
+        worker = None
         try:
-            yield f"data: {json.dumps({'status': 'progress', 'message': '� File received, starting processing...'})}\n\n"
-
-            if amendment_text:
-                yield f"data: {json.dumps({'status': 'progress', 'message': '📝 Amendment PDF processed'})}\n\n"
-
-            # Extract text
-            yield f"data: {json.dumps({'status': 'progress', 'message': '📄 Extracting text from PDF with page tracking...'})}\n\n"
-            extracted_text = extract_text_from_pdf(temp_path)
-
-            # Check for extraction errors
-            is_error = (isinstance(extracted_text, str) and
-                       (extracted_text.startswith('Error') or extracted_text.startswith('PDF') or
-                        extracted_text.startswith('Failed') or extracted_text.startswith('No text')))
-
-            if is_error:
-                cleanup_temp_files(temp_path)
-                cleanup_temp_files(amendment_temp_path)
-                yield f"data: {json.dumps({'status': 'error', 'message': extracted_text})}\n\n"
+            for event in stream_preparation_events(upload):
+                yield sse_event(event)
+            if 'generation_args' not in upload:
                 return
 
-            yield f"data: {json.dumps({'status': 'progress', 'message': f'📊 Extracted {len(extracted_text)} characters from PDF'})}\n\n"
-
-            # Estimate questions
-            if use_offline_estimation:
-                yield f"data: {json.dumps({'status': 'progress', 'message': '🔢 Estimating optimal question count...'})}\n\n"
-                estimation_result = estimate_max_questions_detailed(extracted_text)
-                max_questions = estimation_result["max_questions"]
-            else:
-                max_questions = estimate_max_questions(extracted_text, use_offline=False)
-
-            questions_to_generate = max_questions if use_max_questions else question_count
-
-            yield f"data: {json.dumps({'status': 'progress', 'message': f'🎯 Will generate {questions_to_generate} questions ({difficulty} difficulty)'})}\n\n"
-
-            # Prepare model configuration
-            model_config = {
-                'provider': model_provider,
-                'model_name': model_name,
-                'custom_api_key': custom_api_key,
-                'custom_base_url': custom_base_url,
-                'book_name': book_name,
-                'chapter_name': chapter_name,
-                'use_amendment': use_amendment,
-                'amendment_text': amendment_text if use_amendment else None
-            }
-
-            yield f"data: {json.dumps({'status': 'progress', 'message': f'🤖 Using model: {model_name}'})}\n\n"
-            yield f"data: {json.dumps({'status': 'progress', 'message': '⚙️ Generating MCQ questions with AI...'})}\n\n"
-
-            # Generate questions
-            result = generate_mcq_questions_with_metadata(
-                pdf_path=temp_path,
-                num_questions=questions_to_generate,
-                difficulty=difficulty,
-                book_name=book_name,
-                chapter_name=chapter_name,
-                prefer_offline=prefer_offline,
-                model_config=model_config
-            )
-
-            # Cleanup temp files
-            cleanup_temp_files(temp_path)
-            cleanup_temp_files(amendment_temp_path)
-
-            # Check for errors
-            if 'error' in result:
-                yield f"data: {json.dumps({'status': 'error', 'message': result['error']})}\n\n"
-                return
-
-            questions = result['questions']
-            summary = result['summary']
-            pdf_summary = result.get('pdf_summary', 'Summary not available')
-
-            yield f"data: {json.dumps({'status': 'progress', 'message': f'✅ Generated {len(questions)} questions successfully!'})}\n\n"
-            yield f"data: {json.dumps({'status': 'progress', 'message': '📋 Adding page and section metadata...'})}\n\n"
-
-            # Send final result
-            final_result = {
-                'status': 'complete',
-                'message': f'Successfully generated {len(questions)} MCQ questions',
-                'questions': questions,
-                'summary': summary,
-                'pdf_summary': pdf_summary,
-                'text_length': len(extracted_text),
-                'max_questions_estimate': max_questions,
-                'questions_generated': len(questions),
-                'total_pages': result.get('total_pages', 0),
-                'sections_detected': len(result.get('sections', []))
-            }
-            yield f"data: {json.dumps(final_result)}\n\n"
+            # Generate questions on a worker thread; its chunk progress arrives
+            # through the progress queue and is forwarded as it happens
+            def run_generation():
+                try:
+                    outcome['result'] = generate_mcq_questions_with_metadata(
+                        **upload['generation_args'],
+                        deadline=deadline,
+                        progress=lambda message, **details: send_progress(message, data=details),
+                        cancellation=cancellation
+                    )
+                except Exception as e:
+                    outcome['result'] = {'error': str(e)}
+                finally:
+                    # Cleanup temp files
+                    cleanup_temp_files(upload['temp_path'])
+                    cleanup_temp_files(upload['amendment_temp_path'])
+                    progress_queue.put(None)
+
+            worker = threading.Thread(target=run_generation, name=f"upload-stream-{session_id[:8]}", daemon=True)
+            worker.start()
+
+            while True:
+                try:
+                    event = progress_queue.get(timeout=STREAM_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    # SSE comment: keeps proxies from closing an idle stream and
+                    # surfaces a client disconnect as a failed write
+                    yield ": heartbeat\n\n"
+                    continue
+                if event is None:
+                    break
+                yield f"data: {event}\n\n"
+
+            for event in stream_result_events(upload, outcome['result'], owner):
+                yield sse_event(event)
 
         except Exception as e:
-            yield f"data: {json.dumps({'status': 'error', 'message': str(e)})}\n\n"
+            yield sse_event({'status': 'error', 'message': str(e)})
         finally:
+            # The client went away (GeneratorExit) while chunks were still
+            # being generated: stop the run instead of paying for it
+            if worker is not None and 'result' not in outcome:
+                print(f"🛑 Stream {session_id[:8]} closed by the client - cancelling generation")
+                cancellation.cancel()
             # Cleanup progress queue
-            if session_id in progress_queues:
-                del progress_queues[session_id]
+            progress_queues.remove(session_id)
 
-    return Response(generate(), mimetype='text/event-stream', headers={
-        'Cache-Control': 'no-cache',
-        'Connection': 'keep-alive',
-        'X-Accel-Buffering': 'no'
-    })
+    # The slot is held until the stream is closed, however that happens
+    response = Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
+    response.call_on_close(admission.release)
+    return response
 
 @app.route('/download-pdf', methods=['POST'])
 @csrf.exempt
 @login_required
 def download_pdf():
     try:
-        questions = request.json
+        data = request.json
+        if not data:
+            return jsonify({'error': 'No questions data provided'}), 400
+
+        data = get_export_result(data)
+        if data is None:
+            return jsonify({'error': 'Result not found - it may have expired, please generate again'}), 404
+
+        # Stored results carry the questions under 'questions'; older clients post the list itself
+        questions = data.get('questions', []) if isinstance(data, dict) else data
         if not questions:
             return jsonify({'error': 'No questions data provided'}), 400
 
         print(f"Generating PDF for {len(questions)} questions")
 
-        # Create PDF with proper error handling
-        pdf = FPDF()
-        pdf.set_auto_page_break(auto=True, margin=15)
-        pdf.add_page()
-
-        # Add title
-        pdf.set_font("Arial", 'B', 16)
-        pdf.cell(0, 10, "PDF MCQ Generator-sathish", 0, 1, 'C')
-        pdf.ln(5)
-        pdf.set_font("Arial", 'B', 14)
-        pdf.cell(0, 10, "Multiple Choice Questions", 0, 1, 'C')
-        pdf.ln(10)
-
-        # Add questions
-        for i, q in enumerate(questions, 1):
-            try:
-                # Question - use multi_cell for proper text wrapping
-                pdf.set_font("Arial", 'B', 12)
-                # Support both 'text' and 'question' keys - check if text exists and is not empty
-                question_content = q.get('text', '')
-                if not question_content:
-                    question_content = q.get('question', '')
-                if not question_content:
-                    question_content = 'No question text'
-                # Encode to latin-1 to handle special characters
-                question_text = f"{i}. {question_content}".encode('latin-1', errors='replace').decode('latin-1')
-
-                # Use multi_cell for automatic text wrapping (supports long questions)
-                pdf.multi_cell(0, 8, question_text)
-                pdf.ln(2)
-
-                # Options - use multi_cell for complete sentences without truncation
-                pdf.set_font("Arial", '', 11)
-                options = q.get('options', {})
-
-                for opt_key in ['A', 'B', 'C', 'D']:
-                    opt_text = options.get(opt_key, f'No option {opt_key}')
-                    # Encode to latin-1 to handle special characters
-                    opt_text = opt_text.encode('latin-1', errors='replace').decode('latin-1')
-                    # Use multi_cell to properly wrap long option text
-                    pdf.multi_cell(0, 6, f"{opt_key}) {opt_text}")
-
-                pdf.ln(2)
-
-                # Answer and explanation
-                pdf.set_font("Arial", 'B', 11)
-                pdf.cell(0, 6, f"Correct Answer: {q.get('correct', 'N/A')}", 0, 1)
-                pdf.cell(0, 6, f"Difficulty: {q.get('difficulty', 'medium').capitalize()}", 0, 1)
-
-                # Add metadata if available
-                metadata = q.get('metadata', {})
-                if metadata:
-                    pages = metadata.get('pages', [])
-                    sections = metadata.get('sections', [])
-                    if pages or sections:
-                        pdf.set_font("Arial", 'I', 10)
-                        metadata_text = "Source: "
-                        if pages:
-                            metadata_text += f"Page(s) {', '.join(map(str, pages))}"
-                        if sections:
-                            if pages:
-                                metadata_text += " | "
-                            metadata_text += f"{', '.join(sections)}"
-                        pdf.cell(0, 6, metadata_text, 0, 1)
-
-                # Explanation - use multi_cell for proper text wrapping
-                pdf.set_font("Arial", '', 10)
-                explanation = q.get('explanation', 'No explanation provided')
-                # Encode to latin-1 to handle special characters
-                explanation = f"Explanation: {explanation}".encode('latin-1', errors='replace').decode('latin-1')
-                # Use multi_cell for automatic text wrapping
-                pdf.multi_cell(0, 6, explanation)
-
-                pdf.ln(8)
-
-            except Exception as question_error:
-                print(f"Error processing question {i}: {question_error}")
-                # Add a simple error message and continue
-                pdf.set_font("Arial", '', 10)
-                pdf.cell(0, 6, f"Error processing question {i}", 0, 1)
-                pdf.ln(4)
-                continue
-        
-        # Create PDF in memory (use the working method)
-        pdf_buffer = BytesIO()
         try:
-            # Use output(dest='S') which works reliably
-            pdf_string = pdf.output(dest='S')
-
-            if not pdf_string:
-                print("Error: PDF generation returned empty content")
-                return jsonify({'error': 'PDF generation failed - empty content'}), 500
-
-            if isinstance(pdf_string, str):
-                pdf_buffer.write(pdf_string.encode('latin-1'))
-            else:
-                pdf_buffer.write(pdf_string)
-            pdf_buffer.seek(0)
-
-            # Verify PDF content
-            pdf_content = pdf_buffer.getvalue()
-            if len(pdf_content) == 0:
-                print("Error: PDF buffer is empty")
-                return jsonify({'error': 'PDF generation failed - 0 bytes generated'}), 500
+            pdf_content = build_questions_pdf(questions)
+            pdf_buffer = BytesIO(pdf_content)
 
             print(f"PDF generated successfully: {len(pdf_content)} bytes")
 
@@ -877,6 +1196,9 @@ def download_pdf():
                 download_name='mcq_questions.pdf'
             )
 
+        except ValueError as empty_error:
+            print(f"Error: {empty_error}")
+            return jsonify({'error': str(empty_error)}), 500
         except Exception as output_error:
             print(f"Error generating PDF output: {output_error}")
             return jsonify({'error': f'PDF generation failed: {output_error}'}), 500
@@ -885,60 +1207,6 @@ def download_pdf():
         return jsonify({'error': str(e)}), 500
 
 
-class ProfessionalNotesPDF(FPDF):
-    """Custom PDF class for professional notes with headers and footers"""
-
-    def __init__(self, title="Study Material", website="www.example.com"):
-        super().__init__()
-        self.doc_title = title
-        self.website = website
-        self.header_title = "Study Material"
-
-    def header(self):
-        """Add header to each page (except cover page)"""
-        if self.page_no() > 1:
-            # Blue line at top
-            self.set_draw_color(0, 102, 204)
-            self.set_line_width(0.5)
-            self.line(10, 15, 200, 15)
-
-            # Left header - Study Material
-            self.set_font('Arial', 'BI', 10)
-            self.set_text_color(0, 102, 204)
-            self.set_xy(10, 8)
-            self.cell(95, 6, self.header_title, 0, 0, 'L')
-
-            # Right header - Document title
-            self.set_font('Arial', 'BI', 10)
-            self.set_text_color(0, 102, 204)
-            self.set_xy(105, 8)
-            self.cell(95, 6, self.doc_title, 0, 0, 'R')
-
-            self.ln(15)
-
-    def footer(self):
-        """Add footer to each page (except cover page)"""
-        if self.page_no() > 1:
-            self.set_y(-20)
-
-            # Red line
-            self.set_draw_color(204, 51, 51)
-            self.set_line_width(0.5)
-            self.line(10, self.get_y(), 200, self.get_y())
-
-            # Page number (center)
-            self.set_font('Arial', 'B', 10)
-            self.set_text_color(0, 0, 0)
-            self.set_y(-15)
-            self.cell(0, 10, str(self.page_no()), 0, 0, 'C')
-
-            # Website (right)
-            self.set_font('Arial', 'B', 9)
-            self.set_text_color(0, 102, 204)
-            self.set_xy(150, -15)
-            self.cell(50, 10, self.website, 0, 0, 'R')
-
-
 def create_professional_notes_pdf(notes, filename, title=None, website="Dakshin Postal Academy", prepared_for=None):
     """
     Create a professional PDF with cover page and formatted content.
@@ -960,6 +1228,7 @@ def create_professional_notes_pdf(notes, filename, title=None, website="Dakshin
         prepared_for: List of target audiences (e.g., ['Group B', 'Inspector'])
     """
     import re
+    from notes_pdf import ProfessionalNotesPDF
 
     clean_filename = filename.replace('.pdf', '') if filename else 'Study Notes'
     doc_title = title if title else clean_filename
@@ -1419,8 +1688,12 @@ def download_notes_pdf():
         if not data:
             return jsonify({'error': 'No data provided'}), 400
 
-        notes = data.get('notes', '')
-        filename = data.get('filename', 'notes')
+        stored = get_export_result({'result_id': data['result_id']}) if data.get('result_id') else None
+        if data.get('result_id') and stored is None:
+            return jsonify({'error': 'Result not found - it may have expired, please generate again'}), 404
+
+        notes = stored['notes'] if stored else data.get('notes', '')
+        filename = data.get('filename') or (stored or {}).get('filename') or 'notes'
         title = data.get('title', None)  # Optional custom title
         website = data.get('website', 'Dakshin Postal Academy')
         prepared_for = data.get('prepared_for', None)  # List of target audiences
@@ -1501,8 +1774,6 @@ def download_notes_pdf():
 @login_required
 def parse_mcq():
     """Parse an existing MCQ PDF and extract questions with answers"""
-    global current_questions
-
     try:
         if 'pdfFile' not in request.files:
             return jsonify({'error': 'No file uploaded'}), 400
@@ -1560,11 +1831,12 @@ def parse_mcq():
                     ]
                 }), 400
 
-            # Store questions globally for download
-            current_questions = questions
+            # Keep the result server-side for CSV/PDF export
+            result_id = save_mcq_result(current_user.id, questions)
 
             # Format response
             response = {
+                'result_id': result_id,
                 'questions': questions,
                 'summary': {
                     'total_questions': summary.get('total_questions', 0),
@@ -1704,15 +1976,13 @@ def split_pdf():
         # Create a session ID for this split operation
         session_id = str(uuid.uuid4())
 
-        # Store split files info in session
-        if 'split_sessions' not in app.config:
-            app.config['split_sessions'] = {}
-
-        app.config['split_sessions'][session_id] = {
-            'files': split_files,
-            'temp_dir': temp_dir,
-            'created_at': pd.Timestamp.now()
-        }
+        # Store split files info in session (removed with its temp dir once expired)
+        app.config['split_sessions'].register(
+            session_id,
+            {'files': split_files, 'temp_dir': temp_dir},
+            size_bytes=directory_size(temp_dir),
+            temp_dir=temp_dir
+        )
 
         # Prepare response with file information
         files_info = []
@@ -1757,10 +2027,10 @@ def download_split_pdf(session_id, filename):
         # Decode the filename from URL encoding
         filename = unquote(filename)
 
-        if 'split_sessions' not in app.config or session_id not in app.config['split_sessions']:
+        session_data = app.config['split_sessions'].get(session_id)
+        if session_data is None:
             return jsonify({'error': 'Session not found or expired'}), 404
 
-        session_data = app.config['split_sessions'][session_id]
         split_files = session_data['files']
 
         # Find the requested file
@@ -1802,12 +2072,17 @@ def summarize_pdf():
     model_provider = request.form.get('modelProvider', 'openrouter')
     model_type = request.form.get('modelType', 'deepseek/deepseek-chat')
 
-    # Save file temporarily
-    temp_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-    file.save(temp_path)
+    admission, busy = admit_generation_request(model_type)
+    if busy:
+        return busy
 
+    temp_path = None
     try:
+        # Save file temporarily
+        temp_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
+        os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+        file.save(temp_path)
+
         # Extract text from PDF
         print(f"📄 Processing PDF for comprehensive notes: {file.filename}")
         extracted_text = extract_text_from_pdf(temp_path)
@@ -1824,10 +2099,12 @@ def summarize_pdf():
         print(f"🤖 Generating comprehensive notes with model: {model_type}")
 
         # Generate comprehensive academic notes using the AI model
+        usage_stats = new_token_usage()
         notes = generate_comprehensive_notes(
             text=extracted_text,
             model_provider=model_provider,
-            model_type=model_type
+            model_type=model_type,
+            usage_stats=usage_stats
         )
 
         # Check for actual generation failure (specific error message from generate_comprehensive_notes)
@@ -1839,13 +2116,18 @@ def summarize_pdf():
 
         print(f"✅ Notes generated: {len(notes)} characters")
 
+        result_id = new_result_id()
+        result_store.put(result_id, current_user.id, {'type': 'notes', 'notes': notes, 'filename': file.filename})
+
         return jsonify({
+            'result_id': result_id,
             'success': True,
             'summary': notes,  # Keep 'summary' key for frontend compatibility
             'filename': file.filename,
             'total_pages': total_pages,
             'text_length': len(extracted_text),
-            'model_used': model_type
+            'model_used': model_type,
+            'token_usage': usage_stats
         }), 200
 
     except Exception as e:
@@ -1857,11 +2139,366 @@ def summarize_pdf():
         }), 500
 
     finally:
+        admission.release()
         # Clean up temporary file
-        if os.path.exists(temp_path):
+        if temp_path and os.path.exists(temp_path):
             cleanup_temp_files(temp_path)
 
 
+# ============================================
+# Asynchronous Job API
+# ============================================
+
+JOB_EVENTS_POLL_INTERVAL = 1.0  # seconds between progress checks of the SSE stream
+
+
+def get_owned_job(job_id):
+    """Return the job if it exists and belongs to the current user, else None."""
+    job = get_job(job_id)
+    if job is None or job['owner'] != current_user.id:
+        return None
+    return job
+
+
+@app.route('/jobs', methods=['POST'])
+@csrf.exempt
+@login_required
+def create_job():
+    """
+    Queue a generation job and return its id immediately.
+
+    Takes the same form fields as /upload (jobType 'mcq', the default) or
+    /summarize-pdf (jobType 'notes'). Poll GET /jobs/<id> or follow
+    GET /jobs/<id>/events for progress.
+    """
+    job_type = request.form.get('jobType', 'mcq')
+    if job_type not in JOB_HANDLERS:
+        return jsonify({'error': f"Unknown job type '{job_type}'",
+                        'supported_job_types': list(JOB_HANDLERS)}), 400
+    if job_type == 'batch':
+        return jsonify({'error': 'Batch jobs take several files - use POST /batch'}), 400
+
+    file = request.files.get('pdfFile')
+    if not file or file.filename == '':
+        return jsonify({'error': 'No file uploaded'}), 400
+
+    job_id = new_job_id()
+    files_dir = job_directory(job_id)
+    pdf_path = os.path.join(files_dir, os.path.basename(file.filename))
+    file.save(pdf_path)
+
+    if job_type == 'notes':
+        params = {
+            'pdf_path': pdf_path,
+            'filename': file.filename,
+            'model_provider': request.form.get('modelProvider', 'openrouter'),
+            'model_type': request.form.get('modelType', 'deepseek/deepseek-chat')
+        }
+    else:
+        use_amendment = request.form.get('useAmendment', 'false').lower() in ('on', 'true')
+        amendment_path = None
+        amendment_file = request.files.get('amendmentPdfFile')
+        if use_amendment and amendment_file and amendment_file.filename != '':
+            amendment_path = os.path.join(files_dir, f"amendment_{os.path.basename(amendment_file.filename)}")
+            amendment_file.save(amendment_path)
+
+        params = {
+            'pdf_path': pdf_path,
+            'amendment_path': amendment_path,
+            'filename': file.filename,
+            'num_questions': int(request.form.get('questionCount', 5)),
+            'use_max_questions': request.form.get('useMaxQuestions', 'false').lower() in ('on', 'true'),
+            'use_offline_estimation': request.form.get('useOfflineEstimation', 'false').lower() in ('on', 'true'),
+            'difficulty': request.form.get('difficulty', 'medium'),
+            'prefer_offline': request.form.get('preferOffline', 'false').lower() in ('on', 'true'),
+            'model_config': {
+                'provider': request.form.get('modelProvider', 'openrouter'),
+                'model_name': request.form.get('modelName', 'deepseek/deepseek-chat'),
+                'custom_api_key': request.form.get('customApiKey', ''),
+                'custom_base_url': request.form.get('customBaseUrl', ''),
+                'book_name': request.form.get('bookName', '').strip(),
+                'chapter_name': request.form.get('chapterName', '').strip(),
+                'use_amendment': use_amendment
+            }
+        }
+
+    enqueue_job(job_type, params, owner=current_user.id, job_id=job_id)
+    get_worker_pool().notify()
+
+    return jsonify({
+        'job_id': job_id,
+        'job_type': job_type,
+        'status': JOB_STATUS_QUEUED,
+        'status_url': url_for('job_status', job_id=job_id),
+        'events_url': url_for('job_events', job_id=job_id)
+    }), 202
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+@login_required
+def job_status(job_id):
+    """Return the status of a job, its progress messages and, once finished, its result."""
+    job = get_owned_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    response = {
+        'job_id': job['id'],
+        'job_type': job['job_type'],
+        'status': job['status'],
+        'created_at': job['created_at'],
+        'started_at': job['started_at'],
+        'finished_at': job['finished_at'],
+        'progress': [event['message'] for event in get_job_events(job_id)]
+    }
+    if job['status'] == JOB_STATUS_QUEUED:
+        response['queue_position'] = queued_position(job_id)
+    if job['result'] is not None:
+        response['result'] = job['result']
+    if job['error']:
+        response['error'] = job['error']
+    return jsonify(response)
+
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+@login_required
+def job_events(job_id):
+    """
+    Stream a job's progress as Server-Sent Events.
+
+    Uses the same 'progress' / 'complete' / 'error' messages as /upload-stream.
+    Reconnecting clients send Last-Event-ID and only receive newer events.
+    """
+    job = get_owned_job(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    last_event_id = request.headers.get('Last-Event-ID', '0')
+    last_event_id = int(last_event_id) if last_event_id.isdigit() else 0
+
+    def generate():
+        nonlocal last_event_id
+        while True:
+            for event in get_job_events(job_id, last_event_id):
+                last_event_id = event['id']
+                yield f"id: {event['id']}\ndata: {json.dumps({'status': 'progress', 'message': event['message']})}\n\n"
+
+            current = get_job(job_id)
+            if current is None:
+                yield f"data: {json.dumps({'status': 'error', 'message': 'Job not found'})}\n\n"
+                return
+            if current['status'] in JOB_TERMINAL_STATUSES:
+                if current['error']:
+                    yield f"data: {json.dumps({'status': 'error', 'message': current['error']})}\n\n"
+                else:
+                    final_result = dict(current['result'] or {})
+                    final_result['status'] = 'complete'
+                    final_result.setdefault('message', 'Job completed')
+                    yield f"data: {json.dumps(final_result)}\n\n"
+                return
+
+            # SSE comment: keeps proxies from closing the stream while the job is queued or busy
+            yield ": keep-alive\n\n"
+            time.sleep(JOB_EVENTS_POLL_INTERVAL)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'Connection': 'keep-alive',
+        'X-Accel-Buffering': 'no'
+    })
+
+
+
+@app.route('/sessions/stats', methods=['GET'])
+@login_required
+def session_stats():
+    """Report how many sessions, stored results and bytes the server currently holds."""
+    stats = session_janitor.stats()
+    stats['results'] = result_store.stats()
+    stats['analyses'] = analysis_cache.stats()
+    return jsonify(stats)
+
+
+@app.route('/models/ready', methods=['GET'])
+def models_ready():
+    """Readiness probe: 200 once the preloaded local models are warm, 503 while they load."""
+    readiness = model_registry.readiness()
+    return jsonify(readiness), 200 if readiness['ready'] else 503
+
+
+@app.route('/admission/stats', methods=['GET'])
+@login_required
+def admission_gauges():
+    """Report running and queued generation requests and their queue wait times per lane."""
+    return jsonify(admission_stats())
+
+
+
+# ============================================
+# Multi-PDF Batch API
+# ============================================
+
+@app.route('/batch', methods=['POST'])
+@csrf.exempt
+@login_required
+def create_batch():
+    """
+    Queue MCQ generation for many PDFs at once.
+
+    Accepts any number of 'pdfFiles' (PDFs and/or ZIP archives of PDFs) plus
+    the generation fields of /upload. The files run as one 'batch' job on the
+    shared batch pool; follow it like any job, then download per-file or
+    combined exports from /batch/<id>/download/<csv|pdf> or /batch/<id>/archive.
+    """
+    uploads = [f for f in request.files.getlist('pdfFiles') if f and f.filename]
+    if not uploads:
+        return jsonify({'error': 'No files uploaded'}), 400
+
+    unsupported = [f.filename for f in uploads if not f.filename.lower().endswith(('.pdf', '.zip'))]
+    if unsupported:
+        return jsonify({'error': f"Only PDF and ZIP files are supported: {', '.join(unsupported)}"}), 400
+
+    job_id = new_job_id()
+    files_dir = job_directory(job_id)
+    saved = []
+    for index, upload in enumerate(uploads):
+        filename = os.path.basename(upload.filename)
+        # Prefixed so that files with the same name do not overwrite each other
+        path = os.path.join(files_dir, f"{index:03d}_{filename}")
+        upload.save(path)
+        saved.append((filename, path))
+
+    params = {
+        'uploads': saved,
+        'files_dir': files_dir,
+        'num_questions': int(request.form.get('questionCount', 5)),
+        'difficulty': request.form.get('difficulty', 'medium'),
+        'prefer_offline': request.form.get('preferOffline', 'false').lower() in ('on', 'true'),
+        'model_config': {
+            'provider': request.form.get('modelProvider', 'openrouter'),
+            'model_name': request.form.get('modelName', 'deepseek/deepseek-chat'),
+            'custom_api_key': request.form.get('customApiKey', ''),
+            'custom_base_url': request.form.get('customBaseUrl', ''),
+            'book_name': request.form.get('bookName', '').strip(),
+            'chapter_name': request.form.get('chapterName', '').strip(),
+            'use_amendment': False
+        }
+    }
+
+    enqueue_job('batch', params, owner=current_user.id, job_id=job_id)
+    get_worker_pool().notify()
+
+    return jsonify({
+        'job_id': job_id,
+        'job_type': 'batch',
+        'status': JOB_STATUS_QUEUED,
+        'files_uploaded': len(saved),
+        'status_url': url_for('job_status', job_id=job_id),
+        'events_url': url_for('job_events', job_id=job_id),
+        'archive_url': url_for('download_batch_archive', job_id=job_id)
+    }), 202
+
+
+def get_completed_batch(job_id):
+    """Return (job, None) for a finished batch job of the current user, else (None, error response)."""
+    job = get_owned_job(job_id)
+    if job is None or job['job_type'] != 'batch':
+        return None, (jsonify({'error': 'Batch not found'}), 404)
+    if job['result'] is None:
+        return None, (jsonify({'error': f"Batch is {job['status']}", 'status': job['status']}), 409)
+    return job, None
+
+
+def batch_export_name(filename, extension):
+    return f"{os.path.splitext(filename)[0]}_mcq.{extension}"
+
+
+@app.route('/batch/<job_id>/download/<export_format>', methods=['GET'])
+@login_required
+def download_batch(job_id, export_format):
+    """
+    Download a batch result as CSV or PDF.
+
+    ?file=<n> selects the n-th file of the batch (0-based); without it the
+    questions of all files are combined into one export.
+    """
+    if export_format not in ('csv', 'pdf'):
+        return jsonify({'error': 'Format must be csv or pdf'}), 400
+    job, error = get_completed_batch(job_id)
+    if error:
+        return error
+
+    files = job['result']['files']
+    file_index = request.args.get('file')
+    if file_index is not None:
+        if not file_index.isdigit() or int(file_index) >= len(files):
+            return jsonify({'error': 'File not found in batch'}), 404
+        entry = files[int(file_index)]
+        if not entry['questions']:
+            return jsonify({'error': f"No questions were generated for {entry['filename']}"}), 404
+        if export_format == 'csv':
+            content = build_questions_csv(entry['questions'], entry['pdf_summary'])
+        else:
+            content = build_questions_pdf(entry['questions'])
+        download_name = batch_export_name(entry['filename'], export_format)
+    else:
+        if export_format == 'csv':
+            # Each file's summary stays on that file's first row
+            rows = [row for entry in files for row in questions_csv_rows(entry['questions'], entry['pdf_summary'])]
+            content = rows_to_csv(rows)
+        else:
+            content = build_questions_pdf([q for entry in files for q in entry['questions']])
+        download_name = f"batch_mcq_questions.{export_format}"
+
+    return send_file(
+        BytesIO(content),
+        mimetype='text/csv' if export_format == 'csv' else 'application/pdf',
+        as_attachment=True,
+        download_name=download_name
+    )
+
+
+@app.route('/batch/<job_id>/archive', methods=['GET'])
+@login_required
+def download_batch_archive(job_id):
+    """Download a ZIP with the CSV and PDF of every file plus the combined exports."""
+    import zipfile
+
+    job, error = get_completed_batch(job_id)
+    if error:
+        return error
+
+    files = job['result']['files']
+    archive_buffer = BytesIO()
+    with zipfile.ZipFile(archive_buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        used_names = set()
+        for entry in files:
+            if not entry['questions']:
+                continue
+            base_name = os.path.splitext(entry['filename'])[0]
+            name = base_name
+            # Files from different ZIP folders may share a name
+            suffix = 2
+            while name in used_names:
+                name = f"{base_name}_{suffix}"
+                suffix += 1
+            used_names.add(name)
+            archive.writestr(f"files/{name}_mcq.csv", build_questions_csv(entry['questions'], entry['pdf_summary']))
+            archive.writestr(f"files/{name}_mcq.pdf", build_questions_pdf(entry['questions']))
+
+        rows = [row for entry in files for row in questions_csv_rows(entry['questions'], entry['pdf_summary'])]
+        archive.writestr('batch_mcq_questions.csv', rows_to_csv(rows))
+        archive.writestr('batch_mcq_questions.pdf',
+                         build_questions_pdf([q for entry in files for q in entry['questions']]))
+    archive_buffer.seek(0)
+
+    return send_file(
+        archive_buffer,
+        mimetype='application/zip',
+        as_attachment=True,
+        download_name=f"batch_{job_id[:8]}_mcq.zip"
+    )
+
 # For Vercel deployment - this must be at module level
 application = app
 
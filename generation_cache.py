@@ -0,0 +1,187 @@
+"""
+Persistent per-document cache for generation results.
+
+Results are keyed by the SHA-256 of the extracted document text, so a repeat
+upload of the same PDF (under any filename) is recognised. The cache is a
+single SQLite file; on Vercel it lives in the writable temp directory and
+only survives while the instance stays warm.
+
+Besides PDF summaries it holds per-chunk checkpoints of chunked runs: each
+successful chunk result (MCQs or notes) is stored as soon as it completes,
+keyed by document hash, chunk span and generation settings, so a retried or
+resumed run only executes the chunks that are missing or failed. Checkpoints
+of a run are removed once all its chunks have succeeded, so a fresh upload of
+the same document still gets freshly generated output.
+
+Configuration:
+    GENERATION_CACHE_PATH   SQLite file path (default: cache/generation_cache.db,
+                            or the system temp directory on Vercel)
+    CHECKPOINT_TTL_SECONDS  Age after which unused checkpoints are dropped (default: 7 days)
+"""
+
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import tempfile
+import threading
+
+from prompt_templates import PROMPT_TEMPLATE_VERSION
+
+if os.environ.get('VERCEL'):
+    _DEFAULT_CACHE_PATH = os.path.join(tempfile.gettempdir(), 'generation_cache.db')
+else:
+    _DEFAULT_CACHE_PATH = os.path.join('cache', 'generation_cache.db')
+
+CACHE_PATH = os.environ.get('GENERATION_CACHE_PATH', _DEFAULT_CACHE_PATH)
+CHECKPOINT_TTL_SECONDS = int(os.environ.get('CHECKPOINT_TTL_SECONDS', 7 * 24 * 3600))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS summaries (
+    document_hash TEXT NOT NULL,
+    template_version TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    model TEXT,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (document_hash, template_version)
+);
+CREATE TABLE IF NOT EXISTS chunk_checkpoints (
+    document_hash TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    settings TEXT NOT NULL,
+    span_start INTEGER NOT NULL,
+    span_end INTEGER NOT NULL,
+    result TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (document_hash, kind, settings, span_start, span_end)
+);
+"""
+
+_lock = threading.Lock()
+_initialized_paths = set()
+
+
+def document_hash(text):
+    """Stable hash of the extracted document text used as the cache key."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def _connect(path=None):
+    path = path or CACHE_PATH
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(path, timeout=10)
+    if path not in _initialized_paths:
+        with _lock:
+            connection.executescript(_SCHEMA)
+            _initialized_paths.add(path)
+    return connection
+
+
+def get_cached_summary(doc_hash):
+    """
+    Look up the 2-line summary of a document.
+
+    Args:
+        doc_hash (str): document_hash() of the extracted text
+
+    Returns:
+        str or None: Cached summary, or None on a miss or cache error
+    """
+    try:
+        connection = _connect()
+        try:
+            row = connection.execute(
+                "SELECT summary FROM summaries WHERE document_hash = ? AND template_version = ?",
+                (doc_hash, PROMPT_TEMPLATE_VERSION)
+            ).fetchone()
+        finally:
+            connection.close()
+        return row[0] if row else None
+    except (sqlite3.Error, OSError) as e:
+        print(f"⚠️  Generation cache unavailable: {e}")
+        return None
+
+
+def store_summary(doc_hash, summary, model=None):
+    """Store the 2-line summary of a document; cache errors are logged and ignored."""
+    try:
+        connection = _connect()
+        try:
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO summaries (document_hash, template_version, summary, model, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (doc_hash, PROMPT_TEMPLATE_VERSION, summary, model, time.time())
+                )
+        finally:
+            connection.close()
+    except (sqlite3.Error, OSError) as e:
+        print(f"⚠️  Could not store summary in generation cache: {e}")
+
+
+def load_chunk_checkpoints(doc_hash, kind, settings):
+    """
+    Load the stored chunk results of a run.
+
+    Args:
+        doc_hash (str): document_hash() of the extracted text
+        kind (str): 'mcq' or 'notes'
+        settings (str): Fingerprint of the settings that determine chunking and prompts
+
+    Returns:
+        dict: {(span_start, span_end): result}; empty on a miss or cache error
+    """
+    try:
+        connection = _connect()
+        try:
+            with connection:
+                connection.execute("DELETE FROM chunk_checkpoints WHERE created_at < ?",
+                                   (time.time() - CHECKPOINT_TTL_SECONDS,))
+            rows = connection.execute(
+                "SELECT span_start, span_end, result FROM chunk_checkpoints "
+                "WHERE document_hash = ? AND kind = ? AND settings = ?",
+                (doc_hash, kind, settings)
+            ).fetchall()
+        finally:
+            connection.close()
+        return {(start, end): json.loads(result) for start, end, result in rows}
+    except (sqlite3.Error, OSError) as e:
+        print(f"⚠️  Checkpoints unavailable: {e}")
+        return {}
+
+
+def store_chunk_checkpoint(doc_hash, kind, settings, span, result):
+    """Store the result of one successful chunk; cache errors are logged and ignored."""
+    try:
+        connection = _connect()
+        try:
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO chunk_checkpoints "
+                    "(document_hash, kind, settings, span_start, span_end, result, created_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (doc_hash, kind, settings, span[0], span[1], json.dumps(result), time.time())
+                )
+        finally:
+            connection.close()
+    except (sqlite3.Error, OSError) as e:
+        print(f"⚠️  Could not store chunk checkpoint: {e}")
+
+
+def clear_chunk_checkpoints(doc_hash, kind, settings):
+    """Remove the checkpoints of a run whose chunks have all succeeded."""
+    try:
+        connection = _connect()
+        try:
+            with connection:
+                connection.execute(
+                    "DELETE FROM chunk_checkpoints WHERE document_hash = ? AND kind = ? AND settings = ?",
+                    (doc_hash, kind, settings)
+                )
+        finally:
+            connection.close()
+    except (sqlite3.Error, OSError) as e:
+        print(f"⚠️  Could not clear chunk checkpoints: {e}")
@@ -0,0 +1,206 @@
+"""
+CPU-optimized inference backends for the local models
+
+The fast, professional and enhanced generators run T5 / FLAN-T5, the sentence
+transformers and the RoBERTa QA pipeline as eager float32 PyTorch. On
+CPU-only machines one of these backends can be selected instead, with the
+"inference_backend" key of offline_config.json:
+
+    pytorch    eager float32 PyTorch (default)
+    int8       PyTorch with dynamic int8 quantization of the Linear layers
+    onnx       ONNX Runtime, float32
+    onnx-int8  ONNX Runtime with dynamically int8-quantized weights
+
+ONNX models are exported on first use (through optimum, or sentence-transformers'
+own ONNX backend) and cached under "optimized_model_dir", so later processes
+load the exported files directly. Quantized PyTorch models are made in memory
+at load time, which takes seconds.
+
+On a GPU the backend is always pytorch. When the packages of the selected
+backend are missing (pip install -r requirements-onnx.txt), or an export
+fails, the model is loaded with pytorch and a warning is printed.
+
+Configuration (offline_config.json):
+    inference_backend     pytorch, int8, onnx or onnx-int8 (default: pytorch;
+                          the INFERENCE_BACKEND environment variable overrides it)
+    optimized_model_dir   Cache of exported models (default: <cache_dir>/optimized)
+"""
+
+import os
+import json
+import shutil
+import importlib.util
+
+BACKENDS = ('pytorch', 'int8', 'onnx', 'onnx-int8')
+
+OFFLINE_CONFIG_PATH = os.environ.get(
+    'OFFLINE_CONFIG_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'offline_config.json'))
+
+
+def load_offline_config():
+    """offline_config.json as a dict ({} when missing or unreadable)."""
+    try:
+        with open(OFFLINE_CONFIG_PATH) as config_file:
+            return json.load(config_file)
+    except (OSError, ValueError):
+        return {}
+
+
+def configured_backend():
+    """The backend selected in offline_config.json or INFERENCE_BACKEND."""
+    backend = (os.environ.get('INFERENCE_BACKEND') or load_offline_config().get('inference_backend')
+               or 'pytorch').lower()
+    if backend not in BACKENDS:
+        print(f"⚠️ Unknown inference backend '{backend}', using pytorch (choose from {', '.join(BACKENDS)})")
+        return 'pytorch'
+    return backend
+
+
+def optimized_model_dir():
+    config = load_offline_config()
+    return config.get('optimized_model_dir') or os.path.join(config.get('cache_dir', './models'), 'optimized')
+
+
+def onnx_backend_available():
+    """Whether ONNX Runtime and optimum's exporters are installed."""
+    return all(importlib.util.find_spec(name) for name in ('onnxruntime', 'optimum'))
+
+
+def effective_backend(backend=None):
+    """
+    The backend models are actually loaded with.
+
+    Args:
+        backend (str): Requested backend (default: configured_backend())
+    """
+    backend = backend or configured_backend()
+    if backend == 'pytorch':
+        return backend
+
+    import torch
+    if torch.cuda.is_available():
+        return 'pytorch'
+    if backend.startswith('onnx') and not onnx_backend_available():
+        print(f"⚠️ {backend} backend needs onnxruntime and optimum (requirements-onnx.txt); using pytorch")
+        return 'pytorch'
+    return backend
+
+
+def quantize_int8(model):
+    """Dynamic int8 quantization of a PyTorch model's Linear layers (CPU inference only)."""
+    import torch
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _export_path(kind, model_name, backend):
+    safe_name = model_name.replace('/', '--')
+    return os.path.join(optimized_model_dir(), backend, f"{kind}--{safe_name}")
+
+
+def _quantize_onnx_directory(source, target):
+    """Copy an exported model directory, with every .onnx file int8-quantized."""
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    staging = f"{target}.partial"
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    for name in os.listdir(source):
+        path = os.path.join(source, name)
+        if name.endswith('.onnx'):
+            quantize_dynamic(path, os.path.join(staging, name), weight_type=QuantType.QInt8,
+                             use_external_data_format=os.path.exists(f"{path}_data"))
+        elif not name.endswith('.onnx_data') and os.path.isfile(path):
+            shutil.copy2(path, staging)
+    os.replace(staging, target)
+
+
+def load_ort_model(ort_class, kind, model_name, backend, cache_dir=None):
+    """
+    An optimum ONNX Runtime model, exported and cached on first use.
+
+    Args:
+        ort_class: optimum.onnxruntime class, e.g. ORTModelForSeq2SeqLM
+        kind (str): Model kind, part of the cache path (e.g. 't5', 'qa')
+        model_name (str): Hugging Face model name
+        backend (str): 'onnx' or 'onnx-int8'
+        cache_dir (str): Hugging Face download cache for the export
+    """
+    exported = _export_path(kind, model_name, 'onnx')
+    if not os.path.exists(os.path.join(exported, 'config.json')):
+        print(f"📦 Exporting {model_name} to ONNX (first use only)...")
+        staging = f"{exported}.partial"
+        shutil.rmtree(staging, ignore_errors=True)
+        ort_class.from_pretrained(model_name, export=True, cache_dir=cache_dir).save_pretrained(staging)
+        os.makedirs(os.path.dirname(exported), exist_ok=True)
+        os.replace(staging, exported)
+
+    if backend == 'onnx-int8':
+        quantized = _export_path(kind, model_name, 'onnx-int8')
+        if not os.path.exists(os.path.join(quantized, 'config.json')):
+            print(f"📦 Quantizing the ONNX export of {model_name} to int8 (first use only)...")
+            os.makedirs(os.path.dirname(quantized), exist_ok=True)
+            _quantize_onnx_directory(exported, quantized)
+        exported = quantized
+
+    return ort_class.from_pretrained(exported)
+
+
+def load_seq2seq_model(model_name, backend, cache_dir=None, load_pytorch=None):
+    """
+    A T5-style seq2seq model for the backend; load_pytorch() loads the PyTorch one.
+
+    Models of every backend provide generate() and .device, as generate_in_batches() needs.
+    """
+    if backend.startswith('onnx'):
+        try:
+            from optimum.onnxruntime import ORTModelForSeq2SeqLM
+            return load_ort_model(ORTModelForSeq2SeqLM, 't5', model_name, backend, cache_dir)
+        except Exception as e:
+            print(f"⚠️ ONNX backend failed for {model_name}, using pytorch: {e}")
+            return load_pytorch()
+    model = load_pytorch()
+    return quantize_int8(model) if backend == 'int8' else model
+
+
+def load_sentence_transformer(name, backend, cache_folder=None):
+    """A SentenceTransformer for the backend (ONNX through sentence-transformers' own backend)."""
+    from sentence_transformers import SentenceTransformer
+
+    if backend.startswith('onnx'):
+        try:
+            exported = _export_path('sentence-transformer', name, 'onnx')
+            if not os.path.exists(os.path.join(exported, 'onnx', 'model.onnx')):
+                print(f"📦 Exporting {name} to ONNX (first use only)...")
+                SentenceTransformer(name, cache_folder=cache_folder, backend='onnx').save(exported)
+            if backend == 'onnx-int8':
+                quantized_file = os.path.join('onnx', 'model_qint8_avx2.onnx')
+                if not os.path.exists(os.path.join(exported, quantized_file)):
+                    from sentence_transformers.backend import export_dynamic_quantized_onnx_model
+                    print(f"📦 Quantizing the ONNX export of {name} to int8 (first use only)...")
+                    export_dynamic_quantized_onnx_model(
+                        SentenceTransformer(exported, backend='onnx'), 'avx2', exported)
+                return SentenceTransformer(exported, backend='onnx', model_kwargs={'file_name': quantized_file})
+            return SentenceTransformer(exported, backend='onnx')
+        except Exception as e:
+            print(f"⚠️ ONNX backend failed for {name}, using pytorch: {e}")
+
+    model = SentenceTransformer(name, cache_folder=cache_folder)
+    return quantize_int8(model) if backend == 'int8' else model
+
+
+def load_qa_pipeline(model_name, backend, device=-1):
+    """A question-answering pipeline for the backend."""
+    from transformers import pipeline, AutoTokenizer
+
+    if backend.startswith('onnx'):
+        try:
+            from optimum.onnxruntime import ORTModelForQuestionAnswering
+            model = load_ort_model(ORTModelForQuestionAnswering, 'qa', model_name, backend)
+            return pipeline("question-answering", model=model, tokenizer=AutoTokenizer.from_pretrained(model_name))
+        except Exception as e:
+            print(f"⚠️ ONNX backend failed for {model_name}, using pytorch: {e}")
+
+    qa_pipeline = pipeline("question-answering", model=model_name, tokenizer=model_name, device=device)
+    if backend == 'int8':
+        qa_pipeline.model = quantize_int8(qa_pipeline.model)
+    return qa_pipeline
@@ -0,0 +1,479 @@
+"""
+Local inference service: worker processes that own the T5 and embedding models
+
+Local generation used to run the models inside the request thread, so
+CPU-bound PyTorch work of concurrent users competed under the GIL and every
+user ran its own small batches. With the service, a separate process group
+owns the models:
+
+    python inference_service.py            # start the service
+    INFERENCE_SERVICE_ADDRESS=127.0.0.1:6010 python flask_app.py
+
+The web processes connect over a local socket (multiprocessing.connection,
+authenticated with INFERENCE_SERVICE_AUTHKEY). shared_t5_model() and
+shared_sentence_transformer() then hand the generators remote stand-ins
+(RemoteSeq2SeqModel, RemoteSentenceTransformer), and generate_in_batches() and
+encode() calls travel to the service; the generators themselves do not change.
+
+The service coalesces concurrent requests for the same model and options:
+items are collected for INFERENCE_BATCH_WINDOW_MS (or until
+INFERENCE_MAX_BATCH items are waiting), then run as one batch by one of
+INFERENCE_WORKERS worker processes. Each worker loads, through its own model
+registry, the models it is asked for. spaCy, the QA pipeline and DialoGPT stay
+in the web process. A worker that dies (e.g. killed for memory while loading a
+large model) is started again, and the batches it held are answered with an
+error instead of leaving their clients waiting.
+
+If the service cannot be reached, the web process loads the models itself as
+before and prints a warning.
+
+Messages are pickled, so a client that knows the authkey can run code in the
+service. The built-in development key is only accepted on a loopback
+address; to listen on any other interface, set INFERENCE_SERVICE_AUTHKEY to a
+secret shared with the web processes.
+
+Configuration:
+    INFERENCE_SERVICE_ADDRESS   host:port of the service; unset = models in-process
+    INFERENCE_SERVICE_AUTHKEY   Shared secret of service and clients (default: a development key,
+                                loopback addresses only)
+    INFERENCE_WORKERS           Worker processes of the service (default: 2)
+    INFERENCE_BATCH_WINDOW_MS   How long requests are collected into a batch (default: 10)
+    INFERENCE_MAX_BATCH         Items per batch (default: 32)
+    INFERENCE_TIMEOUT_SECONDS   Longest wait for a result (default: 300)
+"""
+
+import os
+import sys
+import json
+import ipaddress
+import time
+import itertools
+import threading
+import multiprocessing
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from multiprocessing.connection import Listener, Client
+
+INFERENCE_SERVICE_ADDRESS = os.environ.get('INFERENCE_SERVICE_ADDRESS', '')
+# Development key, accepted only when the service listens on a loopback address
+DEFAULT_AUTHKEY = b'pdfmcq-inference'
+INFERENCE_SERVICE_AUTHKEY = os.environ.get('INFERENCE_SERVICE_AUTHKEY', '').encode('utf-8') or DEFAULT_AUTHKEY
+INFERENCE_WORKERS = int(os.environ.get('INFERENCE_WORKERS', 2))
+INFERENCE_BATCH_WINDOW_MS = float(os.environ.get('INFERENCE_BATCH_WINDOW_MS', 10))
+INFERENCE_MAX_BATCH = int(os.environ.get('INFERENCE_MAX_BATCH', 32))
+INFERENCE_TIMEOUT_SECONDS = float(os.environ.get('INFERENCE_TIMEOUT_SECONDS', 300))
+
+# Seconds before an unreachable service is tried again
+RECONNECT_SECONDS = 30
+
+# Seconds between checks that the worker processes are alive
+WORKER_CHECK_SECONDS = 1.0
+
+# True inside the service's worker processes, which hold the models themselves
+_in_worker = False
+
+
+def parse_address(address):
+    """'host:port' -> (host, port)."""
+    host, _, port = address.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+def is_loopback(host):
+    """Whether host only accepts connections from this machine."""
+    if host == 'localhost':
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class InferenceServiceError(Exception):
+    """The service could not run a request."""
+
+
+# --- Service side ---------------------------------------------------------
+
+def _worker_main(task_queue, result_queue):
+    """Worker process: run batches with locally loaded models until told to stop."""
+    # Under spawn this function runs as __mp_main__._worker_main when the service
+    # was started as a script, while model_registry imports inference_service by
+    # name; the address is dropped and the flag set there, so the worker's
+    # registry loads models itself instead of calling back into the service.
+    global _in_worker
+    os.environ.pop('INFERENCE_SERVICE_ADDRESS', None)
+    import inference_service
+    inference_service.INFERENCE_SERVICE_ADDRESS = ''
+    inference_service._in_worker = _in_worker = True
+    from model_registry import shared_t5_model, shared_sentence_transformer, generate_in_batches
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            return
+        try:
+            options = dict(task['options'])
+            load_options = options.pop('load', {})
+            if task['kind'] == 'generate':
+                tokenizer, model = shared_t5_model(task['model'], **load_options)
+                max_input_length = options.pop('max_input_length', 512)
+                results = [[] for _ in task['items']]
+                for index, text in generate_in_batches(tokenizer, model, task['items'], batch_size=len(task['items']),
+                                                       max_input_length=max_input_length, **options):
+                    results[index].append(text)
+            else:
+                model = shared_sentence_transformer(task['model'], **load_options)
+                results = list(model.encode(task['items'], **options))
+            result_queue.put((task['id'], results, None))
+        except Exception as e:
+            result_queue.put((task['id'], None, f"{type(e).__name__}: {e}"))
+
+
+class _Request:
+    """A client request whose items may be spread over several batches."""
+
+    def __init__(self, connection, request_id, item_count):
+        self.connection = connection
+        self.request_id = request_id
+        self.results = [None] * item_count
+        self.remaining = item_count
+        self.error = None
+
+
+class InferenceServer:
+    """Accepts client connections, batches their items and dispatches batches to worker processes."""
+
+    def __init__(self, address, authkey=INFERENCE_SERVICE_AUTHKEY, workers=INFERENCE_WORKERS,
+                 window_seconds=INFERENCE_BATCH_WINDOW_MS / 1000, max_batch=INFERENCE_MAX_BATCH):
+        """
+        Raises:
+            InferenceServiceError: A non-loopback address with the development authkey
+        """
+        if authkey == DEFAULT_AUTHKEY and not is_loopback(address[0]):
+            raise InferenceServiceError(
+                f"Refusing to listen on {address[0]} with the development authkey; "
+                "set INFERENCE_SERVICE_AUTHKEY to a shared secret")
+        self.address = address
+        self.authkey = authkey
+        self.window_seconds = window_seconds
+        self.max_batch = max(1, max_batch)
+        self._context = multiprocessing.get_context('spawn')
+        self._result_queue = self._context.Queue()
+        # Each worker has its own task queue, so the tasks lost with a dead worker are known
+        self._workers = [None] * max(1, workers)
+        self._task_queues = [None] * len(self._workers)
+        self._assigned = [set() for _ in self._workers]   # worker index -> task ids sent to it
+        self._condition = threading.Condition()
+        self._dispatch_lock = threading.Lock()
+        self._groups = {}      # batch key -> {'since': t, 'items': [(request, index, item)]}
+        self._in_flight = {}   # task id -> (worker index, [(request, index)])
+        self._task_ids = itertools.count(1)
+        self._send_locks = {}
+        self.batches = 0
+        self.items = 0
+        self.worker_restarts = 0
+
+    def _start_worker(self, index):
+        """Start worker index with a new task queue; caller holds the dispatch lock (or is starting up)."""
+        self._task_queues[index] = self._context.Queue()
+        self._workers[index] = self._context.Process(
+            target=_worker_main, args=(self._task_queues[index], self._result_queue),
+            daemon=True, name=f"inference-worker-{index}")
+        self._workers[index].start()
+
+    def serve_forever(self):
+        for index in range(len(self._workers)):
+            self._start_worker(index)
+        threading.Thread(target=self._batch_loop, daemon=True, name='inference-batcher').start()
+        threading.Thread(target=self._result_loop, daemon=True, name='inference-results').start()
+        threading.Thread(target=self._monitor_loop, daemon=True, name='inference-monitor').start()
+
+        with Listener(self.address, authkey=self.authkey) as listener:
+            print(f"🧠 Inference service on {self.address[0]}:{self.address[1]} "
+                  f"with {len(self._workers)} workers")
+            while True:
+                try:
+                    connection = listener.accept()
+                except Exception as e:  # e.g. a client with the wrong authkey
+                    print(f"⚠️ Rejected inference client: {e}")
+                    continue
+                self._send_locks[connection] = threading.Lock()
+                threading.Thread(target=self._client_loop, args=(connection,), daemon=True).start()
+
+    def _send(self, connection, message):
+        try:
+            with self._send_locks[connection]:
+                connection.send(message)
+        except (OSError, EOFError, KeyError):
+            pass  # the client went away; its results are dropped
+
+    def _client_loop(self, connection):
+        try:
+            while True:
+                message = connection.recv()
+                if message['kind'] == 'stats':
+                    self._send(connection, {'id': message['id'], 'results': self.stats()})
+                    continue
+                request = _Request(connection, message['id'], len(message['items']))
+                if not message['items']:
+                    self._send(connection, {'id': message['id'], 'results': []})
+                    continue
+                key = (message['kind'], message['model'], json.dumps(message['options'], sort_keys=True))
+                with self._condition:
+                    group = self._groups.setdefault(key, {'since': time.monotonic(), 'items': []})
+                    group['items'].extend((request, index, item) for index, item in enumerate(message['items']))
+                    self._condition.notify()
+        except (OSError, EOFError):
+            pass
+        finally:
+            self._send_locks.pop(connection, None)
+            connection.close()
+
+    def _batch_loop(self):
+        """Dispatch a group once it has max_batch items or its oldest item waited window_seconds."""
+        while True:
+            with self._condition:
+                now = time.monotonic()
+                due = [key for key, group in self._groups.items()
+                       if len(group['items']) >= self.max_batch or now - group['since'] >= self.window_seconds]
+                if not due:
+                    deadlines = [group['since'] + self.window_seconds for group in self._groups.values()]
+                    self._condition.wait(max(0.0, min(deadlines) - now) if deadlines else None)
+                    continue
+                tasks = []
+                for key in due:
+                    group = self._groups.pop(key)
+                    items = group['items']
+                    for start in range(0, len(items), self.max_batch):
+                        tasks.append((key, items[start:start + self.max_batch]))
+            for (kind, model, options), items in tasks:
+                task_id = next(self._task_ids)
+                with self._dispatch_lock:
+                    # The worker with the fewest outstanding batches
+                    worker = min(range(len(self._workers)), key=lambda index: len(self._assigned[index]))
+                    self._assigned[worker].add(task_id)
+                    self._in_flight[task_id] = (worker, [(request, index) for request, index, _ in items])
+                    self.batches += 1
+                    self.items += len(items)
+                    self._task_queues[worker].put({'id': task_id, 'kind': kind, 'model': model,
+                                                   'options': json.loads(options),
+                                                   'items': [item for _, _, item in items]})
+
+    def _result_loop(self):
+        while True:
+            task_id, results, error = self._result_queue.get()
+            self._finish_task(task_id, results, error)
+
+    def _monitor_loop(self):
+        """Start dead workers again and fail the batches they held."""
+        while True:
+            time.sleep(WORKER_CHECK_SECONDS)
+            for index, worker in enumerate(self._workers):
+                if worker.is_alive():
+                    continue
+                with self._dispatch_lock:
+                    lost = sorted(self._assigned[index])
+                    self._assigned[index] = set()
+                    self.worker_restarts += 1
+                    self._start_worker(index)
+                print(f"⚠️ Inference worker {index} exited (code {worker.exitcode}); restarted, "
+                      f"{len(lost)} batch(es) failed")
+                for task_id in lost:
+                    self._finish_task(task_id, None, f"Inference worker exited (code {worker.exitcode}) "
+                                                     "while running the batch")
+
+    def _finish_task(self, task_id, results, error):
+        """Fill the requests of a task with its results or error and reply to those now complete."""
+        replies = []
+        with self._dispatch_lock:
+            worker, items = self._in_flight.pop(task_id, (None, []))
+            if worker is not None:
+                self._assigned[worker].discard(task_id)
+            for offset, (request, index) in enumerate(items):
+                if error:
+                    request.error = error
+                else:
+                    request.results[index] = results[offset]
+                request.remaining -= 1
+                if request.remaining == 0:
+                    replies.append((request.connection, {'id': request.request_id, 'error': request.error}
+                                    if request.error else {'id': request.request_id, 'results': request.results}))
+        for connection, reply in replies:
+            self._send(connection, reply)
+
+    def stats(self):
+        with self._condition:
+            waiting = sum(len(group['items']) for group in self._groups.values())
+        return {'workers': len(self._workers), 'clients': len(self._send_locks), 'waiting_items': waiting,
+                'worker_restarts': self.worker_restarts, 'batches': self.batches, 'items': self.items,
+                'avg_batch_size': round(self.items / self.batches, 2) if self.batches else None}
+
+
+# --- Client side ----------------------------------------------------------
+
+class InferenceClient:
+    """Connection of one web process to the service; thread-safe, requests are multiplexed."""
+
+    def __init__(self, address, authkey=INFERENCE_SERVICE_AUTHKEY):
+        self.address = address
+        self.authkey = authkey
+        self._lock = threading.Lock()
+        self._connection = None
+        self._futures = {}
+        self._request_ids = itertools.count(1)
+
+    def _connect(self):
+        """Open the connection and start the receiver; caller holds the lock."""
+        if self._connection is None:
+            self._connection = Client(self.address, authkey=self.authkey)
+            threading.Thread(target=self._receive_loop, args=(self._connection,), daemon=True,
+                             name='inference-client').start()
+        return self._connection
+
+    def _receive_loop(self, connection):
+        try:
+            while True:
+                message = connection.recv()
+                future = self._futures.pop(message['id'], None)
+                if future is None:
+                    continue
+                if 'error' in message:
+                    future.set_exception(InferenceServiceError(message['error']))
+                else:
+                    future.set_result(message['results'])
+        except (OSError, EOFError):
+            pass
+        with self._lock:
+            if self._connection is connection:
+                self._connection = None
+            pending, self._futures = self._futures, {}
+        for future in pending.values():
+            future.set_exception(InferenceServiceError('Connection to the inference service was lost'))
+
+    def call(self, kind, model, items, options=None, timeout=INFERENCE_TIMEOUT_SECONDS):
+        """
+        Run items through a model of the service.
+
+        Args:
+            kind (str): 'generate' (seq2seq text generation) or 'encode' (sentence embeddings)
+            model (str): Model name
+            items (list): Prompts or sentences
+            options (dict): Generation / encode options; options['load'] are model load options
+
+        Returns:
+            list: One result per item: embedding, or the list of generated texts
+            (empty for a prompt whose generation failed)
+
+        Raises:
+            InferenceServiceError: The service failed the request, is unreachable
+            or did not answer within timeout seconds
+        """
+        future = Future()
+        with self._lock:
+            try:
+                connection = self._connect()
+                request_id = next(self._request_ids)
+                self._futures[request_id] = future
+                connection.send({'id': request_id, 'kind': kind, 'model': model,
+                                 'items': list(items), 'options': options or {}})
+            except (OSError, EOFError, multiprocessing.AuthenticationError) as e:
+                self._connection = None
+                raise InferenceServiceError(f"Inference service unreachable: {e}")
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self._futures.pop(request_id, None)
+            raise InferenceServiceError(f"Inference service did not answer within {timeout:g}s")
+
+    def stats(self):
+        return self.call('stats', None, [])
+
+
+_client = None
+_client_lock = threading.Lock()
+_unreachable_until = 0.0
+
+
+def inference_client():
+    """
+    The process's client of the service, or None when models run in-process:
+    no INFERENCE_SERVICE_ADDRESS, inside a worker, or the service is unreachable.
+    """
+    global _client, _unreachable_until
+    if not INFERENCE_SERVICE_ADDRESS or _in_worker or time.monotonic() < _unreachable_until:
+        return None
+    with _client_lock:
+        if _client is None or _client.pid != os.getpid():
+            _client = InferenceClient(parse_address(INFERENCE_SERVICE_ADDRESS))
+            _client.pid = os.getpid()
+        try:
+            with _client._lock:
+                _client._connect()
+        except (OSError, multiprocessing.AuthenticationError) as e:
+            _unreachable_until = time.monotonic() + RECONNECT_SECONDS
+            print(f"⚠️ Inference service at {INFERENCE_SERVICE_ADDRESS} unreachable ({e}); loading models in-process")
+            return None
+        return _client
+
+
+class RemoteSeq2SeqModel:
+    """Stand-in for a T5 model held by the inference service; used through generate_in_batches()."""
+
+    remote = True
+
+    def __init__(self, client, model_name, load_options=None):
+        self.client = client
+        self.model_name = model_name
+        self.load_options = load_options or {}
+
+    def generate_texts(self, prompts, max_input_length=512, **generate_options):
+        """Generated texts of every prompt (num_return_sequences per prompt; none if its batch failed)."""
+        options = dict(generate_options, max_input_length=max_input_length, load=self.load_options)
+        return self.client.call('generate', self.model_name, prompts, options)
+
+
+class RemoteSentenceTransformer:
+    """Stand-in for a SentenceTransformer held by the inference service."""
+
+    remote = True
+
+    def __init__(self, client, model_name, load_options=None):
+        self.client = client
+        self.model_name = model_name
+        self.load_options = load_options or {}
+
+    def encode(self, sentences, **options):
+        import numpy as np
+
+        single = isinstance(sentences, str)
+        # Batching is up to the service; these do not change the vectors
+        for name in ('batch_size', 'show_progress_bar', 'convert_to_numpy'):
+            options.pop(name, None)
+        vectors = self.client.call('encode', self.model_name, [sentences] if single else list(sentences),
+                                   dict(options, load=self.load_options))
+        matrix = np.asarray(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+        return matrix[0] if single else matrix
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run the local inference service')
+    parser.add_argument('--address', default=INFERENCE_SERVICE_ADDRESS or '127.0.0.1:6010',
+                        help='host:port to listen on (default: INFERENCE_SERVICE_ADDRESS or 127.0.0.1:6010)')
+    parser.add_argument('--workers', type=int, default=INFERENCE_WORKERS,
+                        help=f'Worker processes (default: {INFERENCE_WORKERS})')
+    args = parser.parse_args(argv)
+
+    try:
+        server = InferenceServer(parse_address(args.address), workers=args.workers)
+    except InferenceServiceError as e:
+        print(f"❌ {e}")
+        return 1
+    server.serve_forever()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,718 @@
+"""
+Persistent job queue and background worker pool for long-running generation
+
+/upload and /summarize-pdf do all their work inside the HTTP request, so
+large PDFs tie up a web worker for minutes and die at proxy or serverless
+timeouts. Jobs are instead written to a local SQLite queue and picked up by a
+pool of background worker threads; clients poll the job or follow its
+progress events.
+
+Job types:
+    mcq     generate_mcq_questions_with_metadata()
+    notes   generate_comprehensive_notes()
+    batch   generate_mcq_questions_with_metadata() for many PDFs (or ZIPs of PDFs);
+            the files of all batch jobs share one bounded thread pool, and model
+            calls share the process-wide per-model rate limit
+
+The queue is a single SQLite file, so it survives restarts (jobs that were
+running in a process that died are queued again) and several app processes
+can share it. Background workers need a long-running server; on serverless
+platforms the threads do not outlive the request.
+
+API keys submitted with a job (model_config['custom_api_key']) are never
+written to the queue: the process that queued the job keeps them in memory
+until the job finishes, and only that process claims the job while it is
+alive. A job whose key was lost with its process fails and has to be
+submitted again. Finished jobs and their events are deleted after
+JOB_RETENTION_SECONDS by the session janitor.
+
+Configuration:
+    JOB_QUEUE_PATH   SQLite file path (default: cache/jobs.db, or the temp directory on Vercel)
+    JOB_WORKERS      Number of worker threads per process (default: 2)
+    JOB_RETENTION_SECONDS  Age after which finished jobs and their events are deleted (default: 604800)
+    BATCH_WORKERS    Files of batch jobs processed concurrently per process (default: 3)
+    BATCH_MAX_FILES  Maximum number of PDFs in one batch job (default: 100)
+"""
+
+import os
+import json
+import time
+import uuid
+import shutil
+import socket
+import sqlite3
+import tempfile
+import zipfile
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from mcq_generator import (
+    extract_text_from_pdf, estimate_max_questions, estimate_max_questions_detailed,
+    generate_mcq_questions_with_metadata, generate_comprehensive_notes, new_token_usage
+)
+
+if os.environ.get('VERCEL'):
+    _DEFAULT_QUEUE_PATH = os.path.join(tempfile.gettempdir(), 'jobs.db')
+else:
+    _DEFAULT_QUEUE_PATH = os.path.join('cache', 'jobs.db')
+
+JOB_QUEUE_PATH = os.environ.get('JOB_QUEUE_PATH', _DEFAULT_QUEUE_PATH)
+JOB_FILES_DIR = os.path.join(os.path.dirname(JOB_QUEUE_PATH) or '.', 'job_files')
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+JOB_POLL_INTERVAL = 2.0  # seconds an idle worker waits before checking the queue again
+JOB_RETENTION_SECONDS = float(os.environ.get('JOB_RETENTION_SECONDS', 604800))
+
+# model_config values kept in memory instead of the queue
+JOB_SECRET_KEYS = ('custom_api_key',)
+
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 3))
+BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', 100))
+BATCH_MAX_EXTRACTED_BYTES = 524288000  # same 500MB limit as a single upload
+
+# Shared by all batch jobs of this process, so concurrent batches cannot
+# multiply the number of documents in flight
+_batch_executor = ThreadPoolExecutor(max_workers=max(1, BATCH_WORKERS), thread_name_prefix='batch-file')
+
+JOB_STATUS_QUEUED = 'queued'
+JOB_STATUS_RUNNING = 'running'
+JOB_STATUS_COMPLETED = 'completed'
+JOB_STATUS_FAILED = 'failed'
+JOB_TERMINAL_STATUSES = (JOB_STATUS_COMPLETED, JOB_STATUS_FAILED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    job_type TEXT NOT NULL,
+    owner TEXT,
+    status TEXT NOT NULL,
+    params TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    worker TEXT,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at);
+CREATE TABLE IF NOT EXISTS job_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id TEXT NOT NULL,
+    message TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS job_events_job ON job_events (job_id, id);
+"""
+
+_schema_lock = threading.Lock()
+_schema_ready = False
+
+# job id -> {secret key: value} of the jobs queued by this process
+_job_secrets = {}
+_job_secrets_lock = threading.Lock()
+
+
+class JobError(Exception):
+    """Raised by a job handler to fail the job with a user-facing message."""
+
+
+def _connect():
+    global _schema_ready
+    directory = os.path.dirname(JOB_QUEUE_PATH)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(JOB_QUEUE_PATH, timeout=30, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    if not _schema_ready:
+        with _schema_lock:
+            connection.executescript(_SCHEMA)
+            _schema_ready = True
+    return connection
+
+
+def _job_from_row(row):
+    job = dict(row)
+    job['params'] = json.loads(job['params'])
+    job['result'] = json.loads(job['result']) if job['result'] else None
+    return job
+
+
+# ============================================
+# Queue operations
+# ============================================
+
+def new_job_id():
+    return uuid.uuid4().hex
+
+
+def _process_id():
+    """host:pid of this process, as in the worker names."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _split_secrets(params):
+    """
+    Move the secret values of params['model_config'] out of the params.
+
+    Returns:
+        tuple: (params safe to store, {secret key: value})
+    """
+    model_config = params.get('model_config')
+    secrets = {key: model_config[key] for key in JOB_SECRET_KEYS if (model_config or {}).get(key)}
+    if not secrets:
+        return params, {}
+    params = dict(params, model_config={key: ('' if key in secrets else value)
+                                        for key, value in model_config.items()})
+    params['secrets'] = sorted(secrets)
+    params['secret_holder'] = _process_id()
+    return params, secrets
+
+
+def _secrets_reachable(job_id, params):
+    """
+    Whether this process may claim a job: it needs no secrets, holds them,
+    or the process holding them on this host has exited (the job then fails).
+    """
+    if not params.get('secrets'):
+        return True
+    with _job_secrets_lock:
+        if job_id in _job_secrets:
+            return True
+    host, _, pid = params.get('secret_holder', '').partition(':')
+    return host == socket.gethostname() and pid.isdigit() and not _process_alive(int(pid))
+
+
+def job_directory(job_id):
+    """Directory holding a job's uploaded files (created on demand)."""
+    path = os.path.join(JOB_FILES_DIR, job_id)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def enqueue_job(job_type, params, owner=None, job_id=None):
+    """
+    Add a job to the queue.
+
+    Args:
+        job_type (str): One of JOB_HANDLERS
+        params (dict): JSON-serializable handler parameters
+        owner (str): Id of the user who submitted the job
+        job_id (str): Optional id (e.g. when files were stored under job_directory() first)
+
+    Returns:
+        str: Job id
+    """
+    if job_type not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job type '{job_type}'. Supported: {', '.join(JOB_HANDLERS)}")
+
+    job_id = job_id or new_job_id()
+    params, secrets = _split_secrets(params)
+    if secrets:
+        with _job_secrets_lock:
+            _job_secrets[job_id] = secrets
+    connection = _connect()
+    try:
+        connection.execute(
+            "INSERT INTO jobs (id, job_type, owner, status, params, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, job_type, owner, JOB_STATUS_QUEUED, json.dumps(params), time.time())
+        )
+    except BaseException:
+        with _job_secrets_lock:
+            _job_secrets.pop(job_id, None)
+        raise
+    finally:
+        connection.close()
+
+    add_job_event(job_id, '📥 Job queued')
+    return job_id
+
+
+def get_job(job_id):
+    """Return a job as a dict, or None if it does not exist."""
+    connection = _connect()
+    try:
+        row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    finally:
+        connection.close()
+    return _job_from_row(row) if row else None
+
+
+def add_job_event(job_id, message):
+    connection = _connect()
+    try:
+        connection.execute(
+            "INSERT INTO job_events (job_id, message, created_at) VALUES (?, ?, ?)",
+            (job_id, message, time.time())
+        )
+    finally:
+        connection.close()
+
+
+def get_job_events(job_id, after_id=0):
+    """Return the progress events of a job newer than after_id, oldest first."""
+    connection = _connect()
+    try:
+        rows = connection.execute(
+            "SELECT id, message, created_at FROM job_events WHERE job_id = ? AND id > ? ORDER BY id",
+            (job_id, after_id)
+        ).fetchall()
+    finally:
+        connection.close()
+    return [dict(row) for row in rows]
+
+
+def queued_position(job_id):
+    """Number of queued jobs ahead of a queued job (0 = next to run)."""
+    connection = _connect()
+    try:
+        row = connection.execute(
+            "SELECT COUNT(*) FROM jobs WHERE status = ? AND created_at < "
+            "(SELECT created_at FROM jobs WHERE id = ?)",
+            (JOB_STATUS_QUEUED, job_id)
+        ).fetchone()
+    finally:
+        connection.close()
+    return row[0]
+
+
+def claim_next_job(worker):
+    """
+    Atomically move the oldest queued job this process can run to running.
+
+    Jobs whose API key is held in memory by another live process are left
+    to that process.
+
+    Returns:
+        dict or None: The claimed job
+    """
+    connection = _connect()
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        rows = connection.execute(
+            "SELECT id, params FROM jobs WHERE status = ? ORDER BY created_at", (JOB_STATUS_QUEUED,)
+        ).fetchall()
+        row = next((row for row in rows if _secrets_reachable(row['id'], json.loads(row['params']))), None)
+        if row is None:
+            connection.execute("COMMIT")
+            return None
+        connection.execute(
+            "UPDATE jobs SET status = ?, worker = ?, started_at = ? WHERE id = ?",
+            (JOB_STATUS_RUNNING, worker, time.time(), row['id'])
+        )
+        connection.execute("COMMIT")
+        job = connection.execute("SELECT * FROM jobs WHERE id = ?", (row['id'],)).fetchone()
+    except sqlite3.Error:
+        if connection.in_transaction:
+            connection.execute("ROLLBACK")
+        raise
+    finally:
+        connection.close()
+    return _job_from_row(job)
+
+
+def finish_job(job_id, result=None, error=None):
+    connection = _connect()
+    try:
+        connection.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+            (JOB_STATUS_FAILED if error else JOB_STATUS_COMPLETED,
+             json.dumps(result) if result is not None else None, error, time.time(), job_id)
+        )
+    finally:
+        connection.close()
+
+
+def purge_finished_jobs(now=None, retention_seconds=JOB_RETENTION_SECONDS):
+    """
+    Delete finished jobs older than the retention period, with their events.
+
+    Returns:
+        int: Number of jobs deleted
+    """
+    cutoff = (now or time.time()) - retention_seconds
+    statuses = ', '.join('?' * len(JOB_TERMINAL_STATUSES))
+    connection = _connect()
+    try:
+        connection.execute("BEGIN IMMEDIATE")
+        connection.execute(
+            f"DELETE FROM job_events WHERE job_id IN "
+            f"(SELECT id FROM jobs WHERE status IN ({statuses}) AND finished_at < ?)",
+            (*JOB_TERMINAL_STATUSES, cutoff)
+        )
+        deleted = connection.execute(
+            f"DELETE FROM jobs WHERE status IN ({statuses}) AND finished_at < ?",
+            (*JOB_TERMINAL_STATUSES, cutoff)
+        ).rowcount
+        connection.execute("COMMIT")
+    except sqlite3.Error:
+        if connection.in_transaction:
+            connection.execute("ROLLBACK")
+        raise
+    finally:
+        connection.close()
+    return deleted
+
+
+class FinishedJobRetention:
+    """Deletes expired finished jobs when swept by the SessionJanitor (same interface as a SessionRegistry)."""
+
+    def __init__(self, retention_seconds=JOB_RETENTION_SECONDS):
+        self.name = 'jobs'
+        self.retention_seconds = retention_seconds
+        self.expired_total = 0
+
+    def expire(self, now=None):
+        removed = purge_finished_jobs(now, self.retention_seconds)
+        self.expired_total += removed
+        return removed
+
+    def stats(self):
+        return {'retention_seconds': self.retention_seconds, 'expired_total': self.expired_total}
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def requeue_interrupted_jobs():
+    """
+    Queue again the jobs left running by a process on this host that has exited.
+
+    Returns:
+        int: Number of jobs requeued
+    """
+    hostname = socket.gethostname()
+    connection = _connect()
+    try:
+        rows = connection.execute(
+            "SELECT id, worker FROM jobs WHERE status = ?", (JOB_STATUS_RUNNING,)
+        ).fetchall()
+        requeued = []
+        for row in rows:
+            host, _, pid = (row['worker'] or '').partition(':')
+            pid = pid.split(':')[0]
+            if host == hostname and pid.isdigit() and not _process_alive(int(pid)):
+                connection.execute(
+                    "UPDATE jobs SET status = ?, worker = NULL, started_at = NULL WHERE id = ?",
+                    (JOB_STATUS_QUEUED, row['id'])
+                )
+                requeued.append(row['id'])
+    finally:
+        connection.close()
+
+    for job_id in requeued:
+        add_job_event(job_id, '🔁 Worker stopped unexpectedly - job queued again')
+    return len(requeued)
+
+
+# ============================================
+# Job handlers
+# ============================================
+
+def run_mcq_job(params, report):
+    """Job handler wrapping generate_mcq_questions_with_metadata()."""
+    model_config = dict(params['model_config'])
+
+    amendment_path = params.get('amendment_path')
+    if model_config.get('use_amendment') and amendment_path:
+        report('📝 Extracting amendment PDF...')
+        amendment_text = extract_text_from_pdf(amendment_path)
+        if isinstance(amendment_text, str) and amendment_text.startswith('Error extracting text from PDF:'):
+            raise JobError(f"Failed to extract amendment PDF: {amendment_text}")
+        model_config['amendment_text'] = amendment_text
+
+    num_questions = params['num_questions']
+    max_questions = None
+    if params.get('use_max_questions'):
+        report('🔢 Estimating optimal question count...')
+        extracted_text = extract_text_from_pdf(params['pdf_path'])
+        if params.get('use_offline_estimation'):
+            max_questions = estimate_max_questions_detailed(extracted_text)['max_questions']
+        else:
+            max_questions = estimate_max_questions(extracted_text, use_offline=False)
+        num_questions = max_questions
+
+    report(f"⚙️ Generating {num_questions} MCQ questions with {model_config.get('model_name')}...")
+    result = generate_mcq_questions_with_metadata(
+        pdf_path=params['pdf_path'],
+        num_questions=num_questions,
+        difficulty=params.get('difficulty', 'medium'),
+        book_name=model_config.get('book_name', ''),
+        chapter_name=model_config.get('chapter_name', ''),
+        prefer_offline=params.get('prefer_offline', False),
+        model_config=model_config,
+        progress=lambda message, **details: report(message)
+    )
+    if 'error' in result:
+        raise JobError(result['error'])
+
+    questions = result['questions']
+    report(f"✅ Generated {len(questions)} questions")
+    return {
+        'questions': questions,
+        'summary': result['summary'],
+        'pdf_summary': result.get('pdf_summary', 'Summary not available'),
+        'message': f'Successfully generated {len(questions)} MCQ questions',
+        'questions_generated': len(questions),
+        'max_questions_estimate': max_questions,
+        'total_pages': result.get('total_pages', 0),
+        'sections_detected': len(result.get('sections', [])),
+        'token_usage': result.get('token_usage')
+    }
+
+
+def collect_batch_pdfs(uploads, directory):
+    """
+    List the PDFs of a batch upload, extracting the PDFs inside ZIP archives.
+
+    Args:
+        uploads (list): (filename, path) pairs of the uploaded PDF and ZIP files
+        directory (str): Directory to extract archive members into
+
+    Returns:
+        list: (filename, path) tuples in upload order
+
+    Raises:
+        JobError: If there are no PDFs, too many, or the archives are too large
+    """
+    pdf_files = []
+    extracted_bytes = 0
+    for filename, upload_path in uploads:
+        if not filename.lower().endswith('.zip'):
+            pdf_files.append((filename, upload_path))
+            continue
+
+        try:
+            with zipfile.ZipFile(upload_path) as archive:
+                for member in archive.infolist():
+                    name = os.path.basename(member.filename)
+                    # Skip folders, non-PDFs and macOS resource forks
+                    if member.is_dir() or not name.lower().endswith('.pdf') or name.startswith('._'):
+                        continue
+                    extracted_bytes += member.file_size
+                    if extracted_bytes > BATCH_MAX_EXTRACTED_BYTES:
+                        raise JobError("ZIP contents exceed the 500MB upload limit")
+                    # Members of different folders may share a name
+                    target = os.path.join(directory, f"zip{len(pdf_files):03d}_{name}")
+                    with archive.open(member) as source, open(target, 'wb') as destination:
+                        shutil.copyfileobj(source, destination)
+                    pdf_files.append((name, target))
+        except zipfile.BadZipFile:
+            raise JobError(f"{filename} is not a valid ZIP archive")
+
+    if not pdf_files:
+        raise JobError("The batch contains no PDF files")
+    if len(pdf_files) > BATCH_MAX_FILES:
+        raise JobError(f"The batch contains {len(pdf_files)} PDFs; the limit is {BATCH_MAX_FILES}")
+    return pdf_files
+
+
+def merge_token_usage(total, usage):
+    """Add the counters of one run's token usage to a batch total."""
+    for key in ('calls', 'prompt_tokens', 'cached_tokens', 'completion_tokens', 'template_tokens_saved'):
+        total[key] += (usage or {}).get(key, 0)
+
+
+def run_batch_job(params, report):
+    """
+    Job handler generating MCQs for every PDF of a batch upload.
+
+    Files run concurrently on the shared batch pool; a failed file is
+    reported in its entry and does not fail the batch.
+    """
+    pdf_files = collect_batch_pdfs(params['uploads'], params['files_dir'])
+    model_config = dict(params['model_config'])
+    report(f"📚 Batch of {len(pdf_files)} PDF(s) - generating {params['num_questions']} questions each "
+           f"with {model_config.get('model_name')}")
+
+    def process_file(pdf_path):
+        return generate_mcq_questions_with_metadata(
+            pdf_path=pdf_path,
+            num_questions=params['num_questions'],
+            difficulty=params.get('difficulty', 'medium'),
+            book_name=model_config.get('book_name', ''),
+            chapter_name=model_config.get('chapter_name', ''),
+            prefer_offline=params.get('prefer_offline', False),
+            model_config=model_config
+        )
+
+    futures = {_batch_executor.submit(process_file, path): index for index, (_, path) in enumerate(pdf_files)}
+    files = [None] * len(pdf_files)
+    usage_stats = new_token_usage()
+    for done, future in enumerate(as_completed(futures), 1):
+        index = futures[future]
+        filename = pdf_files[index][0]
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {'error': f"{type(e).__name__}: {e}"}
+
+        if 'error' in result:
+            files[index] = {'filename': filename, 'error': result['error'], 'questions': [], 'pdf_summary': None}
+            report(f"❌ [{done}/{len(pdf_files)}] {filename}: {result['error']}")
+            continue
+
+        questions = result['questions']
+        for question in questions:
+            question['source_file'] = filename
+        merge_token_usage(usage_stats, result.get('token_usage'))
+        files[index] = {
+            'filename': filename,
+            'questions': questions,
+            'pdf_summary': result.get('pdf_summary', 'Summary not available'),
+            'questions_generated': len(questions),
+            'total_pages': result.get('total_pages', 0)
+        }
+        report(f"✅ [{done}/{len(pdf_files)}] {filename}: {len(questions)} questions")
+
+    failed = [entry['filename'] for entry in files if entry.get('error')]
+    if len(failed) == len(files):
+        raise JobError(f"No questions could be generated for any of the {len(files)} file(s)")
+
+    total_questions = sum(len(entry['questions']) for entry in files)
+    return {
+        'files': files,
+        'message': f"Generated {total_questions} MCQ questions from {len(files) - len(failed)} of {len(files)} file(s)",
+        'questions_generated': total_questions,
+        'files_processed': len(files) - len(failed),
+        'files_failed': failed,
+        'token_usage': usage_stats
+    }
+
+
+def run_notes_job(params, report):
+    """Job handler wrapping generate_comprehensive_notes()."""
+    report('📄 Extracting text from PDF...')
+    extracted_text = extract_text_from_pdf(params['pdf_path'])
+    if not extracted_text or len(extracted_text.strip()) < 100:
+        raise JobError('Could not extract sufficient text from PDF')
+
+    from PyPDF2 import PdfReader
+    total_pages = len(PdfReader(params['pdf_path']).pages)
+
+    report(f"🤖 Generating comprehensive notes for {total_pages} pages with {params['model_type']}...")
+    usage_stats = new_token_usage()
+    notes = generate_comprehensive_notes(
+        text=extracted_text,
+        model_provider=params['model_provider'],
+        model_type=params['model_type'],
+        usage_stats=usage_stats
+    )
+    if not notes or notes.startswith("Notes generation failed:") or notes.startswith("Unable to generate notes"):
+        raise JobError(f"Failed to generate notes: {notes or 'No notes generated'}")
+
+    report(f"✅ Notes generated: {len(notes)} characters")
+    return {
+        'success': True,
+        'summary': notes,  # Same key as /summarize-pdf for frontend compatibility
+        'filename': params.get('filename'),
+        'total_pages': total_pages,
+        'text_length': len(extracted_text),
+        'model_used': params['model_type'],
+        'token_usage': usage_stats
+    }
+
+
+JOB_HANDLERS = {
+    'mcq': run_mcq_job,
+    'notes': run_notes_job,
+    'batch': run_batch_job,
+}
+
+
+def run_job(job):
+    """Run one claimed job and record its result; uploaded files are removed afterwards."""
+    job_id = job['id']
+    params = job['params']
+
+    def report(message):
+        add_job_event(job_id, message)
+
+    report(f"🚀 Job started ({job['job_type']})")
+    try:
+        if params.get('secrets'):
+            with _job_secrets_lock:
+                secrets = _job_secrets.get(job_id)
+            if secrets is None:
+                raise JobError("The API key of this job was lost when the server restarted - please submit it again")
+            params = dict(params, model_config={**params['model_config'], **secrets})
+        result = JOB_HANDLERS[job['job_type']](params, report)
+        # Events are written before the final status so streams see them all
+        report('🎉 Job completed')
+        finish_job(job_id, result=result)
+    except JobError as e:
+        report(f"❌ {e}")
+        finish_job(job_id, error=str(e))
+    except Exception as e:
+        traceback.print_exc()
+        report(f"❌ Job failed: {e}")
+        finish_job(job_id, error=f"{type(e).__name__}: {e}")
+    finally:
+        with _job_secrets_lock:
+            _job_secrets.pop(job_id, None)
+        shutil.rmtree(os.path.join(JOB_FILES_DIR, job_id), ignore_errors=True)
+
+
+# ============================================
+# Worker pool
+# ============================================
+
+class JobWorkerPool:
+    """Background threads that consume jobs from the persistent queue."""
+
+    def __init__(self, num_workers=JOB_WORKERS):
+        self.num_workers = max(1, num_workers)
+        self.worker_prefix = _process_id()
+        self._wakeup = threading.Event()
+        self._threads = []
+
+    def start(self):
+        requeued = requeue_interrupted_jobs()
+        if requeued:
+            print(f"🔁 Requeued {requeued} interrupted job(s)")
+        for index in range(self.num_workers):
+            thread = threading.Thread(target=self._worker_loop, args=(f"{self.worker_prefix}:{index}",),
+                                      name=f"job-worker-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        print(f"👷 Started {self.num_workers} job worker(s)")
+
+    def notify(self):
+        """Wake idle workers after a job was queued."""
+        self._wakeup.set()
+
+    def _worker_loop(self, worker):
+        while True:
+            try:
+                job = claim_next_job(worker)
+            except sqlite3.Error as e:
+                print(f"⚠️  Job queue unavailable: {e}")
+                job = None
+
+            if job is None:
+                self._wakeup.wait(JOB_POLL_INTERVAL)
+                self._wakeup.clear()
+                continue
+
+            print(f"👷 {worker} running job {job['id']} ({job['job_type']})")
+            run_job(job)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_worker_pool():
+    """Return the process-wide worker pool, starting it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = JobWorkerPool()
+            _pool.start()
+    return _pool
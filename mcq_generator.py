@@ -1,4 +1,3 @@
-from openai import OpenAI
 import httpx
 import os
 from dotenv import load_dotenv
@@ -7,56 +6,111 @@ from PyPDF2 import PdfReader
 import re
 import math
 import time
+import asyncio
+import threading
+import importlib
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+
+from prompt_templates import (
+    PROMPT_TEMPLATE_VERSION, LEGACY_MCQ_PROMPT_TOKENS, LEGACY_NOTES_PROMPT_TOKENS,
+    MCQ_AMENDMENT_RULES, NOTES_CHUNK_SYSTEM_PROMPT, NOTES_SINGLE_PASS_SYSTEM_PROMPT,
+    STUDY_TOOLS_SYSTEM_PROMPT, SUMMARY_SYSTEM_PROMPT, NOTES_CONDENSE_SYSTEM_PROMPT, STUDY_TOOLS_MAX_CHARS,
+    build_mcq_system_prompt, build_mcq_user_prompt, build_notes_chunk_prompt, build_notes_single_pass_prompt,
+    build_study_tools_prompt, build_summary_prompt, build_notes_condense_prompt, build_prompt_messages
+)
+from generation_cache import (
+    document_hash, get_cached_summary, store_summary,
+    load_chunk_checkpoints, store_chunk_checkpoint, clear_chunk_checkpoints
+)
+from request_deadline import (
+    document_fingerprint, settings_fingerprint, encode_continuation_token, decode_continuation_token
+)
 
 # Timeout settings for API calls (in seconds)
 API_TIMEOUT = 55  # Slightly less than Vercel's 60s max to allow for cleanup
 
+# Maximum number of model calls run concurrently for one document
+MAX_PARALLEL_CALLS = int(os.environ.get('MAX_PARALLEL_CALLS', 4))
+
+# Levels of tree-wise condensing before notes are cut to fit the study tools prompt
+NOTES_REDUCE_MAX_DEPTH = 4
+NOTES_CONDENSE_MIN_CHARS = 1500
+
+# Process-wide cap on MCQ call starts per model, shared by all requests and
+# batch files (0 = no cap; free-tier models default to the OpenRouter limit)
+MODEL_CALLS_PER_MINUTE = float(os.environ.get('MODEL_CALLS_PER_MINUTE', 0))
+FREE_TIER_CALLS_PER_MINUTE = 20
+
+_token_usage_lock = threading.Lock()
+
+# Runs PDF summaries alongside question generation; a summary still running
+# when its request finishes completes in the background and is cached
+_summary_executor = ThreadPoolExecutor(max_workers=MAX_PARALLEL_CALLS, thread_name_prefix='pdf-summary')
+
 # Load environment variables
 load_dotenv()
 
-# Import offline MCQ generator
-try:
-    from offline_mcq_generator import (
-        generate_mcq_questions_offline,
-        estimate_max_questions_offline,
-        is_offline_available
-    )
-    OFFLINE_AVAILABLE = is_offline_available()
-except ImportError:
-    OFFLINE_AVAILABLE = False
+# Local generators and the packages they import at load time. Availability is
+# checked with importlib.util.find_spec(), which locates a package without
+# importing it, so importing this module (and starting the web app) does not
+# load torch, transformers, spaCy, nltk or sklearn. A generator module is
+# imported on its first call; if that fails, the callers' fallbacks apply.
+LOCAL_GENERATOR_DEPENDENCIES = {
+    'offline_mcq_generator': (),
+    'professional_mcq_generator': ('torch', 'transformers', 'sentence_transformers', 'spacy', 'nltk', 'sklearn', 'numpy'),
+    'fast_mcq_generator': ('torch', 'transformers', 'sentence_transformers', 'spacy', 'nltk', 'sklearn', 'numpy'),
+    'enhanced_professional_mcq': ('torch', 'transformers', 'sentence_transformers', 'spacy', 'nltk', 'numpy'),
+}
+
+
+def modules_installed(*names):
+    """Whether all top-level modules can be found, without importing them."""
+    try:
+        return all(importlib.util.find_spec(name) is not None for name in names)
+    except (ImportError, ValueError):
+        return False
+
+
+def local_generator_available(module_name):
+    """Whether a local generator module and its dependencies are installed."""
+    return modules_installed(module_name, *LOCAL_GENERATOR_DEPENDENCIES[module_name])
+
+
+def _lazy_function(module_name, function_name):
+    """A function that imports module_name on first call and delegates to its function_name."""
+    def call(*args, **kwargs):
+        return getattr(importlib.import_module(module_name), function_name)(*args, **kwargs)
+    call.__name__ = function_name
+    call.__qualname__ = function_name
+    return call
+
+
+# Offline MCQ generator
+OFFLINE_AVAILABLE = local_generator_available('offline_mcq_generator')
+generate_mcq_questions_offline = _lazy_function('offline_mcq_generator', 'generate_mcq_questions_offline')
+estimate_max_questions_offline = _lazy_function('offline_mcq_generator', 'estimate_max_questions_offline')
+if not OFFLINE_AVAILABLE:
     print("Offline MCQ generation not available. Install offline dependencies for enhanced functionality.")
 
-# Import professional MCQ generator
-try:
-    from professional_mcq_generator import (
-        generate_professional_mcq_questions,
-        is_professional_mode_available
-    )
-    PROFESSIONAL_AVAILABLE = is_professional_mode_available()
-except ImportError:
-    PROFESSIONAL_AVAILABLE = False
+# Professional MCQ generator
+PROFESSIONAL_AVAILABLE = local_generator_available('professional_mcq_generator')
+generate_professional_mcq_questions = _lazy_function(
+    'professional_mcq_generator', 'generate_professional_mcq_questions')
+if not PROFESSIONAL_AVAILABLE:
     print("Professional MCQ generation not available. Run 'python setup_professional_models.py' for best quality.")
 
-# Import fast MCQ generator
-try:
-    from fast_mcq_generator import (
-        generate_fast_mcq_questions,
-        is_fast_mode_available
-    )
-    FAST_AVAILABLE = is_fast_mode_available()
-except ImportError:
-    FAST_AVAILABLE = False
+# Fast MCQ generator
+FAST_AVAILABLE = local_generator_available('fast_mcq_generator')
+generate_fast_mcq_questions = _lazy_function('fast_mcq_generator', 'generate_fast_mcq_questions')
+if not FAST_AVAILABLE:
     print("Fast MCQ generation not available. Run 'python setup_fast_models.py' for speed optimization.")
 
-# Import enhanced professional MCQ generator
-try:
-    from enhanced_professional_mcq import (
-        generate_enhanced_professional_mcq_questions,
-        is_enhanced_professional_mode_available
-    )
-    ENHANCED_PROFESSIONAL_AVAILABLE = is_enhanced_professional_mode_available()
-except ImportError:
-    ENHANCED_PROFESSIONAL_AVAILABLE = False
+# Enhanced professional MCQ generator
+ENHANCED_PROFESSIONAL_AVAILABLE = local_generator_available('enhanced_professional_mcq')
+generate_enhanced_professional_mcq_questions = _lazy_function(
+    'enhanced_professional_mcq', 'generate_enhanced_professional_mcq_questions')
+if not ENHANCED_PROFESSIONAL_AVAILABLE:
     print("Enhanced professional MCQ generation not available.")
 
 def estimate_token_count(text):
@@ -70,6 +124,93 @@ def estimate_token_count(text):
     # Conservative estimate: 1 token per 3.5 characters (accounting for spaces and punctuation)
     return math.ceil(len(text) / 3.5)
 
+def new_token_usage():
+    """
+    Create an accumulator for token usage across the model calls of a run.
+
+    Returns:
+        dict: Counters filled in by record_token_usage()
+    """
+    return {
+        'calls': 0,
+        'prompt_tokens': 0,
+        'cached_tokens': 0,
+        'completion_tokens': 0,
+        'template_tokens_saved': 0,
+        'prompt_template_version': PROMPT_TEMPLATE_VERSION
+    }
+
+def record_token_usage(usage_stats, completion, template_tokens_saved=0):
+    """
+    Add the token counts reported in ``completion.usage`` to usage_stats.
+
+    Cached prompt tokens are read from ``prompt_tokens_details.cached_tokens``
+    (OpenAI / OpenRouter) or ``prompt_cache_hit_tokens`` (DeepSeek).
+
+    Args:
+        usage_stats (dict): Accumulator from new_token_usage(), or None
+        completion: Chat completion returned by the API
+        template_tokens_saved (int): Instruction tokens saved by the compact template
+    """
+    if usage_stats is None:
+        return
+
+    prompt_tokens = completion_tokens = cached_tokens = 0
+    usage = getattr(completion, 'usage', None)
+    if usage is not None:
+        prompt_tokens = getattr(usage, 'prompt_tokens', 0) or 0
+        completion_tokens = getattr(usage, 'completion_tokens', 0) or 0
+
+        details = getattr(usage, 'prompt_tokens_details', None)
+        if isinstance(details, dict):
+            cached_tokens = details.get('cached_tokens', 0)
+        else:
+            cached_tokens = getattr(details, 'cached_tokens', 0)
+        if not cached_tokens:
+            cached_tokens = getattr(usage, 'prompt_cache_hit_tokens', 0)
+
+    # Calls of one run may complete on several threads
+    with _token_usage_lock:
+        usage_stats['calls'] += 1
+        usage_stats['template_tokens_saved'] += max(0, template_tokens_saved)
+        usage_stats['prompt_tokens'] += prompt_tokens
+        usage_stats['completion_tokens'] += completion_tokens
+        usage_stats['cached_tokens'] += cached_tokens or 0
+
+def format_token_usage(usage_stats):
+    """Format a one-line token usage report for the logs."""
+    return (f"💾 Token usage: {usage_stats['calls']} calls, "
+            f"{usage_stats['prompt_tokens']:,} input tokens "
+            f"({usage_stats['cached_tokens']:,} served from prompt cache), "
+            f"{usage_stats['completion_tokens']:,} output tokens; "
+            f"compact prompt template v{usage_stats['prompt_template_version']} saved "
+            f"~{usage_stats['template_tokens_saved']:,} input tokens")
+
+def report_progress(progress, message, **details):
+    """
+    Pass a progress event to an optional callback.
+
+    Args:
+        progress (callable): progress(message, **details), or None
+        message (str): Human-readable progress message
+        **details: Structured fields such as event, chunk, total_chunks,
+            questions_so_far and tokens_used
+    """
+    if progress is None:
+        return
+    try:
+        progress(message, **details)
+    except Exception as e:
+        print(f"⚠️  Progress callback failed: {e}")
+
+def tokens_used(usage_stats):
+    """Input plus output tokens recorded so far."""
+    return usage_stats['prompt_tokens'] + usage_stats['completion_tokens']
+
+def prompt_overhead_tokens(system_prompt, user_prompt, content):
+    """Estimate the instruction tokens a call sends on top of the document content."""
+    return estimate_token_count(system_prompt) + estimate_token_count(user_prompt) - estimate_token_count(content)
+
 def repair_json_response(response):
     """
     Attempt to repair and clean up malformed JSON responses from AI models.
@@ -329,70 +470,412 @@ def get_rate_limit_delay(model_name, chunk_number):
 
     return 0  # No delay for first chunk or unknown models
 
-def generate_pdf_summary(text, model_provider='openrouter', model_type='basic'):
+class CallRateLimiter:
+    """Spaces the starts of model calls evenly across all threads of the process."""
+
+    def __init__(self, calls_per_minute):
+        self.interval = 60.0 / calls_per_minute if calls_per_minute > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Claim the next call slot without waiting.
+
+        Returns:
+            float: Seconds until the slot starts
+        """
+        if not self.interval:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        return slot - now
+
+    def wait(self, cancellation=None):
+        """
+        Block until the next call slot.
+
+        Returns:
+            float: Seconds waited
+        """
+        delay = self.reserve()
+        if delay > 0:
+            if cancellation:
+                cancellation.wait(delay)
+            else:
+                time.sleep(delay)
+        return delay
+
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_model_rate_limiter(model_name):
+    """Return the process-wide CallRateLimiter of a model."""
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(model_name)
+        if limiter is None:
+            calls_per_minute = MODEL_CALLS_PER_MINUTE
+            if not calls_per_minute and ':free' in model_name:
+                calls_per_minute = FREE_TIER_CALLS_PER_MINUTE
+            limiter = _rate_limiters[model_name] = CallRateLimiter(calls_per_minute)
+        return limiter
+
+
+def run_calls_concurrently(call, items, max_workers=MAX_PARALLEL_CALLS, min_interval=0):
+    """
+    Run call(item) for every item on a thread pool.
+
+    Model calls spend their time waiting on the network, so threads overlap
+    them. For rate-limited models the call starts are spaced at least
+    min_interval seconds apart (see get_rate_limit_delay()).
+
+    Args:
+        call (callable): Function making one model call; should handle its own errors
+        items (list): Arguments for each call
+        max_workers (int): Maximum number of concurrent calls
+        min_interval (float): Minimum seconds between two call starts
+
+    Returns:
+        list: Results in the same order as items
+    """
+    if not items:
+        return []
+
+    start_lock = threading.Lock()
+    next_start = [time.monotonic()]
+
+    def throttled_call(item):
+        if min_interval > 0:
+            with start_lock:
+                now = time.monotonic()
+                wait = next_start[0] - now
+                next_start[0] = max(next_start[0], now) + min_interval
+            if wait > 0:
+                time.sleep(wait)
+        return call(item)
+
+    workers = max(1, min(max_workers, len(items)))
+    if workers == 1:
+        return [throttled_call(item) for item in items]
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(throttled_call, items))
+
+# The online generation loops are written once as generators that yield the
+# I/O they need, so the same code runs on the blocking OpenAI client (Flask,
+# job workers) and on AsyncOpenAI (ASGI). Steps and what the driver sends back:
+#     ('client', (provider, api_key, base_url))   API client
+#     ('sleep', seconds)                           None
+#     ('complete', request_options)                chat completion
+#     ('io', (function, args))                     function(*args), e.g. a cache lookup;
+#                                                  run on a worker thread by the async driver
+# An exception raised by a step is thrown into the generator at its yield.
+
+def run_model_steps(steps, cancellation=None):
+    """
+    Drive a model-step generator with the blocking OpenAI client.
+
+    Args:
+        steps (generator): Generator following the step protocol above
+        cancellation (CancellationToken): Optional; cancelling closes the client
+            (aborting the call in flight) and interrupts sleeps
+
+    Returns:
+        The generator's return value
+    """
+    client = None
+    response = error = None
+    while True:
+        try:
+            step, argument = steps.throw(error) if error else steps.send(response)
+        except StopIteration as finished:
+            return finished.value
+        response = error = None
+        try:
+            if step == 'client':
+                client = response = get_ai_client(*argument)
+                if cancellation:
+                    # Closing the client aborts the request in flight
+                    cancellation.on_cancel(client.close)
+            elif step == 'sleep':
+                if argument > 0:
+                    if cancellation:
+                        cancellation.wait(argument)
+                    else:
+                        time.sleep(argument)
+            elif step == 'complete':
+                response = client.chat.completions.create(**argument)
+            elif step == 'io':
+                function, args = argument
+                response = function(*args)
+            else:
+                raise ValueError(f"Unknown model step '{step}'")
+        except Exception as e:
+            error = e
+
+async def run_model_steps_async(steps):
+    """
+    Drive a model-step generator with AsyncOpenAI.
+
+    Waiting on the model does not hold a thread; cancelling the awaiting task
+    aborts the call in flight and closes the generator.
+
+    Returns:
+        The generator's return value
+    """
+    client = None
+    response = error = None
+    try:
+        while True:
+            try:
+                step, argument = steps.throw(error) if error else steps.send(response)
+            except StopIteration as finished:
+                return finished.value
+            response = error = None
+            try:
+                if step == 'client':
+                    client = response = get_ai_client(*argument, async_client=True)
+                elif step == 'sleep':
+                    if argument > 0:
+                        await asyncio.sleep(argument)
+                elif step == 'complete':
+                    response = await client.chat.completions.create(**argument)
+                elif step == 'io':
+                    # Blocking SQLite calls must not stall the event loop
+                    function, args = argument
+                    response = await asyncio.to_thread(function, *args)
+                else:
+                    raise ValueError(f"Unknown model step '{step}'")
+            except Exception as e:
+                error = e
+    finally:
+        steps.close()
+        if client is not None:
+            await client.close()
+
+def generate_pdf_summary(text, model_provider='openrouter', model_type='basic',
+                         custom_api_key=None, custom_base_url=None, usage_stats=None):
     """
     Generate a 2-line summary of the PDF content to help users understand the subject.
 
+    Summaries are cached by document hash, so a repeat upload of the same
+    document never pays for another call.
+
     Args:
         text (str): Extracted text from PDF
         model_provider (str): AI provider to use
-        model_type (str): Type of model to use
+        model_type (str): 'basic'/'advanced' or an actual model name
+        custom_api_key (str): API key for the 'custom' provider
+        custom_base_url (str): Base URL for the 'custom' provider
+        usage_stats (dict): Optional accumulator from new_token_usage()
 
     Returns:
         str: 2-line summary of the PDF content
     """
+    return run_model_steps(_pdf_summary_steps(text, model_provider, model_type,
+                                              custom_api_key, custom_base_url, usage_stats))
+
+async def generate_pdf_summary_async(text, model_provider='openrouter', model_type='basic',
+                                     custom_api_key=None, custom_base_url=None, usage_stats=None):
+    """Async twin of generate_pdf_summary() using AsyncOpenAI."""
+    return await run_model_steps_async(_pdf_summary_steps(text, model_provider, model_type,
+                                                          custom_api_key, custom_base_url, usage_stats))
+
+def _pdf_summary_steps(text, model_provider, model_type, custom_api_key, custom_base_url, usage_stats):
+    """Model steps of generate_pdf_summary() (see run_model_steps())."""
     try:
         if not text or len(text.strip()) < 50:
             return "Unable to generate summary - insufficient content"
 
-        # Limit text to first 3000 characters for summary generation
-        summary_text = text[:3000]
+        doc_hash = document_hash(text)
+        cached_summary = yield ('io', (get_cached_summary, (doc_hash,)))
+        if cached_summary:
+            print("💾 PDF summary served from cache")
+            return cached_summary
 
-        client = get_ai_client(model_provider)
+        yield ('client', (model_provider, custom_api_key, custom_base_url))
         model = get_model_name(model_provider, model_type)
 
-        prompt = f"""Generate a concise 2-line summary of the following document content.
-The summary should help users understand the main subject and topic of the document.
-Keep it brief, informative, and in plain language.
+        # Counts against the model's process-wide rate limit like the MCQ chunk calls,
+        # so the summaries of a batch cannot burst past it
+        yield ('sleep', get_model_rate_limiter(model).reserve())
 
-Document Content:
-{summary_text}
-
-Provide ONLY the 2-line summary, nothing else."""
-
-        completion = client.chat.completions.create(
+        # Only the first SUMMARY_MAX_CHARS characters are sent for summary generation
+        completion = yield ('complete', dict(
             model=model,
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant that creates concise document summaries."},
-                {"role": "user", "content": prompt}
-            ],
+            messages=build_prompt_messages(SUMMARY_SYSTEM_PROMPT, build_summary_prompt(text), model),
             max_tokens=200,
             temperature=0.5,
-        )
+        ))
+        record_token_usage(usage_stats, completion)
 
         summary = completion.choices[0].message.content.strip()
+        if summary:
+            yield ('io', (store_summary, (doc_hash, summary, model)))
         return summary
 
     except Exception as e:
         print(f"⚠️  Error generating PDF summary: {e}")
         return "Summary generation failed"
 
+def start_pdf_summary(text, model_config=None, usage_stats=None):
+    """
+    Start generating the PDF summary in the background with the user's selected model.
+
+    Args:
+        text (str): Extracted text from PDF
+        model_config (dict): Model configuration; defaults to OpenRouter 'basic'
+        usage_stats (dict): Optional accumulator from new_token_usage()
+
+    Returns:
+        concurrent.futures.Future: Resolves to the summary string
+    """
+    model_config = model_config or {}
+    return _summary_executor.submit(
+        generate_pdf_summary, text,
+        model_config.get('provider', 'openrouter'),
+        model_config.get('model_name') or 'basic',
+        model_config.get('custom_api_key'),
+        model_config.get('custom_base_url'),
+        usage_stats
+    )
 
-def generate_comprehensive_notes(text, model_provider='openrouter', model_type='meta-llama/llama-3.3-70b-instruct:free'):
+def split_notes(notes, max_chars):
+    """
+    Split notes into consecutive pieces of at most max_chars, at paragraph,
+    line or word boundaries where possible, so nothing is cut off.
+
+    Args:
+        notes (str): Notes to split
+        max_chars (int): Maximum length of a piece
+
+    Returns:
+        list: The pieces, in order; [notes] if it already fits
+    """
+    max_chars = max(1, max_chars)
+    pieces = []
+    rest = notes
+    while len(rest) > max_chars:
+        window = rest[:max_chars + 1]
+        cut = -1
+        for boundary in ("\n\n", "\n", " "):
+            cut = window.rfind(boundary)
+            if cut > 0:
+                break
+        if cut <= 0:
+            cut = max_chars
+        pieces.append(rest[:cut].rstrip())
+        rest = rest[cut:].lstrip()
+    if rest or not pieces:
+        pieces.append(rest)
+    return pieces
+
+def condense_notes_for_study_tools(client, model, chunk_notes, max_output_tokens, usage_stats=None,
+                                   budget_chars=STUDY_TOOLS_MAX_CHARS, min_interval=0):
+    """
+    Condense per-chunk notes tree-wise until they fit the study tools prompt.
+
+    Each level groups consecutive parts into batches of at most budget_chars,
+    condenses the batches concurrently and repeats on the results, so every
+    chunk contributes and wall time grows with the tree depth rather than
+    the number of chunks. A part longer than budget_chars is split into
+    sub-parts first, and a group whose condense call fails is kept as is for
+    the next level, so no notes are cut off before the final depth.
+
+    Args:
+        client: OpenAI-compatible client
+        model (str): Model to call
+        chunk_notes (list): Notes of each chunk, in document order
+        max_output_tokens (int): Output token cap of the model
+        usage_stats (dict): Optional accumulator from new_token_usage()
+        budget_chars (int): Maximum length of the condensed notes
+        min_interval (float): Minimum seconds between call starts (rate-limited models)
+
+    Returns:
+        str: Condensed notes covering every chunk, at most about budget_chars long
+    """
+    section_separator = "\n\n" + "="*60 + "\n\n"
+    total_parts = len(chunk_notes)
+    # (first part, last part, notes) in document order
+    level = [(i + 1, i + 1, notes) for i, notes in enumerate(chunk_notes)]
+
+    def level_size(parts):
+        return sum(len(notes) for _, _, notes in parts) + len(section_separator) * (len(parts) - 1)
+
+    depth = 0
+    while level_size(level) > budget_chars and depth < NOTES_REDUCE_MAX_DEPTH:
+        depth += 1
+
+        # Split oversized parts, then group consecutive parts so each condense call gets at most budget_chars of input
+        parts = [(first, last, piece) for first, last, notes in level
+                 for piece in split_notes(notes, budget_chars)]
+        groups = []
+        for part in parts:
+            if groups and level_size(groups[-1] + [part]) <= budget_chars:
+                groups[-1].append(part)
+            else:
+                groups.append([part])
+
+        target_chars = max(NOTES_CONDENSE_MIN_CHARS,
+                           (budget_chars - len(section_separator) * (len(groups) - 1)) // len(groups))
+        max_tokens = min(max_output_tokens, math.ceil(target_chars / 3) + 256)
+
+        def condense(group):
+            first_part, last_part = group[0][0], group[-1][1]
+            notes = section_separator.join(part_notes for _, _, part_notes in group)
+            user_prompt = build_notes_condense_prompt(first_part, last_part, total_parts, notes, target_chars)
+            try:
+                completion = client.chat.completions.create(
+                    model=model,
+                    messages=build_prompt_messages(NOTES_CONDENSE_SYSTEM_PROMPT, user_prompt, model),
+                    max_tokens=max_tokens,
+                    temperature=0.2,
+                )
+                record_token_usage(usage_stats, completion)
+                condensed = completion.choices[0].message.content.strip()
+            except Exception as condense_error:
+                print(f"⚠️  Error condensing notes of parts {first_part}-{last_part}: {condense_error}")
+                condensed = ''
+            # Keep the group's parts for the next level so they stay represented in full
+            return [(first_part, last_part, condensed)] if condensed else group
+
+        level = [part for condensed in run_calls_concurrently(condense, groups, min_interval=min_interval)
+                 for part in condensed]
+        print(f"🌳 Reduce level {depth}: {len(groups)} condensed groups, {level_size(level):,} characters")
+
+    if level_size(level) > budget_chars:
+        # Still too long after the maximum depth - give every part an equal share
+        share = max(1, budget_chars // len(level) - len(section_separator))
+        level = [(first, last, notes[:share]) for first, last, notes in level]
+
+    return section_separator.join(notes for _, _, notes in level)
+
+def generate_comprehensive_notes(text, model_provider='openrouter', model_type='meta-llama/llama-3.3-70b-instruct:free',
+                                 usage_stats=None):
     """
     Generate EXHAUSTIVE, ERROR-FREE, AND COMPLETE NOTES from PDF content.
     Designed for academic/exam preparation with detailed rule-wise analysis.
 
     Uses chunked processing to ensure ALL pages are covered, even for large documents.
+    Every chunk call shares the same static system prompt so it can be served
+    from the provider's prompt cache.
 
     Args:
         text (str): Extracted text from PDF
         model_provider (str): AI provider to use
         model_type (str): Model identifier (can be 'basic', 'advanced', or a full model name like 'meta-llama/llama-3.3-70b-instruct:free')
+        usage_stats (dict): Optional accumulator from new_token_usage() for token and cache statistics
 
     Returns:
         str: Comprehensive notes with tables, flowcharts, and exam-oriented content
     """
+    if usage_stats is None:
+        usage_stats = new_token_usage()
+
     try:
         if not text or len(text.strip()) < 100:
             return "Unable to generate notes - insufficient content"
@@ -471,147 +954,86 @@ def generate_comprehensive_notes(text, model_provider='openrouter', model_type='
         print(f"📊 Processing {len(text)} characters ({total_tokens} estimated tokens)...")
         print(f"🔧 Model config: {model_context_info}, chunk size: {chunk_size}, overlap: {chunk_overlap}")
 
-        system_prompt = """You are an expert academic note-maker, government-exam trainer, and documentation analyst.
-Your task is to prepare EXHAUSTIVE, ERROR-FREE, AND COMPLETE NOTES from the given document section.
-
-ABSOLUTE REQUIREMENTS - VIOLATION IS NOT ALLOWED:
-1. Process EVERY SINGLE RULE from Rule 1 to the last rule - NO SKIPPING
-2. Do NOT write "continued in next section" or "and so on" - COMPLETE ALL CONTENT
-3. Do NOT summarize multiple rules together - each rule must be separate
-4. Do NOT omit any rule, note, explanation, proviso, example, or exception
-5. Every rule number, sub-rule, NOTE, and reference must be preserved
-6. Use clean ASCII characters only - avoid special symbols like emojis
-7. Do NOT use ** for bold - use plain text with UPPERCASE for emphasis
-8. Format for professional PDF printing
-
-IMPORTANT: Do NOT add comparison tables, summary tables, or flowcharts after each rule.
-These study tools will be added ONLY at the very end of the complete document.
-Focus on comprehensive rule coverage in this section.
-
-FORBIDDEN PHRASES (NEVER USE THESE):
-- "Continued for subsequent sections"
-- "And so on"
-- "etc."
-- "remaining rules follow similar pattern"
-- "as mentioned earlier"
-- Any phrase suggesting incomplete coverage
-
-These notes will be used for:
-- Daily reference by government officers
-- Competitive & departmental examinations
-- Quick revision before tests"""
-
         # Check if text needs to be chunked
         if total_tokens > max_context_tokens:
             print(f"📚 Document too large ({total_tokens} tokens), processing in chunks...")
 
             # Use dynamic chunk sizes based on model context limits (set above)
-            chunks = chunk_text(text, max_tokens=chunk_size, overlap_tokens=chunk_overlap)
+            spans = chunk_text_spans(text, max_tokens=chunk_size, overlap_tokens=chunk_overlap)
+            chunks = [text[span_start:span_end].strip() for span_start, span_end in spans]
             print(f"📄 Split into {len(chunks)} chunks for comprehensive processing")
             print(f"📊 Each chunk: ~{chunk_size:,} tokens with {chunk_overlap:,} token overlap")
 
-            all_notes = []
-
-            for i, chunk in enumerate(chunks):
-                chunk_num = i + 1
-                is_first = (i == 0)
-                is_last = (i == len(chunks) - 1)
-
-                # Adjust prompt based on chunk position
-                if is_first:
-                    chunk_instruction = f"""This is PART {chunk_num} of {len(chunks)} of the document.
-
-START with:
-1. Document Title and Overview
-2. Purpose of the Rules/Document
-3. Who Should Study This (DDO, Accounts Officer, Audit Officer, Exam Aspirants)
-4. Key Concepts Introduction
-
-Then process EVERY SINGLE RULE in this section completely - do NOT skip any rule."""
-
-                elif is_last:
-                    chunk_instruction = f"""This is the FINAL PART ({chunk_num} of {len(chunks)}) of the document.
-
-Process EVERY REMAINING RULE completely - do NOT skip any rule.
-Focus on comprehensive rule coverage only - study tools will be generated separately."""
-
-                else:
-                    chunk_instruction = f"""This is PART {chunk_num} of {len(chunks)} of the document.
-
-Process EVERY SINGLE RULE in this section completely.
-Do NOT skip any rule. Do NOT write "continued" or "and so on".
-Cover each rule with full details."""
-
-                user_prompt = f"""{chunk_instruction}
-
-CRITICAL: Process EVERY rule in this section. Do NOT abbreviate or skip.
-
-FORMAT FOR EACH RULE:
+            # Use the max_output_tokens determined above based on model type
+            # This ensures we stay within timeout limits while maximizing output quality
+            max_tokens = max_output_tokens
 
-RULE [Number] - [Title]
-[Complete rule text - do not abbreviate or skip any part]
-Key Points:
-- Point 1
-- Point 2
-Explanation: [Clear explanation]
-Important for Exam: [Why this matters]
+            # Rate-limited models get their call starts spaced instead of a sleep per chunk
+            min_interval = get_rate_limit_delay(model, 2)
 
-IMPORTANT REMINDERS:
-- Do NOT use ** for bold - use UPPERCASE for emphasis
-- Do NOT write "continued for subsequent sections" - complete ALL rules
-- Do NOT add comparison tables or flowcharts here - they will be added at the END only
-- Focus on comprehensive rule coverage
+            # Chunks that succeeded in an earlier, failed attempt are not sent again
+            doc_hash = document_hash(text)
+            settings = settings_fingerprint(PROMPT_TEMPLATE_VERSION, model_provider, model,
+                                            chunk_size, chunk_overlap, max_output_tokens)
+            checkpoints = load_chunk_checkpoints(doc_hash, 'notes', settings)
+            if checkpoints:
+                print(f"♻️ {len(checkpoints)} chunk(s) restored from checkpoints")
 
----
-DOCUMENT SECTION TO PROCESS (cover every rule below):
-{chunk}"""
+            def process_chunk(indexed_chunk):
+                i, chunk = indexed_chunk
+                chunk_num = i + 1
+                checkpoint = checkpoints.get(spans[i])
+                if checkpoint:
+                    return checkpoint['notes']
 
-                # Use the max_output_tokens determined above based on model type
-                # This ensures we stay within timeout limits while maximizing output quality
-                max_tokens = max_output_tokens
+                user_prompt = build_notes_chunk_prompt(chunk_num, len(chunks), chunk)
 
                 print(f"📤 Processing chunk {chunk_num}/{len(chunks)} (max_tokens: {max_tokens})...")
 
-                # Add rate limiting delay
-                delay = get_rate_limit_delay(model, chunk_num)
-                if delay > 0:
-                    print(f"⏳ Rate limit delay: waiting {delay} seconds...")
-                    time.sleep(delay)
-
                 try:
                     completion = client.chat.completions.create(
                         model=model,
-                        messages=[
-                            {"role": "system", "content": system_prompt},
-                            {"role": "user", "content": user_prompt}
-                        ],
+                        messages=build_prompt_messages(NOTES_CHUNK_SYSTEM_PROMPT, user_prompt, model),
                         max_tokens=max_tokens,
                         temperature=0.3,
                     )
+                    record_token_usage(usage_stats, completion,
+                                       LEGACY_NOTES_PROMPT_TOKENS - prompt_overhead_tokens(NOTES_CHUNK_SYSTEM_PROMPT, user_prompt, chunk))
 
                     chunk_notes = completion.choices[0].message.content.strip()
-                    all_notes.append(chunk_notes)
+                    store_chunk_checkpoint(doc_hash, 'notes', settings, spans[i], {'notes': chunk_notes})
                     print(f"✅ Chunk {chunk_num}/{len(chunks)} completed: {len(chunk_notes)} characters")
+                    return chunk_notes
 
                 except httpx.TimeoutException as timeout_error:
                     print(f"⏰ TIMEOUT processing chunk {chunk_num} with model {model}: {timeout_error}")
-                    all_notes.append(f"\n\n[Note: Section {chunk_num} timed out - try a faster model like DeepSeek or Llama 3.2 3B]\n\n")
+                    return f"\n\n[Note: Section {chunk_num} timed out - try a faster model like DeepSeek or Llama 3.2 3B]\n\n"
                 except Exception as chunk_error:
                     error_msg = str(chunk_error)
                     print(f"⚠️  Error processing chunk {chunk_num} with model {model}: {error_msg}")
                     # Check for specific error types
                     if "404" in error_msg:
-                        all_notes.append(f"\n\n[Error: Model '{model}' not found - invalid model ID]\n\n")
+                        return f"\n\n[Error: Model '{model}' not found - invalid model ID]\n\n"
                     elif "429" in error_msg:
-                        all_notes.append(f"\n\n[Error: Rate limited on model '{model}' - try again later]\n\n")
+                        return f"\n\n[Error: Rate limited on model '{model}' - try again later]\n\n"
                     elif "timeout" in error_msg.lower():
-                        all_notes.append(f"\n\n[Error: Model '{model}' timed out - try a faster model]\n\n")
+                        return f"\n\n[Error: Model '{model}' timed out - try a faster model]\n\n"
                     else:
-                        all_notes.append(f"\n\n[Note: Section {chunk_num} could not be processed - {error_msg}]\n\n")
+                        return f"\n\n[Note: Section {chunk_num} could not be processed - {error_msg}]\n\n"
+
+            # Map: all chunks are processed concurrently, results stay in document order
+            print(f"⚡ Processing {len(chunks)} chunks with up to {min(MAX_PARALLEL_CALLS, len(chunks))} concurrent calls")
+            all_notes = run_calls_concurrently(process_chunk, list(enumerate(chunks)), min_interval=min_interval)
 
             # Log completion summary
-            successful_chunks = sum(1 for note in all_notes if not note.startswith('\n\n[Note:') and not note.startswith('\n\n[Error:'))
+            successful_notes = [note for note in all_notes
+                                if not note.startswith('\n\n[Note:') and not note.startswith('\n\n[Error:')]
+            successful_chunks = len(successful_notes)
             print(f"📊 Chunk processing complete: {successful_chunks}/{len(chunks)} chunks processed successfully")
+            if successful_chunks == len(chunks):
+                clear_chunk_checkpoints(doc_hash, 'notes', settings)
+            else:
+                print(f"💾 Completed chunks are checkpointed - a retry only reruns the {len(chunks) - successful_chunks} failed chunk(s)")
 
             # Combine all notes with clear section separators between chunks
             section_separator = "\n\n" + "="*60 + "\n\n"
@@ -644,64 +1066,24 @@ DOCUMENT SECTION TO PROCESS (cover every rule below):
             # ================================================================
             print(f"📚 Generating comprehensive study tools for entire document...")
 
-            # Create a condensed summary of all notes for study tools generation
-            # Extract key rules and topics from the combined notes
-            notes_summary = combined_notes[:30000] if len(combined_notes) > 30000 else combined_notes
-
-            study_tools_prompt = f"""Based on the following comprehensive notes from a {len(chunks)}-part document,
-create STUDY TOOLS that cover the ENTIRE document content.
-
-IMPORTANT: These study tools must summarize ALL content from ALL sections of the document, not just one part.
-
-CREATE THE FOLLOWING STUDY TOOLS:
-
-1. MASTER COMPARISON TABLE - Compare ALL major rules from the entire document:
-| Rule No | Subject | Authority | Time Limit | Key Condition |
-|---------|---------|-----------|------------|---------------|
-(Include at least 15-20 key rules from across all sections)
-
-2. COMPREHENSIVE SUMMARY TABLE - Summarize ALL chapters/sections:
-| Chapter/Section | Key Rules | Important Points | Exam Focus |
-|-----------------|-----------|------------------|------------|
-(Cover every major section of the document)
-
-3. FLOWCHARTS for ALL major processes (use -> arrow format):
-FLOWCHART - [Process Name]:
-Step 1 -> Step 2 -> Step 3 -> Step 4
-
-(Include at least 3-5 flowcharts for key processes like Application, Approval, Appeal, etc.)
-
-4. QUICK REVISION SHEET
-- One-page summary of ALL key points from the entire document
-- Must cover rules from ALL sections
-
-5. EXAM FOCUS AREAS
-- List the most important rules for exams from ALL sections
-- Include rule numbers and brief descriptions
-
-6. COMMON MISTAKES TO AVOID
-- Common confusions between similar rules
-- Frequently misunderstood provisions
-
-7. MCQ-PRONE AREAS
-- Topics likely to appear in MCQs
-- Tricky distinctions to remember
+            # Reduce: condense the notes of all chunks tree-wise until they fit the
+            # study tools prompt, so the tables cover the whole document
+            notes_summary = condense_notes_for_study_tools(
+                client, model, [note.replace("**", "") for note in successful_notes] or [combined_notes],
+                max_output_tokens, usage_stats, min_interval=min_interval
+            )
 
----
-DOCUMENT NOTES TO ANALYZE:
-{notes_summary}"""
+            study_tools_prompt = build_study_tools_prompt(len(chunks), notes_summary)
 
             try:
                 print(f"🤖 Calling model for study tools generation...")
                 study_completion = client.chat.completions.create(
                     model=model,
-                    messages=[
-                        {"role": "system", "content": "You are an expert exam preparation specialist. Create comprehensive study tools that cover ALL content from the entire document provided."},
-                        {"role": "user", "content": study_tools_prompt}
-                    ],
+                    messages=build_prompt_messages(STUDY_TOOLS_SYSTEM_PROMPT, study_tools_prompt, model),
                     max_tokens=max_output_tokens,
                     temperature=0.3,
                 )
+                record_token_usage(usage_stats, study_completion)
                 study_tools = study_completion.choices[0].message.content.strip()
                 print(f"✅ Study tools generated: {len(study_tools)} characters")
 
@@ -723,74 +1105,12 @@ DOCUMENT NOTES TO ANALYZE:
             estimated_words = total_chars // 5
             print(f"✅ Generated {total_chars:,} characters (~{estimated_words:,} words) of comprehensive notes from {len(chunks)} chunks + study tools")
             print(f"📝 All {len(chunks)} document sections processed with comprehensive study tools")
+            print(format_token_usage(usage_stats))
             return combined_notes
 
         else:
             # Single chunk processing for smaller documents
-            user_prompt = f"""DOCUMENT HANDLING INSTRUCTIONS:
-- Process the document chapter-by-chapter and rule-by-rule
-- Maintain original numbering (Chapter, Rule, Sub-rule, Notes)
-- Preserve exact legal/technical meaning
-- Use simple language for explanation, not for altering rules
-
-NOTE-MAKING STRUCTURE (MANDATORY):
-
-CHAPTER OVERVIEW (for each chapter):
-- Purpose of the chapter
-- Who should study it (DDO / Accounts / Audit / Exam aspirants)
-- Key concepts involved
-
-DETAILED NOTES (RULE-WISE):
-For each Rule:
-RULE [Number] - [Title]
-[Exact text simplified but complete - no abbreviation]
-Key Points:
-- Point 1 with explanation
-- Point 2 with explanation
-Authority: [Who has the power]
-Time Limits: [If applicable]
-Conditions: [Key conditions]
-Exceptions: [Important exceptions]
-Cross-References: [Related rules]
-
-MANDATORY STUDY TOOLS (YOU MUST INCLUDE THESE - DO NOT SKIP):
-
-1. COMPARISON TABLES (after every 2-3 rules) - REQUIRED:
-| Rule No | Subject | Authority | Time Limit | Key Condition |
-|---------|---------|-----------|------------|---------------|
-| 1       | Example | Officer   | 30 days    | Approval needed|
-
-2. SUMMARY TABLES - REQUIRED:
-| Topic | Key Points | Remember |
-|-------|------------|----------|
-
-3. MANDATORY FLOWCHARTS (include at least 2-3 in the document):
-Use this exact arrow format:
-
-FLOWCHART - Process Name:
-Step 1 -> Step 2 -> Step 3 -> Step 4
-
-Examples of flowcharts to include:
-- Application Process: Submit -> Verify -> Approve -> Grant
-- Appeal Process: Grievance -> Review -> Decision -> Implementation
-- Recognition Process: Form Association -> Apply -> Scrutiny -> Recognition
-- Any procedural steps in the rules
-
-EXAM-ORIENTED SECTION (after each chapter):
-EXAM HIGHLIGHTS:
-- Most important rules
-- Frequently confused provisions
-- Common mistakes by students
-- MCQ focus areas
-
-QUICK REVISION SHEET (at the end):
-- One-page summary
-- Key rule numbers and their essence
-- Must-remember points
-
----
-DOCUMENT CONTENT TO PROCESS:
-{text}"""
+            user_prompt = build_notes_single_pass_prompt(text)
 
             # Use the max_output_tokens determined at the start based on model type
             # This ensures we stay within timeout limits while maximizing output quality
@@ -801,13 +1121,11 @@ DOCUMENT CONTENT TO PROCESS:
             try:
                 completion = client.chat.completions.create(
                     model=model,
-                    messages=[
-                        {"role": "system", "content": system_prompt},
-                        {"role": "user", "content": user_prompt}
-                    ],
+                    messages=build_prompt_messages(NOTES_SINGLE_PASS_SYSTEM_PROMPT, user_prompt, model),
                     max_tokens=max_tokens,
                     temperature=0.3,
                 )
+                record_token_usage(usage_stats, completion)
                 notes = completion.choices[0].message.content.strip()
             except httpx.TimeoutException as timeout_error:
                 print(f"⏰ TIMEOUT with model {model}: {timeout_error}")
@@ -844,6 +1162,7 @@ DOCUMENT CONTENT TO PROCESS:
             notes = re.sub(r'\n{4,}', '\n\n\n', notes)
 
             print(f"✅ Generated {len(notes)} characters of comprehensive notes")
+            print(format_token_usage(usage_stats))
             return notes
 
     except Exception as e:
@@ -1046,11 +1365,35 @@ def chunk_text(text, max_tokens=120000, overlap_tokens=2000):
     if not text:
         return []
 
+    # If text is small enough, return as single chunk
+    if estimate_token_count(text) <= max_tokens:
+        return [text]
+
+    return [text[start:end].strip() for start, end in chunk_text_spans(text, max_tokens, overlap_tokens)]
+
+def chunk_text_spans(text, max_tokens=120000, overlap_tokens=2000):
+    """
+    Computes the character spans of the chunks returned by chunk_text().
+
+    The spans identify chunks independently of their text, e.g. as keys of
+    per-chunk checkpoints.
+
+    Args:
+        text (str): The text to chunk
+        max_tokens (int): Maximum tokens per chunk
+        overlap_tokens (int): Number of tokens to overlap between chunks
+
+    Returns:
+        list: (start, end) character offsets; text[start:end].strip() is the chunk
+    """
+    if not text:
+        return []
+
     total_tokens = estimate_token_count(text)
 
     # If text is small enough, return as single chunk
     if total_tokens <= max_tokens:
-        return [text]
+        return [(0, len(text))]
 
     # Use a more conservative approach - aim for 90% of max tokens to ensure we stay under
     target_tokens = int(max_tokens * 0.9)
@@ -1058,7 +1401,7 @@ def chunk_text(text, max_tokens=120000, overlap_tokens=2000):
     target_chars_per_chunk = int(target_tokens * chars_per_token)
     overlap_chars = int(overlap_tokens * chars_per_token)
 
-    chunks = []
+    spans = []
     start = 0
 
     while start < len(text):
@@ -1085,15 +1428,15 @@ def chunk_text(text, max_tokens=120000, overlap_tokens=2000):
         # Extract chunk and verify it's within token limits
         chunk = text[start:end].strip()
         if chunk:
+            chunk_end = end
             # Double-check token count and trim if necessary
             chunk_tokens = estimate_token_count(chunk)
             if chunk_tokens > max_tokens:
                 # If still too large, trim more aggressively
                 reduction_factor = max_tokens / chunk_tokens
-                new_end = start + int((end - start) * reduction_factor * 0.9)  # Extra safety margin
-                chunk = text[start:new_end].strip()
+                chunk_end = start + int((end - start) * reduction_factor * 0.9)  # Extra safety margin
 
-            chunks.append(chunk)
+            spans.append((start, min(chunk_end, len(text))))
 
         # Move start position for next chunk (with overlap)
         start = max(start + 1, end - overlap_chars)
@@ -1102,7 +1445,7 @@ def chunk_text(text, max_tokens=120000, overlap_tokens=2000):
         if start >= len(text):
             break
 
-    return chunks
+    return spans
 
 def estimate_max_questions(text, use_offline=True):
     """
@@ -1503,8 +1846,15 @@ def build_reference_string(reference_info, manual_book_name='', manual_chapter_n
     else:
         return ""
 
-def get_ai_client(model_provider, custom_api_key=None, custom_base_url=None):
-    """Returns the appropriate AI client based on the selected model."""
+def get_ai_client(model_provider, custom_api_key=None, custom_base_url=None, async_client=False):
+    """Returns the appropriate AI client based on the selected model.
+
+    With async_client=True an AsyncOpenAI client with the same configuration
+    is returned (used by the ASGI serving path).
+    """
+    from openai import OpenAI, AsyncOpenAI
+
+    client_class = AsyncOpenAI if async_client else OpenAI
     print(f"🔑 Setting up AI client for provider: {model_provider}")
 
     if model_provider == 'custom':
@@ -1516,14 +1866,14 @@ def get_ai_client(model_provider, custom_api_key=None, custom_base_url=None):
         if custom_base_url:
             client_config["base_url"] = custom_base_url
 
-        return OpenAI(**client_config, timeout=httpx.Timeout(API_TIMEOUT, connect=10.0))
+        return client_class(**client_config, timeout=httpx.Timeout(API_TIMEOUT, connect=10.0))
 
     elif model_provider == 'openrouter':
         api_key = os.getenv("OPENROUTER_API_KEY")
         print(f"🔑 OpenRouter API key: {'✅ Found' if api_key else '❌ Missing'}")
         if not api_key:
             raise ValueError("OpenRouter API key is missing. Please set OPENROUTER_API_KEY in environment variables.")
-        return OpenAI(
+        return client_class(
             base_url="https://openrouter.ai/api/v1",
             api_key=api_key,
             timeout=httpx.Timeout(API_TIMEOUT, connect=10.0),
@@ -1533,13 +1883,13 @@ def get_ai_client(model_provider, custom_api_key=None, custom_base_url=None):
         print(f"🔑 OpenAI API key: {'✅ Found' if api_key else '❌ Missing'}")
         if not api_key:
             raise ValueError("OpenAI API key is not configured. To use OpenAI models, please select 'OpenRouter' as provider and choose GPT models from the list - they work with your OpenRouter API key!")
-        return OpenAI(api_key=api_key, timeout=httpx.Timeout(API_TIMEOUT, connect=10.0))
+        return client_class(api_key=api_key, timeout=httpx.Timeout(API_TIMEOUT, connect=10.0))
     elif model_provider == 'anthropic':
         api_key = os.getenv("ANTHROPIC_API_KEY")
         print(f"🔑 Anthropic API key: {'✅ Found' if api_key else '❌ Missing'}")
         if not api_key:
             raise ValueError("Anthropic API key is not configured. To use Claude models, please select 'OpenRouter' as provider and choose Claude models from the list - they work with your OpenRouter API key!")
-        return OpenAI(
+        return client_class(
             base_url="https://api.anthropic.com/v1",
             api_key=api_key,
             timeout=httpx.Timeout(API_TIMEOUT, connect=10.0),
@@ -1549,7 +1899,7 @@ def get_ai_client(model_provider, custom_api_key=None, custom_base_url=None):
         print(f"🔑 DeepSeek API key: {'✅ Found' if api_key else '❌ Missing'}")
         if not api_key:
             raise ValueError("DeepSeek API key is not configured. To use DeepSeek models, please select 'OpenRouter' as provider - DeepSeek models are available there!")
-        return OpenAI(
+        return client_class(
             base_url="https://api.deepseek.com",
             api_key=api_key,
             timeout=httpx.Timeout(API_TIMEOUT, connect=10.0),
@@ -1612,38 +1962,7 @@ def create_amendment_prompt_section(use_amendment=False):
     if not use_amendment:
         return ""
 
-    return """
-    AMENDMENT ANALYSIS REQUIREMENTS:
-    ================================
-    You are analyzing BOTH an original document AND its amendment.
-
-    1. AMENDMENT-FOCUSED QUESTIONS:
-       - Generate questions that cover changes introduced in the amendment
-       - Include questions about differences between original and amended versions
-       - Ask about new provisions added in the amendment
-       - Ask about provisions removed or modified by the amendment
-       - Example: "What was changed in the amendment regarding...?"
-       - Example: "Which provision was added/removed in the amendment?"
-
-    2. REFERENCE SPECIFICATION:
-       - In explanations, specify whether the answer comes from:
-         * Original document only
-         * Amendment only
-         * Both documents (for comparative questions)
-       - Use format: "Reference: Original Section X / Amendment Section Y"
-       - Or: "Reference: Original Section X (amended by Amendment Section Y)"
-
-    3. COMPARATIVE ANALYSIS:
-       - Create questions that test understanding of changes
-       - Include "before and after" type questions
-       - Ask about the impact of amendments
-       - Ensure questions highlight the differences clearly
-
-    4. COVERAGE:
-       - Ensure at least 50% of questions focus on amendment-related content
-       - Balance between original document and amendment questions
-       - Cover all major changes and new provisions
-    """
+    return MCQ_AMENDMENT_RULES
 
 def merge_texts_for_amendment_analysis(original_text, amendment_text):
     """
@@ -1959,283 +2278,352 @@ def generate_mcq_questions(text, num_questions=5, model_provider='openrouter', m
         traceback.print_exc()
         return f"Error generating questions: {e}"
 
-def generate_mcq_questions_advanced(text, num_questions=5, difficulty='medium', model_config=None):
-    """Advanced MCQ generation with custom model support."""
-    try:
-        if not model_config:
-            # Fallback to default configuration
-            return generate_mcq_questions(text, num_questions, 'openrouter', 'basic')
+def plan_mcq_chunks(text, num_questions, provider, model_name):
+    """
+    Plans the chunk calls of an MCQ generation run up front.
+
+    Uses the same chunking and 5-questions-per-chunk cap as
+    generate_mcq_questions_advanced(), but fixes each chunk's question count
+    in advance so the calls can be submitted together (e.g. as a batch job).
 
+    Args:
+        text (str): Text to generate questions from
+        num_questions (int): Total number of questions requested
+        provider (str): AI provider
+        model_name (str): Model name
+
+    Returns:
+        list: Dicts with 'index', 'text' and 'num_questions' for each planned call
+    """
+    max_context_tokens, _, _ = get_model_token_limits(provider, model_name)
+    if estimate_token_count(text) <= max_context_tokens:
+        return [{'index': 0, 'text': text, 'num_questions': num_questions}]
+
+    chunks = chunk_text(text, max_context_tokens)
+    questions_per_chunk = min(5, max(1, math.ceil(num_questions / len(chunks))))
+
+    plan = []
+    remaining = num_questions
+    for i, chunk in enumerate(chunks):
+        if remaining <= 0:
+            break
+        count = min(questions_per_chunk, remaining)
+        plan.append({'index': i, 'text': chunk, 'num_questions': count})
+        remaining -= count
+
+    return plan
+
+def request_mcq_questions(client, model_name, system_prompt, num_questions, text, usage_stats=None,
+                          timeout=None):
+    """
+    Make one MCQ generation call and parse the JSON response.
+
+    Args:
+        client: OpenAI-compatible client
+        model_name (str): Model to call
+        system_prompt (str): Static run-level prompt from build_mcq_system_prompt()
+        num_questions (int): Number of questions to request
+        text (str): Text (or chunk) to generate questions from
+        usage_stats (dict): Optional accumulator from new_token_usage()
+        timeout (float): Optional per-call timeout overriding the client's API_TIMEOUT
+
+    Returns:
+        list or dict: Parsed questions
+
+    Raises:
+        json.JSONDecodeError: If the repaired response is still not valid JSON
+    """
+    completion = client.chat.completions.create(
+        **mcq_request_options(model_name, system_prompt, num_questions, text, timeout)
+    )
+    return parse_mcq_completion(completion, system_prompt, num_questions, text, usage_stats)
+
+def mcq_request_options(model_name, system_prompt, num_questions, text, timeout=None):
+    """Keyword arguments of the chat.completions.create() call of one MCQ request."""
+    options = {
+        'model': model_name,
+        'messages': build_prompt_messages(system_prompt, build_mcq_user_prompt(num_questions, text), model_name),
+        'max_tokens': 8000,
+        'temperature': 0.7
+    }
+    if timeout:
+        options['timeout'] = timeout
+    return options
+
+def parse_mcq_completion(completion, system_prompt, num_questions, text, usage_stats=None):
+    """
+    Record the token usage of an MCQ completion and parse its JSON questions.
+
+    Raises:
+        json.JSONDecodeError: If the repaired response is still not valid JSON
+    """
+    user_prompt = build_mcq_user_prompt(num_questions, text)
+    record_token_usage(usage_stats, completion,
+                       LEGACY_MCQ_PROMPT_TOKENS - prompt_overhead_tokens(system_prompt, user_prompt, text))
+
+    response = completion.choices[0].message.content.strip()
+
+    # Use robust JSON repair to handle truncated/malformed responses
+    response = repair_json_response(response)
+
+    return json.loads(response)
+
+def generate_mcq_questions_advanced(text, num_questions=5, difficulty='medium', model_config=None, usage_stats=None,
+                                    deadline=None, continuation_token=None, progress=None, cancellation=None):
+    """
+    Advanced MCQ generation with custom model support.
+
+    All calls of a run share one static system prompt, so providers with
+    prefix caching serve the repeated instructions from cache; the cached
+    token counts reported by the API are accumulated in usage_stats.
+
+    With a deadline (request_deadline.RequestDeadline) a chunk call is only
+    started when it is expected to finish in time. When the run has to stop
+    early, the questions produced so far are returned and
+    deadline.continuation_token is set; passing that token back with the same
+    text and settings resumes from the next unprocessed chunk.
+
+    progress(message, **details) is called when a chunk starts and finishes.
+    Cancelling the optional cancellation (request_deadline.CancellationToken)
+    stops the run before its next chunk and aborts the call in flight by
+    closing the API client; completed chunks stay checkpointed.
+    """
+    if not model_config:
+        # Fallback to default configuration
+        return generate_mcq_questions(text, num_questions, 'openrouter', 'basic')
+
+    return run_model_steps(
+        _mcq_generation_steps(text, num_questions, difficulty, model_config, usage_stats,
+                              deadline, continuation_token, progress, cancellation),
+        cancellation
+    )
+
+async def generate_mcq_questions_advanced_async(text, num_questions=5, difficulty='medium', model_config=None,
+                                                usage_stats=None, deadline=None, continuation_token=None,
+                                                progress=None):
+    """
+    Async twin of generate_mcq_questions_advanced() using AsyncOpenAI.
+
+    Cancel the awaiting task to stop the run; completed chunks stay checkpointed.
+    """
+    if not model_config:
+        return await asyncio.to_thread(generate_mcq_questions, text, num_questions, 'openrouter', 'basic')
+
+    return await run_model_steps_async(
+        _mcq_generation_steps(text, num_questions, difficulty, model_config, usage_stats,
+                              deadline, continuation_token, progress)
+    )
+
+def _mcq_generation_steps(text, num_questions, difficulty, model_config, usage_stats=None,
+                          deadline=None, continuation_token=None, progress=None, cancellation=None):
+    """Model steps of generate_mcq_questions_advanced() (see run_model_steps())."""
+    if usage_stats is None:
+        usage_stats = new_token_usage()
+
+    model_name = model_config.get('model_name', 'meta-llama/llama-3.3-70b-instruct:free')
+    try:
         provider = model_config.get('provider', 'openrouter')
-        model_name = model_config.get('model_name', 'meta-llama/llama-3.3-70b-instruct:free')
         custom_api_key = model_config.get('custom_api_key')
         custom_base_url = model_config.get('custom_base_url')
         book_name = model_config.get('book_name', '').strip()
         chapter_name = model_config.get('chapter_name', '').strip()
         use_amendment = model_config.get('use_amendment', False)
 
+        # Resume position of a run that was cut short by its deadline
+        document = document_fingerprint(text)
+        settings = settings_fingerprint(PROMPT_TEMPLATE_VERSION, provider, model_name, difficulty,
+                                        book_name, chapter_name, bool(use_amendment))
+        start_chunk = 0
+        questions_done = 0
+        if continuation_token:
+            try:
+                resume = decode_continuation_token(continuation_token)
+            except ValueError as token_error:
+                return f"Error generating questions: {token_error}"
+            if resume['doc'] != document or resume['cfg'] != settings:
+                return "Error generating questions: continuation token does not match this document and settings"
+            start_chunk = resume['chunk']
+            questions_done = resume['done']
+            num_questions = resume['total']
+            print(f"⏩ Resuming at chunk {start_chunk + 1} ({questions_done}/{num_questions} questions already generated)")
+
         print(f"🚀 Starting advanced generation with provider: {provider}")
         print(f"🤖 Model selected: {model_name}")
         print(f"📝 Text length: {len(text)} characters")
         print(f"🎯 Questions requested: {num_questions}")
 
         # Get AI client with custom configuration
-        client = get_ai_client(provider, custom_api_key, custom_base_url)
+        yield ('client', (provider, custom_api_key, custom_base_url))
 
         # Build source reference using only manual inputs
         source_reference = build_reference_string({}, book_name, chapter_name)
 
-        # Enhanced prompt with difficulty specification and source reference
-        explanation_instruction = ""
-        if source_reference:
-            explanation_instruction = f"- In the explanation, include the source reference at the end: {source_reference}"
-
-        # Add amendment-specific instructions if enabled
-        amendment_section = create_amendment_prompt_section(use_amendment)
+        # Static prompt shared by every call of this run (cacheable prefix)
+        system_prompt = build_mcq_system_prompt(use_amendment, source_reference)
 
         # Check if text needs to be chunked
         token_count = estimate_token_count(text)
         max_context_tokens, is_free_tier, rate_limit = get_model_token_limits(provider, model_name)
+        rate_limiter = get_model_rate_limiter(model_name)
 
         print(f"📊 Text analysis: {token_count} tokens, limit: {max_context_tokens} ({'free tier' if is_free_tier else 'paid tier'}, rate limit: {rate_limit})")
 
         # If text is too large, chunk it
         if token_count > max_context_tokens:
-            chunks = chunk_text(text, max_context_tokens)
+            spans = chunk_text_spans(text, max_context_tokens)
+            chunks = [text[span_start:span_end].strip() for span_start, span_end in spans]
             all_questions = []
             # Cap questions per chunk at 5 to prevent token exhaustion and ensure complete answers
             questions_per_chunk = min(5, max(1, math.ceil(num_questions / len(chunks))))
+            if deadline:
+                deadline.chunks_total = len(chunks)
+                deadline.chunks_done = start_chunk
+
+            # Chunks that succeeded in an earlier, failed or cut-short attempt
+            doc_hash = document_hash(text)
+            checkpoints = yield ('io', (load_chunk_checkpoints, (doc_hash, 'mcq', settings)))
+            calls_made = 0
+            failed_chunks = 0
 
             # Process each chunk
-            for i, chunk in enumerate(chunks):
+            for i in range(start_chunk, len(chunks)):
+                chunk = chunks[i]
+                generated = questions_done + len(all_questions)
+
+                if cancellation and cancellation.cancelled:
+                    print(f"🛑 Run cancelled before chunk {i+1}/{len(chunks)}")
+                    break
+
                 # For the last chunk, adjust questions to match total requested
                 if i == len(chunks) - 1:
-                    remaining = num_questions - len(all_questions)
+                    remaining = num_questions - generated
                     if remaining <= 0:
                         break
                     # Still cap at 5 even for remaining questions
                     questions_per_chunk = min(5, remaining)
 
-                chunk_prompt = f"""Generate exactly {questions_per_chunk} multiple-choice questions (MCQs) from the following text.
-
-                ⚠️ MANDATORY QUALITY RULES - MUST FOLLOW STRICTLY:
-
-                1. SINGLE CORRECT ANSWER RULE (CRITICAL):
-                   - Ensure ONLY ONE option is correct under ALL circumstances
-                   - The correct answer must be unambiguous and absolute
-                   - No option should be "partially correct" or "correct in some cases"
-
-                2. NO CONDITIONAL/SITUATIONAL LANGUAGE:
-                   - Do NOT frame questions involving conditional, optional, or situational clauses unless explicitly stated in the question
-                   - Avoid words like "may", "can", "if required", "in case of", "unless", "sometimes", "usually", "generally"
-                   - Only use absolute statements that are always true or always false
-
-                3. VERIFICATION FOR 'NOT CORRECT' QUESTIONS:
-                   - For questions asking "Which is NOT correct?", verify that the remaining three options are EXPLICITLY stated in the PDF as correct
-                   - Do NOT infer or assume - only use facts directly stated in the text
-                   - If exclusivity cannot be guaranteed, DO NOT generate the question
-
-                4. PARAGRAPH REFERENCE (MANDATORY):
-                   - Include the exact paragraph/section reference in the explanation for validation
-                   - Format: "Reference: [Section/Rule/Paragraph number or identifier]"
-
-                5. INDEPENDENT VERIFIABILITY:
-                   - Each option must be independently verifiable from the PDF
-                   - Generate assertion-reason or statement-based MCQs where possible
-                   - Each statement in options should be traceable to specific text
-
-                6. EXCLUSIVITY GUARANTEE:
-                   - If exclusivity of the correct answer cannot be guaranteed, DO NOT generate the question
-                   - Skip ambiguous topics rather than creating potentially incorrect questions
-
-                7. COVERAGE AND DISTRIBUTION:
-                   - Cover ALL major rules and notes evenly
-                   - DO NOT over-emphasize a single rule
-                   - Distribute questions across different topics
-                   - Include: Applicability, exclusions, definitions, numerical provisions, amendments
-
-                DIFFICULTY DISTRIBUTION:
-                   - 40% easy (direct rule-based facts)
-                   - 40% medium (rule + condition combination)
-                   - 20% tricky (exceptions, notes, negative framing)
-
-                FORMAT REQUIREMENTS:
-                   - Each question must have 4 options (A, B, C, D)
-                   - Include correct answer letter
-                   - Provide brief explanation WITH paragraph reference
-                   - Format as valid JSON array
-
-                CRITICAL - COMPLETE SENTENCES:
-                   - EVERY option MUST be a COMPLETE sentence that ends properly
-                   - NEVER truncate or cut off options mid-sentence
-                   - If an option is long, complete it fully - do NOT abbreviate
-                   - Each option should be self-contained and grammatically complete
-                   - Example of WRONG: "The Association has been formed with the object of promoting the common..."
-                   - Example of RIGHT: "The Association has been formed with the object of promoting the common service interest of its members."
-                {explanation_instruction}{amendment_section}
-
-                JSON Structure:
-                {{
-                    "question": "[Question Text]",
-                    "options": {{"A": "[Option A]", "B": "[Option B]", "C": "[Option C]", "D": "[Option D]"}},
-                    "correct": "[Correct Option Letter]",
-                    "difficulty": "[easy/medium/hard]",
-                    "explanation": "[Explanation for the correct answer. Reference: Section/Rule X]{source_reference}"
-                }}
-
-                Text: {chunk}
-                """
-
-                # Add rate limiting delay for free tier models
-                delay = get_rate_limit_delay(model_name, i+1)
-                if delay > 0:
-                    print(f"⏳ Rate limit delay: waiting {delay} seconds before chunk {i+1}...")
-                    time.sleep(delay)
-
-                try:
-                    # Build system message based on amendment mode
-                    # Strong complete sentence instruction appended to all system messages
-                    complete_sentence_instruction = " ABSOLUTE REQUIREMENT - COMPLETE SENTENCES: Every MCQ option (A, B, C, D) MUST be a grammatically complete sentence. NEVER end an option with: 'the', 'a', 'an', 'of', 'to', 'for', 'with', 'by', 'in', 'on', 'at', 'and', 'or', 'is', 'are', 'its', 'their'. Each option must end with a period or proper punctuation. If you cannot complete a sentence within token limits, make the sentence SHORTER but COMPLETE - do NOT truncate."
-
-                    if use_amendment:
-                        system_message = "You are an expert educator analyzing an original document and its amendment. You create high-quality MCQs with ONLY ONE correct answer per question, focusing on changes, differences, and new provisions introduced by amendments. You MUST: 1) Ensure single correct answer under all circumstances, 2) Avoid conditional words like 'may', 'can', 'if required', 3) Include paragraph references for validation (specify Original/Amendment), 4) Make each option independently verifiable, 5) Skip questions if exclusivity cannot be guaranteed, 6) Focus on amendment changes and differences. Always respond with valid JSON array format."
-                    else:
-                        system_message = "You are an expert educator specializing in government rules, regulations, and policy documents. You create high-quality MCQs with ONLY ONE correct answer per question. You MUST: 1) Ensure single correct answer under all circumstances, 2) Avoid conditional words like 'may', 'can', 'if required', 3) Include paragraph references for validation, 4) Make each option independently verifiable, 5) Skip questions if exclusivity cannot be guaranteed. Always respond with valid JSON array format."
-
-                    completion = client.chat.completions.create(
-                        model=model_name,
-                        messages=[
-                            {"role": "system", "content": system_message + complete_sentence_instruction},
-                            {"role": "user", "content": chunk_prompt}
-                        ],
-                        max_tokens=8000,
-                        temperature=0.7,
-                    )
-
-                    response = completion.choices[0].message.content.strip()
-
-                    # Use robust JSON repair to handle truncated/malformed responses
-                    response = repair_json_response(response)
-
-                    chunk_questions = json.loads(response)
+                checkpoint = checkpoints.get(spans[i])
+                if checkpoint and checkpoint.get('num_questions') == questions_per_chunk:
+                    print(f"♻️ Chunk {i+1}/{len(chunks)} restored from checkpoint")
+                    chunk_questions = checkpoint['questions']
+                    report_progress(progress, f"♻️ Section {i+1}/{len(chunks)} restored from an earlier run",
+                                    event='chunk_restored', chunk=i + 1, total_chunks=len(chunks),
+                                    questions_so_far=generated + len(chunk_questions),
+                                    tokens_used=tokens_used(usage_stats))
+                    if deadline:
+                        deadline.chunks_done = i + 1
+                else:
+                    delay = get_rate_limit_delay(model_name, i+1)
+
+                    # Only start a call that can finish before the deadline; the
+                    # first call of a request always runs so every request makes progress
+                    if deadline and calls_made and not deadline.can_start(delay):
+                        print(f"⏱️ Deadline reached: {deadline.remaining():.0f}s left, stopping before chunk {i+1}/{len(chunks)}")
+                        deadline.continuation_token = encode_continuation_token(
+                            document, settings, i, generated, num_questions
+                        )
+                        break
 
-                    # Add questions from this chunk
-                    if isinstance(chunk_questions, list):
-                        all_questions.extend(chunk_questions)
-                    else:
-                        # Handle case where API returns a single question object instead of a list
-                        all_questions.append(chunk_questions)
+                    # Add rate limiting delay for free tier models
+                    if delay > 0:
+                        print(f"⏳ Rate limit delay: waiting {delay} seconds before chunk {i+1}...")
+                        yield ('sleep', delay)
 
-                    # If we have enough questions, stop processing chunks
-                    if len(all_questions) >= num_questions:
-                        all_questions = all_questions[:num_questions]  # Trim to exact number
+                    # Calls of concurrent requests and batch files share the model's limit
+                    yield ('sleep', rate_limiter.reserve())
+                    if cancellation and cancellation.cancelled:
+                        print(f"🛑 Run cancelled before chunk {i+1}/{len(chunks)}")
                         break
 
-                except Exception as chunk_error:
-                    print(f"Error processing chunk {i+1}: {chunk_error}")
-                    continue
+                    report_progress(progress, f"🧩 Generating questions for section {i+1}/{len(chunks)}...",
+                                    event='chunk_started', chunk=i + 1, total_chunks=len(chunks),
+                                    questions_so_far=generated, tokens_used=tokens_used(usage_stats))
+                    calls_made += 1
+                    call_started = time.monotonic()
+                    try:
+                        completion = yield ('complete', mcq_request_options(
+                            model_name, system_prompt, questions_per_chunk, chunk,
+                            timeout=deadline.call_timeout(API_TIMEOUT) if deadline else None
+                        ))
+                        chunk_questions = parse_mcq_completion(completion, system_prompt, questions_per_chunk,
+                                                               chunk, usage_stats)
+                        yield ('io', (store_chunk_checkpoint, (doc_hash, 'mcq', settings, spans[i],
+                                      {'num_questions': questions_per_chunk, 'questions': chunk_questions})))
+
+                    except Exception as chunk_error:
+                        if cancellation and cancellation.cancelled:
+                            print(f"🛑 Run cancelled during chunk {i+1}/{len(chunks)}")
+                            break
+                        print(f"Error processing chunk {i+1}: {chunk_error}")
+                        failed_chunks += 1
+                        report_progress(progress, f"⚠️ Section {i+1}/{len(chunks)} failed: {chunk_error}",
+                                        event='chunk_failed', chunk=i + 1, total_chunks=len(chunks),
+                                        questions_so_far=generated, tokens_used=tokens_used(usage_stats))
+                        if deadline and deadline.expired():
+                            # The call was cut off by the deadline - retry this chunk on resume
+                            deadline.continuation_token = encode_continuation_token(
+                                document, settings, i, generated, num_questions
+                            )
+                            break
+                        continue
+                    finally:
+                        if deadline:
+                            deadline.record_call(time.monotonic() - call_started)
+                            deadline.chunks_done = i + 1
+
+                # Add questions from this chunk
+                if isinstance(chunk_questions, list):
+                    all_questions.extend(chunk_questions)
+                else:
+                    # Handle case where API returns a single question object instead of a list
+                    all_questions.append(chunk_questions)
+
+                if not checkpoint or checkpoint.get('num_questions') != questions_per_chunk:
+                    report_progress(progress, f"✅ Section {i+1}/{len(chunks)} done "
+                                              f"({questions_done + len(all_questions)}/{num_questions} questions)",
+                                    event='chunk_finished', chunk=i + 1, total_chunks=len(chunks),
+                                    questions_so_far=min(num_questions, questions_done + len(all_questions)),
+                                    tokens_used=tokens_used(usage_stats))
+
+                # If we have enough questions, stop processing chunks
+                if questions_done + len(all_questions) >= num_questions:
+                    all_questions = all_questions[:num_questions - questions_done]  # Trim to exact number
+                    break
 
+            if cancellation and cancellation.cancelled:
+                print(f"🛑 Cancelled after {len(all_questions)} questions - completed chunks stay checkpointed")
+            elif deadline and deadline.partial:
+                print(f"⏸️ Returning {len(all_questions)} questions; continuation token issued for the remaining chunks")
+            elif failed_chunks and questions_done + len(all_questions) < num_questions:
+                print(f"💾 {failed_chunks} chunk(s) failed - completed chunks are checkpointed, a retry only reruns the failed ones")
+            else:
+                # Run complete: a fresh upload of the document should get fresh questions
+                yield ('io', (clear_chunk_checkpoints, (doc_hash, 'mcq', settings)))
+            print(format_token_usage(usage_stats))
             return all_questions
         else:
             # Original behavior for text that fits in context window
-            prompt = f"""Generate exactly {num_questions} multiple-choice questions (MCQs) from the following text.
-
-            ⚠️ MANDATORY QUALITY RULES - MUST FOLLOW STRICTLY:
-
-            1. SINGLE CORRECT ANSWER RULE (CRITICAL):
-               - Ensure ONLY ONE option is correct under ALL circumstances
-               - The correct answer must be unambiguous and absolute
-               - No option should be "partially correct" or "correct in some cases"
-
-            2. NO CONDITIONAL/SITUATIONAL LANGUAGE:
-               - Do NOT frame questions involving conditional, optional, or situational clauses unless explicitly stated in the question
-               - Avoid words like "may", "can", "if required", "in case of", "unless", "sometimes", "usually", "generally"
-               - Only use absolute statements that are always true or always false
-
-            3. VERIFICATION FOR 'NOT CORRECT' QUESTIONS:
-               - For questions asking "Which is NOT correct?", verify that the remaining three options are EXPLICITLY stated in the PDF as correct
-               - Do NOT infer or assume - only use facts directly stated in the text
-               - If exclusivity cannot be guaranteed, DO NOT generate the question
-
-            4. PARAGRAPH REFERENCE (MANDATORY):
-               - Include the exact paragraph/section reference in the explanation for validation
-               - Format: "Reference: [Section/Rule/Paragraph number or identifier]"
-
-            5. INDEPENDENT VERIFIABILITY:
-               - Each option must be independently verifiable from the PDF
-               - Generate assertion-reason or statement-based MCQs where possible
-               - Each statement in options should be traceable to specific text
-
-            6. EXCLUSIVITY GUARANTEE:
-               - If exclusivity of the correct answer cannot be guaranteed, DO NOT generate the question
-               - Skip ambiguous topics rather than creating potentially incorrect questions
-
-            7. COVERAGE AND DISTRIBUTION:
-               - Cover ALL major rules and notes evenly
-               - DO NOT over-emphasize a single rule
-               - Distribute questions across different topics
-               - Include: Applicability, exclusions, definitions, numerical provisions, amendments
-
-            DIFFICULTY DISTRIBUTION:
-               - 40% easy (direct rule-based facts)
-               - 40% medium (rule + condition combination)
-               - 20% tricky (exceptions, notes, negative framing)
-
-            FORMAT REQUIREMENTS:
-               - Each question must have 4 options (A, B, C, D)
-               - Include correct answer letter
-               - Provide brief explanation WITH paragraph reference
-               - Format as valid JSON array
-
-            CRITICAL - COMPLETE SENTENCES:
-               - EVERY option MUST be a COMPLETE sentence that ends properly
-               - NEVER truncate or cut off options mid-sentence
-               - If an option is long, complete it fully - do NOT abbreviate
-               - Each option should be self-contained and grammatically complete
-               - Example of WRONG: "The Association has been formed with the object of promoting the common..."
-               - Example of RIGHT: "The Association has been formed with the object of promoting the common service interest of its members."
-            {explanation_instruction}
-
-            JSON Structure:
-            {{
-                "question": "[Question Text]",
-                "options": {{"A": "[Option A]", "B": "[Option B]", "C": "[Option C]", "D": "[Option D]"}},
-                "correct": "[Correct Option Letter]",
-                "difficulty": "[easy/medium/hard]",
-                "explanation": "[Explanation for the correct answer. Reference: Section/Rule X]{source_reference}"
-            }}
-
-            Text: {text}
-            """
-
             print(f"📤 Sending API request to model: {model_name}")
-
-            # Strong complete sentence instruction
-            complete_sentence_rule = " ABSOLUTE REQUIREMENT - COMPLETE SENTENCES: Every MCQ option (A, B, C, D) MUST be a grammatically complete sentence ending with proper punctuation. NEVER end an option with: 'the', 'a', 'an', 'of', 'to', 'for', 'with', 'by', 'in', 'on', 'at', 'and', 'or', 'is', 'are', 'its', 'their', 'his', 'her'. If a sentence is too long, make it SHORTER but COMPLETE - do NOT truncate."
-
-            completion = client.chat.completions.create(
-                model=model_name,
-                messages=[
-                    {"role": "system", "content": "You are an expert educator specializing in government rules, regulations, and policy documents. You create high-quality MCQs with ONLY ONE correct answer per question. You MUST: 1) Ensure single correct answer under all circumstances, 2) Avoid conditional words like 'may', 'can', 'if required', 3) Include paragraph references for validation, 4) Make each option independently verifiable, 5) Skip questions if exclusivity cannot be guaranteed. Always respond with valid JSON array format." + complete_sentence_rule},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=8000,
-                temperature=0.7,
-            )
-
-            print(f"✅ API response received from {model_name}")
-            response = completion.choices[0].message.content.strip()
-
-            # Use robust JSON repair to handle truncated/malformed responses
-            response = repair_json_response(response)
-
-            parsed_response = json.loads(response)
-            print(f"✅ Successfully parsed {len(parsed_response) if isinstance(parsed_response, list) else 1} questions from {model_name}")
+            yield ('sleep', rate_limiter.reserve())
+            report_progress(progress, "🧩 Generating questions for the whole document...",
+                            event='chunk_started', chunk=1, total_chunks=1,
+                            questions_so_far=0, tokens_used=tokens_used(usage_stats))
+
+            completion = yield ('complete', mcq_request_options(
+                model_name, system_prompt, num_questions, text,
+                timeout=deadline.call_timeout(API_TIMEOUT) if deadline else None
+            ))
+            parsed_response = parse_mcq_completion(completion, system_prompt, num_questions, text, usage_stats)
+            generated = len(parsed_response) if isinstance(parsed_response, list) else 1
+            report_progress(progress, f"✅ Document done ({generated} questions)",
+                            event='chunk_finished', chunk=1, total_chunks=1,
+                            questions_so_far=generated, tokens_used=tokens_used(usage_stats))
+            print(f"✅ Successfully parsed {generated} questions from {model_name}")
+            print(format_token_usage(usage_stats))
             return parsed_response
 
     except json.JSONDecodeError as json_error:
         print(f"❌ JSON parsing error with model {model_name}: {json_error}")
-        print(f"📄 Raw response: {response[:500] if 'response' in locals() else 'No response'}")
         return f"Error parsing AI response from {model_name}: {json_error}"
     except Exception as e:
         print(f"❌ Error with model {model_name}: {type(e).__name__}: {e}")
@@ -2245,7 +2633,9 @@ def generate_mcq_questions_advanced(text, num_questions=5, difficulty='medium',
 def generate_mcq_questions_with_offline_fallback(text, num_questions=5, difficulty='medium',
                                                 book_name='', chapter_name='',
                                                 prefer_offline=False, prefer_professional=False,
-                                                prefer_fast=False, model_config=None, use_amendment=False):
+                                                prefer_fast=False, model_config=None, use_amendment=False,
+                                                usage_stats=None, deadline=None, continuation_token=None,
+                                                progress=None, cancellation=None):
     """
     Generate MCQ questions with multiple fallback options including professional and fast modes.
 
@@ -2260,6 +2650,11 @@ def generate_mcq_questions_with_offline_fallback(text, num_questions=5, difficul
         prefer_fast (bool): Whether to prefer fast generation
         model_config (dict): Configuration for online models
         use_amendment (bool): Whether amendment analysis is enabled
+        usage_stats (dict): Optional token usage accumulator for online generation
+        deadline (RequestDeadline): Optional request deadline for online generation
+        continuation_token (str): Optional token to resume a run cut short by its deadline
+        progress (callable): Optional progress(message, **details) callback for online generation
+        cancellation (CancellationToken): Optional token that stops online generation
 
     Returns:
         list: Generated MCQ questions or error message
@@ -2340,7 +2735,9 @@ def generate_mcq_questions_with_offline_fallback(text, num_questions=5, difficul
     try:
         if model_config:
             return generate_mcq_questions_advanced(
-                text, num_questions, difficulty, model_config
+                text, num_questions, difficulty, model_config, usage_stats,
+                deadline=deadline, continuation_token=continuation_token,
+                progress=progress, cancellation=cancellation
             )
         else:
             return generate_mcq_questions(
@@ -2551,9 +2948,125 @@ def get_generation_capabilities():
 
     return capabilities
 
+def extract_generation_input(pdf_path, model_config=None):
+    """
+    Extracts the text and page/section metadata that MCQ generation works on,
+    merging in the amendment text when amendment analysis is enabled.
+
+    Args:
+        pdf_path (str): Path to the PDF file
+        model_config (dict): Model configuration (may carry amendment settings)
+
+    Returns:
+        dict: {'text', 'page_map', 'sections', 'total_pages', 'use_amendment'}
+              or error message string
+    """
+    # Extract text with metadata
+    print("📄 Extracting text with page and section tracking...")
+    extraction_result = extract_text_from_pdf_with_metadata(pdf_path)
+
+    # Check if extraction failed
+    if isinstance(extraction_result, str):
+        return extraction_result
+
+    text = extraction_result['text']
+    sections = extraction_result['sections']
+    total_pages = extraction_result['total_pages']
+
+    print(f"📊 Extracted {len(text)} characters from {total_pages} pages")
+    print(f"🔍 Detected {len(sections)} sections/headings")
+
+    # Handle amendment text if provided
+    use_amendment = False
+    if model_config and model_config.get('use_amendment'):
+        amendment_text = model_config.get('amendment_text')
+        if amendment_text and amendment_text.strip():
+            use_amendment = True
+            print("📝 Amendment text detected - merging for analysis...")
+            text = merge_texts_for_amendment_analysis(text, amendment_text)
+            print(f"📊 Merged text length: {len(text)} characters")
+
+    return {
+        'text': text,
+        'page_map': extraction_result['page_map'],
+        'sections': sections,
+        'total_pages': total_pages,
+        'use_amendment': use_amendment
+    }
+
+def add_question_metadata(questions, page_map, sections, total_pages, first_question_number=1):
+    """
+    Tags generated questions with the pages and sections they relate to,
+    cleans their options and builds the distribution summary.
+
+    Shared by interactive generation and batch-mode generation so both
+    produce identical metadata.
+
+    Args:
+        questions (list): Generated MCQ questions
+        page_map (list): List of page information
+        sections (list): List of detected sections
+        total_pages (int): Total number of pages
+        first_question_number (int): Number of the first question (continued runs start later)
+
+    Returns:
+        tuple: (questions, summary, truncation_warnings)
+    """
+    # Add metadata to each question by analyzing the question text
+    print("🏷️  Adding page and section metadata to questions...")
+    for i, question in enumerate(questions):
+        # Try to find which part of the PDF this question relates to
+        question_text = question.get('question', '')
+
+        # Search for question keywords in page text
+        metadata = {'pages': [], 'sections': []}
+
+        # Extract key terms from question (simple approach)
+        question_words = set(re.findall(r'\b\w{4,}\b', question_text.lower()))
+
+        best_match_score = 0
+        best_match_pages = []
+        best_match_sections = []
+
+        for page_info in page_map:
+            page_text_lower = page_info['text'].lower()
+            # Count how many question keywords appear in this page
+            matches = sum(1 for word in question_words if word in page_text_lower)
+
+            if matches > best_match_score:
+                best_match_score = matches
+                best_match_pages = [page_info['page_number']]
+                best_match_sections = [s['title'] for s in page_info.get('sections', [])]
+            elif matches == best_match_score and matches > 0:
+                best_match_pages.append(page_info['page_number'])
+                best_match_sections.extend([s['title'] for s in page_info.get('sections', [])])
+
+        # Remove duplicates and sort
+        metadata['pages'] = sorted(list(set(best_match_pages)))
+        metadata['sections'] = list(set(best_match_sections))
+
+        # Add metadata to question
+        question['metadata'] = metadata
+        question['question_number'] = first_question_number + i
+
+        # Clean and validate answer options (no longer truncates)
+        question = equalize_answer_lengths(question)
+
+    # Validate that all options are complete sentences
+    questions, truncation_warnings = validate_complete_sentences(questions)
+    if truncation_warnings > 0:
+        print(f"⚠️  {truncation_warnings} options may be incomplete - check AI output quality")
+
+    # Generate summary statistics
+    summary = generate_question_distribution_summary(questions, page_map, sections, total_pages)
+
+    return questions, summary, truncation_warnings
+
 def generate_mcq_questions_with_metadata(pdf_path, num_questions=5, difficulty='medium',
                                         book_name='', chapter_name='',
-                                        prefer_offline=False, model_config=None):
+                                        prefer_offline=False, model_config=None,
+                                        deadline=None, continuation_token=None,
+                                        progress=None, cancellation=None):
     """
     Generate MCQ questions with detailed page and section metadata tracking.
 
@@ -2565,42 +3078,40 @@ def generate_mcq_questions_with_metadata(pdf_path, num_questions=5, difficulty='
         chapter_name (str): Chapter name for reference
         prefer_offline (bool): Whether to prefer offline generation
         model_config (dict): Model configuration
+        deadline (RequestDeadline): Optional request deadline budget
+        continuation_token (str): Token from a previous partial result to resume from
+        progress (callable): Optional progress(message, **details) callback for per-chunk events
+        cancellation (CancellationToken): Optional token that stops the run (e.g. client disconnected)
 
     Returns:
         dict: {
             'questions': list of MCQ questions with metadata,
             'summary': dict with distribution statistics,
             'page_map': list of page information,
-            'sections': list of detected sections
+            'sections': list of detected sections,
+            'token_usage': dict with input, cached and output token counts,
+            'partial': True if the deadline stopped the run early,
+            'continuation_token': token resuming the run, or None
         }
     """
     try:
-        # Extract text with metadata
-        print("📄 Extracting text with page and section tracking...")
-        extraction_result = extract_text_from_pdf_with_metadata(pdf_path)
+        generation_input = extract_generation_input(pdf_path, model_config)
 
         # Check if extraction failed
-        if isinstance(extraction_result, str):
-            return {'error': extraction_result}
-
-        text = extraction_result['text']
-        page_map = extraction_result['page_map']
-        sections = extraction_result['sections']
-        total_pages = extraction_result['total_pages']
-
-        print(f"📊 Extracted {len(text)} characters from {total_pages} pages")
-        print(f"🔍 Detected {len(sections)} sections/headings")
-
-        # Handle amendment text if provided
-        use_amendment = False
-        amendment_text = None
-        if model_config and model_config.get('use_amendment'):
-            amendment_text = model_config.get('amendment_text')
-            if amendment_text and amendment_text.strip():
-                use_amendment = True
-                print("📝 Amendment text detected - merging for analysis...")
-                text = merge_texts_for_amendment_analysis(text, amendment_text)
-                print(f"📊 Merged text length: {len(text)} characters")
+        if isinstance(generation_input, str):
+            return {'error': generation_input}
+
+        text = generation_input['text']
+        use_amendment = generation_input['use_amendment']
+
+        usage_stats = new_token_usage()
+
+        # The summary runs concurrently with question generation (a continued
+        # run already returned it with its first part)
+        summary_future = None
+        if not continuation_token:
+            print("📋 Generating PDF summary alongside the questions...")
+            summary_future = start_pdf_summary(text, model_config, usage_stats)
 
         # Generate questions using existing function
         questions = generate_mcq_questions_with_offline_fallback(
@@ -2611,75 +3122,118 @@ def generate_mcq_questions_with_metadata(pdf_path, num_questions=5, difficulty='
             chapter_name=chapter_name,
             prefer_offline=prefer_offline,
             model_config=model_config,
-            use_amendment=use_amendment
+            use_amendment=use_amendment,
+            usage_stats=usage_stats,
+            deadline=deadline,
+            continuation_token=continuation_token,
+            progress=progress,
+            cancellation=cancellation
         )
 
         # Check if generation failed
         if isinstance(questions, str):
             return {'error': questions}
 
-        # Generate PDF summary
-        print("📋 Generating PDF summary...")
-        pdf_summary = generate_pdf_summary(text)
-        print(f"✅ PDF Summary: {pdf_summary}")
-
-        # Add metadata to each question by analyzing the question text
-        print("🏷️  Adding page and section metadata to questions...")
-        for i, question in enumerate(questions):
-            # Try to find which part of the PDF this question relates to
-            question_text = question.get('question', '')
+        if cancellation and cancellation.cancelled:
+            if summary_future:
+                summary_future.cancel()
+            return {'error': 'Generation cancelled'}
 
-            # Search for question keywords in page text
-            metadata = {'pages': [], 'sections': []}
-
-            # Extract key terms from question (simple approach)
-            question_words = set(re.findall(r'\b\w{4,}\b', question_text.lower()))
+        pdf_summary = None
+        if summary_future:
+            try:
+                pdf_summary = summary_future.result(timeout=deadline.remaining() if deadline else None)
+                print(f"✅ PDF Summary: {pdf_summary}")
+            except FuturesTimeoutError:
+                # Keeps running in the background and is cached for the next upload
+                print("⏱️ PDF summary not ready before the deadline")
+                pdf_summary = "Summary not available"
 
-            best_match_score = 0
-            best_match_pages = []
-            best_match_sections = []
+        return build_metadata_result(questions, generation_input, pdf_summary, usage_stats,
+                                     deadline, continuation_token)
 
-            for page_info in page_map:
-                page_text_lower = page_info['text'].lower()
-                # Count how many question keywords appear in this page
-                matches = sum(1 for word in question_words if word in page_text_lower)
+    except Exception as e:
+        print(f"❌ Error in metadata generation: {e}")
+        import traceback
+        traceback.print_exc()
+        return {'error': str(e)}
 
-                if matches > best_match_score:
-                    best_match_score = matches
-                    best_match_pages = [page_info['page_number']]
-                    best_match_sections = [s['title'] for s in page_info.get('sections', [])]
-                elif matches == best_match_score and matches > 0:
-                    best_match_pages.append(page_info['page_number'])
-                    best_match_sections.extend([s['title'] for s in page_info.get('sections', [])])
+async def generate_mcq_questions_with_metadata_async(pdf_path, num_questions=5, difficulty='medium',
+                                                    book_name='', chapter_name='',
+                                                    prefer_offline=False, model_config=None,
+                                                    deadline=None, continuation_token=None, progress=None):
+    """
+    Async twin of generate_mcq_questions_with_metadata() for the ASGI serving path.
 
-            # Remove duplicates and sort
-            metadata['pages'] = sorted(list(set(best_match_pages)))
-            metadata['sections'] = list(set(best_match_sections))
+    Online generation and the PDF summary await AsyncOpenAI, so a request
+    waiting on the model holds no thread. PDF extraction and offline
+    generation are CPU-bound and run in worker threads. Cancel the awaiting
+    task to stop the run.
 
-            # Add metadata to question
-            question['metadata'] = metadata
-            question['question_number'] = i + 1
+    Returns:
+        dict: Same keys as generate_mcq_questions_with_metadata()
+    """
+    try:
+        generation_input = await asyncio.to_thread(extract_generation_input, pdf_path, model_config)
 
-            # Clean and validate answer options (no longer truncates)
-            question = equalize_answer_lengths(question)
+        # Check if extraction failed
+        if isinstance(generation_input, str):
+            return {'error': generation_input}
+
+        text = generation_input['text']
+        usage_stats = new_token_usage()
+
+        summary_task = None
+        if not continuation_token:
+            print("📋 Generating PDF summary alongside the questions...")
+            summary_config = model_config or {}
+            summary_task = asyncio.ensure_future(generate_pdf_summary_async(
+                text,
+                summary_config.get('provider', 'openrouter'),
+                summary_config.get('model_name') or 'basic',
+                summary_config.get('custom_api_key'),
+                summary_config.get('custom_base_url'),
+                usage_stats
+            ))
+
+        if model_config and not prefer_offline:
+            questions = await generate_mcq_questions_advanced_async(
+                text, num_questions, difficulty, model_config, usage_stats,
+                deadline=deadline, continuation_token=continuation_token, progress=progress
+            )
+        else:
+            questions = await asyncio.to_thread(
+                generate_mcq_questions_with_offline_fallback,
+                text=text,
+                num_questions=num_questions,
+                difficulty=difficulty,
+                book_name=book_name,
+                chapter_name=chapter_name,
+                prefer_offline=prefer_offline,
+                model_config=model_config,
+                use_amendment=generation_input['use_amendment'],
+                usage_stats=usage_stats,
+                deadline=deadline,
+                continuation_token=continuation_token
+            )
 
-        # Validate that all options are complete sentences
-        questions, truncation_warnings = validate_complete_sentences(questions)
-        if truncation_warnings > 0:
-            print(f"⚠️  {truncation_warnings} options may be incomplete - check AI output quality")
+        # Check if generation failed
+        if isinstance(questions, str):
+            return {'error': questions}
 
-        # Generate summary statistics
-        summary = generate_question_distribution_summary(questions, page_map, sections, total_pages)
+        pdf_summary = None
+        if summary_task:
+            try:
+                # Shielded: a summary still running completes and is cached
+                pdf_summary = await asyncio.wait_for(asyncio.shield(summary_task),
+                                                     timeout=deadline.remaining() if deadline else None)
+                print(f"✅ PDF Summary: {pdf_summary}")
+            except asyncio.TimeoutError:
+                print("⏱️ PDF summary not ready before the deadline")
+                pdf_summary = "Summary not available"
 
-        return {
-            'questions': questions,
-            'summary': summary,
-            'page_map': page_map,
-            'sections': sections,
-            'total_pages': total_pages,
-            'pdf_summary': pdf_summary,
-            'truncation_warnings': truncation_warnings
-        }
+        return build_metadata_result(questions, generation_input, pdf_summary, usage_stats,
+                                     deadline, continuation_token)
 
     except Exception as e:
         print(f"❌ Error in metadata generation: {e}")
@@ -2687,6 +3241,37 @@ def generate_mcq_questions_with_metadata(pdf_path, num_questions=5, difficulty='
         traceback.print_exc()
         return {'error': str(e)}
 
+def build_metadata_result(questions, generation_input, pdf_summary, usage_stats, deadline=None,
+                          continuation_token=None):
+    """Tag generated questions with their metadata and build the result of generate_mcq_questions_with_metadata()."""
+    page_map = generation_input['page_map']
+    sections = generation_input['sections']
+    total_pages = generation_input['total_pages']
+
+    first_question_number = 1
+    if continuation_token:
+        first_question_number = decode_continuation_token(continuation_token)['done'] + 1
+
+    # Tag questions with pages/sections and build distribution statistics
+    questions, summary, truncation_warnings = add_question_metadata(
+        questions, page_map, sections, total_pages, first_question_number
+    )
+
+    return {
+        'questions': questions,
+        'summary': summary,
+        'page_map': page_map,
+        'sections': sections,
+        'total_pages': total_pages,
+        'pdf_summary': pdf_summary,
+        'truncation_warnings': truncation_warnings,
+        'token_usage': usage_stats,
+        'partial': bool(deadline and deadline.partial),
+        'continuation_token': deadline.continuation_token if deadline else None,
+        'chunks_processed': deadline.chunks_done if deadline else None,
+        'total_chunks': deadline.chunks_total if deadline else None
+    }
+
 def generate_question_distribution_summary(questions, page_map, sections, total_pages):
     """
     Generates a detailed summary of question distribution across pages and sections.
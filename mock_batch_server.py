@@ -0,0 +1,290 @@
+"""
+Local mock of the OpenAI Files + Batches API for offline testing
+
+Implements just enough of the API for batch_generation.py (and the regular
+chat completions endpoint for interactive runs with provider 'custom'):
+
+    POST /v1/files                  upload a JSONL batch input file
+    GET  /v1/files/<id>             file metadata
+    GET  /v1/files/<id>/content     file content
+    POST /v1/batches                create a batch job
+    GET  /v1/batches/<id>           batch status (completes after --delay seconds)
+    POST /v1/batches/<id>/cancel    cancel a batch job
+    POST /v1/chat/completions       single chat completion
+
+Responses are deterministic fake MCQs built from the sentences of the
+submitted text, so the full parsing and metadata path can be exercised
+without network access or API keys.
+
+Usage:
+    python mock_batch_server.py --port 8765 --delay 2
+"""
+
+import re
+import json
+import time
+import uuid
+import argparse
+import threading
+from email.parser import BytesParser
+from email.policy import default as default_policy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_files = {}
+_batches = {}
+_lock = threading.Lock()
+
+
+def _new_id(prefix):
+    return f"{prefix}-{uuid.uuid4().hex[:24]}"
+
+
+def _fake_questions(text, count):
+    """Build deterministic MCQs from the sentences of the text."""
+    sentences = [s.strip() for s in re.split(r'(?<=[.!?])\s+', text) if len(s.strip()) > 40]
+    if not sentences:
+        sentences = ["The document does not contain enough text for a detailed question."]
+
+    questions = []
+    for i in range(count):
+        sentence = sentences[i % len(sentences)][:200].rstrip(' .') + '.'
+        questions.append({
+            "question": f"According to the document, which of the following statements is correct? (Item {i + 1})",
+            "options": {
+                "A": sentence,
+                "B": "The document states the opposite of this provision.",
+                "C": "The document does not address this subject at all.",
+                "D": "The provision applies only in exceptional circumstances."
+            },
+            "correct": "A",
+            "difficulty": "medium",
+            "explanation": f"The document states: {sentence} Reference: Mock Section {i + 1}"
+        })
+    return questions
+
+
+def _fake_completion(body):
+    """Build a chat.completion object for a request body."""
+    messages = body.get('messages', [])
+    prompt_text = ''
+    for message in messages:
+        content = message.get('content', '')
+        if isinstance(content, list):
+            content = ' '.join(part.get('text', '') for part in content)
+        prompt_text += content + '\n'
+    user_text = messages[-1].get('content', '') if messages else ''
+
+    count_match = re.search(r'Generate exactly (\d+)', user_text)
+    if count_match:
+        source_text = user_text.split('TEXT:\n', 1)[-1]
+        content = json.dumps(_fake_questions(source_text, int(count_match.group(1))))
+    else:
+        source_text = user_text.split('\n', 1)[-1]
+        sentences = [s.strip() for s in re.split(r'(?<=[.!?])\s+', source_text) if s.strip()]
+        content = '\n'.join(sentences[:2]) or "Mock summary of the document."
+
+    prompt_tokens = len(prompt_text) // 4
+    return {
+        "id": _new_id("chatcmpl"),
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get('model', 'mock-model'),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": prompt_tokens + len(content) // 4,
+            "prompt_tokens_details": {"cached_tokens": 0}
+        }
+    }
+
+
+def _store_file(filename, content, purpose):
+    file_id = _new_id("file")
+    _files[file_id] = {
+        "id": file_id,
+        "object": "file",
+        "bytes": len(content),
+        "created_at": int(time.time()),
+        "filename": filename,
+        "purpose": purpose,
+        "status": "processed",
+        "_content": content
+    }
+    return file_id
+
+
+def _run_batch(batch):
+    """Process every request of a batch and attach the output file."""
+    input_content = _files[batch['input_file_id']]['_content'].decode('utf-8')
+    output_lines = []
+    completed = failed = 0
+    for line in input_content.splitlines():
+        if not line.strip():
+            continue
+        request = json.loads(line)
+        try:
+            completion = _fake_completion(request['body'])
+            output_lines.append(json.dumps({
+                "id": _new_id("batch_req"),
+                "custom_id": request['custom_id'],
+                "response": {"status_code": 200, "request_id": _new_id("req"), "body": completion},
+                "error": None
+            }))
+            completed += 1
+        except Exception as e:
+            output_lines.append(json.dumps({
+                "id": _new_id("batch_req"),
+                "custom_id": request.get('custom_id'),
+                "response": None,
+                "error": {"code": "mock_error", "message": str(e)}
+            }))
+            failed += 1
+
+    output_content = ('\n'.join(output_lines) + '\n').encode('utf-8')
+    batch['output_file_id'] = _store_file(f"{batch['id']}_output.jsonl", output_content, 'batch_output')
+    batch['request_counts'] = {"total": completed + failed, "completed": completed, "failed": failed}
+    batch['status'] = 'completed'
+    batch['completed_at'] = int(time.time())
+
+
+class MockBatchHandler(BaseHTTPRequestHandler):
+    """Request handler for the mock API."""
+
+    delay = 2.0
+
+    def _send_json(self, payload, status=200):
+        data = json.dumps({k: v for k, v in payload.items() if not k.startswith('_')}).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_error(self, status, message):
+        self._send_json({"error": {"message": message, "type": "invalid_request_error"}}, status)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length', 0))
+        return self.rfile.read(length) if length else b''
+
+    def log_message(self, format, *args):
+        print(f"[mock-batch] {self.command} {self.path} -> {args[1] if len(args) > 1 else ''}")
+
+    def do_POST(self):
+        path = self.path.split('?')[0].rstrip('/')
+        body = self._read_body()
+
+        with _lock:
+            if path.endswith('/files'):
+                # Parse the multipart upload with the email parser (cgi is deprecated)
+                header = f"Content-Type: {self.headers.get('Content-Type')}\r\n\r\n".encode('utf-8')
+                message = BytesParser(policy=default_policy).parsebytes(header + body)
+                filename, content, purpose = 'upload.jsonl', b'', 'batch'
+                for part in message.iter_parts():
+                    name = part.get_param('name', header='content-disposition')
+                    if name == 'file':
+                        filename = part.get_filename() or filename
+                        content = part.get_payload(decode=True) or b''
+                    elif name == 'purpose':
+                        purpose = part.get_content().strip()
+                file_id = _store_file(filename, content, purpose)
+                return self._send_json(_files[file_id])
+
+            if path.endswith('/batches'):
+                request = json.loads(body or b'{}')
+                if request.get('input_file_id') not in _files:
+                    return self._send_error(400, "Unknown input_file_id")
+                batch_id = _new_id("batch")
+                now = int(time.time())
+                _batches[batch_id] = {
+                    "id": batch_id,
+                    "object": "batch",
+                    "endpoint": request.get('endpoint', '/v1/chat/completions'),
+                    "input_file_id": request['input_file_id'],
+                    "completion_window": request.get('completion_window', '24h'),
+                    "status": "validating",
+                    "output_file_id": None,
+                    "error_file_id": None,
+                    "created_at": now,
+                    "expires_at": now + 86400,
+                    "request_counts": {"total": 0, "completed": 0, "failed": 0},
+                    "metadata": request.get('metadata')
+                }
+                return self._send_json(_batches[batch_id])
+
+            match = re.search(r'/batches/([^/]+)/cancel$', path)
+            if match:
+                batch = _batches.get(match.group(1))
+                if not batch:
+                    return self._send_error(404, "Batch not found")
+                if batch['status'] not in ('completed', 'failed', 'expired'):
+                    batch['status'] = 'cancelled'
+                return self._send_json(batch)
+
+            if path.endswith('/chat/completions'):
+                return self._send_json(_fake_completion(json.loads(body or b'{}')))
+
+        self._send_error(404, f"Unknown endpoint {self.path}")
+
+    def do_GET(self):
+        path = self.path.split('?')[0].rstrip('/')
+
+        with _lock:
+            match = re.search(r'/files/([^/]+)/content$', path)
+            if match:
+                file_info = _files.get(match.group(1))
+                if not file_info:
+                    return self._send_error(404, "File not found")
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/octet-stream')
+                self.send_header('Content-Length', str(len(file_info['_content'])))
+                self.end_headers()
+                self.wfile.write(file_info['_content'])
+                return
+
+            match = re.search(r'/files/([^/]+)$', path)
+            if match:
+                file_info = _files.get(match.group(1))
+                return self._send_json(file_info) if file_info else self._send_error(404, "File not found")
+
+            match = re.search(r'/batches/([^/]+)$', path)
+            if match:
+                batch = _batches.get(match.group(1))
+                if not batch:
+                    return self._send_error(404, "Batch not found")
+                if batch['status'] in ('validating', 'in_progress'):
+                    if time.time() - batch['created_at'] >= self.delay:
+                        _run_batch(batch)
+                    else:
+                        batch['status'] = 'in_progress'
+                        batch.setdefault('in_progress_at', int(time.time()))
+                return self._send_json(batch)
+
+        self._send_error(404, f"Unknown endpoint {self.path}")
+
+
+def run_mock_batch_server(host='127.0.0.1', port=8765, delay=2.0):
+    """Start the mock server and serve until interrupted."""
+    MockBatchHandler.delay = delay
+    server = ThreadingHTTPServer((host, port), MockBatchHandler)
+    print(f"🧪 Mock batch API listening on http://{host}:{port}/v1 (batches complete after {delay}s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Local mock of the OpenAI Files + Batches API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--delay', type=float, default=2.0, help="Seconds before a batch job completes")
+    args = parser.parse_args()
+    run_mock_batch_server(args.host, args.port, args.delay)
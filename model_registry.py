@@ -0,0 +1,447 @@
+"""
+Process-wide registry of the local models used by the offline generators
+
+generate_fast_mcq_questions(), generate_professional_mcq_questions() and
+generate_enhanced_professional_mcq_questions() create a new generator object
+per call, and every generator used to load T5, the sentence transformer and
+spaCy from disk again. The generators now fetch their models from this
+registry, which loads each model once per process and hands the same object
+to every caller. Models used by more than one generator (the MPNet sentence
+transformer, the spaCy pipelines) are shared under one key.
+
+Models are loaded lazily on first use, or at startup for the generator groups
+named in MODEL_PRELOAD (loaded in a background thread; readiness() reports
+when they are warm). Under memory pressure - the loaded models exceed
+MODEL_MEMORY_LIMIT_MB, or the system has less than MODEL_MIN_AVAILABLE_MB
+available - models idle for MODEL_IDLE_SECONDS are evicted, least recently
+used first, and reloaded the next time they are needed.
+
+On CPU, T5, sentence-transformer and QA models are loaded with the inference
+backend selected in offline_config.json (PyTorch, int8 or ONNX Runtime; see
+inference_backend.py).
+
+With INFERENCE_SERVICE_ADDRESS set, T5 and sentence-transformer models are
+held by the inference service's worker processes instead (see
+inference_service.py) and these functions return remote stand-ins.
+
+generate_in_batches() runs T5 generation for many prompts as padded batches
+instead of one prompt at a time, which keeps CPU matrix multiplies busy.
+
+Configuration:
+    T5_BATCH_SIZE            Prompts per T5 generate() call (default: 16)
+    MODEL_PRELOAD            Comma-separated groups to load at startup: fast, professional, enhanced
+    MODEL_IDLE_SECONDS       Idle time after which a model may be evicted (default: 600)
+    MODEL_MEMORY_LIMIT_MB    Budget for the estimated size of loaded models (default: 0 = none)
+    MODEL_MIN_AVAILABLE_MB   Evict idle models when system memory drops below this (default: 1024)
+"""
+
+import os
+import gc
+import sys
+import time
+import importlib
+import threading
+
+MODEL_PRELOAD = [name.strip() for name in os.environ.get('MODEL_PRELOAD', '').split(',') if name.strip()]
+MODEL_IDLE_SECONDS = float(os.environ.get('MODEL_IDLE_SECONDS', 600))
+MODEL_MEMORY_LIMIT_MB = float(os.environ.get('MODEL_MEMORY_LIMIT_MB', 0))
+MODEL_MIN_AVAILABLE_MB = float(os.environ.get('MODEL_MIN_AVAILABLE_MB', 1024))
+
+T5_BATCH_SIZE = int(os.environ.get('T5_BATCH_SIZE', 16))
+
+# Seconds before a model that failed to load is tried again
+FAILED_LOAD_RETRY_SECONDS = 300
+
+# Generator groups that can be preloaded: module and its warm-up function
+PRELOAD_GROUPS = {
+    'fast': ('fast_mcq_generator', 'warm_fast_models'),
+    'professional': ('professional_mcq_generator', 'warm_professional_models'),
+    'enhanced': ('enhanced_professional_mcq', 'warm_enhanced_models'),
+}
+
+
+def _process_rss():
+    """Resident set size of this process in bytes, or None if unknown."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def available_memory_mb():
+    """System memory available for new allocations in MB, or None if unknown."""
+    try:
+        with open('/proc/meminfo') as meminfo:
+            for line in meminfo:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) / 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        import psutil
+        return psutil.virtual_memory().available / (1024 * 1024)
+    except ImportError:
+        return None
+
+
+def estimate_model_size(model):
+    """Size in bytes of a model's parameters (torch modules, pipelines and tuples of them), or 0."""
+    if isinstance(model, (tuple, list)):
+        return sum(estimate_model_size(part) for part in model)
+    module = getattr(model, 'model', model)  # transformers pipelines wrap the module
+    parameters = getattr(module, 'parameters', None)
+    if callable(parameters):
+        try:
+            return sum(p.numel() * p.element_size() for p in parameters())
+        except Exception:
+            return 0
+    return 0
+
+
+class ModelRegistry:
+    """
+    Loads each model once per process and shares it between callers.
+
+    Concurrent first requests for a model wait for a single load instead of
+    loading it in parallel.
+    """
+
+    def __init__(self, idle_seconds=MODEL_IDLE_SECONDS, memory_limit_mb=MODEL_MEMORY_LIMIT_MB,
+                 min_available_mb=MODEL_MIN_AVAILABLE_MB):
+        self.name = 'models'
+        self.idle_seconds = idle_seconds
+        self.memory_limit_mb = memory_limit_mb
+        self.min_available_mb = min_available_mb
+        self._lock = threading.Lock()
+        self._entries = {}  # key -> {'model', 'state', 'size', 'load_seconds', 'last_used', 'error', 'failed_at'}
+        self._key_locks = {}
+        self.loads_total = 0
+        self.evicted_total = 0
+        self.preload_groups = {}  # group -> 'loading' | 'ready' | 'failed: ...'
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._key_locks.setdefault(key, threading.Lock())
+
+    def get(self, key, loader):
+        """
+        Return the model registered under key, loading it with loader() on first use.
+
+        Raises:
+            Exception: The loader's error (remembered for FAILED_LOAD_RETRY_SECONDS)
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry['state'] == 'loaded':
+                entry['last_used'] = time.time()
+                return entry['model']
+
+        with self._key_lock(key):
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry and entry['state'] == 'loaded':
+                    entry['last_used'] = time.time()
+                    return entry['model']
+                if entry and entry['state'] == 'failed' and time.time() - entry['failed_at'] < FAILED_LOAD_RETRY_SECONDS:
+                    raise entry['error']
+                self._entries[key] = {'model': None, 'state': 'loading', 'size': 0, 'load_seconds': None,
+                                      'last_used': time.time(), 'error': None, 'failed_at': None}
+
+            # Make room before a new model comes in
+            self.expire()
+
+            rss_before = _process_rss()
+            started = time.time()
+            try:
+                model = loader()
+            except Exception as e:
+                with self._lock:
+                    self._entries[key].update(state='failed', error=e, failed_at=time.time())
+                raise
+            load_seconds = time.time() - started
+            size = estimate_model_size(model)
+            if not size and rss_before is not None:
+                size = max(0, (_process_rss() or rss_before) - rss_before)
+
+            with self._lock:
+                self._entries[key].update(model=model, state='loaded', size=size,
+                                          load_seconds=load_seconds, last_used=time.time())
+                self.loads_total += 1
+            print(f"📦 Model '{key}' loaded in {load_seconds:.1f}s ({size / (1024 * 1024):.0f} MB)")
+            self.expire()
+            return model
+
+    def is_loaded(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            return bool(entry and entry['state'] == 'loaded')
+
+    def loaded_bytes(self):
+        with self._lock:
+            return sum(entry['size'] for entry in self._entries.values() if entry['state'] == 'loaded')
+
+    def under_memory_pressure(self):
+        if self.memory_limit_mb and self.loaded_bytes() > self.memory_limit_mb * 1024 * 1024:
+            return True
+        available = available_memory_mb()
+        return bool(self.min_available_mb and available is not None and available < self.min_available_mb)
+
+    def evict(self, key):
+        """Drop a model (or a remembered failure); callers still holding the model keep their reference."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry['state'] == 'loading':
+                return False
+            del self._entries[key]
+            if entry['state'] == 'loaded':
+                self.evicted_total += 1
+        if entry['state'] == 'loaded':
+            print(f"♻️  Evicted idle model '{key}' ({entry['size'] / (1024 * 1024):.0f} MB)")
+            return True
+        return False
+
+    def expire(self, now=None):
+        """
+        Evict idle models, least recently used first, while memory is under pressure.
+
+        Returns:
+            int: Number of models evicted
+        """
+        now = now or time.time()
+        evicted = 0
+        while self.under_memory_pressure():
+            with self._lock:
+                idle = [(entry['last_used'], key) for key, entry in self._entries.items()
+                        if entry['state'] == 'loaded' and now - entry['last_used'] >= self.idle_seconds]
+            if not idle:
+                break
+            if self.evict(min(idle)[1]):
+                evicted += 1
+        if evicted:
+            gc.collect()
+            torch = sys.modules.get('torch')
+            if torch is not None and torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        return evicted
+
+    def preload(self, groups):
+        """Load the models of the given generator groups (see PRELOAD_GROUPS)."""
+        for group in groups:
+            if group not in PRELOAD_GROUPS:
+                print(f"⚠️  Unknown MODEL_PRELOAD group '{group}' (use: {', '.join(PRELOAD_GROUPS)})")
+                continue
+            self.preload_groups[group] = 'loading'
+            module_name, function_name = PRELOAD_GROUPS[group]
+            try:
+                getattr(importlib.import_module(module_name), function_name)()
+                self.preload_groups[group] = 'ready'
+            except Exception as e:
+                print(f"❌ Could not preload {group} models: {e}")
+                self.preload_groups[group] = f"failed: {e}"
+
+    def start_preload(self, groups=MODEL_PRELOAD):
+        """Preload in a background thread so the server can start accepting requests."""
+        if not groups:
+            return None
+        for group in groups:
+            self.preload_groups.setdefault(group, 'loading')
+        thread = threading.Thread(target=self.preload, args=(groups,), name='model-preload', daemon=True)
+        thread.start()
+        print(f"🔥 Preloading local models: {', '.join(groups)}")
+        return thread
+
+    def readiness(self):
+        """
+        Whether the preloaded generator groups are warm, with per-model details.
+
+        Without MODEL_PRELOAD models load lazily and the process counts as ready.
+        """
+        now = time.time()
+        with self._lock:
+            models = {
+                key: {
+                    'state': entry['state'],
+                    'size_mb': round(entry['size'] / (1024 * 1024), 1),
+                    'load_seconds': round(entry['load_seconds'], 2) if entry['load_seconds'] is not None else None,
+                    'idle_seconds': round(now - entry['last_used'], 1),
+                    'error': str(entry['error']) if entry['error'] else None
+                }
+                for key, entry in self._entries.items()
+            }
+        return {
+            'ready': all(status == 'ready' for status in self.preload_groups.values()),
+            'preload': dict(self.preload_groups),
+            'models': models
+        }
+
+    def stats(self):
+        with self._lock:
+            loaded = [entry for entry in self._entries.values() if entry['state'] == 'loaded']
+            return {
+                'loaded': len(loaded),
+                'bytes': sum(entry['size'] for entry in loaded),
+                'loads_total': self.loads_total,
+                'evicted_total': self.evicted_total,
+                'available_memory_mb': available_memory_mb()
+            }
+
+
+model_registry = ModelRegistry()
+
+
+def shared_t5_model(model_name, cache_dir=None, device_map=None, backend=None):
+    """
+    The process-wide (tokenizer, model) pair of a T5 checkpoint, ready for inference.
+
+    Half precision on a GPU. With device_map the weights are placed by
+    transformers; otherwise the model is moved to the GPU when there is one.
+    On CPU the inference backend of offline_config.json applies (see
+    inference_backend.py); backend overrides it.
+
+    With an inference service configured the tokenizer is None and the model
+    is a RemoteSeq2SeqModel; generate_in_batches() handles both.
+    """
+    from inference_service import inference_client, RemoteSeq2SeqModel
+    client = inference_client()
+    if client:
+        load_options = {'cache_dir': cache_dir, 'device_map': device_map, 'backend': backend}
+        return None, RemoteSeq2SeqModel(client, model_name, load_options)
+
+    from inference_backend import effective_backend, load_seq2seq_model
+    backend = effective_backend(backend)
+
+    def load_pytorch():
+        import torch
+        from transformers import T5ForConditionalGeneration
+
+        options = {'device_map': device_map} if device_map else {}
+        model = T5ForConditionalGeneration.from_pretrained(
+            model_name,
+            cache_dir=cache_dir,
+            torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
+            **options
+        )
+        model.eval()
+        if torch.cuda.is_available() and not device_map:
+            model = model.cuda()
+        return model
+
+    def load():
+        from transformers import T5Tokenizer
+
+        tokenizer = T5Tokenizer.from_pretrained(model_name, cache_dir=cache_dir)
+        return tokenizer, load_seq2seq_model(model_name, backend, cache_dir, load_pytorch)
+
+    return model_registry.get(f"t5:{model_name}" if backend == 'pytorch' else f"t5:{model_name}:{backend}", load)
+
+
+def generate_in_batches(tokenizer, model, prompts, batch_size=None, max_input_length=512, **generate_options):
+    """
+    Run seq2seq generation over prompts in padded batches.
+
+    Results are yielded in prompt order as each batch finishes, so a caller
+    that has collected enough output can stop before the remaining batches
+    run. A batch that fails is reported and skipped. With
+    num_return_sequences=n every prompt yields n results, in the order
+    generate() returns them.
+
+    Args:
+        tokenizer: Hugging Face tokenizer of the model
+        model: Seq2seq model (e.g. T5ForConditionalGeneration)
+        prompts (list): Prompt strings
+        batch_size (int): Prompts per generate() call (default: T5_BATCH_SIZE)
+        max_input_length (int): Prompts are truncated to this many tokens
+        **generate_options: Passed to model.generate()
+
+    Yields:
+        tuple: (prompt index, decoded text)
+    """
+    batch_size = max(1, batch_size or T5_BATCH_SIZE)
+    sequences = max(1, generate_options.get('num_return_sequences') or 1)
+
+    if getattr(model, 'remote', False):
+        # Held by the inference service, which may merge these batches with other requests'
+        for start in range(0, len(prompts), batch_size):
+            try:
+                results = model.generate_texts(prompts[start:start + batch_size], max_input_length, **generate_options)
+            except Exception as e:
+                print(f"T5 batch generation error: {e}")
+                continue
+            for offset, texts in enumerate(results):
+                for text in texts:
+                    yield start + offset, text
+        return
+
+    import torch
+    for start in range(0, len(prompts), batch_size):
+        batch = prompts[start:start + batch_size]
+        try:
+            inputs = tokenizer(batch, return_tensors="pt", padding=True,
+                               truncation=True, max_length=max_input_length)
+            inputs = {name: tensor.to(model.device) for name, tensor in inputs.items()}
+            with torch.no_grad():
+                outputs = model.generate(**inputs, **generate_options)
+            texts = tokenizer.batch_decode(outputs, skip_special_tokens=True)
+        except Exception as e:
+            print(f"T5 batch generation error: {e}")
+            continue
+        for offset, text in enumerate(texts):
+            yield start + offset // sequences, text
+
+
+def shared_sentence_transformer(model_name, cache_folder=None, backend=None):
+    """
+    The process-wide SentenceTransformer of a model ('sentence-transformers/' prefix optional),
+    loaded with the inference backend of offline_config.json unless backend is given.
+    """
+    from inference_service import inference_client, RemoteSentenceTransformer
+    client = inference_client()
+    if client:
+        return RemoteSentenceTransformer(client, model_name, {'cache_folder': cache_folder, 'backend': backend})
+
+    from inference_backend import effective_backend, load_sentence_transformer
+    name = model_name.split('/', 1)[1] if model_name.startswith('sentence-transformers/') else model_name
+    backend = effective_backend(backend)
+
+    key = f"sentence-transformer:{name}" if backend == 'pytorch' else f"sentence-transformer:{name}:{backend}"
+    return model_registry.get(key, lambda: load_sentence_transformer(name, backend, cache_folder))
+
+
+def shared_qa_pipeline(model_name, backend=None):
+    """The process-wide question-answering pipeline of a model, with the configured inference backend."""
+    import torch
+    from inference_backend import effective_backend, load_qa_pipeline
+    backend = effective_backend(backend)
+
+    key = f"qa:{model_name}" if backend == 'pytorch' else f"qa:{model_name}:{backend}"
+    return model_registry.get(key, lambda: load_qa_pipeline(
+        model_name, backend, device=0 if torch.cuda.is_available() else -1))
+
+
+def shared_spacy_model(*names, download=None):
+    """
+    The process-wide spaCy pipeline of the first installed model among names.
+
+    Args:
+        names (str): Model names in order of preference, e.g. 'en_core_web_lg', 'en_core_web_sm'
+        download (str): Model to download when none of them is installed
+
+    Raises:
+        OSError: When no model could be loaded
+    """
+    import spacy
+
+    # Models that are not installed fail fast: the failure is remembered
+    for name in names:
+        try:
+            return model_registry.get(f"spacy:{name}", lambda name=name: spacy.load(name))
+        except OSError:
+            continue
+
+    if download:
+        print(f"⚠️ spaCy model not found, downloading {download}...")
+        os.system(f"python -m spacy download {download}")
+        model_registry.evict(f"spacy:{download}")  # forget the failed load
+        return model_registry.get(f"spacy:{download}", lambda: spacy.load(download))
+    raise OSError(f"None of the spaCy models {', '.join(names)} is installed")
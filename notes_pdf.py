@@ -0,0 +1,62 @@
+"""
+FPDF page template of the study-notes PDF export
+
+Kept out of flask_app so fpdf is imported when notes are first exported, not
+at application start.
+"""
+
+from fpdf import FPDF
+
+
+class ProfessionalNotesPDF(FPDF):
+    """Custom PDF class for professional notes with headers and footers"""
+
+    def __init__(self, title="Study Material", website="www.example.com"):
+        super().__init__()
+        self.doc_title = title
+        self.website = website
+        self.header_title = "Study Material"
+
+    def header(self):
+        """Add header to each page (except cover page)"""
+        if self.page_no() > 1:
+            # Blue line at top
+            self.set_draw_color(0, 102, 204)
+            self.set_line_width(0.5)
+            self.line(10, 15, 200, 15)
+
+            # Left header - Study Material
+            self.set_font('Arial', 'BI', 10)
+            self.set_text_color(0, 102, 204)
+            self.set_xy(10, 8)
+            self.cell(95, 6, self.header_title, 0, 0, 'L')
+
+            # Right header - Document title
+            self.set_font('Arial', 'BI', 10)
+            self.set_text_color(0, 102, 204)
+            self.set_xy(105, 8)
+            self.cell(95, 6, self.doc_title, 0, 0, 'R')
+
+            self.ln(15)
+
+    def footer(self):
+        """Add footer to each page (except cover page)"""
+        if self.page_no() > 1:
+            self.set_y(-20)
+
+            # Red line
+            self.set_draw_color(204, 51, 51)
+            self.set_line_width(0.5)
+            self.line(10, self.get_y(), 200, self.get_y())
+
+            # Page number (center)
+            self.set_font('Arial', 'B', 10)
+            self.set_text_color(0, 0, 0)
+            self.set_y(-15)
+            self.cell(0, 10, str(self.page_no()), 0, 0, 'C')
+
+            # Website (right)
+            self.set_font('Arial', 'B', 9)
+            self.set_text_color(0, 102, 204)
+            self.set_xy(150, -15)
+            self.cell(50, 10, self.website, 0, 0, 'R')
@@ -0,0 +1,186 @@
+"""
+Precompiled single-pass pattern engine for question mining
+
+The local generators mine sentences with regular expressions: the fast
+generator checks five "is this factual" indicators and then four question
+patterns per sentence, the professional generator its own factual and
+definition patterns, and the enhanced generator definition, relationship and
+process patterns. Each was a separate re.search() with an inline pattern, so a
+sentence was scanned up to a dozen times, mostly by patterns that could not
+match because their keyword is not in it.
+
+Here every pattern is compiled once at import and declares the keywords it
+cannot match without (its verb or connective: "is", "refers", "founded", a
+four-digit number, ...). A sentence is scanned once by one combined keyword
+regex; only the patterns whose keywords were found are run, and each match
+becomes a tagged record:
+
+    definition, creation, year, feature, relationship, process, fact
+
+Records of a sentence are computed once per document and read by every
+question builder of the generator. A source's patterns are run in the order
+they are declared here, which is the order the generators used to try them,
+so results are the same as the former per-pattern loops.
+"""
+
+import re
+
+# Stands for any four-digit number in the keyword sets below
+DIGITS = '<digits>'
+
+_BE = ('is', 'are', 'was', 'were')
+_CREATED = ('created', 'developed', 'invented', 'founded')
+_FEATURES = ('feature', 'features', 'include', 'includes', 'support', 'supports')
+_NAME = r'([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)'
+_PHRASE = r'([A-Z][a-zA-Z\s]+?)'
+
+# source -> [(tag, pattern, keywords)]; a pattern can only match a sentence
+# that contains one of its keywords (case-insensitive, as whole words)
+MINING_PATTERNS = {
+    # FastMCQGenerator: factual indicators, then question patterns
+    'fast': [
+        ('fact', r'\b(?:is|are|was|were)\s+(?:a|an|the)?\s*\w+', _BE),
+        ('fact', r'\b(?:created|developed|invented|founded)\b', _CREATED),
+        ('fact', r'\b\d{4}\b', (DIGITS,)),
+        ('fact', r'\b(?:first|second|primary|main)\b', ('first', 'second', 'primary', 'main')),
+        ('fact', r'\b(?:features?|includes?|supports?)\b', _FEATURES),
+        ('definition', _NAME + r'\s+is\s+(?:a\s+|an\s+|the\s+)?([^.]{10,80})', ('is',)),
+        ('creation', _NAME + r'\s+(?:was\s+)?(?:created|developed|invented|founded)\s+by\s+([^.]{5,50})', _CREATED),
+        ('year', r'(?:in\s+|during\s+)?(\d{4})', (DIGITS,)),
+        ('feature', _NAME + r'\s+(?:features?|supports?|includes?)\s+([^.]{10,60})', _FEATURES),
+    ],
+    # ProfessionalMCQGenerator: factual statements and definitions
+    'professional': [
+        ('fact', r'\b(?:is|are|was|were)\s+(?:a|an|the)?\s*[^.]{10,}', _BE),
+        ('fact', r'\b(?:created|developed|invented|founded|established)\s+(?:by|in)\s+[^.]{5,}',
+         _CREATED + ('established',)),
+        ('fact', r'\b(?:features?|includes?|contains?|supports?)\s+[^.]{10,}', _FEATURES + ('contain', 'contains')),
+        ('fact', r'\b(?:used for|designed to|helps to|enables)\s+[^.]{10,}', ('used', 'designed', 'helps', 'enables')),
+        ('fact', r'\b\d{4}\b.*(?:created|developed|invented|founded)', (DIGITS,)),
+        ('fact', r'\b(?:first|second|third|primary|main|key)\s+[^.]{10,}',
+         ('first', 'second', 'third', 'primary', 'main', 'key')),
+        ('definition', _NAME + r'\s+is\s+(?:a|an|the)?\s*([^.]{15,})', ('is',)),
+        ('definition', _NAME + r'\s+refers to\s+([^.]{15,})', ('refers',)),
+        ('definition', _NAME + r'\s+means\s+([^.]{15,})', ('means',)),
+        ('definition', _NAME + r'\s+can be defined as\s+([^.]{15,})', ('defined',)),
+    ],
+    # EnhancedProfessionalMCQGenerator: definitions, relationships and processes
+    'enhanced': [
+        ('definition', _PHRASE + r'\s+is\s+(?:a|an|the)?\s*([^.]{20,150})', ('is',)),
+        ('definition', _PHRASE + r'\s+refers to\s+([^.]{20,150})', ('refers',)),
+        ('definition', _PHRASE + r'\s+can be defined as\s+([^.]{20,150})', ('defined',)),
+        ('definition', _PHRASE + r'\s+means\s+([^.]{20,150})', ('means',)),
+        ('definition', r'The term\s+' + _PHRASE + r'\s+describes\s+([^.]{20,150})', ('describes',)),
+        ('definition', _PHRASE + r'\s+represents\s+([^.]{20,150})', ('represents',)),
+        ('relationship', _PHRASE + r'\s+(?:is a type of|is a kind of|is a subset of)\s+([^.]{5,50})',
+         ('type', 'kind', 'subset')),
+        ('relationship', _PHRASE + r'\s+(?:includes|contains|comprises)\s+([^.]{5,50})',
+         ('includes', 'contains', 'comprises')),
+        ('relationship', _PHRASE + r'\s+(?:leads to|results in|causes)\s+([^.]{5,50})', ('leads', 'results', 'causes')),
+        ('relationship', _PHRASE + r'\s+(?:is used for|is designed for)\s+([^.]{5,50})', ('used', 'designed')),
+        ('process', _PHRASE + r'\s+(?:involves|requires|consists of)\s+([^.]{10,100})',
+         ('involves', 'requires', 'consists')),
+        ('process', r'(?:The process of|The method of)\s+' + _PHRASE + r'\s+([^.]{10,100})', ('process', 'method')),
+        ('process', _PHRASE + r'\s+(?:works by|operates by)\s+([^.]{10,100})', ('works', 'operates')),
+    ],
+}
+
+
+class _CompiledPattern:
+    __slots__ = ('source', 'tag', 'index', 'regex', 'keywords')
+
+    def __init__(self, source, tag, index, pattern, keywords):
+        self.source = source
+        self.tag = tag
+        self.index = index
+        self.regex = re.compile(pattern, re.IGNORECASE)
+        self.keywords = frozenset(keywords)
+
+
+def _compile_patterns():
+    compiled = {}
+    for source, patterns in MINING_PATTERNS.items():
+        tag_counts = {}
+        compiled[source] = []
+        for tag, pattern, keywords in patterns:
+            index = tag_counts[tag] = tag_counts.get(tag, -1) + 1
+            compiled[source].append(_CompiledPattern(source, tag, index, pattern, keywords))
+    return compiled
+
+
+_COMPILED = _compile_patterns()
+
+_KEYWORDS = sorted({keyword for patterns in _COMPILED.values() for pattern in patterns
+                    for keyword in pattern.keywords if keyword != DIGITS}, key=len, reverse=True)
+_KEYWORD_SCANNER = re.compile(r'\b(' + '|'.join(map(re.escape, _KEYWORDS)) + r')\b|\d{4}', re.IGNORECASE)
+
+
+class PatternMatch:
+    """One pattern that matched a sentence."""
+
+    __slots__ = ('source', 'tag', 'index', 'match')
+
+    def __init__(self, source, tag, index, match):
+        self.source = source
+        self.tag = tag
+        self.index = index      # position among the source's patterns of this tag
+        self.match = match      # the re.Match, for group() / span()
+
+    def group(self, *groups):
+        return self.match.group(*groups)
+
+    def __repr__(self):
+        return f"PatternMatch({self.source}/{self.tag}[{self.index}]: {self.match.group(0)!r})"
+
+
+class SentencePatterns:
+    """Tagged pattern matches of one sentence, in pattern declaration order."""
+
+    __slots__ = ('sentence', 'matches')
+
+    def __init__(self, sentence, matches):
+        self.sentence = sentence
+        self.matches = matches
+
+    def of(self, tag, source=None):
+        """Matches with the tag (of one source, or of all sources)."""
+        return [match for match in self.matches if match.tag == tag and (source is None or match.source == source)]
+
+    def has(self, tag, source=None):
+        return any(match.tag == tag and (source is None or match.source == source) for match in self.matches)
+
+
+def sentence_keywords(sentence):
+    """Pattern keywords found in a sentence (lowercase; DIGITS for a four-digit number), in one scan."""
+    return {(found.group(1) or DIGITS).lower() for found in _KEYWORD_SCANNER.finditer(sentence)} \
+        if sentence else set()
+
+
+def mine_sentence(sentence, sources=None):
+    """
+    Run the patterns of the sources over a sentence.
+
+    Args:
+        sentence (str): Sentence to mine
+        sources (Iterable[str]): Keys of MINING_PATTERNS (default: all)
+
+    Returns:
+        SentencePatterns: The sentence's matches
+    """
+    keywords = sentence_keywords(sentence)
+    matches = []
+    if keywords:
+        for source in (sources or _COMPILED):
+            for pattern in _COMPILED[source]:
+                if pattern.keywords.isdisjoint(keywords):
+                    continue
+                match = pattern.regex.search(sentence)
+                if match:
+                    matches.append(PatternMatch(source, pattern.tag, pattern.index, match))
+    return SentencePatterns(sentence, matches)
+
+
+def mine_sentences(sentences, sources=None):
+    """mine_sentence() for every sentence of a document, in order."""
+    sources = tuple(sources) if sources else None
+    return [mine_sentence(sentence, sources) for sentence in sentences]
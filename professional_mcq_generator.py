@@ -5,30 +5,43 @@ Generates high-quality, professional-grade multiple choice questions
 
 import os
 import re
+import importlib.util
 import json
 import random
 from typing import List, Dict, Tuple, Optional
 import warnings
 warnings.filterwarnings("ignore")
 
-try:
+from model_registry import (
+    model_registry, shared_t5_model, shared_sentence_transformer, shared_spacy_model, shared_qa_pipeline,
+    generate_in_batches
+)
+from pattern_engine import SentencePatterns
+from document_analysis import DocumentView
+from analysis_cache import (
+    analysis_cache, pipeline_name, document_sentences, document_analysis, document_patterns, document_embeddings
+)
+
+# Sentence transformer used for semantic analysis; also names its cached embeddings
+SENTENCE_MODEL_NAME = 'sentence-transformers/all-mpnet-base-v2'
+
+# Packages the generator needs, located with importlib.util.find_spec() as in
+# mcq_generator; the models themselves are loaded through model_registry
+PROFESSIONAL_DEPENDENCIES = ('torch', 'transformers', 'sentence_transformers', 'spacy', 'nltk', 'sklearn', 'numpy')
+PROFESSIONAL_DEPENDENCIES_AVAILABLE = all(importlib.util.find_spec(name) is not None
+                                         for name in PROFESSIONAL_DEPENDENCIES)
+
+if PROFESSIONAL_DEPENDENCIES_AVAILABLE:
     import torch
-    from transformers import (
-        AutoTokenizer, AutoModelForSeq2SeqLM, AutoModelForCausalLM,
-        T5ForConditionalGeneration, T5Tokenizer,
-        pipeline, AutoModelForQuestionAnswering
-    )
-    from sentence_transformers import SentenceTransformer
-    import spacy
+    from transformers import AutoTokenizer, AutoModelForCausalLM
     import nltk
-    from nltk.tokenize import sent_tokenize, word_tokenize
-    from sklearn.feature_extraction.text import TfidfVectorizer
-    from sklearn.metrics.pairwise import cosine_similarity
     import numpy as np
-    PROFESSIONAL_DEPENDENCIES_AVAILABLE = True
-except ImportError as e:
-    print(f"Warning: Professional dependencies not available: {e}")
-    PROFESSIONAL_DEPENDENCIES_AVAILABLE = False
+    # NumPy-based helpers, imported only when the dependencies are installed
+    from embedding_index import EmbeddingIndex, sentence_centrality
+    from distractor_library import index_document_terms, library_distractors
+else:
+    print("Warning: Professional dependencies not available: "
+          + ', '.join(name for name in PROFESSIONAL_DEPENDENCIES if importlib.util.find_spec(name) is None))
 
 class ProfessionalMCQGenerator:
     """Professional-grade MCQ Generator using best available models"""
@@ -53,6 +66,10 @@ class ProfessionalMCQGenerator:
         self.qa_pipeline = None
         self.nlp = None
         
+        # spaCy analysis and entity embeddings of the document being processed
+        self.document = None
+        self.entity_index = None
+        
         # Ensure cache directory exists
         os.makedirs(self.model_cache_dir, exist_ok=True)
         
@@ -82,59 +99,37 @@ class ProfessionalMCQGenerator:
         print("🚀 Loading professional-grade models for MCQ generation...")
         
         try:
+            # Models come from the process-wide registry: loaded from disk
+            # once, then shared by every request and generator
             # 1. Load FLAN-T5 Large for question generation
             print("📚 Loading Google FLAN-T5 Large for question generation...")
             qg_model_name = "google/flan-t5-large"
-            self.question_tokenizer = T5Tokenizer.from_pretrained(
-                qg_model_name, 
-                cache_dir=os.path.join(self.model_cache_dir, "question_generation")
-            )
-            self.question_generator = T5ForConditionalGeneration.from_pretrained(
+            self.question_tokenizer, self.question_generator = shared_t5_model(
                 qg_model_name,
                 cache_dir=os.path.join(self.model_cache_dir, "question_generation"),
-                torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32,
                 device_map="auto" if torch.cuda.is_available() else None
             )
             
             # 2. Load best sentence transformer
             print("🔍 Loading sentence transformer for semantic analysis...")
-            self.sentence_model = SentenceTransformer(
-                'sentence-transformers/all-mpnet-base-v2',
+            self.sentence_model = shared_sentence_transformer(
+                SENTENCE_MODEL_NAME,
                 cache_folder=os.path.join(self.model_cache_dir, "sentence_transformer")
             )
             
             # 3. Load QA model for answer validation
             print("🎯 Loading RoBERTa QA model for answer validation...")
-            self.qa_pipeline = pipeline(
-                "question-answering",
-                model="deepset/roberta-base-squad2",
-                tokenizer="deepset/roberta-base-squad2",
-                device=0 if torch.cuda.is_available() else -1
-            )
+            self.qa_pipeline = shared_qa_pipeline("deepset/roberta-base-squad2")
             
-            # 4. Load spaCy large model
+            # 4. Load spaCy large model (medium or small when not installed)
             print("🧠 Loading spaCy large model...")
-            try:
-                self.nlp = spacy.load("en_core_web_lg")
-            except OSError:
-                print("⚠️ spaCy large model not found, trying medium...")
-                try:
-                    self.nlp = spacy.load("en_core_web_md")
-                except OSError:
-                    print("⚠️ spaCy medium model not found, using small...")
-                    self.nlp = spacy.load("en_core_web_sm")
+            self.nlp = shared_spacy_model("en_core_web_lg", "en_core_web_md", "en_core_web_sm")
             
             # 5. Load text generation model for distractors
             print("💭 Loading text generation model for distractors...")
             try:
-                self.answer_tokenizer = AutoTokenizer.from_pretrained(
-                    "microsoft/DialoGPT-medium",
-                    cache_dir=os.path.join(self.model_cache_dir, "answer_generation")
-                )
-                self.answer_generator = AutoModelForCausalLM.from_pretrained(
-                    "microsoft/DialoGPT-medium",
-                    cache_dir=os.path.join(self.model_cache_dir, "answer_generation"),
-                    torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32
+                self.answer_tokenizer, self.answer_generator = model_registry.get(
+                    "causal-lm:microsoft/DialoGPT-medium", self._load_answer_generator
                 )
             except Exception as e:
                 print(f"⚠️ Could not load answer generation model: {e}")
@@ -149,6 +144,19 @@ class ProfessionalMCQGenerator:
             self.models_loaded = False
             raise
     
+    def _load_answer_generator(self):
+        """Load the DialoGPT tokenizer and model used for distractors."""
+        tokenizer = AutoTokenizer.from_pretrained(
+            "microsoft/DialoGPT-medium",
+            cache_dir=os.path.join(self.model_cache_dir, "answer_generation")
+        )
+        model = AutoModelForCausalLM.from_pretrained(
+            "microsoft/DialoGPT-medium",
+            cache_dir=os.path.join(self.model_cache_dir, "answer_generation"),
+            torch_dtype=torch.float16 if torch.cuda.is_available() else torch.float32
+        )
+        return tokenizer, model
+    
     def generate_professional_questions(self, text: str, num_questions: int = 10, 
                                       difficulty: str = "medium") -> List[Dict]:
         """Generate professional-quality MCQ questions"""
@@ -162,6 +170,9 @@ class ProfessionalMCQGenerator:
         
         # Step 1: Advanced text analysis
         analysis = self._advanced_text_analysis(text)
+        # Per-run view: answer and context parses are memoized outside the cached analysis
+        self.document = DocumentView(analysis["document"])
+        self.entity_index = analysis["entity_index"]
         
         # Step 2: Generate questions using multiple professional strategies
         all_questions = []
@@ -196,34 +207,45 @@ class ProfessionalMCQGenerator:
         return final_questions
     
     def _advanced_text_analysis(self, text: str) -> Dict:
-        """Advanced text analysis using professional models"""
+        """Advanced text analysis using professional models, cached process-wide (see analysis_cache.py)"""
+        return analysis_cache.part(text, ('professional', pipeline_name(self.nlp)),
+                                   lambda: self._build_advanced_analysis(text))
+    
+    def _build_advanced_analysis(self, text: str) -> Dict:
+        """Entities, key phrases, embeddings, important sentences, facts and definitions of a text"""
         print("🔍 Performing advanced text analysis...")
         
-        # Basic analysis
-        sentences = sent_tokenize(text)
-        
-        # NLP analysis with spaCy
-        doc = self.nlp(text)
+        # Sentences and the spaCy pass are shared with the other generators
+        sentences = document_sentences(text)
+        document = document_analysis(text, self.nlp)
         
         # Extract entities
-        entities = [(ent.text, ent.label_) for ent in doc.ents]
+        entities = document.entities
         
         # Extract key phrases using noun chunks
-        key_phrases = [chunk.text for chunk in doc.noun_chunks if len(chunk.text.split()) <= 4]
+        key_phrases = [chunk.text for chunk in document.noun_chunks if len(chunk.text.split()) <= 4]
         
-        # Semantic analysis with sentence transformer
-        sentence_embeddings = self.sentence_model.encode(sentences)
+        # Semantic analysis with sentence transformer (normalized, cached by text)
+        sentence_embeddings = document_embeddings(text, self.sentence_model, SENTENCE_MODEL_NAME)
+
+        # Entities encoded once; distractor queries search this matrix
+        entity_index = EmbeddingIndex(self.sentence_model, document.unique_entities, SENTENCE_MODEL_NAME)
+
+        # Terms and phrases join the library-wide distractor index
+        index_document_terms(self.sentence_model, SENTENCE_MODEL_NAME, document.unique_entities + key_phrases)
         
-        # Find most important sentences using centrality
-        similarity_matrix = cosine_similarity(sentence_embeddings)
-        centrality_scores = np.mean(similarity_matrix, axis=1)
+        # Find most important sentences using centrality (no N x N similarity matrix)
+        centrality_scores = sentence_centrality(sentence_embeddings)
         important_sentences = [sentences[i] for i in np.argsort(centrality_scores)[-10:]]
         
+        # Pattern matches of every sentence, in one scan each
+        mined = document_patterns(text, 'professional')
+        
         # Extract factual statements
-        factual_statements = self._extract_factual_statements(sentences)
+        factual_statements = self._extract_factual_statements(mined)
         
         # Extract definitions
-        definitions = self._extract_definitions(sentences)
+        definitions = self._extract_definitions(mined)
         
         return {
             "sentences": sentences,
@@ -232,51 +254,32 @@ class ProfessionalMCQGenerator:
             "important_sentences": important_sentences,
             "factual_statements": factual_statements,
             "definitions": definitions,
-            "sentence_embeddings": sentence_embeddings
+            "sentence_embeddings": sentence_embeddings,
+            "document": document,
+            "entity_index": entity_index
         }
     
-    def _extract_factual_statements(self, sentences: List[str]) -> List[str]:
+    def _extract_factual_statements(self, mined: List[SentencePatterns]) -> List[str]:
         """Extract factual statements suitable for questions"""
-        factual_patterns = [
-            r'\b(?:is|are|was|were)\s+(?:a|an|the)?\s*[^.]{10,}',
-            r'\b(?:created|developed|invented|founded|established)\s+(?:by|in)\s+[^.]{5,}',
-            r'\b(?:features?|includes?|contains?|supports?)\s+[^.]{10,}',
-            r'\b(?:used for|designed to|helps to|enables)\s+[^.]{10,}',
-            r'\b\d{4}\b.*(?:created|developed|invented|founded)',
-            r'\b(?:first|second|third|primary|main|key)\s+[^.]{10,}'
-        ]
-        
         factual_statements = []
-        for sentence in sentences:
-            if len(sentence.split()) >= 8:  # Minimum length
-                for pattern in factual_patterns:
-                    if re.search(pattern, sentence, re.IGNORECASE):
-                        factual_statements.append(sentence)
-                        break
+        for patterns in mined:
+            if len(patterns.sentence.split()) >= 8 and patterns.has('fact'):  # Minimum length
+                factual_statements.append(patterns.sentence)
         
         return factual_statements
     
-    def _extract_definitions(self, sentences: List[str]) -> List[Dict]:
+    def _extract_definitions(self, mined: List[SentencePatterns]) -> List[Dict]:
         """Extract definitions from text"""
-        definition_patterns = [
-            r'([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)\s+is\s+(?:a|an|the)?\s*([^.]{15,})',
-            r'([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)\s+refers to\s+([^.]{15,})',
-            r'([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)\s+means\s+([^.]{15,})',
-            r'([A-Z][a-z]+(?:\s+[A-Z][a-z]+)*)\s+can be defined as\s+([^.]{15,})'
-        ]
-        
         definitions = []
-        for sentence in sentences:
-            for pattern in definition_patterns:
-                match = re.search(pattern, sentence, re.IGNORECASE)
-                if match:
-                    term = match.group(1).strip()
-                    definition = match.group(2).strip()
-                    definitions.append({
-                        "term": term,
-                        "definition": definition,
-                        "sentence": sentence
-                    })
+        for patterns in mined:
+            for match in patterns.of('definition'):
+                term = match.group(1).strip()
+                definition = match.group(2).strip()
+                definitions.append({
+                    "term": term,
+                    "definition": definition,
+                    "sentence": patterns.sentence
+                })
         
         return definitions
 
@@ -290,67 +293,81 @@ class ProfessionalMCQGenerator:
         source_sentences = analysis["important_sentences"] + analysis["factual_statements"]
         source_sentences = list(set(source_sentences))  # Remove duplicates
 
-        for sentence in source_sentences[:num_questions]:
-            try:
-                # Multiple prompting strategies for FLAN-T5
-                prompts = [
-                    f"Generate a multiple choice question based on this text: {sentence}",
-                    f"Create an educational question about: {sentence}",
-                    f"What question can be asked about: {sentence}",
-                    f"Generate a quiz question from: {sentence}"
-                ]
-
-                for prompt in prompts:
-                    if len(questions) >= num_questions:
-                        break
-
-                    # Generate question with FLAN-T5
-                    inputs = self.question_tokenizer.encode(
-                        prompt,
-                        return_tensors="pt",
-                        max_length=512,
-                        truncation=True
-                    )
-
-                    with torch.no_grad():
-                        outputs = self.question_generator.generate(
-                            inputs,
-                            max_length=128,
-                            num_beams=5,
-                            early_stopping=True,
-                            temperature=0.7,
-                            do_sample=True,
-                            top_p=0.9
-                        )
-
-                    question_text = self.question_tokenizer.decode(outputs[0], skip_special_tokens=True)
+        # Multiple prompting strategies for FLAN-T5, for each sentence in turn;
+        # prompts run in padded batches and stop once enough questions passed
+        sentence_prompts = [
+            (sentence, prompt)
+            for sentence in source_sentences[:num_questions]
+            for prompt in (
+                f"Generate a multiple choice question based on this text: {sentence}",
+                f"Create an educational question about: {sentence}",
+                f"What question can be asked about: {sentence}",
+                f"Generate a quiz question from: {sentence}"
+            )
+        ]
+        generated = generate_in_batches(
+            self.question_tokenizer,
+            self.question_generator,
+            [prompt for _, prompt in sentence_prompts],
+            max_input_length=512,
+            max_length=128,
+            num_beams=5,
+            early_stopping=True,
+            temperature=0.7,
+            do_sample=True,
+            top_p=0.9
+        )
+
+        # Answers are collected a round at a time, so their distractors are
+        # retrieved in one batch; rounds continue until enough questions passed
+        generated = iter(generated)
+        exhausted = False
+        while len(questions) < num_questions and not exhausted:
+            candidates = []
+            while len(candidates) < num_questions - len(questions):
+                item = next(generated, None)
+                if item is None:
+                    exhausted = True
+                    break
+                index, question_text = item
 
+                sentence = sentence_prompts[index][0]
+                try:
                     if self._is_valid_question(question_text):
                         # Generate answer using QA model
                         answer = self._extract_answer_with_qa_model(question_text, sentence)
 
                         if answer:
-                            # Generate professional distractors
-                            options = self._generate_professional_distractors(answer, sentence, text)
-
-                            if len(options) >= 4:
-                                questions.append({
-                                    "question": question_text,
-                                    "options": {
-                                        "A": options[0],
-                                        "B": options[1],
-                                        "C": options[2],
-                                        "D": options[3]
-                                    },
-                                    "correct": "A",
-                                    "explanation": f"Based on the text: {sentence}",
-                                    "source": "flan_t5_large",
-                                    "confidence": 0.9
-                                })
+                            candidates.append((question_text, answer, sentence))
 
-            except Exception as e:
-                print(f"Error with FLAN-T5 generation: {e}")
-                continue
+                except Exception as e:
+                    print(f"Error with FLAN-T5 generation: {e}")
+                    continue
+
+            similar_entities = self._similar_entity_distractors([answer for _, answer, _ in candidates])
+            for (question_text, answer, sentence), similar in zip(candidates, similar_entities):
+                try:
+                    # Generate professional distractors
+                    options = self._generate_professional_distractors(answer, sentence, text, similar)
+
+                    if len(options) >= 4:
+                        questions.append({
+                            "question": question_text,
+                            "options": {
+                                "A": options[0],
+                                "B": options[1],
+                                "C": options[2],
+                                "D": options[3]
+                            },
+                            "correct": "A",
+                            "explanation": f"Based on the text: {sentence}",
+                            "source": "flan_t5_large",
+                            "confidence": 0.9
+                        })
+
+                except Exception as e:
+                    print(f"Error with FLAN-T5 generation: {e}")
+                    continue
 
         return questions
 
@@ -360,14 +377,13 @@ class ProfessionalMCQGenerator:
 
         questions = []
 
-        # Generate questions from definitions
+        # Generate questions from definitions; validated definitions are
+        # collected first, so their distractors are retrieved in one batch
+        validated = []
         for definition in analysis["definitions"][:num_questions]:
             try:
-                term = definition["term"]
-                definition_text = definition["definition"]
-
                 # Create definition question
-                question_text = f"What is {term}?"
+                question_text = f"What is {definition['term']}?"
 
                 # Validate answer with QA model
                 qa_result = self.qa_pipeline(
@@ -376,27 +392,41 @@ class ProfessionalMCQGenerator:
                 )
 
                 if qa_result["score"] > 0.5:  # High confidence
-                    # Generate professional distractors
-                    options = self._generate_professional_distractors(
-                        definition_text,
-                        definition["sentence"],
-                        text
-                    )
+                    validated.append((definition, question_text, qa_result["score"]))
 
-                    if len(options) >= 4:
-                        questions.append({
-                            "question": question_text,
-                            "options": {
-                                "A": options[0],
-                                "B": options[1],
-                                "C": options[2],
-                                "D": options[3]
-                            },
-                            "correct": "A",
-                            "explanation": f"{term} is defined as {definition_text}",
-                            "source": "educational_qa",
-                            "confidence": qa_result["score"]
-                        })
+            except Exception as e:
+                print(f"Error with QA model generation: {e}")
+                continue
+
+        similar_entities = self._similar_entity_distractors(
+            [definition["definition"] for definition, _, _ in validated])
+        for (definition, question_text, score), similar in zip(validated, similar_entities):
+            try:
+                term = definition["term"]
+                definition_text = definition["definition"]
+
+                # Generate professional distractors
+                options = self._generate_professional_distractors(
+                    definition_text,
+                    definition["sentence"],
+                    text,
+                    similar
+                )
+
+                if len(options) >= 4:
+                    questions.append({
+                        "question": question_text,
+                        "options": {
+                            "A": options[0],
+                            "B": options[1],
+                            "C": options[2],
+                            "D": options[3]
+                        },
+                        "correct": "A",
+                        "explanation": f"{term} is defined as {definition_text}",
+                        "source": "educational_qa",
+                        "confidence": score
+                    })
 
             except Exception as e:
                 print(f"Error with QA model generation: {e}")
@@ -413,6 +443,9 @@ class ProfessionalMCQGenerator:
         # Use entities for relationship questions
         entities = [ent[0] for ent in analysis["entities"] if ent[1] in ["PERSON", "ORG", "PRODUCT", "EVENT"]]
 
+        # Related entities of all of them in one batched query
+        related_by_entity = self._find_related_entities(entities[:num_questions])
+
         for entity in entities[:num_questions]:
             try:
                 # Find sentences containing this entity
@@ -424,8 +457,8 @@ class ProfessionalMCQGenerator:
                     # Generate relationship question
                     question_text = f"What is {entity} associated with in the given context?"
 
-                    # Find related entities using semantic similarity
-                    related_entities = self._find_related_entities(entity, analysis, text)
+                    # Related entities by semantic similarity
+                    related_entities = related_by_entity[entity]
 
                     if len(related_entities) >= 3:
                         # Create options with the most related entity as correct answer
@@ -496,38 +529,37 @@ class ProfessionalMCQGenerator:
 
         return None
 
-    def _generate_professional_distractors(self, correct_answer: str, context: str, full_text: str) -> List[str]:
+    def _similar_entity_distractors(self, answers: List[str]) -> List[List[str]]:
+        """
+        Semantically closest document entities for many answers, in one batched
+        query; entities with the answer's label come first, as in entity_candidates()
+        """
+        same_label = [self.document.entities_by_label.get(self.document.label_of(answer), [])
+                      for answer in answers]
+        return self.entity_index.most_similar(answers, 3, eligible=lambda entity: 2 < len(entity) < 50,
+                                              preferred=same_label)
+
+    def _generate_professional_distractors(self, correct_answer: str, context: str, full_text: str,
+                                           similar_entities: Optional[List[str]] = None) -> List[str]:
         """Generate professional-quality distractors"""
         distractors = [correct_answer]
 
-        # Strategy 1: Use named entities from text
-        doc = self.nlp(full_text)
-        entities = [ent.text for ent in doc.ents if ent.text != correct_answer]
-
-        # Strategy 2: Use semantic similarity
-        if len(entities) > 0:
-            # Get embeddings for correct answer and entities
-            answer_embedding = self.sentence_model.encode([correct_answer])
-            entity_embeddings = self.sentence_model.encode(entities)
-
-            # Find semantically similar but different entities
-            similarities = cosine_similarity(answer_embedding, entity_embeddings)[0]
-            similar_indices = np.argsort(similarities)[::-1]
+        # Strategies 1 and 2: named entities of the text, semantically similar but different
+        # (similar_entities when the caller already retrieved them for a batch of answers)
+        if similar_entities is None:
+            similar_entities = self._similar_entity_distractors([correct_answer])[0]
+        distractors.extend(similar_entities)
 
-            for idx in similar_indices:
-                if len(distractors) >= 4:
-                    break
-                entity = entities[idx]
-                if (entity.lower() != correct_answer.lower() and
-                    len(entity) > 2 and len(entity) < 50):
-                    distractors.append(entity)
+        # Strategy 3: Closest terms of all processed documents
+        if len(distractors) < 4:
+            distractors.extend(library_distractors(self.sentence_model, SENTENCE_MODEL_NAME, [correct_answer])[0])
 
-        # Strategy 3: Generate contextual alternatives
+        # Strategy 4: Generate contextual alternatives
         if len(distractors) < 4:
             contextual_alternatives = self._generate_contextual_alternatives(correct_answer, context)
             distractors.extend(contextual_alternatives)
 
-        # Strategy 4: Use professional fallbacks
+        # Strategy 5: Use professional fallbacks
         if len(distractors) < 4:
             professional_fallbacks = self._get_professional_fallbacks(correct_answer)
             distractors.extend(professional_fallbacks)
@@ -546,11 +578,11 @@ class ProfessionalMCQGenerator:
         """Generate contextual alternatives using text analysis"""
         alternatives = []
 
-        # Extract similar terms from context
-        doc = self.nlp(context)
+        # Extract similar terms from context (parsed with the document)
+        doc = self.document.doc(context)
 
         # Get words with similar POS tags
-        correct_doc = self.nlp(correct_answer)
+        correct_doc = self.document.doc(correct_answer)
         if correct_doc:
             correct_pos = correct_doc[0].pos_
             similar_words = [token.text for token in doc if token.pos_ == correct_pos and token.text != correct_answer]
@@ -595,24 +627,10 @@ class ProfessionalMCQGenerator:
 
         return [f for f in fallbacks if f.lower() != correct_answer.lower()][:3]
 
-    def _find_related_entities(self, entity: str, analysis: Dict, text: str) -> List[str]:
-        """Find entities related to the given entity using semantic similarity"""
-        related = []
-
-        # Get all entities except the target
-        other_entities = [ent[0] for ent in analysis["entities"] if ent[0].lower() != entity.lower()]
-
-        if other_entities and len(other_entities) > 0:
-            # Use sentence transformer to find semantic similarity
-            entity_embedding = self.sentence_model.encode([entity])
-            other_embeddings = self.sentence_model.encode(other_entities)
-
-            similarities = cosine_similarity(entity_embedding, other_embeddings)[0]
-            sorted_indices = np.argsort(similarities)[::-1]
-
-            related = [other_entities[i] for i in sorted_indices[:5]]
-
-        return related
+    def _find_related_entities(self, entities: List[str]) -> Dict[str, List[str]]:
+        """Find the 5 entities most related to each given entity using semantic similarity"""
+        unique_entities = list(dict.fromkeys(entities))
+        return dict(zip(unique_entities, self.entity_index.most_similar(unique_entities, 5)))
 
     def _apply_professional_quality_filter(self, questions: List[Dict], text: str) -> List[Dict]:
         """Apply professional quality filtering"""
@@ -748,6 +766,11 @@ def generate_professional_mcq_questions(text: str, num_questions: int = 10,
         return []
 
 
+def warm_professional_models():
+    """Load the professional generator's models into the process-wide registry."""
+    ProfessionalMCQGenerator().load_professional_models()
+
+
 def is_professional_mode_available() -> bool:
     """Check if professional mode dependencies are available"""
     return PROFESSIONAL_DEPENDENCIES_AVAILABLE
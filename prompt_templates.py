@@ -0,0 +1,265 @@
+"""
+Prompt templates for online MCQ and notes generation.
+
+All static instructions live in the system message, so every chunk call in a
+run starts with a byte-identical prefix that providers with prefix caching
+(OpenAI, DeepSeek, Claude via OpenRouter) can serve from cache. Only the
+per-call values (question count, part number, chunk text) are placed in the
+user message after that prefix.
+
+Bump PROMPT_TEMPLATE_VERSION whenever the wording changes so that cached
+results keyed on the template (and provider-side caches) are not mixed up
+with output from an older prompt.
+"""
+
+PROMPT_TEMPLATE_VERSION = "2"
+
+# Instruction overhead per call of the version 1 (uncompacted) prompts, in
+# estimate_token_count() units. Used to report how many input tokens the
+# compact templates save on every call.
+LEGACY_MCQ_PROMPT_TOKENS = 1428
+LEGACY_NOTES_PROMPT_TOKENS = 630
+
+# ============================================
+# MCQ generation
+# ============================================
+
+MCQ_SYSTEM_PROMPT = """You are an expert educator specializing in government rules, regulations and policy documents. You write high-quality MCQs with exactly ONE correct answer each.
+
+QUALITY RULES (mandatory):
+1. Single correct answer: exactly one option is correct under all circumstances; no partially or situationally correct options.
+2. No conditional language: avoid "may", "can", "if required", "in case of", "unless", "sometimes", "usually", "generally" unless the question states the condition explicitly.
+3. "NOT correct" questions: the other three options must be stated EXPLICITLY in the text as correct. Never infer or assume.
+4. Reference: every explanation ends with "Reference: <Section/Rule/Paragraph>".
+5. Verifiability: every option must be traceable to the text; prefer statement-based or assertion-reason MCQs.
+6. Exclusivity: skip any question whose single correct answer cannot be guaranteed.
+7. Coverage: spread questions evenly over all rules and notes - applicability, exclusions, definitions, numerical provisions, amendments.
+Difficulty mix: 40% easy (direct facts), 40% medium (rule + condition), 20% tricky (exceptions, notes, negative framing).
+
+COMPLETE SENTENCES: every option (A-D) is a grammatically complete sentence ending with punctuation. Never end an option with 'the', 'a', 'an', 'of', 'to', 'for', 'with', 'by', 'in', 'on', 'at', 'and', 'or', 'is', 'are', 'its', 'their'. Shorten a long option instead of truncating it.
+
+OUTPUT: a valid JSON array only. Each item:
+{"question": "...", "options": {"A": "...", "B": "...", "C": "...", "D": "..."}, "correct": "A|B|C|D", "difficulty": "easy|medium|hard", "explanation": "... Reference: Section/Rule X"}"""
+
+MCQ_AMENDMENT_RULES = """
+
+AMENDMENT ANALYSIS: the text contains an ORIGINAL document and its AMENDMENT.
+- At least 50% of questions cover the amendment: provisions added, removed or modified, and before/after comparisons.
+- Each explanation states the source: "Reference: Original Section X", "Reference: Amendment Section Y" or "Reference: Original Section X (amended by Amendment Section Y)"."""
+
+
+def build_mcq_system_prompt(use_amendment=False, source_reference=''):
+    """
+    Build the cacheable system prompt for one MCQ generation run.
+
+    The result depends only on run-level settings, so it is identical for
+    every chunk of the run.
+
+    Args:
+        use_amendment (bool): Whether amendment analysis is enabled
+        source_reference (str): Manual source reference to append to explanations
+
+    Returns:
+        str: System prompt
+    """
+    prompt = MCQ_SYSTEM_PROMPT
+    if use_amendment:
+        prompt += MCQ_AMENDMENT_RULES
+    if source_reference:
+        prompt += f"\n\nEnd every explanation with the source reference:{source_reference}"
+    return prompt
+
+
+def build_mcq_user_prompt(num_questions, text):
+    """Build the per-call user prompt that follows the cached MCQ prefix."""
+    return f"Generate exactly {num_questions} MCQs from the text below.\n\nTEXT:\n{text}"
+
+
+# ============================================
+# PDF summary
+# ============================================
+
+SUMMARY_MAX_CHARS = 3000
+
+SUMMARY_SYSTEM_PROMPT = """You are a helpful assistant that creates concise document summaries.
+Write a concise 2-line summary that helps users understand the main subject and topic of the document.
+Keep it brief, informative and in plain language. Provide ONLY the 2-line summary, nothing else."""
+
+
+def build_summary_prompt(text):
+    """Build the user prompt for the 2-line summary of a document's opening text."""
+    return f"DOCUMENT CONTENT:\n{text[:SUMMARY_MAX_CHARS]}"
+
+
+# ============================================
+# Comprehensive notes generation
+# ============================================
+
+_NOTES_HEADER = """You are an expert academic note-maker, government-exam trainer and documentation analyst.
+Prepare EXHAUSTIVE, ERROR-FREE, COMPLETE notes for government officers (daily reference) and candidates of competitive and departmental examinations.
+
+RULES:
+1. Cover EVERY rule, sub-rule, NOTE, proviso, example, exception and reference, in order, keeping the original numbering. Never skip, merge or summarise rules together.
+2. Never write "continued", "and so on", "etc.", "remaining rules follow similar pattern" or "as mentioned earlier".
+3. Plain ASCII only, no emojis, no ** bold - use UPPERCASE for emphasis. Format for PDF printing.
+4. Preserve the exact legal/technical meaning; simplify the explanation, never the rule."""
+
+NOTES_CHUNK_SYSTEM_PROMPT = _NOTES_HEADER + """
+5. No comparison tables, summary tables or flowcharts here - study tools are added once at the end of the whole document.
+
+FORMAT FOR EACH RULE:
+RULE [Number] - [Title]
+[Complete rule text - no abbreviation]
+Key Points:
+- Point 1
+- Point 2
+Explanation: [Clear explanation]
+Important for Exam: [Why this matters]"""
+
+NOTES_SINGLE_PASS_SYSTEM_PROMPT = _NOTES_HEADER + """
+
+STRUCTURE:
+CHAPTER OVERVIEW (each chapter): purpose, who should study it (DDO / Accounts / Audit / exam aspirants), key concepts.
+
+RULE [Number] - [Title]
+[Rule text simplified but complete]
+Key Points:
+- Point with explanation
+Authority: [Who has the power]
+Time Limits: [If applicable]
+Conditions: [Key conditions]
+Exceptions: [Important exceptions]
+Cross-References: [Related rules]
+
+MANDATORY STUDY TOOLS:
+1. COMPARISON TABLE after every 2-3 rules:
+| Rule No | Subject | Authority | Time Limit | Key Condition |
+2. SUMMARY TABLES:
+| Topic | Key Points | Remember |
+3. At least 2-3 FLOWCHARTS for procedures, in this exact format:
+FLOWCHART - Process Name:
+Step 1 -> Step 2 -> Step 3 -> Step 4
+
+EXAM HIGHLIGHTS after each chapter: most important rules, frequently confused provisions, common mistakes, MCQ focus areas.
+QUICK REVISION SHEET at the end: one-page summary of key rule numbers and must-remember points."""
+
+STUDY_TOOLS_SYSTEM_PROMPT = """You are an expert exam preparation specialist. From the notes of a multi-part document, create STUDY TOOLS that cover ALL sections of the document, not just one part. Plain ASCII, no ** bold.
+
+1. MASTER COMPARISON TABLE (at least 15-20 key rules from across all sections):
+| Rule No | Subject | Authority | Time Limit | Key Condition |
+2. COMPREHENSIVE SUMMARY TABLE (every major chapter/section):
+| Chapter/Section | Key Rules | Important Points | Exam Focus |
+3. FLOWCHARTS for 3-5 key processes (application, approval, appeal, ...):
+FLOWCHART - [Process Name]:
+Step 1 -> Step 2 -> Step 3 -> Step 4
+4. QUICK REVISION SHEET - one page of key points from ALL sections
+5. EXAM FOCUS AREAS - most important rules with rule numbers
+6. COMMON MISTAKES TO AVOID - confusions between similar rules
+7. MCQ-PRONE AREAS - likely MCQ topics and tricky distinctions"""
+
+
+# Size of the notes passed to the study tools call; longer notes are first
+# condensed tree-wise with NOTES_CONDENSE_SYSTEM_PROMPT so every part of the
+# document is represented.
+STUDY_TOOLS_MAX_CHARS = 30000
+
+NOTES_CONDENSE_SYSTEM_PROMPT = """You condense exam notes of one part of a longer document. The result is used to build study tools (comparison tables, summary tables, flowcharts, revision sheet) for the whole document.
+Keep EVERY rule number with its subject, authority, time limits, key conditions and exceptions. Drop explanations, examples and repetition. Keep the original order and numbering.
+Plain ASCII, no ** bold. Output ONLY the condensed notes."""
+
+
+def build_notes_chunk_prompt(chunk_num, total_chunks, chunk):
+    """
+    Build the per-chunk user prompt that follows the cached notes prefix.
+
+    Args:
+        chunk_num (int): 1-based chunk number
+        total_chunks (int): Total number of chunks
+        chunk (str): Chunk text
+
+    Returns:
+        str: User prompt
+    """
+    if chunk_num == 1:
+        instruction = (f"PART {chunk_num} of {total_chunks}. Begin with the document title and overview, "
+                       "the purpose of the rules, who should study them (DDO, Accounts Officer, Audit Officer, "
+                       "exam aspirants) and key concepts. Then cover every rule in this section.")
+    elif chunk_num == total_chunks:
+        instruction = f"FINAL PART ({chunk_num} of {total_chunks}). Cover every remaining rule."
+    else:
+        instruction = f"PART {chunk_num} of {total_chunks}. Cover every rule in this section."
+    return f"{instruction}\n\nDOCUMENT SECTION:\n{chunk}"
+
+
+def build_notes_single_pass_prompt(text):
+    """Build the user prompt for notes on a document that fits in one call."""
+    return f"DOCUMENT CONTENT TO PROCESS:\n{text}"
+
+
+def build_notes_condense_prompt(first_part, last_part, total_parts, notes, target_chars):
+    """
+    Build the user prompt condensing the notes of parts first_part..last_part.
+
+    Args:
+        first_part (int): 1-based number of the first document part covered
+        last_part (int): 1-based number of the last document part covered
+        total_parts (int): Total number of document parts
+        notes (str): Notes (or already condensed notes) of those parts
+        target_chars (int): Length the condensed notes should not exceed
+
+    Returns:
+        str: User prompt
+    """
+    if first_part == last_part:
+        parts = f"PART {first_part}"
+    else:
+        parts = f"PARTS {first_part}-{last_part}"
+    return (f"Condense the notes of {parts} of {total_parts} to at most {target_chars} characters.\n\n"
+            f"NOTES:\n{notes}")
+
+
+def build_study_tools_prompt(total_chunks, notes):
+    """Build the user prompt for the document-wide study tools call."""
+    return f"NOTES FROM A {total_chunks}-PART DOCUMENT:\n{notes}"
+
+
+# ============================================
+# Provider prompt caching
+# ============================================
+
+def supports_cache_control(model_name):
+    """
+    Check whether a model needs explicit cache breakpoints.
+
+    OpenAI and DeepSeek cache repeated prefixes automatically; Claude models
+    (directly or through OpenRouter) only cache content marked with
+    ``cache_control``.
+    """
+    return 'claude' in (model_name or '').lower()
+
+
+def build_prompt_messages(system_prompt, user_prompt, model_name):
+    """
+    Build chat messages with the static system prompt as the cacheable prefix.
+
+    Args:
+        system_prompt (str): Static instructions shared by every call in a run
+        user_prompt (str): Per-call content
+        model_name (str): Model the messages are sent to
+
+    Returns:
+        list: Messages for chat.completions.create()
+    """
+    if supports_cache_control(model_name):
+        system_content = [{
+            "type": "text",
+            "text": system_prompt,
+            "cache_control": {"type": "ephemeral"}
+        }]
+    else:
+        system_content = system_prompt
+
+    return [
+        {"role": "system", "content": system_content},
+        {"role": "user", "content": user_prompt}
+    ]
@@ -0,0 +1,199 @@
+"""
+Request deadline budget and continuation tokens for online MCQ generation.
+
+On Vercel every request is killed after the function's ``maxDuration``
+(60s in vercel.json), so a multi-chunk run that keeps issuing calls loses
+everything it produced. A RequestDeadline is created when the request
+arrives and passed through the generation pipeline. The chunk scheduler only
+starts a call when it expects the call to finish inside the remaining budget,
+and when it has to stop it records a continuation token. Sending that token
+back with the same PDF and settings resumes from the next unprocessed chunk.
+
+A CancellationToken travels the same way and stops a run whose client has
+gone away (e.g. a closed /upload-stream connection): no further chunk calls
+are started and the call in flight is aborted by closing its API client.
+"""
+
+import os
+import json
+import time
+import base64
+import hashlib
+import threading
+
+# Vercel function limit for api/index.py (see vercel.json)
+SERVERLESS_MAX_DURATION = 60
+
+# Seconds kept back for metadata tagging and sending the response
+DEADLINE_RESERVE_SECONDS = float(os.environ.get('DEADLINE_RESERVE_SECONDS', 5))
+
+# Assumed duration of a chunk call until one has been observed in this request
+DEFAULT_CALL_SECONDS = float(os.environ.get('DEFAULT_CALL_SECONDS', 20))
+
+CONTINUATION_TOKEN_VERSION = 1
+
+
+class RequestDeadline:
+    """
+    Wall-clock budget for one request.
+
+    Besides answering "can this still finish in time?", the deadline carries
+    the outcome of a cut-short run back to the caller: the continuation token
+    and how many chunks were processed.
+    """
+
+    def __init__(self, budget_seconds, reserve_seconds=DEADLINE_RESERVE_SECONDS):
+        self.budget_seconds = budget_seconds
+        self.started_at = time.monotonic()
+        self.expires_at = self.started_at + max(0.0, budget_seconds - reserve_seconds)
+        self.call_durations = []
+        self.continuation_token = None
+        self.chunks_total = 0
+        self.chunks_done = 0
+
+    @classmethod
+    def for_request(cls, is_serverless=False):
+        """
+        Create the deadline for an incoming request.
+
+        REQUEST_DEADLINE_SECONDS overrides the budget; otherwise serverless
+        deployments get the platform limit and local runs are unlimited.
+
+        Returns:
+            RequestDeadline or None: None when the request has no deadline
+        """
+        configured = os.environ.get('REQUEST_DEADLINE_SECONDS')
+        if configured:
+            budget = float(configured)
+            return cls(budget) if budget > 0 else None
+        if is_serverless:
+            return cls(SERVERLESS_MAX_DURATION)
+        return None
+
+    def remaining(self):
+        """Seconds left before the deadline (never negative)."""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def expected_call_seconds(self):
+        """Longest call observed in this request, or the default before the first call."""
+        return max(self.call_durations) if self.call_durations else DEFAULT_CALL_SECONDS
+
+    def can_start(self, extra_seconds=0):
+        """Whether a call (plus e.g. a rate-limit delay) is expected to finish in time."""
+        return self.remaining() >= self.expected_call_seconds() + extra_seconds
+
+    def record_call(self, seconds):
+        self.call_durations.append(seconds)
+
+    def call_timeout(self, default_timeout):
+        """Per-call timeout clipped to the remaining budget."""
+        return max(1.0, min(default_timeout, self.remaining()))
+
+    @property
+    def partial(self):
+        return self.continuation_token is not None
+
+
+class CancellationToken:
+    """
+    Cancellation flag shared between a request handler and its generation run.
+
+    The run registers callbacks (e.g. closing its API client) that abort work
+    in flight; cancel() sets the flag and invokes them once.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"⚠️  Cancellation callback failed: {e}")
+
+    def on_cancel(self, callback):
+        """Run callback on cancel(), or immediately when already cancelled."""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def wait(self, seconds):
+        """Sleep up to seconds; returns True if cancelled in the meantime."""
+        return self._event.wait(seconds)
+
+
+def document_fingerprint(text):
+    """Short stable hash identifying the extracted document text."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def settings_fingerprint(*settings):
+    """Short stable hash of the run settings that determine chunking and prompts."""
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+
+
+def encode_continuation_token(document, settings, next_chunk, questions_done, total_questions):
+    """
+    Encode the position of a cut-short run as a URL-safe token.
+
+    Args:
+        document (str): document_fingerprint() of the text
+        settings (str): settings_fingerprint() of the run settings
+        next_chunk (int): Index of the first chunk that was not processed
+        questions_done (int): Questions already returned to the client
+        total_questions (int): Questions requested for the whole run
+
+    Returns:
+        str: Continuation token
+    """
+    payload = {
+        'v': CONTINUATION_TOKEN_VERSION,
+        'doc': document,
+        'cfg': settings,
+        'chunk': next_chunk,
+        'done': questions_done,
+        'total': total_questions
+    }
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_continuation_token(token):
+    """
+    Decode a continuation token.
+
+    Returns:
+        dict: Token payload
+
+    Raises:
+        ValueError: If the token is malformed or from another token version
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid continuation token: {e}")
+
+    if not isinstance(payload, dict) or payload.get('v') != CONTINUATION_TOKEN_VERSION:
+        raise ValueError("Invalid continuation token: unsupported version")
+    for key in ('doc', 'cfg', 'chunk', 'done', 'total'):
+        if key not in payload:
+            raise ValueError(f"Invalid continuation token: missing '{key}'")
+    return payload
@@ -0,0 +1,169 @@
+"""
+Server-side store for generation results
+
+Generated questions (and notes) are kept on the server under a random result
+id, so export endpoints such as /download-csv and /download-pdf only need the
+id instead of the browser posting the full JSON back. Each result belongs to
+the user who created it.
+
+Two backends share one interface:
+    memory   bounded in-process LRU (entry count and total size limits)
+    sqlite   SQLite file shared by all worker processes, pruned to the same limits
+
+Configuration:
+    RESULT_STORE_BACKEND       'memory' (default) or 'sqlite'
+    RESULT_STORE_PATH          SQLite file path (default: cache/results.db, or the temp directory on Vercel)
+    RESULT_STORE_MAX_ENTRIES   Maximum number of stored results (default: 200)
+    RESULT_STORE_MAX_BYTES     Maximum total size of stored results (default: 64 MB)
+"""
+
+import os
+import json
+import time
+import uuid
+import sqlite3
+import tempfile
+import threading
+from collections import OrderedDict
+
+RESULT_STORE_BACKEND = os.environ.get('RESULT_STORE_BACKEND', 'memory')
+RESULT_STORE_MAX_ENTRIES = int(os.environ.get('RESULT_STORE_MAX_ENTRIES', 200))
+RESULT_STORE_MAX_BYTES = int(os.environ.get('RESULT_STORE_MAX_BYTES', 64 * 1024 * 1024))
+
+if os.environ.get('VERCEL'):
+    _DEFAULT_STORE_PATH = os.path.join(tempfile.gettempdir(), 'results.db')
+else:
+    _DEFAULT_STORE_PATH = os.path.join('cache', 'results.db')
+
+RESULT_STORE_PATH = os.environ.get('RESULT_STORE_PATH', _DEFAULT_STORE_PATH)
+
+
+def new_result_id():
+    return uuid.uuid4().hex
+
+
+class InMemoryResultStore:
+    """Bounded LRU of results held in this process."""
+
+    def __init__(self, max_entries=RESULT_STORE_MAX_ENTRIES, max_bytes=RESULT_STORE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # result_id -> (owner, payload, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def put(self, result_id, owner, payload):
+        """Store (or replace) a result and evict the least recently used ones over the limits."""
+        size = len(json.dumps(payload))
+        with self._lock:
+            if result_id in self._entries:
+                self._bytes -= self._entries.pop(result_id)[2]
+            self._entries[result_id] = (owner, payload, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+
+    def get(self, result_id, owner):
+        """Return the payload of a result owned by owner, or None."""
+        with self._lock:
+            entry = self._entries.get(result_id)
+            if entry is None or entry[0] != owner:
+                return None
+            self._entries.move_to_end(result_id)
+            return entry[1]
+
+    def stats(self):
+        with self._lock:
+            return {'backend': 'memory', 'entries': len(self._entries), 'bytes': self._bytes,
+                    'max_entries': self.max_entries, 'max_bytes': self.max_bytes}
+
+
+class SQLiteResultStore:
+    """Results in a SQLite file, pruned by last access to the entry and size limits."""
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS results (
+        id TEXT PRIMARY KEY,
+        owner TEXT,
+        payload TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        accessed_at REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at);
+    """
+
+    def __init__(self, path=RESULT_STORE_PATH, max_entries=RESULT_STORE_MAX_ENTRIES,
+                 max_bytes=RESULT_STORE_MAX_BYTES):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = self._connect()
+        try:
+            connection.executescript(self._SCHEMA)
+        finally:
+            connection.close()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=10)
+
+    def put(self, result_id, owner, payload):
+        data = json.dumps(payload)
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO results (id, owner, payload, size, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                    (result_id, owner, data, len(data), time.time())
+                )
+                self._prune(connection)
+        finally:
+            connection.close()
+
+    def _prune(self, connection):
+        """Delete least recently used results until both limits hold."""
+        count, total = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        rows = connection.execute("SELECT id, size FROM results ORDER BY accessed_at").fetchall()
+        for result_id, size in rows:
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            connection.execute("DELETE FROM results WHERE id = ?", (result_id,))
+            count -= 1
+            total -= size
+
+    def get(self, result_id, owner):
+        connection = self._connect()
+        try:
+            with connection:
+                row = connection.execute(
+                    "SELECT owner, payload FROM results WHERE id = ?", (result_id,)
+                ).fetchone()
+                if row is None or row[0] != owner:
+                    return None
+                connection.execute("UPDATE results SET accessed_at = ? WHERE id = ?", (time.time(), result_id))
+        finally:
+            connection.close()
+        return json.loads(row[1])
+
+    def stats(self):
+        connection = self._connect()
+        try:
+            count, total = connection.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results").fetchone()
+        finally:
+            connection.close()
+        return {'backend': 'sqlite', 'entries': count, 'bytes': total,
+                'max_entries': self.max_entries, 'max_bytes': self.max_bytes}
+
+
+def create_result_store(backend=RESULT_STORE_BACKEND):
+    """Create the result store selected by RESULT_STORE_BACKEND."""
+    if backend == 'sqlite':
+        return SQLiteResultStore()
+    if backend != 'memory':
+        print(f"⚠️  Unknown RESULT_STORE_BACKEND '{backend}', using the in-memory store")
+    return InMemoryResultStore()
@@ -0,0 +1,156 @@
+"""
+Registry of short-lived per-request sessions with TTLs and a background janitor
+
+Streaming uploads keep a progress queue per session and PDF splitting keeps
+the split files in a temp directory until the user downloads them. Both used
+to live in plain dicts that were never pruned, and the split directories were
+never deleted. Sessions are now registered here with a time-to-live: every
+access extends it, and the janitor thread removes expired sessions together
+with their temp directories.
+
+Each registry also tracks how many bytes its sessions hold (e.g. the size of
+the split files), so stats() can report sessions and bytes currently held.
+
+Configuration:
+    SESSION_TTL_SECONDS         Idle lifetime of a progress session (default: 1 hour)
+    SPLIT_SESSION_TTL_SECONDS   Idle lifetime of a split-PDF session (default: 30 minutes)
+    SESSION_JANITOR_INTERVAL    Seconds between janitor sweeps (default: 60)
+"""
+
+import os
+import time
+import shutil
+import threading
+
+SESSION_TTL_SECONDS = float(os.environ.get('SESSION_TTL_SECONDS', 3600))
+SPLIT_SESSION_TTL_SECONDS = float(os.environ.get('SPLIT_SESSION_TTL_SECONDS', 1800))
+SESSION_JANITOR_INTERVAL = float(os.environ.get('SESSION_JANITOR_INTERVAL', 60))
+
+
+def directory_size(path):
+    """Total size in bytes of the files below path (0 if it does not exist)."""
+    total = 0
+    for root, _, files in os.walk(path or ''):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def remove_temp_dir(temp_dir):
+    """Delete a session's temp directory; errors are logged and ignored."""
+    if temp_dir and os.path.isdir(temp_dir):
+        try:
+            shutil.rmtree(temp_dir)
+        except OSError as e:
+            print(f"⚠️  Could not remove temp directory {temp_dir}: {e}")
+
+
+class SessionRegistry:
+    """
+    Sessions keyed by id, each with a value, an idle TTL, a size in bytes and
+    an optional temp directory that is deleted when the session goes away.
+    """
+
+    def __init__(self, name, ttl_seconds):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self._sessions = {}  # session_id -> {'value', 'size', 'temp_dir', 'created_at', 'expires_at'}
+        self._lock = threading.Lock()
+        self.expired_total = 0
+
+    def register(self, session_id, value, size_bytes=0, temp_dir=None):
+        now = time.time()
+        with self._lock:
+            previous = self._sessions.pop(session_id, None)
+            self._sessions[session_id] = {
+                'value': value,
+                'size': size_bytes,
+                'temp_dir': temp_dir,
+                'created_at': now,
+                'expires_at': now + self.ttl_seconds
+            }
+        if previous and previous['temp_dir'] != temp_dir:
+            remove_temp_dir(previous['temp_dir'])
+
+    def get(self, session_id):
+        """Return the value of a live session and extend its TTL, or None."""
+        now = time.time()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session['expires_at'] <= now:
+                return None
+            session['expires_at'] = now + self.ttl_seconds
+            return session['value']
+
+    def __contains__(self, session_id):
+        with self._lock:
+            session = self._sessions.get(session_id)
+            return session is not None and session['expires_at'] > time.time()
+
+    def remove(self, session_id):
+        """Drop a session and delete its temp directory."""
+        with self._lock:
+            session = self._sessions.pop(session_id, None)
+        if session:
+            remove_temp_dir(session['temp_dir'])
+
+    def expire(self, now=None):
+        """
+        Remove every session whose TTL has run out.
+
+        Returns:
+            int: Number of sessions removed
+        """
+        now = now or time.time()
+        with self._lock:
+            expired_ids = [sid for sid, session in self._sessions.items() if session['expires_at'] <= now]
+            expired = [self._sessions.pop(sid) for sid in expired_ids]
+            self.expired_total += len(expired)
+        for session in expired:
+            remove_temp_dir(session['temp_dir'])
+        return len(expired)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'sessions': len(self._sessions),
+                'bytes': sum(session['size'] for session in self._sessions.values()),
+                'ttl_seconds': self.ttl_seconds,
+                'expired_total': self.expired_total
+            }
+
+
+class SessionJanitor:
+    """Background thread that periodically expires the sessions of a set of registries."""
+
+    def __init__(self, registries, interval=SESSION_JANITOR_INTERVAL):
+        self.registries = list(registries)
+        self.interval = interval
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._loop, name='session-janitor', daemon=True)
+        self._thread.start()
+        print(f"🧹 Session janitor sweeping every {self.interval:g}s")
+
+    def sweep(self):
+        """Expire sessions in every registry; returns {registry name: sessions removed}."""
+        removed = {registry.name: registry.expire() for registry in self.registries}
+        if any(removed.values()):
+            details = ', '.join(f"{name}: {count}" for name, count in removed.items() if count)
+            print(f"🧹 Expired sessions ({details})")
+        return removed
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"⚠️  Session janitor error: {e}")
+
+    def stats(self):
+        return {registry.name: registry.stats() for registry in self.registries}